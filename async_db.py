@@ -0,0 +1,178 @@
+# async_db.py - Ma'lumotlar ombori funksiyalarining asinxron versiyasi
+#
+# psycopg2 va sqlite3 sinxron ishlaydi, shuning uchun har bir so'rov alohida thread'larda
+# (cheklangan ThreadPoolExecutor) bajariladi va event loop bloklanmaydi.
+# Thread'lar soni DB ulanishlar hovuzi hajmiga teng, ya'ni hovuzdan ortiq
+# ulanish hech qachon so'ralmaydi. Funksiyalar tanlangan backend'ga
+# (storage.backend: db.py yoki db_sqlite.py) uzatiladi.
+
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import metrics
+import slowlog
+import stats
+import storage
+from chat_registry import registry as chat_registry
+from config import DB_POOL_MAX_SIZE, SHARD_SIZE
+
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX_SIZE, thread_name_prefix="db")
+
+def _timed(func, *args, **kwargs):
+    """
+    Funksiyani executor thread'ida bajaradi va vaqtini metrikaga yozadi (navbatda kutish hisobga olinmaydi).
+    Chegaradan sekin chaqiruvlar slowlog ga tushadi.
+    """
+    name = getattr(func, '__name__', 'other')
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        metrics.DB_ERRORS.labels(name).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.DB_QUERY.labels(name).observe(elapsed)
+        if elapsed >= slowlog.db_threshold:
+            slowlog.slow_db(name, elapsed)
+
+async def run(func, *args, **kwargs):
+    """
+    Sinxron DB funksiyasini executor'da bajaradi va natijasini kutadi. Chaqiruvchining konteksti
+    (slowlog.post_id/chat_id) thread'ga o'tkaziladi, asyncio.to_thread dagi kabi.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, _timed, func, *args, **kwargs))
+
+def shutdown():
+    """Executor va DB hovuzini yopadi (dastur to'xtaganda chaqiriladi)."""
+    _executor.shutdown(wait=True)
+    storage.backend.close_pool()
+
+# --- storage.Storage BILAN BIR XIL FUNKSIYALAR ---
+
+async def init_db():
+    return await run(storage.backend.init_db)
+
+async def get_db_summary():
+    return await run(storage.backend.get_db_summary)
+
+async def add_chat(chat_id: int, title: str, chat_type: str):
+    return await run(storage.backend.add_chat, chat_id, title, chat_type)
+
+async def get_active_chats():
+    # Registr yuklangan bo'lsa, executor'ga ham murojaat qilinmaydi
+    if chat_registry.loaded:
+        return chat_registry.ids()
+    return await run(storage.backend.get_active_chats)
+
+async def add_scheduled_post(media_type: str, file_id: str, caption: str, schedule_time: datetime,
+                             source_chat_id: int = None, source_message_ids: list = None, caption_index: int = None) -> int:
+    return await run(storage.backend.add_scheduled_post, media_type, file_id, caption, schedule_time,
+                     source_chat_id, source_message_ids, caption_index)
+
+async def add_scheduled_posts(posts: list):
+    return await run(storage.backend.add_scheduled_posts, posts)
+
+async def deactivate_chat(chat_id: int):
+    return await run(storage.backend.deactivate_chat, chat_id)
+
+async def migrate_chat(old_chat_id: int, new_chat_id: int):
+    return await run(storage.backend.migrate_chat, old_chat_id, new_chat_id)
+
+async def claim_chats_for_health_check(limit: int, interval_seconds: float):
+    return await run(storage.backend.claim_chats_for_health_check, limit, interval_seconds)
+
+async def record_chat_health(chat_id: int, can_post_messages: bool):
+    return await run(storage.backend.record_chat_health, chat_id, can_post_messages)
+
+async def get_chat_bots():
+    return await run(storage.backend.get_chat_bots)
+
+async def get_unassigned_chats(limit: int):
+    return await run(storage.backend.get_unassigned_chats, limit)
+
+async def assign_chat_bot(chat_id: int, bot_id: int):
+    return await run(storage.backend.assign_chat_bot, chat_id, bot_id)
+
+async def reset_chat_bots(bot_ids: list) -> int:
+    return await run(storage.backend.reset_chat_bots, bot_ids)
+
+async def get_due_posts(after: tuple = None, limit: int = None):
+    return await run(storage.backend.get_due_posts, after, limit)
+
+async def get_upcoming_schedule():
+    return await run(storage.backend.get_upcoming_schedule)
+
+async def mark_post_as_sent(post_id: int):
+    return await run(storage.backend.mark_post_as_sent, post_id)
+
+async def add_recurring_post(media_type: str, file_id: str, caption: str, cron: str, timezone: str,
+                             source_chat_id: int = None, source_message_ids: list = None, caption_index: int = None):
+    return await run(storage.backend.add_recurring_post, media_type, file_id, caption, cron, timezone,
+                     source_chat_id, source_message_ids, caption_index)
+
+async def get_post_schedules():
+    return await run(storage.backend.get_post_schedules)
+
+async def cancel_post_schedule(schedule_id: int) -> bool:
+    return await run(storage.backend.cancel_post_schedule, schedule_id)
+
+async def get_pending_deliveries(post_id: int, first_chat_id: int = None, last_chat_id: int = None):
+    return await run(storage.backend.get_pending_deliveries, post_id, first_chat_id, last_chat_id)
+
+async def record_deliveries(rows: list):
+    return await run(storage.backend.record_deliveries, rows)
+
+async def finish_post_delivery(post_id: int) -> str:
+    return await run(storage.backend.finish_post_delivery, post_id)
+
+async def get_delivery_stats(recent_posts: int = stats.RECENT_POSTS, failing_chats: int = stats.FAILING_CHATS) -> dict:
+    return await run(storage.backend.get_delivery_stats, recent_posts, failing_chats)
+
+async def plan_due_post(post_id: int, chat_ids, shard_size: int = SHARD_SIZE):
+    return await run(storage.backend.plan_due_post, post_id, chat_ids, shard_size)
+
+async def claim_delivery_shard(worker_id: str, lease_seconds: int):
+    return await run(storage.backend.claim_delivery_shard, worker_id, lease_seconds)
+
+async def renew_shard_lease(post_id: int, shard_no: int, worker_id: str, lease_seconds: int) -> bool:
+    return await run(storage.backend.renew_shard_lease, post_id, shard_no, worker_id, lease_seconds)
+
+async def complete_delivery_shard(post_id: int, shard_no: int, worker_id: str) -> bool:
+    return await run(storage.backend.complete_delivery_shard, post_id, shard_no, worker_id)
+
+async def get_completed_post_ids():
+    return await run(storage.backend.get_completed_post_ids)
+
+async def get_post(post_id: int):
+    return await run(storage.backend.get_post, post_id)
+
+async def get_post_messages(post_ids: list):
+    return await run(storage.backend.get_post_messages, post_ids)
+
+async def update_post_caption(post_id: int, caption: str):
+    return await run(storage.backend.update_post_caption, post_id, caption)
+
+async def clear_post_messages(post_ids: list, chat_ids: list):
+    return await run(storage.backend.clear_post_messages, post_ids, chat_ids)
+
+async def count_archivable_posts(older_than_seconds: float) -> dict:
+    return await run(storage.backend.count_archivable_posts, older_than_seconds)
+
+async def archive_sent_posts(older_than_seconds: float, batch_size: int) -> int:
+    return await run(storage.backend.archive_sent_posts, older_than_seconds, batch_size)
+
+async def get_fsm_record(key: str):
+    return await run(storage.backend.get_fsm_record, key)
+
+async def set_fsm_state(key: str, state: str, origin: str = ''):
+    return await run(storage.backend.set_fsm_state, key, state, origin)
+
+async def set_fsm_data(key: str, data: dict, origin: str = ''):
+    return await run(storage.backend.set_fsm_data, key, data, origin)
@@ -0,0 +1,2392 @@
+# benchmark.py - Botning unumdorligini o'lchash uchun skript
+#
+# Ishlatish:
+#   python benchmark.py db --queries 200
+#   python benchmark.py latency --slow-seconds 2
+#   python benchmark.py fanout --chats 300 --latency-ms 50
+#   python benchmark.py dispatch --posts 20 --spread 10 --idle 30
+#   python benchmark.py explain --rows 1000000
+#   python benchmark.py replicas --workers 1,2,4 --chats 1000 --posts 4
+#   python benchmark.py webhook --updates 5000 --concurrency 100
+#   python benchmark.py metrics --iterations 200000
+#   python benchmark.py storage --backends sqlite,postgres --chats 2000 --posts 5
+#   python benchmark.py e2e --backend sqlite --chats 2000 --posts 3 --output e2e.json
+#   python benchmark.py e2e --backend sqlite --chats 2000 --posts 3 --album 10
+#   python benchmark.py drain --backend sqlite --posts 10000 --chats 5
+#   python benchmark.py health --backend sqlite --chats 1000 --dead 50
+#   python benchmark.py startup --backend postgres --posts 200000
+#   python benchmark.py retention --backend postgres --posts 1000 --chats 200
+#   python benchmark.py import --backend postgres --rows 2000 --invalid 20
+#   python benchmark.py postactions --backend sqlite --chats 1000 --albums 11
+#   python benchmark.py pool --backend postgres --chats 600 --helpers 2
+#   python benchmark.py recurring --backend postgres --schedules 200 --horizon-days 365
+#   python benchmark.py fsm --backend postgres --updates 1000
+#   python benchmark.py slowlog --backend postgres --chats 500 --slow 5 --profile-seconds 2
+#   python benchmark.py stats --backend postgres --chats 300 --posts 5 --history-posts 2000
+#
+# Natijalar JSON ko'rinishida chiqariladi.
+
+import argparse
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytz
+
+import async_db
+import delivery
+import metrics
+import profiler
+import scheduler
+import slowlog
+import stats
+import startup
+import storage
+import server
+from chat_health import ChatHealthProber
+from chat_registry import registry as chat_registry
+from config import DRAIN_PAGE_SIZE, GLOBAL_RATE_LIMIT, WEBHOOK_PATH, WEBHOOK_SECRET
+from post_dispatcher import PostDispatcher
+
+# db.py (psycopg2) va pg_listener faqat Postgres benchmark'lari ichida import qilinadi,
+# shuning uchun SQLite benchmark'lari psycopg2 o'rnatilmagan muhitda ham ishlaydi.
+
+def _is_postgres(backend) -> bool:
+    return backend.__name__ == 'db'
+
+
+# --- DB: HOVUZSIZ VA HOVUZ BILAN SO'ROVLAR ---
+
+def bench_db(queries: int) -> dict:
+    """Har so'rovda yangi ulanish ochish va hovuzdan foydalanishni solishtiradi (so'rov/soniya)."""
+    import db
+
+    # 1. Eski usul: har bir so'rov uchun yangi ulanish
+    start = time.perf_counter()
+    for _ in range(queries):
+        conn = db.get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1;")
+            cur.fetchone()
+        finally:
+            conn.close()
+    direct_seconds = time.perf_counter() - start
+
+    # 2. Yangi usul: hovuzdan olingan ulanishlar
+    db.get_pool() # Hovuzni yaratish vaqti o'lchovga kirmasin
+    start = time.perf_counter()
+    for _ in range(queries):
+        with db.db_cursor() as cur:
+            cur.execute("SELECT 1;")
+            cur.fetchone()
+    pooled_seconds = time.perf_counter() - start
+    db.close_pool()
+
+    return {
+        'queries': queries,
+        'direct_qps': round(queries / direct_seconds, 1),
+        'pooled_qps': round(queries / pooled_seconds, 1),
+        'speedup': round(direct_seconds / pooled_seconds, 2),
+    }
+
+
+# --- ASYNC DB: SEKIN SO'ROV PAYTIDA HANDLER KECHIKISHI ---
+
+def _slow_query(seconds: float):
+    """Sekin so'rovni taqlid qiladi (pg_sleep)."""
+    import db
+
+    with db.db_cursor() as cur:
+        cur.execute("SELECT pg_sleep(%s);", (seconds,))
+
+async def _handler_latencies(duration: float) -> list:
+    """
+    Handler'ni taqlid qiladi: har 10 ms da "so'rov keladi" va get_active_chats() chaqiriladi.
+    Javob vaqti (ms) = event loop so'rovga yetib kelguncha kechikish + DB so'rovi vaqti.
+    """
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        arrival = time.perf_counter() + 0.01
+        await asyncio.sleep(0.01)
+        await async_db.get_active_chats()
+        latencies.append((time.perf_counter() - arrival) * 1000)
+    return latencies
+
+def _summary(latencies: list) -> dict:
+    latencies = sorted(latencies)
+    return {
+        'samples': len(latencies),
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p99_ms': round(_percentile(latencies, 99), 2),
+        'max_ms': round(latencies[-1], 2),
+    }
+
+async def bench_latency(slow_seconds: float) -> dict:
+    """Sekin so'rov bajarilayotganda handler javob vaqti tekis qolishini ko'rsatadi."""
+    await async_db.get_active_chats() # Hovuzni isitish
+
+    # 1. Sekin so'rovsiz
+    idle = await _handler_latencies(slow_seconds)
+
+    # 2. Sekin so'rov executor'da (yangi usul)
+    slow = asyncio.create_task(async_db.run(_slow_query, slow_seconds))
+    with_executor = await _handler_latencies(slow_seconds)
+    await slow
+
+    # 3. Sekin so'rov to'g'ridan-to'g'ri event loop'da (eski usul)
+    async def blocking_query():
+        await asyncio.sleep(0.05)
+        _slow_query(slow_seconds)
+    slow = asyncio.create_task(blocking_query())
+    blocking = await _handler_latencies(slow_seconds)
+    await slow
+
+    result = {
+        'slow_query_seconds': slow_seconds,
+        'idle': _summary(idle),
+        'slow_query_in_executor': _summary(with_executor),
+        'slow_query_on_event_loop': _summary(blocking),
+    }
+    # Executor'dagi sekin so'rov handler'larni ushlab turmaydi; eski usulda esa o'lchov bloklanishni ko'radi
+    result['ok'] = (
+        result['slow_query_in_executor']['p99_ms'] < 50
+        and result['slow_query_on_event_loop']['max_ms'] >= slow_seconds * 1000 * 0.9
+    )
+    return result
+
+
+# --- FAN-OUT: SOXTA BOT API BILAN O'TKAZUVCHANLIK ---
+
+class _FakeBot:
+    """Bot API'ni taqlid qiladi: har bir yuborish `latency` soniya davom etadi."""
+
+    id = 42
+
+    def __init__(self, latency: float, keep_log: bool = True):
+        self.latency = latency
+        self.keep_log = keep_log
+        self.sent = 0
+        self.log = [] # (chat_id, matn yoki caption)
+        self.dead_chats = set() # get_chat_member() bot chiqarilgan deb javob beradigan chatlar
+        self.kicked_from = set() # yuborish TelegramForbiddenError bilan tugaydigan chatlar
+        self.probes = 0
+        self.items = 0 # chatlarda paydo bo'lgan xabarlar (message_id shu hisoblagichdan)
+        self.media_sources = set() # copy_message bilan nusxalanganda media (caption'li) bo'ladigan asl xabarlar
+        self.media = set() # (chat_id, message_id): matni yo'q, faqat caption'i bor xabarlar
+        self.authored = set() # shu bot yuborgan (chat_id, message_id): boshqa bot ularni tahrirlay olmaydi
+        self.edits = 0
+        self.caption_edits = set() # edit_message_caption bilan tahrirlangan (chat_id, message_id)
+        self.delete_calls = 0
+        self.deleted = 0
+        self.slow_chats = {} # chat_id -> shu chatga yuborishdagi qo'shimcha kechikish (soniya)
+
+    async def _send(self, chat_id, *args, **kwargs):
+        await asyncio.sleep(self.latency + self.slow_chats.get(chat_id, 0))
+        self._check_kicked(chat_id)
+        self.sent += 1
+        self.items += 1
+        self.authored.add((chat_id, self.items))
+        if self.keep_log:
+            self.log.append((chat_id, args[0] if args else kwargs.get('caption')))
+        return SimpleNamespace(message_id=self.items, chat=SimpleNamespace(id=chat_id))
+
+    send_message = send_photo = send_video = send_document = _send
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        message = await self._send(chat_id, message_id)
+        if message_id in self.media_sources:
+            self.media.add((chat_id, message.message_id))
+        return message
+
+    async def get_chat_member(self, chat_id, user_id):
+        await asyncio.sleep(self.latency)
+        self.probes += 1
+        status = 'kicked' if chat_id in self.dead_chats else 'administrator'
+        return SimpleNamespace(status=status, can_post_messages=True)
+
+    async def copy_messages(self, chat_id, from_chat_id, message_ids, **kwargs):
+        message = await self._send(chat_id, message_ids)
+        copies = [message] + [SimpleNamespace(message_id=self.items + i) for i in range(1, len(message_ids))]
+        self.items += len(message_ids) - 1
+        self.media.update((chat_id, copy.message_id) for copy in copies)
+        self.authored.update((chat_id, copy.message_id) for copy in copies)
+        return copies
+
+    async def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        from aiogram.exceptions import TelegramBadRequest
+
+        await asyncio.sleep(self.latency)
+        self.edits += 1
+        self._check_kicked(chat_id)
+        self._check_author(chat_id, message_id)
+        if (chat_id, message_id) in self.media:
+            raise TelegramBadRequest(method=None, message="Bad Request: there is no text in the message to edit")
+        return True
+
+    async def edit_message_caption(self, chat_id, message_id, caption=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        self.edits += 1
+        self._check_kicked(chat_id)
+        self._check_author(chat_id, message_id)
+        self.caption_edits.add((chat_id, message_id))
+        return True
+
+    def _check_author(self, chat_id, message_id):
+        if (chat_id, message_id) not in self.authored:
+            from aiogram.exceptions import TelegramBadRequest
+
+            raise TelegramBadRequest(method=None, message="Bad Request: message can't be edited")
+
+    def _check_kicked(self, chat_id):
+        if chat_id in self.kicked_from:
+            from aiogram.exceptions import TelegramForbiddenError
+
+            raise TelegramForbiddenError(method=None, message="Forbidden: bot was kicked from the channel chat")
+
+    async def delete_messages(self, chat_id, message_ids):
+        await asyncio.sleep(self.latency)
+        self.delete_calls += 1
+        self.deleted += len(message_ids)
+        return True
+
+async def bench_fanout(chats: int, latency_ms: float, rate: float) -> dict:
+    """Bitta postni `chats` ta chatga yuborish tezligini o'lchaydi (xabar/soniya)."""
+    bot = _FakeBot(latency_ms / 1000)
+    post = {'id': 1, 'media_type': 'text', 'file_id': None, 'caption': 'benchmark'}
+    rate_limiter = delivery.RateLimiter(global_rate=rate)
+
+    start = time.perf_counter()
+    results = await delivery.fan_out(range(chats), lambda chat_id: delivery.send_post(bot, post, chat_id), rate_limiter)
+    seconds = time.perf_counter() - start
+
+    return {
+        'chats': chats,
+        'latency_ms': latency_ms,
+        'global_rate_limit': rate,
+        'sent': sum(1 for r in results if r.ok),
+        'seconds': round(seconds, 2),
+        'messages_per_second': round(chats / seconds, 1),
+        # Eski ketma-ket sikl: har yuborishdan keyin 0.5 s kutish
+        'serial_messages_per_second': round(1 / (latency_ms / 1000 + 0.5), 1),
+    }
+
+
+# --- DISPATCHER: KECHIKISH VA BO'SH VAQTDAGI SO'ROVLAR ---
+
+def _percentile(values: list, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+async def bench_dispatch(posts: int, spread: float, idle: float) -> dict:
+    """
+    `spread` soniya ichida `posts` ta post rejalashtiradi (NOTIFY orqali), ularning
+    qanchalik kechikib yuborilishini va bo'sh turganda nechta DB so'rovi bo'lishini o'lchaydi.
+    """
+    await async_db.init_db()
+    tz = pytz.timezone("Asia/Tashkent")
+    post_times = {}
+    lateness = []
+
+    async def on_due():
+        due = await async_db.get_due_posts()
+        now = time.time()
+        for post in due:
+            if post['id'] in post_times:
+                lateness.append((now - post_times.pop(post['id'])) * 1000)
+                await async_db.mark_post_as_sent(post['id'])
+
+    dispatcher = PostDispatcher(on_due)
+    listener = storage.notify_listener()
+    if listener is not None:
+        await listener.start()
+    await dispatcher.start()
+
+    base = time.time() + 1
+    for i in range(posts):
+        when = base + spread * i / posts
+        naive = datetime.fromtimestamp(when, tz).replace(tzinfo=None)
+        post_id = await async_db.add_scheduled_post('text', '', 'benchmark', naive)
+        post_times[post_id] = when
+
+    deadline = time.time() + spread + 10
+    while post_times and time.time() < deadline:
+        await asyncio.sleep(0.1)
+
+    # Bo'sh turgan paytda DB ga nechta murojaat bo'ladi
+    start_count = storage.backend.transaction_count
+    await asyncio.sleep(idle)
+    idle_queries = storage.backend.transaction_count - start_count
+
+    dispatcher.stop()
+    if listener is not None:
+        listener.stop()
+
+    return {
+        'posts': posts,
+        'dispatched': len(lateness),
+        'lateness_p50_ms': round(_percentile(lateness, 50), 1) if lateness else None,
+        'lateness_p99_ms': round(_percentile(lateness, 99), 1) if lateness else None,
+        'lateness_max_ms': round(max(lateness), 1) if lateness else None,
+        'idle_seconds': idle,
+        'idle_queries': idle_queries,
+        # Eski usul: har daqiqada so'rov, o'rtacha 30 s kechikish
+        'polling_idle_queries': round(idle / 60, 2),
+        'polling_lateness_avg_ms': 30000,
+        # Barcha postlar NOTIFY orqali yetib kelib, vaqtidan ko'pi bilan 1 s kechikib yuborilishi kerak
+        'ok': len(lateness) == posts and max(lateness, default=0) < 1000,
+    }
+
+
+# --- EXPLAIN: ISSIQ SO'ROVLAR INDEKSDAN FOYDALANISHINI TEKSHIRISH ---
+
+_EXPLAIN_SCHEMA = 'benchmark_explain'
+
+def _plan_nodes(plan: dict):
+    """EXPLAIN (FORMAT JSON) daraxtidagi barcha tugunlarni qaytaradi."""
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _plan_nodes(child)
+
+def _explain(cur, query: str, params=None) -> dict:
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, params)
+    result = cur.fetchone()[0][0]
+    nodes = [
+        f"{node['Node Type']}" + (f" on {node['Relation Name']}" if 'Relation Name' in node else '')
+        + (f" using {node['Index Name']}" if 'Index Name' in node else '')
+        for node in _plan_nodes(result['Plan'])
+    ]
+    return {
+        'nodes': nodes,
+        'seq_scan': any(node.startswith('Seq Scan') for node in nodes),
+        'execution_ms': round(result['Execution Time'], 2),
+    }
+
+def bench_explain(rows: int, pending: int, chats: int) -> dict:
+    """
+    Alohida sxemada migratsiyalarni bajarib, `rows` ta yuborilgan post va `chats` ta chat
+    (ko'pi nofaol) bilan to'ldiradi, so'ng get_due_posts va get_active_chats so'rovlari
+    Seq Scan ishlatmasligini EXPLAIN orqali tekshiradi. Sxema oxirida o'chiriladi.
+    """
+    import db
+
+    conn = db.get_db_connection()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {_EXPLAIN_SCHEMA} CASCADE;")
+            cur.execute(f"CREATE SCHEMA {_EXPLAIN_SCHEMA};")
+            cur.execute(f"SET search_path TO {_EXPLAIN_SCHEMA};")
+            db.apply_migrations(cur)
+
+            # Yuborilgan postlar tarixi va oz sonli kutilayotgan postlar
+            cur.execute("""
+                INSERT INTO scheduled_posts (media_type, caption, schedule_time, is_sent, status)
+                SELECT 'text', 'post ' || g, NOW() - g * INTERVAL '1 minute', TRUE, 'done'
+                FROM generate_series(1, %s) g;
+            """, (rows,))
+            cur.execute("""
+                INSERT INTO scheduled_posts (media_type, caption, schedule_time)
+                SELECT 'text', 'pending ' || g, NOW() + (g - %s / 2) * INTERVAL '1 minute'
+                FROM generate_series(1, %s) g;
+            """, (pending, pending))
+            # Chatlar: har 10 tadan bittasi faol
+            cur.execute("""
+                INSERT INTO target_chats (id, title, type, is_active)
+                SELECT -1000000000000 - g, 'chat ' || g, 'channel', g %% 10 = 0
+                FROM generate_series(1, %s) g;
+            """, (chats,))
+            cur.execute("VACUUM ANALYZE scheduled_posts;")
+            cur.execute("VACUUM ANALYZE target_chats;")
+
+            now = datetime.now(pytz.timezone("Asia/Tashkent"))
+            plans = {
+                'get_due_posts': _explain(cur, db.DUE_POSTS_QUERY, (db.POST_PENDING, db.POST_IN_PROGRESS, now, '-infinity', 0, DRAIN_PAGE_SIZE)),
+                'get_active_chats': _explain(cur, db.ACTIVE_CHATS_QUERY),
+            }
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {_EXPLAIN_SCHEMA} CASCADE;")
+        conn.close()
+
+    return {
+        'rows': rows,
+        'pending': pending,
+        'chats': chats,
+        'plans': plans,
+        'ok': not any(plan['seq_scan'] for plan in plans.values()),
+    }
+
+
+# --- BIR NECHTA NUSXA: O'TKAZUVCHANLIK VA TAKRORIY YUBORISHLAR ---
+
+_REPLICAS_SCHEMA = 'benchmark_replicas'
+
+def _replica_worker(latency: float, rate: float, barrier, results):
+    """Alohida jarayon: barcha nusxalar tayyor bo'lgach check_and_send_posts ni bajaradi."""
+    async def run():
+        delivery.limiter = delivery.RateLimiter(global_rate=rate, chat_rate_per_minute=rate * 60)
+        bot = _FakeBot(latency)
+        await async_db.get_active_chats()
+        barrier.wait()
+        start = time.time()
+        await scheduler.check_and_send_posts(bot)
+        return start, time.time(), bot.log
+
+    results.put(asyncio.run(run()))
+
+def _seed_replicas(chats: int, posts: int):
+    import db
+
+    conn = db.get_db_connection()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {_REPLICAS_SCHEMA} CASCADE;")
+            cur.execute(f"CREATE SCHEMA {_REPLICAS_SCHEMA};")
+            cur.execute(f"SET search_path TO {_REPLICAS_SCHEMA};")
+            db.apply_migrations(cur)
+            cur.execute("""
+                INSERT INTO target_chats (id, title, type)
+                SELECT -1000000000000 - g, 'chat ' || g, 'channel' FROM generate_series(1, %s) g;
+            """, (chats,))
+            cur.execute("""
+                INSERT INTO scheduled_posts (media_type, caption, schedule_time)
+                SELECT 'text', 'post ' || g, NOW() - INTERVAL '1 minute' FROM generate_series(1, %s) g;
+            """, (posts,))
+    finally:
+        conn.close()
+
+def bench_replicas(worker_counts: list, chats: int, posts: int, latency_ms: float, rate: float, shard_size: int) -> dict:
+    """
+    Har bir nusxalar soni uchun alohida sxemani to'ldirib, shuncha jarayonda bir vaqtda
+    check_and_send_posts ni ishga tushiradi. O'tkazuvchanlik va takroriy yuborishlar sanaladi.
+    Eslatma: haqiqiy Telegram limitlari bot tokeni bo'yicha umumiy, shuning uchun `rate` (va chat
+    limiti) bu yerda har bir jarayon uchun alohida va worker'lar masshtabini o'lchash uchun baland qo'yiladi.
+    """
+    # Bola jarayonlar (va ularning hovuzlari) shu sxemada ishlaydi
+    os.environ['PGOPTIONS'] = f"-c search_path={_REPLICAS_SCHEMA}"
+    os.environ['SHARD_SIZE'] = str(shard_size)
+    ctx = multiprocessing.get_context('spawn')
+    runs = []
+    try:
+        for workers in worker_counts:
+            _seed_replicas(chats, posts)
+            barrier = ctx.Barrier(workers)
+            results = ctx.Queue()
+            procs = [ctx.Process(target=_replica_worker, args=(latency_ms / 1000, rate, barrier, results)) for _ in range(workers)]
+            for proc in procs:
+                proc.start()
+            outputs = [results.get() for _ in procs]
+            for proc in procs:
+                proc.join()
+
+            sends = [entry for _, _, log in outputs for entry in log]
+            seconds = max(end for _, end, _ in outputs) - min(start for start, _, _ in outputs)
+            runs.append({
+                'workers': workers,
+                'sends': len(sends),
+                'expected': chats * posts,
+                'duplicates': len(sends) - len(set(sends)),
+                'seconds': round(seconds, 2),
+                'messages_per_second': round(len(sends) / seconds, 1),
+            })
+    finally:
+        import db
+
+        os.environ.pop('PGOPTIONS', None)
+        conn = db.get_db_connection()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {_REPLICAS_SCHEMA} CASCADE;")
+        conn.close()
+
+    base = runs[0]['messages_per_second'] / runs[0]['workers']
+    for run in runs:
+        run['scaling_efficiency'] = round(run['messages_per_second'] / (base * run['workers']), 2)
+    return {
+        'chats': chats,
+        'posts': posts,
+        'latency_ms': latency_ms,
+        'shard_size': shard_size,
+        'runs': runs,
+        'ok': all(run['duplicates'] == 0 and run['sends'] == run['expected'] for run in runs),
+    }
+
+
+# --- WEBHOOK: YANGILANISHLARNI QAYTA ISHLASH KECHIKISHI VA O'TKAZUVCHANLIGI ---
+
+def _synthetic_update(update_id: int) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': 1000 + update_id % 50, 'type': 'private'},
+            'from': {'id': 1000 + update_id % 50, 'is_bot': False, 'first_name': 'benchmark'},
+            'text': 'benchmark',
+        },
+    }
+
+async def bench_webhook(updates: int, concurrency: int, handler_ms: float) -> dict:
+    """
+    server.create_app() dagi webhook yo'liga `concurrency` ta parallel mijoz bilan `updates` ta
+    soxta yangilanish yuboradi. HTTP javob (ack) kechikishi, handler bajarilguncha kechikish
+    va yangilanish/soniya o'lchanadi. Handler `handler_ms` davomida ishlaydi, Bot API chaqirilmaydi.
+    """
+    from aiohttp import ClientSession, web
+    from aiogram import Bot, Dispatcher
+
+    bot = Bot(token="42:BENCHMARK")
+    dp = Dispatcher()
+    sent_at = {}
+    handled = []
+    all_handled = asyncio.Event()
+
+    @dp.message()
+    async def handle(message):
+        await asyncio.sleep(handler_ms / 1000)
+        handled.append((time.perf_counter() - sent_at[message.message_id]) * 1000)
+        if len(handled) == updates:
+            all_handled.set()
+
+    logging.getLogger('aiogram.event').setLevel(logging.WARNING) # har bir yangilanish logi o'lchovni buzmasin
+    runner = web.AppRunner(server.create_app(dp, bot), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    url = f"http://127.0.0.1:{port}{WEBHOOK_PATH}"
+    headers = {'X-Telegram-Bot-Api-Secret-Token': WEBHOOK_SECRET} if WEBHOOK_SECRET else {}
+
+    acks = []
+    queue = asyncio.Queue()
+    for update_id in range(1, updates + 1):
+        queue.put_nowait(update_id)
+
+    async def client(session):
+        while not queue.empty():
+            update_id = queue.get_nowait()
+            sent_at[update_id] = time.perf_counter()
+            async with session.post(url, json=_synthetic_update(update_id), headers=headers) as response:
+                await response.read()
+                acks.append((time.perf_counter() - sent_at[update_id]) * 1000)
+
+    try:
+        async with ClientSession() as session:
+            start = time.perf_counter()
+            await asyncio.gather(*(client(session) for _ in range(concurrency)))
+            await asyncio.wait_for(all_handled.wait(), timeout=60)
+            seconds = time.perf_counter() - start
+
+            # Yuklama tugagach Health Check javob vaqti
+            health_start = time.perf_counter()
+            async with session.get(f"http://127.0.0.1:{port}/health") as response:
+                health_ok = response.status == 200
+            health_ms = (time.perf_counter() - health_start) * 1000
+    finally:
+        await runner.cleanup()
+        await bot.session.close()
+
+    return {
+        'updates': updates,
+        'concurrency': concurrency,
+        'handler_ms': handler_ms,
+        'handled': len(handled),
+        'seconds': round(seconds, 2),
+        'updates_per_second': round(len(handled) / seconds, 1),
+        'ack_p50_ms': round(_percentile(acks, 50), 2),
+        'ack_p99_ms': round(_percentile(acks, 99), 2),
+        'handled_p50_ms': round(_percentile(handled, 50), 2),
+        'handled_p99_ms': round(_percentile(handled, 99), 2),
+        'health_ms': round(health_ms, 2),
+        'ok': health_ok and len(handled) == updates,
+    }
+
+
+# --- METRIKALAR: INSTRUMENTATSIYA QO'SHIMCHA XARAJATI ---
+
+def _ns_per_call(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e9
+
+async def bench_metrics(iterations: int, chats: int) -> dict:
+    """
+    Bitta yuborish va bitta DB chaqiruviga qo'shiladigan metrika amallarining narxini (ns)
+    o'lchaydi va uni soxta (kechikishsiz) bot bilan fan_out dagi bitta yuborish narxiga solishtiradi.
+    """
+    def noop():
+        return None
+
+    def send_instrumentation():
+        # delivery.fan_out dagi bitta muvaffaqiyatli yuborish uchun metrika amallari
+        start = time.perf_counter()
+        metrics.SEND_LATENCY.observe(time.perf_counter() - start)
+        metrics.SENT.inc()
+        metrics.SEND_QUEUE_DEPTH.dec()
+
+    baseline_ns = _ns_per_call(noop, iterations)
+    send_ns = _ns_per_call(send_instrumentation, iterations) - baseline_ns
+    db_ns = _ns_per_call(lambda: async_db._timed(noop), iterations) - baseline_ns
+
+    # Kechikishsiz bot va cheklovsiz limiter: faqat fan_out ning o'z narxi qoladi
+    bot = _FakeBot(0)
+    post = {'id': 1, 'media_type': 'text', 'file_id': None, 'caption': 'benchmark'}
+    rate_limiter = delivery.RateLimiter(global_rate=1e9, chat_rate_per_minute=1e9)
+    start = time.perf_counter()
+    await delivery.fan_out(range(chats), lambda chat_id: delivery.send_post(bot, post, chat_id), rate_limiter)
+    fanout_ns = (time.perf_counter() - start) / chats * 1e9
+
+    start = time.perf_counter()
+    body = metrics.render()
+    render_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        'iterations': iterations,
+        'send_instrumentation_ns': round(send_ns),
+        'db_call_instrumentation_ns': round(db_ns),
+        'fanout_ns_per_send': round(fanout_ns),
+        'overhead_percent_of_send': round(send_ns / fanout_ns * 100, 2),
+        # Haqiqiy Bot API chaqiruvi ~50 ms davom etadi
+        'overhead_percent_of_50ms_send': round(send_ns / 50e6 * 100, 4),
+        'render_ms': round(render_ms, 2),
+        'render_bytes': len(body),
+    }
+
+
+# --- STORAGE: BIR XIL SSENARIY HAR BIR BACKEND'DA ---
+
+_STORAGE_SCHEMA = 'benchmark_storage'
+
+async def _storage_run(chats: int, posts: int, latency: float) -> dict:
+    """Joriy backend'da chatlar va o'tgan vaqtli postlar yaratib, check_and_send_posts ni bajaradi."""
+    backend = storage.backend
+    chat_registry.invalidate()
+    await async_db.init_db()
+    await async_db.get_active_chats()
+    for i in range(chats):
+        await async_db.add_chat(-1000000000000 - i, f"chat {i}", 'channel')
+    for i in range(posts):
+        await async_db.add_scheduled_post('text', '', f"post {i}", datetime(2020, 1, 1))
+
+    delivery.limiter = delivery.RateLimiter(global_rate=1e9, chat_rate_per_minute=1e9)
+    bot = _FakeBot(latency)
+    start_count = backend.transaction_count
+    start = time.perf_counter()
+    await scheduler.check_and_send_posts(bot)
+    seconds = time.perf_counter() - start
+
+    return {
+        'sends': bot.sent,
+        'duplicates': len(bot.log) - len(set(bot.log)),
+        'seconds': round(seconds, 2),
+        'messages_per_second': round(bot.sent / seconds, 1),
+        'transactions': backend.transaction_count - start_count,
+        'unfinished_posts': len(await async_db.get_upcoming_schedule()),
+    }
+
+@contextmanager
+def _isolated_backend(name: str):
+    """
+    `name` backend'ini tanlaydi va toza bazada ishlatadi: SQLite ':memory:' da,
+    Postgres alohida sxemada (PGOPTIONS orqali, sxema oxirida o'chiriladi).
+    """
+    backend = storage.use(name)
+    if name == 'sqlite':
+        backend.database = ':memory:'
+    else:
+        os.environ['PGOPTIONS'] = f"-c search_path={_STORAGE_SCHEMA}"
+        _recreate_schema(_STORAGE_SCHEMA)
+    try:
+        yield backend
+    finally:
+        backend.close_pool()
+        if name != 'sqlite':
+            _recreate_schema(_STORAGE_SCHEMA, create=False)
+            os.environ.pop('PGOPTIONS', None)
+
+def _recreate_schema(schema: str, create: bool = True):
+    import db
+
+    conn = db.get_db_connection()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE;")
+            if create:
+                cur.execute(f"CREATE SCHEMA {schema};")
+    finally:
+        conn.close()
+
+def bench_storage(backends: list, chats: int, posts: int, latency_ms: float) -> dict:
+    """
+    Bir xil ssenariyni har bir backend'da bajaradi va natijalarni solishtiradi: barcha xabarlar
+    bir martadan yuborilgan va barcha postlar yakunlangan bo'lishi kerak.
+    """
+    runs = {}
+    for name in backends:
+        with _isolated_backend(name):
+            runs[name] = asyncio.run(_storage_run(chats, posts, latency_ms / 1000))
+
+    return {
+        'chats': chats,
+        'posts': posts,
+        'latency_ms': latency_ms,
+        'runs': runs,
+        'ok': all(
+            run['sends'] == chats * posts and run['duplicates'] == 0 and run['unfinished_posts'] == 0
+            for run in runs.values()
+        ),
+    }
+
+
+# --- E2E: SOXTA BOT API SERVERI BILAN TO'LIQ YUBORISH ZANJIRI ---
+
+class _FakeBotApi:
+    """
+    Bot API o'rnini bosuvchi lokal aiohttp server: har bir so'rov `latency` soniya davom etadi,
+    `flood_rate` ehtimol bilan 429 (retry_after) qaytaradi, `failing_chats` dagi chatlarga 403.
+    """
+
+    def __init__(self, latency: float, flood_rate: float, retry_after: int, failing_chats: set):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.failing_chats = failing_chats
+        self.counts = {'ok': 0, 'flood': 0, 'forbidden': 0}
+        self.items = 0 # chatlarda paydo bo'lgan xabarlar (albom copyMessages da bir nechta)
+        self.log = [] # muvaffaqiyatli yuborilgan (chat_id, matn yoki nusxalangan message_id'lar)
+
+    async def handle(self, request):
+        from aiohttp import web
+
+        data = await request.post()
+        await asyncio.sleep(self.latency)
+        chat_id = int(data['chat_id'])
+        if self.flood_rate and random.random() < self.flood_rate:
+            self.counts['flood'] += 1
+            return web.json_response({
+                'ok': False, 'error_code': 429,
+                'description': f"Too Many Requests: retry after {self.retry_after}",
+                'parameters': {'retry_after': self.retry_after},
+            }, status=429)
+        if chat_id in self.failing_chats:
+            self.counts['forbidden'] += 1
+            return web.json_response({
+                'ok': False, 'error_code': 403,
+                'description': "Forbidden: bot was kicked from the channel chat",
+            }, status=403)
+        self.counts['ok'] += 1
+        if request.match_info['method'].lower() == 'copymessages':
+            message_ids = json.loads(data['message_ids'])
+            self.items += len(message_ids)
+            self.log.append((chat_id, tuple(message_ids)))
+            return web.json_response({'ok': True, 'result': [
+                {'message_id': self.items - len(message_ids) + i + 1} for i in range(len(message_ids))
+            ]})
+        self.items += 1
+        text = data.get('text') or data.get('caption') or data.get('message_id')
+        self.log.append((chat_id, text))
+        return web.json_response({'ok': True, 'result': {
+            'message_id': self.counts['ok'],
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'channel', 'title': 'benchmark'},
+            'text': text,
+        }})
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+async def _e2e_run(chats: int, posts: int, latency: float, flood_rate: float, retry_after: int, failing: int, rate: float,
+                   album: int = 0) -> dict:
+    from aiohttp import web
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    chat_ids = [-1000000000000 - i for i in range(chats)]
+    api = _FakeBotApi(latency, flood_rate, retry_after, set(chat_ids[:failing]))
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', api.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    port = runner.addresses[0][1]
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{port}"))
+    bot = Bot(token="42:BENCHMARK", session=session)
+    send_latencies = []
+
+    @session.middleware
+    async def measure(make_request, bot, method):
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            send_latencies.append((time.perf_counter() - start) * 1000)
+
+    try:
+        # Seed: chatlar va vaqti o'tgan postlar
+        chat_registry.invalidate()
+        await async_db.init_db()
+        await async_db.get_active_chats()
+        for i, chat_id in enumerate(chat_ids):
+            await async_db.add_chat(chat_id, f"chat {i}", 'channel')
+        for i in range(posts):
+            if album:
+                # Admin chatidagi `album` ta xabardan nusxalanadigan post (har bir postda boshqa xabarlar)
+                source_ids = list(range(i * album + 1, (i + 1) * album + 1))
+                await async_db.add_scheduled_post('copy', '', f"post {i}", datetime(2020, 1, 1), 1, source_ids)
+            else:
+                await async_db.add_scheduled_post('text', '', f"post {i}", datetime(2020, 1, 1))
+
+        delivery.limiter = delivery.RateLimiter(global_rate=rate, chat_rate_per_minute=rate * 60)
+        backend = storage.backend
+        start_transactions = backend.transaction_count
+        tracemalloc.start()
+        start = time.perf_counter()
+        await scheduler.check_and_send_posts(bot)
+        seconds = time.perf_counter() - start
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        transactions = backend.transaction_count - start_transactions
+        unfinished = len(await async_db.get_upcoming_schedule())
+    finally:
+        await session.close()
+        await runner.cleanup()
+
+    # Birinchi post 403 qaytargan chatlarni nofaol qiladi, keyingilari ularga yuborilmaydi
+    expected = (chats - failing) * posts
+    return {
+        'messages_sent': api.counts['ok'],
+        'expected': expected,
+        'items_delivered': api.items,
+        'duplicates': len(api.log) - len(set(api.log)),
+        'responses': api.counts,
+        'seconds': round(seconds, 2),
+        'messages_per_second': round(api.counts['ok'] / seconds, 1),
+        'send_latency_p50_ms': round(_percentile(send_latencies, 50), 2),
+        'send_latency_p99_ms': round(_percentile(send_latencies, 99), 2),
+        'db_transactions': transactions,
+        'db_transactions_per_message': round(transactions / max(api.counts['ok'], 1), 4),
+        'peak_traced_memory_mb': round(peak_bytes / 2**20, 2),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'unfinished_posts': unfinished,
+    }
+
+def bench_e2e(backend: str, chats: int, posts: int, latency_ms: float, flood_rate: float,
+              retry_after: int, failing: int, rate: float, output: str, album: int = 0) -> dict:
+    """
+    To'liq zanjir: soxta Bot API serveri + aiogram Bot (maxsus API URL) + tanlangan storage
+    backend + scheduler.check_and_send_posts. Natija `output` fayliga ham JSON sifatida yoziladi,
+    shuning uchun commit'lar orasida solishtirish mumkin. `album` > 0 bo'lsa, postlar shuncha
+    xabardan iborat 'copy' postlari: har bir chatga bitta copyMessages chaqiruvi ketishi kerak.
+    """
+    logging.getLogger().setLevel(logging.WARNING) # har bir chat/post logi o'lchovni buzmasin
+    with _isolated_backend(backend):
+        run = asyncio.run(_e2e_run(chats, posts, latency_ms / 1000, flood_rate, retry_after, failing, rate, album))
+
+    result = {
+        'benchmark': 'e2e',
+        'commit': _git_commit(),
+        'timestamp': datetime.now(pytz.utc).isoformat(),
+        'params': {
+            'backend': backend, 'chats': chats, 'posts': posts, 'latency_ms': latency_ms,
+            'flood_rate': flood_rate, 'retry_after': retry_after, 'failing_chats': failing, 'rate': rate,
+            'album': album,
+        },
+        **run,
+        'ok': (
+            run['messages_sent'] == run['expected'] and run['duplicates'] == 0 and run['unfinished_posts'] == 0
+            and run['items_delivered'] == run['expected'] * max(album, 1)
+        ),
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(result, f, indent=2)
+    return result
+
+# --- DRAIN: KATTA BACKLOG'NI BIR TEKIS YUBORISH ---
+
+async def _drain_run(posts: int, chats: int, interval: float) -> dict:
+    chat_registry.invalidate()
+    await async_db.init_db()
+    await async_db.get_active_chats()
+    for i in range(chats):
+        await async_db.add_chat(-1000000000000 - i, f"chat {i}", 'channel')
+    # Har xil vaqtda kechikib qolgan postlar (eng eskisi birinchi yuboriladi)
+    base = datetime(2020, 1, 1)
+    for i in range(posts):
+        await async_db.add_scheduled_post('text', '', f"post {i}", base + timedelta(seconds=i))
+
+    delivery.limiter = delivery.RateLimiter(global_rate=1e9, chat_rate_per_minute=1e9)
+    bot = _FakeBot(0, keep_log=False)
+    samples = []
+
+    async def sample():
+        last_sent = 0
+        while True:
+            await asyncio.sleep(interval)
+            current, _ = tracemalloc.get_traced_memory()
+            samples.append({
+                'posts_per_second': round((bot.sent - last_sent) / chats / interval, 1),
+                'traced_memory_mb': round(current / 2**20, 2),
+                'lag_hours': round(scheduler.drain_lag / 3600, 1),
+            })
+            last_sent = bot.sent
+
+    tracemalloc.start()
+    sampler = asyncio.create_task(sample())
+    start = time.perf_counter()
+    await scheduler.check_and_send_posts(bot)
+    seconds = time.perf_counter() - start
+    sampler.cancel()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Birinchi va oxirgi (to'liq bo'lmagan) oraliqlar barqarorlikka kiritilmaydi
+    steady = [s['posts_per_second'] for s in samples[1:-1]] or [s['posts_per_second'] for s in samples]
+    memory = [s['traced_memory_mb'] for s in samples]
+    return {
+        'posts': posts,
+        'chats': chats,
+        'page_size': DRAIN_PAGE_SIZE,
+        'sent': bot.sent,
+        'unfinished_posts': len(await async_db.get_upcoming_schedule()),
+        'seconds': round(seconds, 2),
+        'posts_per_second': round(posts / seconds, 1),
+        'throughput_min': min(steady) if steady else None,
+        'throughput_max': max(steady) if steady else None,
+        'throughput_cv': round(statistics.pstdev(steady) / statistics.mean(steady), 3) if len(steady) > 1 else None,
+        'memory_first_mb': memory[0] if memory else None,
+        'memory_last_mb': memory[-1] if memory else None,
+        'peak_traced_memory_mb': round(peak_bytes / 2**20, 2),
+        'samples': samples,
+    }
+
+def bench_drain(backend: str, posts: int, chats: int, interval: float) -> dict:
+    """
+    `posts` ta kechikib qolgan postni bitta check_and_send_posts chaqiruvi bilan yuboradi va har
+    `interval` soniyada o'tkazuvchanlik, xotira (tracemalloc) va kechikishni yozib boradi.
+    Xotira backlog hajmiga bog'liq bo'lmasligi (oxirgi o'lchov birinchisidan sezilarli oshmasligi)
+    va barcha postlar yakunlanishi tekshiriladi.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    with _isolated_backend(backend):
+        result = asyncio.run(_drain_run(posts, chats, interval))
+    result['backend'] = backend
+    result['ok'] = (
+        result['sent'] == posts * chats and result['unfinished_posts'] == 0
+        and (result['memory_last_mb'] is None or result['memory_last_mb'] <= result['memory_first_mb'] * 1.5 + 1)
+    )
+    return result
+
+
+# --- HEALTH: CHATLARNI FON REJIMIDA TEKSHIRISH ---
+
+async def _health_run(chats: int, dead: int, rate: float) -> dict:
+    chat_registry.invalidate()
+    await async_db.init_db()
+    await async_db.get_active_chats()
+    chat_ids = [-1000000000000 - i for i in range(chats)]
+    for i, chat_id in enumerate(chat_ids):
+        await async_db.add_chat(chat_id, f"chat {i}", 'channel')
+
+    delivery.limiter = delivery.RateLimiter(global_rate=rate, chat_rate_per_minute=rate * 60)
+    bot = _FakeBot(0.005, keep_log=False)
+    bot.dead_chats = set(chat_ids[:dead])
+    post = {'id': 1, 'media_type': 'text', 'file_id': None, 'caption': 'benchmark'}
+
+    # 1. Tekshiruvsiz yuborish (taqqoslash uchun)
+    start = time.perf_counter()
+    await delivery.fan_out(chat_ids, lambda chat_id: delivery.send_post(bot, post, chat_id))
+    baseline = time.perf_counter() - start
+    await asyncio.sleep(1.5) # bucket to'lishi uchun
+
+    # 2. Prober ishlayotganda yuborish: tekshiruvlar yuborishlar tugaguncha kutib turishi kerak
+    prober = ChatHealthProber(bot, interval_hours=1 / 3600, max_rate=rate, batch_size=50)
+    prober.start()
+    await asyncio.sleep(0.5)
+    probes_before = bot.probes
+    start = time.perf_counter()
+    await delivery.fan_out(chat_ids, lambda chat_id: delivery.send_post(bot, post, chat_id))
+    with_prober = time.perf_counter() - start
+    probes_during = bot.probes - probes_before
+
+    # 3. Yuborish tugagach o'lik chatlar nofaol qilinishini kutish
+    start = time.perf_counter()
+    while chat_registry.count > chats - dead and time.perf_counter() - start < 60:
+        await asyncio.sleep(0.1)
+    pruned_seconds = time.perf_counter() - start
+    prober.stop()
+
+    return {
+        'chats': chats,
+        'dead_chats': dead,
+        'fan_out_seconds': round(baseline, 2),
+        'fan_out_with_prober_seconds': round(with_prober, 2),
+        'probes_during_fan_out': probes_during,
+        'probes_total': bot.probes,
+        'active_chats_after': chat_registry.count,
+        'seconds_to_prune_after_fan_out': round(pruned_seconds, 2),
+    }
+
+def bench_health(backend: str, chats: int, dead: int, rate: float) -> dict:
+    """
+    ChatHealthProber umumiy cheklovchida yuborishlarga yo'l berishini (yuborish davomida deyarli
+    tekshiruv bo'lmasligi va fan-out sekinlashmasligi) va o'lik chatlarni nofaol qilishini tekshiradi.
+    """
+    logging.getLogger().setLevel(logging.ERROR)
+    with _isolated_backend(backend):
+        result = asyncio.run(_health_run(chats, dead, rate))
+    result['backend'] = backend
+    result['ok'] = (
+        result['active_chats_after'] == chats - dead
+        and result['probes_during_fan_out'] <= rate * 0.05
+        and result['fan_out_with_prober_seconds'] <= result['fan_out_seconds'] * 1.1
+    )
+    return result
+
+
+# --- STARTUP: ISHGA TUSHISH VAQTI JADVAL HAJMIGA BOG'LIQ EMASLIGI ---
+
+async def _startup_phases() -> dict:
+    """main.on_startup() dagi DB bosqichlari (Telegram va LISTEN'siz)."""
+    startup.phases.clear()
+    chat_registry.invalidate()
+    dispatcher = PostDispatcher(lambda: asyncio.sleep(0))
+    await startup.parallel(db=async_db.init_db())
+    await startup.parallel(chats=async_db.get_active_chats(), summary=async_db.get_db_summary(),
+                           dispatcher=dispatcher.reconcile())
+    return dict(startup.phases)
+
+def _seed_history(backend, chats: int, posts: int):
+    """`posts` ta allaqachon yuborilgan post (tarix) va `chats` ta chatni to'g'ridan-to'g'ri yozadi."""
+    ph = '?' if not _is_postgres(backend) else '%s'
+    with backend.db_cursor() as cur:
+        cur.executemany(
+            f"INSERT INTO target_chats (id, title, type, is_active) VALUES ({ph}, {ph}, 'channel', TRUE);",
+            [(-1000000000000 - i, f"chat {i}") for i in range(chats)]
+        )
+        now = datetime.now(pytz.utc)
+        schedule_time = (lambda i: now.timestamp() - i) if not _is_postgres(backend) else (lambda i: now - timedelta(seconds=i))
+        cur.executemany(
+            f"INSERT INTO scheduled_posts (media_type, file_id, caption, schedule_time, status, is_sent) "
+            f"VALUES ('text', '', {ph}, {ph}, 'done', TRUE);",
+            [(f"post {i}", schedule_time(i)) for i in range(posts)]
+        )
+    if _is_postgres(backend):
+        with backend.db_cursor() as cur:
+            cur.execute("ANALYZE scheduled_posts;")
+
+def bench_startup(backend: str, chats: int, posts: int) -> dict:
+    """
+    Ishga tushishning DB bosqichlarini bo'sh bazada va `posts` ta yuborilgan post tarixi bo'lgan
+    bazada o'lchaydi. Jadvallar to'liq o'qilmagani uchun vaqt tarix hajmi bilan o'smasligi kerak.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    with _isolated_backend(backend) as selected:
+        empty = asyncio.run(_startup_phases())
+        _seed_history(selected, chats, posts)
+        seeded = asyncio.run(_startup_phases())
+        summary = asyncio.run(async_db.get_db_summary())
+
+    empty_total = sum(empty.values())
+    seeded_total = sum(seeded.values())
+    return {
+        'backend': backend,
+        'chats': chats,
+        'history_posts': posts,
+        'summary': summary,
+        'empty_ms': {name: round(seconds * 1000, 2) for name, seconds in empty.items()},
+        'seeded_ms': {name: round(seconds * 1000, 2) for name, seconds in seeded.items()},
+        'empty_total_ms': round(empty_total * 1000, 2),
+        'seeded_total_ms': round(seeded_total * 1000, 2),
+        # Faol chatlar registri (chats) chatlar soniga proporsional, bu kutilgan holat. Qolgan
+        # bosqichlar tarix hajmidan qat'i nazar bo'sh bazadagidek (o'lchov xatosi bilan) bo'lishi kerak.
+        'ok': seeded['summary'] + seeded['dispatcher'] <= max(empty['summary'] + empty['dispatcher'], 0.005) * 5,
+    }
+
+
+# --- RETENTION: ESKI POSTLARNI ARXIVLASH ---
+
+def _seed_sent_posts(backend, chats: int, posts: int, pending: int, age_days: float):
+    """`posts` ta `age_days` kun oldin `chats` ta chatga yuborilgan post va `pending` ta kutilayotgan post."""
+    ph = '?' if not _is_postgres(backend) else '%s'
+    sent_at = time.time() - age_days * 86400
+    when = (lambda ts: ts) if not _is_postgres(backend) else (lambda ts: datetime.fromtimestamp(ts, pytz.utc))
+    with backend.db_cursor() as cur:
+        cur.executemany(
+            f"INSERT INTO scheduled_posts (id, media_type, file_id, caption, schedule_time, status, is_sent) "
+            f"VALUES ({ph}, 'text', '', {ph}, {ph}, {ph}, {ph});",
+            [(i + 1, f"post {i}", when(sent_at + i), 'done', True) for i in range(posts)]
+            + [(posts + i + 1, f"pending {i}", when(time.time() + 3600 + i), 'pending', False) for i in range(pending)]
+        )
+        for post_id in range(1, posts + 1):
+            cur.executemany(
+                f"INSERT INTO post_deliveries (post_id, chat_id, status, attempts, message_id, sent_at) "
+                f"VALUES ({ph}, {ph}, 'sent', 1, {ph}, {ph});",
+                [(post_id, -1000000000000 - c, post_id * chats + c, when(sent_at + post_id)) for c in range(chats)]
+            )
+
+def _table_rows(cur, table: str) -> int:
+    cur.execute(f"SELECT COUNT(*) FROM {table};")
+    return cur.fetchone()[0]
+
+def _relation_bytes(cur, *tables) -> int:
+    cur.execute("SELECT " + " + ".join(f"pg_total_relation_size('{t}')" for t in tables) + ";")
+    return cur.fetchone()[0]
+
+def bench_retention(backend: str, chats: int, posts: int, pending: int, batch_size: int) -> dict:
+    """
+    `posts` ta eski yuborilgan postni (har biri `chats` ta yetkazish yozuvi bilan) arxivlaydi:
+    dry run hech narsani o'zgartirmasligi, issiq jadvalda faqat kutilayotgan postlar qolishi,
+    arxivdagi yuborishlar soni jurnaldagiga tengligi va partiyalar qisqaligi tekshiriladi.
+    """
+    import retention
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with _isolated_backend(backend) as selected:
+        asyncio.run(async_db.init_db())
+        _seed_sent_posts(selected, chats, posts, pending, age_days=60)
+        with selected.db_cursor() as cur:
+            before_bytes = _relation_bytes(cur, 'scheduled_posts', 'post_deliveries') if _is_postgres(selected) else None
+
+        dry = asyncio.run(retention.archive_old_posts(days=30, dry_run=True))
+        with selected.db_cursor() as cur:
+            after_dry = _table_rows(cur, 'scheduled_posts')
+
+        start = time.perf_counter()
+        run = asyncio.run(retention.archive_old_posts(days=30, batch_size=batch_size, pause=0, dry_run=False))
+        seconds = time.perf_counter() - start
+
+        with selected.db_cursor() as cur:
+            hot_posts = _table_rows(cur, 'scheduled_posts')
+            hot_deliveries = _table_rows(cur, 'post_deliveries')
+            archived = _table_rows(cur, 'scheduled_posts_archive')
+            cur.execute("SELECT COALESCE(SUM(sent_count), 0) FROM scheduled_posts_archive;")
+            archived_sent = cur.fetchone()[0]
+            archive_bytes = _relation_bytes(cur, 'scheduled_posts_archive') if _is_postgres(selected) else None
+
+    return {
+        'backend': backend,
+        'posts': posts,
+        'chats': chats,
+        'pending_posts': pending,
+        'dry_run': dry,
+        'archive': run,
+        'seconds': round(seconds, 2),
+        'hot_posts_after': hot_posts,
+        'hot_deliveries_after': hot_deliveries,
+        'archived_posts': archived,
+        'archived_sent_deliveries': archived_sent,
+        'hot_bytes_before': before_bytes,
+        'archive_bytes': archive_bytes,
+        'ok': (
+            dry['posts'] == posts and dry['deliveries'] == posts * chats and after_dry == posts + pending
+            and hot_posts == pending and hot_deliveries == 0
+            and archived == posts and archived_sent == posts * chats
+        ),
+    }
+
+
+def _import_csv(rows: int, invalid: int) -> bytes:
+    """/import uchun `rows` ta to'g'ri va `invalid` ta noto'g'ri qatorli CSV fayl."""
+    import csv
+    import io
+
+    base = datetime.now(pytz.timezone("Asia/Tashkent")).replace(tzinfo=None, microsecond=0) + timedelta(days=1)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['media_type', 'file_id', 'caption', 'schedule_time'])
+    for i in range(rows):
+        when = (base + timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M:%S')
+        if i % 3:
+            writer.writerow(['text', '', f"Import post #{i}", when])
+        else:
+            writer.writerow(['photo', f"file-{i}", f"Rasm #{i}", when])
+    bad = [
+        ['audio', 'x', 'caption', base.strftime('%Y-%m-%d %H:%M:%S')], # noma'lum media_type
+        ['photo', '', 'caption', base.strftime('%Y-%m-%d %H:%M:%S')], # file_id yo'q
+        ['text', '', 'caption', '04.11.2025 18:30'], # noto'g'ri format
+        ['text', '', 'caption', '2000-01-01 00:00:00'], # o'tib ketgan vaqt
+        ['text', '', '', base.strftime('%Y-%m-%d %H:%M:%S')], # bo'sh matn
+    ]
+    for i in range(invalid):
+        writer.writerow(bad[i % len(bad)])
+    return out.getvalue().encode()
+
+def bench_import(backend: str, rows: int, invalid: int) -> dict:
+    """
+    /import yo'lini o'lchaydi: CSV faylni tekshirish, so'ng bir xil postlarni bitta-bitta
+    add_scheduled_post() bilan va bitta add_scheduled_posts() tranzaksiyasi bilan saqlash.
+    """
+    import post_import
+
+    logging.getLogger().setLevel(logging.WARNING)
+    data = _import_csv(rows, invalid)
+
+    start = time.perf_counter()
+    posts, rejected = post_import.load(data, 'posts.csv')
+    parse_seconds = time.perf_counter() - start
+
+    with _isolated_backend(backend) as selected:
+        asyncio.run(async_db.init_db())
+
+        async def one_by_one():
+            return [await async_db.add_scheduled_post(p.media_type, p.file_id, p.caption, p.schedule_time) for p in posts]
+
+        results = {}
+        for name, run in (('per_row', one_by_one), ('bulk', lambda: async_db.add_scheduled_posts(posts))):
+            start_transactions = selected.transaction_count
+            start = time.perf_counter()
+            created = asyncio.run(run())
+            seconds = time.perf_counter() - start
+            results[name] = {
+                'created': len(created),
+                'seconds': round(seconds, 3),
+                'posts_per_second': round(len(created) / seconds, 1),
+                'transactions': selected.transaction_count - start_transactions,
+            }
+
+        with selected.db_cursor() as cur:
+            stored = _table_rows(cur, 'scheduled_posts')
+
+    return {
+        'backend': backend,
+        'rows': rows + invalid,
+        'valid': len(posts),
+        'rejected': len(rejected),
+        'parse_seconds': round(parse_seconds, 3),
+        **results,
+        'speedup': round(results['per_row']['seconds'] / results['bulk']['seconds'], 1),
+        'report': post_import.report(results['bulk']['created'], rejected, limit=5).splitlines(),
+        'ok': (
+            len(posts) == rows and len(rejected) == invalid
+            and results['bulk']['created'] == rows and results['bulk']['transactions'] == 1
+            and stored == 2 * rows
+        ),
+    }
+
+
+# --- POST_ACTIONS: YUBORILGAN POSTLARNI TAHRIRLASH VA O'CHIRISH ---
+
+async def _post_actions_run(chats: int, albums: int, rate: float) -> dict:
+    import post_actions
+
+    chat_registry.invalidate()
+    await async_db.init_db()
+    await async_db.get_active_chats()
+    for i in range(chats):
+        await async_db.add_chat(-1000000000000 - i, f"chat {i}", 'channel')
+
+    delivery.limiter = delivery.RateLimiter(global_rate=rate, chat_rate_per_minute=rate * 60)
+    bot = _FakeBot(0.005, keep_log=False)
+    bot.media_sources = {7}
+    past = datetime.now(pytz.timezone("Asia/Tashkent")).replace(tzinfo=None) - timedelta(minutes=1)
+
+    # Albomlar (10 tadan), caption'i 3-qismda bo'lgan albom, bitta rasmli copy post (turi saqlanmagan)
+    # va bitta matnli post
+    album_ids = [
+        await async_db.add_scheduled_post('copy', '', 'albom', past, 1, list(range(100 + 10 * i, 110 + 10 * i)))
+        for i in range(albums)
+    ]
+    late_caption_id = await async_db.add_scheduled_post('copy', '', 'albom', past, 1, list(range(900, 910)), 2)
+    photo_id = await async_db.add_scheduled_post('copy', '', 'rasm', past, 1, [7])
+    text_id = await async_db.add_scheduled_post('text', '', 'matn', past)
+    await scheduler.check_and_send_posts(bot)
+    sent_calls = bot.sent
+
+    edits = {}
+    edited_parts = {}
+    edited_posts = {'album': album_ids[0], 'album_late_caption': late_caption_id, 'copied_photo': photo_id, 'text': text_id}
+    for name, post_id in edited_posts.items():
+        before = bot.edits
+        bot.caption_edits = set()
+        start = time.perf_counter()
+        summary = await post_actions.edit_post(bot, post_id, f"tahrirlangan {name}")
+        edits[name] = {**summary, 'fake_api_calls': bot.edits - before, 'seconds': round(time.perf_counter() - start, 2)}
+        edited_parts[name] = bot.caption_edits
+    captions_updated = [
+        (await async_db.get_post(post_id))['caption'] for post_id in edited_posts.values()
+    ] == [f"tahrirlangan {name}" for name in edits]
+    # Albomda faqat caption'li qism tahrirlanadi: 1-qism (odatiy) yoki 3-qism
+    caption_parts_edited = all([
+        edited_parts[name] == {(chat_id, message_ids[index]) for chat_id, _, message_ids, _ in await async_db.get_post_messages([post_id])}
+        for name, post_id, index in (('album', album_ids[0], 0), ('album_late_caption', late_caption_id, 2))
+    ])
+
+    # Bot barcha chatlardan chiqarilgan: hech bir chatda tahrirlanmasa saqlangan matn o'zgarmaydi
+    bot.kicked_from = {-1000000000000 - i for i in range(chats)}
+    failed_edit = await post_actions.edit_post(bot, text_id, "hech qayerda ko'rinmaydigan matn")
+    bot.kicked_from = set()
+    failed_edit_kept_caption = (
+        failed_edit['failed'] == chats and failed_edit['caption_saved'] is False
+        and (await async_db.get_post(text_id))['caption'] == "tahrirlangan text"
+    )
+
+    post_ids = album_ids + [late_caption_id, photo_id, text_id]
+    start = time.perf_counter()
+    deleted = await post_actions.delete_posts(bot, post_ids)
+    delete_seconds = time.perf_counter() - start
+    repeated = await post_actions.delete_posts(bot, post_ids)
+    left = await async_db.get_post_messages(post_ids)
+
+    messages_per_chat = (albums + 1) * 10 + 2
+    return {
+        'chats': chats,
+        'posts': len(post_ids),
+        'send_api_calls': sent_calls,
+        'edit': edits,
+        'caption_parts_edited': caption_parts_edited,
+        'failed_edit_kept_caption': failed_edit_kept_caption,
+        'delete': {
+            **deleted,
+            'seconds': round(delete_seconds, 2),
+            'messages_deleted': bot.deleted,
+            # Har bir xabar alohida deleteMessage bilan o'chirilganda
+            'single_delete_api_calls': bot.deleted,
+        },
+        'repeated_delete_chats': repeated['chats'],
+        'messages_left_in_ledger': len(left),
+        'ok': (
+            all(e['ok'] == chats and e['failed'] == 0 for e in edits.values())
+            and edits['text']['api_calls'] == chats and edits['album']['api_calls'] == chats
+            and edits['album_late_caption']['api_calls'] == chats
+            and edits['copied_photo']['api_calls'] < chats * 1.1
+            and captions_updated and caption_parts_edited and failed_edit_kept_caption
+            and deleted['ok'] == chats
+            and deleted['api_calls'] == bot.delete_calls == chats * -(-messages_per_chat // post_actions.DELETE_BATCH_SIZE)
+            and bot.deleted == chats * messages_per_chat
+            and repeated['chats'] == 0 and not left
+        ),
+    }
+
+def bench_post_actions(backend: str, chats: int, albums: int, rate: float) -> dict:
+    """
+    Postlarni yuborib, so'ng /editpost va /deletepost yo'lini o'lchaydi: har bir chatda bitta tahrirlash
+    chaqiruvi, o'chirish esa chatdagi barcha xabarlar (albomlar) uchun 100 tadan partiyalab.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    with _isolated_backend(backend):
+        result = asyncio.run(_post_actions_run(chats, albums, rate))
+    result['backend'] = backend
+    return result
+
+
+# --- POOL: BIR NECHTA BOT TOKENI ORQALI YUBORISH ---
+
+async def _pool_run(chats: int, helpers: int, rate: float, kicked: int) -> dict:
+    import bot_pool
+    import post_actions
+
+    chat_registry.invalidate()
+    await async_db.init_db()
+    await async_db.get_active_chats()
+    chat_ids = [-1000000000000 - i for i in range(chats)]
+    for i, chat_id in enumerate(chat_ids):
+        await async_db.add_chat(chat_id, f"chat {i}", 'channel')
+
+    make_limiter = lambda: delivery.RateLimiter(global_rate=rate, chat_rate_per_minute=rate * 60)
+    primary = _FakeBot(0.005, keep_log=False)
+    helper_bots = []
+    for n in range(helpers):
+        helper = _FakeBot(0.005, keep_log=False)
+        helper.id = 43 + n
+        # Har bir yordamchi bot chatlarning to'rtdan birida a'zo emas
+        helper.dead_chats = set(chat_ids[n::4])
+        helper_bots.append(helper)
+    bots = [primary] + helper_bots
+    past = datetime.now(pytz.timezone("Asia/Tashkent")).replace(tzinfo=None) - timedelta(minutes=1)
+
+    async def deliver(warm_up: bool = True) -> dict:
+        """Rasmli copy postni barcha chatlarga yuboradi. Avval bucket'larni bo'shatuvchi isitish posti."""
+        if warm_up:
+            await async_db.add_scheduled_post('copy', '', 'isitish', past, 1, [7])
+            await scheduler.check_and_send_posts(primary)
+        sent_before = [b.sent for b in bots]
+        post_id = await async_db.add_scheduled_post('copy', '', 'benchmark', past, 1, [7])
+        start = time.perf_counter()
+        await scheduler.check_and_send_posts(primary)
+        seconds = time.perf_counter() - start
+        delivered = len(await async_db.get_post_messages([post_id]))
+        return {
+            'post_id': post_id,
+            'seconds': round(seconds, 2),
+            'messages_per_second': round(delivered / seconds, 1),
+            'delivered': delivered,
+            'sent_per_bot': {b.id: b.sent - sent for b, sent in zip(bots, sent_before)},
+        }
+
+    try:
+        # 1. Bitta bot (pool'siz)
+        delivery.limiter = make_limiter()
+        bot_pool.pool = None
+        single = await deliver()
+
+        # 2. Chatlarni botlarga biriktirish (tekshiruvlar tezligi o'lchovga ta'sir qilmasin)
+        assigner = bot_pool.BotPool(primary, helper_bots, staging_chat_id=-999,
+                                    rate_limiter_factory=lambda: delivery.RateLimiter(global_rate=10000))
+        await assigner.load()
+        start = time.perf_counter()
+        while await assigner.assign_pending():
+            pass
+        assign_seconds = time.perf_counter() - start
+
+        # 3. Pool orqali yuborish (biriktirishlar DB dan o'qiladi)
+        delivery.limiter = make_limiter()
+        pool = bot_pool.pool = bot_pool.BotPool(primary, helper_bots, staging_chat_id=-999, rate_limiter_factory=make_limiter)
+        await pool.load()
+        chats_per_bot = pool.chats_per_bot()
+        pooled = await deliver()
+
+        # 4. Yordamchi bot `kicked` ta chatdan chiqarilgan: chatlar asosiy botga o'tishi kerak
+        kicked_chats = [chat_id for chat_id, bot_id in await async_db.get_chat_bots() if bot_id == helper_bots[0].id][:kicked]
+        helper_bots[0].kicked_from = set(kicked_chats)
+        fallback = await deliver(warm_up=False)
+        moved = sum(1 for chat_id, bot_id in await async_db.get_chat_bots() if chat_id in helper_bots[0].kicked_from and bot_id == primary.id)
+
+        # 5. Yordamchi bot chatlarga qaytarilgan, lekin chatlar asosiy botda qoldi: 3-qadamdagi post
+        # xabarlarini ularni yuborgan bot tahrirlaydi
+        helper_bots[0].kicked_from = set()
+        edit_after_move = await post_actions.edit_post(primary, pooled['post_id'], "tahrirlangan")
+
+        # 6. Oxirgi yordamchi bot pool'dan olib tashlangan: uning xabarlari asosiy bot orqali (xato sifatida)
+        removed = helper_bots[-1]
+        removed_messages = sum(
+            1 for _, _, _, bot_id in await async_db.get_post_messages([pooled['post_id']]) if bot_id == removed.id
+        )
+        pool = bot_pool.pool = bot_pool.BotPool(primary, helper_bots[:-1], staging_chat_id=-999, rate_limiter_factory=make_limiter)
+        await pool.load()
+        edit_after_removal = await post_actions.edit_post(primary, pooled['post_id'], "yana tahrirlangan")
+    finally:
+        bot_pool.pool = None
+
+    return {
+        'chats': chats,
+        'bots': len(bots),
+        'rate_per_bot': rate,
+        'single_bot': single,
+        'assign_seconds': round(assign_seconds, 2),
+        'chats_per_bot': chats_per_bot,
+        'pool': pooled,
+        'speedup': round(single['seconds'] / pooled['seconds'], 2),
+        'kicked_helper_fallback': {
+            **fallback,
+            'kicked_chats': len(kicked_chats),
+            'moved_to_primary': moved,
+            'active_chats_after': chat_registry.count,
+        },
+        'edit_after_move': {key: edit_after_move[key] for key in ('ok', 'failed', 'sender_missing')},
+        'edit_after_removal': {
+            **{key: edit_after_removal[key] for key in ('ok', 'failed', 'sender_missing')},
+            'removed_bot_messages': removed_messages,
+        },
+    }
+
+def bench_pool(backend: str, chats: int, helpers: int, rate: float, kicked: int) -> dict:
+    """
+    Bitta bot va asosiy + `helpers` ta yordamchi bot bilan yuborishni solishtiradi: har bir botning o'z
+    limiti bo'lgani uchun tezlik botlar soniga yaqin marta oshishi, chatlar teng taqsimlanishi, chiqarilgan
+    yordamchi botning chatlari esa nofaol qilinmasdan asosiy botga o'tishi kerak.
+    """
+    logging.getLogger().setLevel(logging.ERROR)
+    with _isolated_backend(backend):
+        result = asyncio.run(_pool_run(chats, helpers, rate, kicked))
+    result['backend'] = backend
+    loads = list(result['chats_per_bot'].values())
+    fallback = result['kicked_helper_fallback']
+    result['ok'] = (
+        result['single_bot']['delivered'] == result['pool']['delivered'] == chats
+        and result['speedup'] >= result['bots'] * 0.75
+        and max(loads) - min(loads) <= chats * 0.05 + 1
+        and fallback['delivered'] == chats
+        and fallback['moved_to_primary'] == fallback['kicked_chats'] == kicked
+        and fallback['active_chats_after'] == chats
+        # Tahrir chatning hozirgi botiga emas, xabarni yuborgan botga boradi
+        and result['edit_after_move']['ok'] == chats and result['edit_after_move']['sender_missing'] == 0
+        and result['edit_after_removal']['sender_missing'] == result['edit_after_removal']['removed_bot_messages'] > 0
+        and result['edit_after_removal']['ok'] == chats - result['edit_after_removal']['removed_bot_messages']
+    )
+    return result
+
+
+# --- RECURRING: TAKRORLANUVCHI POSTLAR (FAQAT NAVBATDAGI POST SAQLANADI) ---
+
+def _dst_check(years: int = 2) -> dict:
+    """'0 9 * * *' ning har bir vaqti o'z mintaqasida 09:00 da va har kuni bir martadan bo'lishi kerak."""
+    import recurrence
+
+    result = {}
+    for timezone in ('Asia/Tashkent', 'Europe/Berlin', 'America/New_York'):
+        tz = pytz.timezone(timezone)
+        when = datetime.now(tz)
+        times = []
+        for _ in range(365 * years):
+            when = recurrence.next_occurrence('0 9 * * *', timezone, when)
+            times.append(when.astimezone(tz))
+        result[timezone] = {
+            'occurrences': len(times),
+            'offsets': sorted({str(t.utcoffset()) for t in times}),
+            'ok': all(t.hour == 9 and t.minute == 0 for t in times) and len({t.date() for t in times}) == len(times),
+        }
+    return result
+
+async def _recurring_run(backend, schedules: int, horizon_days: int, chats: int, rounds: int) -> dict:
+    chat_registry.invalidate()
+    await async_db.init_db()
+    await async_db.get_active_chats()
+    for i in range(chats):
+        await async_db.add_chat(-1000000000000 - i, f"chat {i}", 'channel')
+    delivery.limiter = delivery.RateLimiter(global_rate=100000, chat_rate_per_minute=100000 * 60)
+    bot = _FakeBot(0.001, keep_log=False)
+    ph = '?' if not _is_postgres(backend) else '%s'
+
+    async def upcoming() -> dict:
+        start = time.perf_counter()
+        rows = await async_db.get_upcoming_schedule()
+        return {'rows': len(rows), 'ms': round((time.perf_counter() - start) * 1000, 2)}
+
+    # 1. Avvalgi usul: har kungi post uchun `horizon_days` ta qator oldindan
+    tomorrow = datetime.now(pytz.timezone("Asia/Tashkent")).replace(tzinfo=None, hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    await async_db.add_scheduled_posts([
+        ('text', '', f"kunlik {n}", tomorrow + timedelta(days=day)) for n in range(schedules) for day in range(horizon_days)
+    ])
+    expanded = await upcoming()
+    with backend.db_cursor() as cur:
+        cur.execute("DELETE FROM scheduled_posts;")
+
+    # 2. Takrorlanuvchi post: bitta jadval qatori va bitta navbatdagi post
+    created = [await async_db.add_recurring_post('text', '', f"kunlik {n}", '0 9 * * *', 'Asia/Tashkent') for n in range(schedules)]
+    recurring = await upcoming()
+
+    # 3. Har bir aylanishda navbatdagi postlar "vaqti keldi" qilinadi: yuborilgach har bir jadvalning
+    # yangi posti shu tranzaksiyada paydo bo'lishi va dispatcher'ga qaytarilishi kerak
+    cycles = []
+    for _ in range(rounds):
+        past = time.time() - 60
+        with backend.db_cursor() as cur:
+            cur.execute(
+                f"UPDATE scheduled_posts SET schedule_time = {ph} WHERE status = {ph} AND schedule_id IS NOT NULL;",
+                (past if not _is_postgres(backend) else datetime.fromtimestamp(past, pytz.utc), storage.POST_PENDING)
+            )
+        sent_before = bot.sent
+        start = time.perf_counter()
+        occurrences = await scheduler.check_and_send_posts(bot)
+        seconds = time.perf_counter() - start
+        pending = await async_db.get_upcoming_schedule()
+        cycles.append({
+            'seconds': round(seconds, 2),
+            'sent': bot.sent - sent_before,
+            'next_occurrences_returned': len(occurrences),
+            'pending_rows': len(pending),
+            'all_in_future': all(when.timestamp() > time.time() for _, when in pending),
+            'returned_match_pending': sorted(post_id for post_id, _ in occurrences) == sorted(post_id for post_id, _ in pending),
+        })
+
+    # 4. Allaqachon rejalashtirilgan postni qayta rejalashtirish keyingi postni takror yaratmaydi
+    replanned = await async_db.plan_due_post(created[0][1], await async_db.get_active_chats())
+    after_replan = len(await async_db.get_upcoming_schedule())
+
+    # 5. Jadvalni to'xtatish uning navbatdagi postini ham o'chiradi
+    cancelled = await async_db.cancel_post_schedule(created[0][0])
+    with backend.db_cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) FROM scheduled_posts WHERE schedule_id = {ph} AND status = {ph};", (created[0][0], storage.POST_PENDING))
+        cancelled_pending = cur.fetchone()[0]
+    active_schedules = len(await async_db.get_post_schedules())
+    with backend.db_cursor() as cur:
+        schedule_rows = _table_rows(cur, 'post_schedules')
+
+    return {
+        'schedules': schedules,
+        'chats': chats,
+        'expanded_rows_for_horizon': expanded,
+        'recurring_rows': recurring,
+        'schedule_rows': schedule_rows,
+        'cycles': cycles,
+        'replan_returned': replanned,
+        'pending_after_replan': after_replan,
+        'cancelled': cancelled,
+        'cancelled_schedule_pending_posts': cancelled_pending,
+        'active_schedules_after_cancel': active_schedules,
+    }
+
+def bench_recurring(backend: str, schedules: int, horizon_days: int, chats: int, rounds: int) -> dict:
+    """
+    Har kungi postlarni oldindan `horizon_days` kunga yoyish bilan takrorlanuvchi jadvalni solishtiradi:
+    kutilayotgan qatorlar soni jadvallar soniga teng qolishi, har bir yuborishdan keyin har bir jadvalning
+    aynan bitta keyingi posti yaratilishi va vaqtlar yozgi vaqtga o'tishda ham to'g'ri bo'lishi kerak.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    with _isolated_backend(backend) as selected:
+        result = asyncio.run(_recurring_run(selected, schedules, horizon_days, chats, rounds))
+    result['backend'] = backend
+    result['dst'] = _dst_check()
+    result['ok'] = (
+        result['expanded_rows_for_horizon']['rows'] == schedules * horizon_days
+        and result['recurring_rows']['rows'] == result['schedule_rows'] == schedules
+        and all(
+            c['sent'] == schedules * chats and c['next_occurrences_returned'] == c['pending_rows'] == schedules
+            and c['all_in_future'] and c['returned_match_pending']
+            for c in result['cycles']
+        )
+        and result['replan_returned'] is None and result['pending_after_replan'] == schedules
+        and result['cancelled'] and result['cancelled_schedule_pending_posts'] == 0
+        and result['active_schedules_after_cancel'] == schedules - 1
+        and all(check['ok'] for check in result['dst'].values())
+    )
+    return result
+
+
+# --- FSM: ADMIN JARAYONLARI QAYTA ISHGA TUSHISHDAN OMON QOLISHI ---
+
+_FSM_ADMIN_ID = 777
+
+def _admin_update(update_id: int, text: str) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': _FSM_ADMIN_ID, 'type': 'private'},
+            'from': {'id': _FSM_ADMIN_ID, 'is_bot': False, 'first_name': 'admin'},
+            'text': text,
+        },
+    }
+
+async def _fsm_restart(backend, storage_kind: str) -> dict:
+    """
+    /newpost -> post (process_post_content) -> bot qayta ishga tushadi (main qayta yuklanadi, yangi
+    Dispatcher va bo'sh kesh) -> vaqt (process_schedule_time). Post rejalashtirilishi kerak.
+    """
+    import importlib
+
+    from aiohttp import web
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from aiogram.types import Update
+
+    import config
+
+    api = _FakeBotApi(0, 0, 0, set())
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', api.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    bot = Bot(token="42:BENCHMARK", session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{runner.addresses[0][1]}")))
+
+    # main.py import paytida token va admin ro'yxatini o'qiydi
+    config.BOT_TOKEN = config.BOT_TOKEN or "42:BENCHMARK"
+    config.ADMIN_ID = [_FSM_ADMIN_ID]
+
+    def start_bot():
+        main = importlib.reload(sys.modules['main']) if 'main' in sys.modules else importlib.import_module('main')
+        if storage_kind == 'memory':
+            main.dp.fsm.storage = MemoryStorage()
+        return main
+
+    async def feed(main, update_id: int, text: str):
+        await main.dp.feed_update(bot, Update.model_validate(_admin_update(update_id, text), context={'bot': bot}))
+
+    def fsm_rows() -> int:
+        with backend.db_cursor() as cur:
+            return _table_rows(cur, 'fsm_states')
+
+    try:
+        await async_db.init_db()
+        await async_db.add_chat(-1000000000000, "chat", 'channel')
+        main = start_bot()
+        await feed(main, 1, '/newpost')
+        await feed(main, 2, "Qayta ishga tushishdan omon qolgan post")
+        rows_before_restart = fsm_rows()
+
+        main = start_bot()
+        schedule_time = datetime.now(pytz.timezone("Asia/Tashkent")) + timedelta(days=1)
+        await feed(main, 3, schedule_time.strftime('%Y-%m-%d %H:%M:%S'))
+        upcoming = await async_db.get_upcoming_schedule()
+        post = await async_db.get_post(upcoming[0][0]) if upcoming else None
+        rows_after = fsm_rows()
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+
+    return {
+        'fsm_rows_before_restart': rows_before_restart,
+        'posts_scheduled_after_restart': len(upcoming),
+        'caption': post['caption'] if post else None,
+        'fsm_rows_after_finish': rows_after,
+        'bot_replies': len(api.log),
+    }
+
+async def _fsm_latency(updates: int, ttl: float) -> dict:
+    """Bitta yangilanishdagi odatiy o'qishlar: holat filtri (get_state) va handler'dagi get_data."""
+    from aiogram.fsm.storage.base import StorageKey
+
+    from fsm_storage import DbStorage
+
+    fsm = DbStorage(ttl=ttl)
+    key = StorageKey(bot_id=42, chat_id=_FSM_ADMIN_ID, user_id=_FSM_ADMIN_ID)
+    await fsm.set_state(key, 'PostState:waiting_for_schedule_time')
+    await fsm.set_data(key, {'media_type': 'copy', 'source_message_ids': [1, 2, 3]})
+    latencies = []
+    for _ in range(updates):
+        start = time.perf_counter()
+        await fsm.get_state(key)
+        await fsm.get_data(key)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        'ttl_seconds': ttl,
+        'db_reads': fsm.reads,
+        'update_p50_ms': round(_percentile(latencies, 50), 3),
+        'update_p99_ms': round(_percentile(latencies, 99), 3),
+    }
+
+async def _fsm_replicas() -> dict:
+    """Ikki nusxa (ikki DbStorage): A yozgan holat B ning keshida NOTIFY orqali TTL dan ancha oldin yangilanadi."""
+    from aiogram.fsm.storage.base import StorageKey
+
+    from db import FSM_CHANGED_CHANNEL
+    from fsm_storage import DbStorage
+
+    listener = storage.notify_listener()
+    first, second = DbStorage(ttl=60), DbStorage(ttl=60)
+    for replica in (first, second):
+        listener.subscribe(FSM_CHANGED_CHANNEL, replica.apply_notify)
+    await listener.start()
+    try:
+        key = StorageKey(bot_id=42, chat_id=_FSM_ADMIN_ID, user_id=_FSM_ADMIN_ID)
+        # Ikkala keshda ham eski holat (None)
+        await first.get_state(key)
+        await second.get_state(key)
+        start = time.perf_counter()
+        await first.set_state(key, 'PostState:waiting_for_post')
+        first_reads = first.reads
+        while await second.get_state(key) != 'PostState:waiting_for_post' and time.perf_counter() - start < 5:
+            await asyncio.sleep(0.005)
+        seen_ms = (time.perf_counter() - start) * 1000
+        # O'zining NOTIFY'i (shu paytgacha kelgan) yozuvchi keshini tozalamaydi
+        state = await first.get_state(key)
+    finally:
+        listener.stop()
+    return {
+        'cache_ttl_seconds': 60,
+        'visible_on_other_replica_ms': round(seen_ms, 1),
+        'writer_cache_kept': first.reads == first_reads and state == 'PostState:waiting_for_post',
+    }
+
+def bench_fsm(backend: str, updates: int) -> dict:
+    """
+    DbStorage bilan admin jarayoni bot qayta ishga tushganda ham davom etishini (xotiradagi storage
+    bilan esa yo'qolishini), kesh bir yangilanishdagi DB o'qishlarini kamaytirishini va Postgres'da
+    boshqa nusxa yozgan holat NOTIFY orqali darhol ko'rinishini tekshiradi.
+    """
+    logging.getLogger().setLevel(logging.ERROR)
+    result = {'backend': backend, 'restart': {}}
+    for storage_kind in ('memory', 'db'):
+        with _isolated_backend(backend) as selected:
+            result['restart'][storage_kind] = asyncio.run(_fsm_restart(selected, storage_kind))
+    with _isolated_backend(backend):
+        asyncio.run(async_db.init_db())
+        result['latency'] = {
+            'no_cache': asyncio.run(_fsm_latency(updates, ttl=0)),
+            'cached': asyncio.run(_fsm_latency(updates, ttl=5)),
+        }
+        result['replicas'] = asyncio.run(_fsm_replicas()) if backend != 'sqlite' else None
+
+    memory, persisted = result['restart']['memory'], result['restart']['db']
+    result['ok'] = (
+        memory['posts_scheduled_after_restart'] == 0
+        and persisted['posts_scheduled_after_restart'] == 1
+        and persisted['caption'] == "Qayta ishga tushishdan omon qolgan post"
+        and persisted['fsm_rows_before_restart'] == 1 and persisted['fsm_rows_after_finish'] == 0
+        and result['latency']['no_cache']['db_reads'] == 2 * updates
+        and result['latency']['cached']['db_reads'] <= 2
+        and (result['replicas'] is None or (
+            result['replicas']['visible_on_other_replica_ms'] < 1000 and result['replicas']['writer_cache_kept']
+        ))
+    )
+    return result
+
+
+
+# --- SEKIN AMALLAR JURNALI VA /profile ---
+
+class _LogCapture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+async def _slowlog_overhead(iterations: int, calls: int) -> dict:
+    """Chegaradan tez amallarga qo'shiladigan narx (ns): taqqoslash, kontekst o'tkazish va chat_id o'rnatish."""
+    def noop():
+        return None
+
+    elapsed = 0.001
+    check_ns = _ns_per_call(lambda: elapsed >= slowlog.db_threshold, iterations) - _ns_per_call(lambda: elapsed, iterations)
+    baseline_ns = _ns_per_call(noop, iterations)
+    copy_context_ns = _ns_per_call(lambda: contextvars.copy_context().run(noop), iterations) - baseline_ns
+    chat_id_ns = _ns_per_call(lambda: slowlog.chat_id.reset(slowlog.chat_id.set(1)), iterations) - baseline_ns
+
+    # async_db.run: executor'ga o'tish kontekst o'tkazmasdan (avvalgi usul) va o'tkazib
+    loop = asyncio.get_running_loop()
+    for _ in range(100):
+        await async_db.run(noop) # thread'larni isitish
+    start = time.perf_counter()
+    for _ in range(calls):
+        await loop.run_in_executor(async_db._executor, functools.partial(async_db._timed, noop))
+    plain_us = (time.perf_counter() - start) / calls * 1e6
+    start = time.perf_counter()
+    for _ in range(calls):
+        await async_db.run(noop)
+    run_us = (time.perf_counter() - start) / calls * 1e6
+
+    return {
+        'threshold_check_ns': round(check_ns, 1),
+        'copy_context_ns': round(copy_context_ns),
+        'chat_id_set_reset_ns': round(chat_id_ns),
+        'db_run_without_context_us': round(plain_us, 1),
+        'db_run_us': round(run_us, 1),
+        # Bitta yuborish (~50 ms) uchun: taqqoslash + chat_id o'rnatish
+        'overhead_percent_of_50ms_send': round((check_ns + chat_id_ns) / 50e6 * 100, 5),
+    }
+
+async def _slowlog_run(chats: int, slow: int) -> dict:
+    """
+    Bir nechta chatga yuborish sekin bo'lgan postni yuboradi: faqat o'sha chatlar post_id/chat_id bilan
+    logga tushishi va shard ichidagi DB chaqiruvlari post_id ni ko'rishi tekshiriladi.
+    """
+    chat_registry.invalidate()
+    await async_db.init_db()
+    await async_db.get_active_chats()
+    chat_ids = [-1000000000000 - i for i in range(chats)]
+    for i, chat_id in enumerate(chat_ids):
+        await async_db.add_chat(chat_id, f"chat {i}", 'channel')
+
+    bot = _FakeBot(0.001, keep_log=False)
+    slow_chats = set(random.sample(chat_ids, slow))
+    bot.slow_chats = {chat_id: 0.1 for chat_id in slow_chats}
+    past = datetime.now(pytz.timezone("Asia/Tashkent")).replace(tzinfo=None) - timedelta(minutes=1)
+    post_id = await async_db.add_scheduled_post('text', '', 'benchmark', past)
+
+    capture = _LogCapture()
+    slowlog.logger.addHandler(capture)
+    slowlog.logger.setLevel(logging.WARNING)
+    slowlog.logger.propagate = False
+    thresholds = slowlog.db_threshold, slowlog.send_threshold
+    # Yuborish chegarasi sekin chatlar kechikishidan past, DB chegarasi 0: har bir DB chaqiruvi logga tushadi
+    slowlog.db_threshold, slowlog.send_threshold = 0, 0.05
+    slow_before = metrics.SLOW_SEND._value.get()
+    try:
+        await scheduler.check_and_send_posts(bot)
+    finally:
+        slowlog.db_threshold, slowlog.send_threshold = thresholds
+        slowlog.logger.removeHandler(capture)
+        slowlog.logger.setLevel(logging.NOTSET)
+        slowlog.logger.propagate = True
+
+    sends = [m for m in capture.messages if m.startswith("Sekin yuborish")]
+    logged_chats = {int(m.rsplit('chat_id=', 1)[1].rstrip(')')) for m in sends if 'chat_id=' in m}
+    db_calls = [m for m in capture.messages if m.startswith("Sekin DB")]
+    # Shard ichidagi chaqiruvlar (yuborilmagan chatlar, jurnal yozuvi, shard'ni yakunlash)
+    shard_calls = [m for m in db_calls if m.split()[3] in ('get_pending_deliveries', 'record_deliveries', 'complete_delivery_shard')]
+    return {
+        'chats': chats,
+        'delivered': bot.sent,
+        'slow_chats': slow,
+        'slow_sends_logged': len(sends),
+        'slow_sends_metric': metrics.SLOW_SEND._value.get() - slow_before,
+        'logged_chats_match': logged_chats == slow_chats,
+        'sends_have_post_id': all(f"post_id={post_id}" in m for m in sends),
+        'db_calls_logged': len(db_calls),
+        'shard_db_calls': len(shard_calls),
+        'shard_db_calls_have_post_id': bool(shard_calls) and all(f"post_id={post_id}" in m for m in shard_calls),
+        'example': sends[0] if sends else None,
+    }
+
+def _burn(seconds: float):
+    """Event loop'ni band qiluvchi CPU ishi."""
+    deadline = time.perf_counter() + seconds
+    n = 0
+    while time.perf_counter() < deadline:
+        n += 1
+    return n
+
+def _db_busy(seconds: float):
+    """Executor thread'idagi CPU ishi (sekin so'rov o'rniga)."""
+    return _burn(seconds)
+
+async def _profile_run(seconds: float) -> dict:
+    """
+    Event loop vaqtining bir qismi _burn da o'tadigan yuklama ostida profil yig'adi: natija collapsed-stack
+    formatida ekanini, namunalardagi _burn ulushi haqiqiy ulushga yaqinligini va profiler loop'ni
+    qanchalik sekinlashtirishini tekshiradi.
+    """
+    async def workload(duration: float):
+        """(bajarilgan _burn iteratsiyalari, loop vaqtining _burn dagi ulushi)."""
+        iterations, busy = 0, 0.0
+        start = time.perf_counter()
+        while time.perf_counter() < start + duration:
+            began = time.perf_counter()
+            iterations += _burn(0.002)
+            busy += time.perf_counter() - began
+            await asyncio.sleep(0.002)
+        return iterations, busy / (time.perf_counter() - start)
+
+    before, _ = await workload(seconds)
+    (data, samples), (with_profiler, burn_share) = await asyncio.gather(profiler.profile(seconds), workload(seconds))
+    after, _ = await workload(seconds)
+    without = (before + after) / 2
+    # Executor thread'idagi ish ham profilga tushadi
+    (db_data, _), _ = await asyncio.gather(profiler.profile(seconds / 2), async_db.run(_db_busy, seconds / 2))
+    db_stacks = [line.rsplit(' ', 1)[0] for line in db_data.decode().splitlines()]
+
+    # Ikkinchi /profile birinchisi tugaguncha rad etiladi
+    first = asyncio.create_task(profiler.profile(0.2))
+    await asyncio.sleep(0.01)
+    try:
+        await profiler.profile(0.1)
+        concurrent_rejected = False
+    except ValueError:
+        concurrent_rejected = True
+    await first
+
+    lines = data.decode().splitlines()
+    parsed = [line.rsplit(' ', 1) for line in lines]
+    well_formed = all(len(p) == 2 and p[1].isdigit() and p[0] for p in parsed)
+    loop_stacks = [(stack, int(count)) for stack, count in parsed if stack.startswith('MainThread;')]
+    loop_samples = sum(count for _, count in loop_stacks)
+    burn_samples = sum(count for stack, count in loop_stacks if '_burn (' in stack)
+    return {
+        'seconds': seconds,
+        'samples': samples,
+        'lines': len(lines),
+        'bytes': len(data),
+        'well_formed': well_formed,
+        'loop_samples': loop_samples,
+        'burn_share_actual': round(burn_share, 2),
+        'burn_share_sampled': round(burn_samples / max(loop_samples, 1), 2),
+        'db_busy_seen': any(stack.startswith(async_db._executor._thread_name_prefix) and '_db_busy (' in stack for stack in db_stacks),
+        'loop_slowdown_percent': round((1 - with_profiler / without) * 100, 1),
+        'concurrent_rejected': concurrent_rejected,
+    }
+
+
+def bench_slowlog(backend: str, chats: int, slow: int, iterations: int, profile_seconds: float) -> dict:
+    """
+    Sekin amallar jurnali tez amallarga deyarli narx qo'shmasligini, sekin yuborishlar va DB chaqiruvlari
+    post_id/chat_id bilan yozilishini hamda /profile flame graph uchun to'g'ri fayl berishini tekshiradi.
+    """
+    logging.getLogger().setLevel(logging.ERROR)
+    with _isolated_backend(backend):
+        result = {
+            'backend': backend,
+            'overhead': asyncio.run(_slowlog_overhead(iterations, 2000)),
+            'context': asyncio.run(_slowlog_run(chats, slow)),
+            'profile': asyncio.run(_profile_run(profile_seconds)),
+        }
+    context, profile = result['context'], result['profile']
+    result['ok'] = (
+        context['delivered'] == chats
+        and context['slow_sends_logged'] == slow == context['slow_sends_metric']
+        and context['logged_chats_match'] and context['sends_have_post_id']
+        and context['shard_db_calls_have_post_id']
+        and result['overhead']['threshold_check_ns'] < 100
+        and profile['well_formed'] and profile['db_busy_seen'] and profile['concurrent_rejected']
+        and abs(profile['burn_share_sampled'] - profile['burn_share_actual']) <= 0.15
+    )
+    return result
+
+
+
+# --- YETKAZISH STATISTIKASI (/stats) ---
+
+def _ledger_truth(backend) -> dict:
+    """Hisoblagichlar bilan solishtirish uchun post_deliveries ni to'liq o'qib sanaydi."""
+    with backend.db_cursor() as cur:
+        cur.execute("SELECT post_id, chat_id, status FROM post_deliveries WHERE status <> 'pending';")
+        rows = cur.fetchall()
+    posts, chats = {}, {}
+    for post_id, chat_id, status in rows:
+        i = 0 if status == 'sent' else 1
+        posts.setdefault(post_id, [0, 0])[i] += 1
+        chats.setdefault(chat_id, [0, 0])[i] += 1
+    return {
+        'sent': sum(p[0] for p in posts.values()),
+        'failed': sum(p[1] for p in posts.values()),
+        'posts': posts,
+        'chats': chats,
+    }
+
+def _stats_counters(backend) -> dict:
+    with backend.db_cursor() as cur:
+        cur.execute("SELECT post_id, sent, failed FROM post_stats;")
+        posts = {post_id: [sent, failed] for post_id, sent, failed in cur.fetchall()}
+        cur.execute("SELECT chat_id, sent, failed FROM chat_stats;")
+        chats = {chat_id: [sent, failed] for chat_id, sent, failed in cur.fetchall()}
+        cur.execute("SELECT COALESCE(SUM(posts), 0), COALESCE(SUM(sent), 0), COALESCE(SUM(failed), 0) FROM hourly_stats;")
+        hourly = list(cur.fetchone())
+    return {'posts': posts, 'chats': chats, 'hourly': hourly}
+
+def _rebuild_stats(backend):
+    """Hisoblagich jadvallarini tozalab, 13-migratsiyani qayta bajaradi (boshlang'ich qiymatlar tarixdan)."""
+    with backend.db_cursor() as cur:
+        for table in ('post_stats', 'hourly_stats', 'chat_stats', 'delivery_totals'):
+            cur.execute(f"DELETE FROM {table};")
+        cur.execute("DELETE FROM schema_migrations WHERE version = 13;")
+    asyncio.run(async_db.init_db())
+
+def _rollups_agree(backend, totals: dict) -> bool:
+    """Soat va chat bo'yicha hisoblagichlar yig'indisi jami qiymatlarga tengmi."""
+    counters = _stats_counters(backend)
+    chats = [sum(c[0] for c in counters['chats'].values()), sum(c[1] for c in counters['chats'].values())]
+    return counters['hourly'] == [totals['posts'], totals['sent'], totals['failed']] and chats == [totals['sent'], totals['failed']]
+
+async def _stats_run(backend, chats: int, posts: int, failing: int) -> dict:
+    """
+    Haqiqiy yuborish zanjiri (scheduler + fan_out + LedgerWriter) orqali postlar yuboriladi, ba'zi chatlardan
+    bot chiqarilgan: hisoblagichlar jurnalni to'liq sanash natijasiga aynan teng bo'lishi kerak.
+    """
+    chat_registry.invalidate()
+    await async_db.init_db()
+    await async_db.get_active_chats()
+    chat_ids = [-1000000000000 - i for i in range(chats)]
+    for i, chat_id in enumerate(chat_ids):
+        await async_db.add_chat(chat_id, f"chat {i}", 'channel')
+
+    bot = _FakeBot(0.001, keep_log=False)
+    bot.kicked_from = set(chat_ids[:failing])
+    delivery.limiter = delivery.RateLimiter(global_rate=1e9, chat_rate_per_minute=1e9)
+    past = datetime.now(pytz.timezone("Asia/Tashkent")).replace(tzinfo=None) - timedelta(minutes=1)
+    post_ids = []
+    for i in range(posts):
+        post_ids.append(await async_db.add_scheduled_post('text', '', f"post {i}", past))
+        await scheduler.check_and_send_posts(bot)
+
+    # Kechikkan natijalar qayta yozilsa (ijara boshqa worker'ga o'tgan holat) jurnaldagi 'sent' ham,
+    # hisoblagichlar ham o'zgarmaydi (aks holda totals_match jurnal bilan mos kelmaydi)
+    before = await async_db.get_delivery_stats()
+    await async_db.record_deliveries([(post_ids[-1], chat_id, 'failed', None, None, 'kechikkan natija', 1, None) for chat_id in chat_ids[failing:]])
+    await async_db.finish_post_delivery(post_ids[-1])
+    after = await async_db.get_delivery_stats()
+
+    truth = _ledger_truth(backend)
+    counters = _stats_counters(backend)
+    totals = after['totals']
+    return {
+        'posts': posts,
+        'chats': chats,
+        'failing_chats': failing,
+        'totals': {k: round(v, 2) if isinstance(v, float) else v for k, v in totals.items()},
+        'ledger_sent': truth['sent'],
+        'ledger_failed': truth['failed'],
+        'totals_match': (totals['posts'], totals['sent'], totals['failed']) == (posts, truth['sent'], truth['failed']),
+        'per_post_match': counters['posts'] == truth['posts'],
+        'per_chat_match': counters['chats'] == truth['chats'],
+        'hourly_match': counters['hourly'] == [posts, truth['sent'], truth['failed']],
+        'last_24h_match': after['last_24h'] == totals,
+        'duplicate_ignored': before == after,
+        # Hammasida bittadan xato: qaysilari ko'rsatilishi tartibga bog'liq, soni va to'plami tekshiriladi
+        'failing_chats_reported': len(after['failing_chats']) == min(failing, stats.FAILING_CHATS)
+            and {c['chat_id'] for c in after['failing_chats']} <= bot.kicked_from,
+        'avg_delay_seconds': round(totals['delay_seconds'] / totals['sent'], 2) if totals['sent'] else None,
+        'report': stats.report(after, chat_registry.count),
+    }
+
+async def _stats_latency(queries: int) -> float:
+    """get_delivery_stats ning median vaqti (ms)."""
+    await async_db.get_delivery_stats() # isitish
+    timings = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        await async_db.get_delivery_stats()
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(timings), 3)
+
+def _scan_ms(backend) -> float:
+    """Taqqoslash uchun: xuddi shu jami qiymatlarni post_deliveries ni sanab olish (avvalgi usul)."""
+    start = time.perf_counter()
+    with backend.db_cursor() as cur:
+        cur.execute("SELECT status, COUNT(*) FROM post_deliveries GROUP BY status;")
+        cur.fetchall()
+    return round((time.perf_counter() - start) * 1000, 2)
+
+def bench_stats(backend: str, chats: int, posts: int, failing: int, history_posts: int) -> dict:
+    """
+    Hisoblagichlar aniqligini (jurnalni sanash bilan solishtirib), migratsiya mavjud tarixdan boshlang'ich
+    qiymatlarni to'g'ri hisoblashini, arxivlash jami qiymatlarni o'zgartirmasligini va /stats so'rovi
+    kichik va katta tarixda bir xil vaqt olishini tekshiradi.
+    """
+    import retention
+
+    logging.getLogger().setLevel(logging.ERROR)
+    result = {'backend': backend}
+    with _isolated_backend(backend) as selected:
+        result['exact'] = asyncio.run(_stats_run(selected, chats, posts, failing))
+
+    with _isolated_backend(backend) as selected:
+        asyncio.run(async_db.init_db())
+        small_ms = asyncio.run(_stats_latency(200))
+        small_scan_ms = _scan_ms(selected)
+
+        # Tarix hisoblagichlarsiz (to'g'ridan-to'g'ri) yoziladi, so'ng 13-migratsiya qayta bajarilib
+        # boshlang'ich qiymatlar jurnaldan hisoblanadi
+        _seed_sent_posts(selected, chats, history_posts, 0, age_days=2)
+        _rebuild_stats(selected)
+        if _is_postgres(selected):
+            with selected.db_cursor() as cur:
+                cur.execute("ANALYZE;")
+        truth = _ledger_truth(selected)
+        backfilled = asyncio.run(async_db.get_delivery_stats())['totals']
+        backfill_rollups_agree = _rollups_agree(selected, backfilled)
+        large_ms = asyncio.run(_stats_latency(200))
+        large_scan_ms = _scan_ms(selected)
+
+        # Arxivlash jurnalni o'chiradi, hisoblagichlar esa qoladi
+        asyncio.run(retention.archive_old_posts(days=1, batch_size=500, pause=0, dry_run=False))
+        with selected.db_cursor() as cur:
+            deliveries_left = _table_rows(cur, 'post_deliveries')
+        archived = asyncio.run(async_db.get_delivery_stats())['totals']
+
+        # Tarix arxivda bo'lganda ham migratsiya bir xil qiymatlarni hisoblaydi
+        _rebuild_stats(selected)
+        from_archive = asyncio.run(async_db.get_delivery_stats())['totals']
+        archive_rollups_agree = _rollups_agree(selected, from_archive)
+
+    result['history'] = {
+        'posts': history_posts,
+        'deliveries': history_posts * chats,
+        'backfill_match': (backfilled['posts'], backfilled['sent'], backfilled['failed']) == (history_posts, truth['sent'], truth['failed']),
+        'backfill_rollups_agree': backfill_rollups_agree,
+        # SQLite arxivi vaqtlarni JSON matnida saqlaydi (~1 mks aniqlik), shuning uchun kechikish yig'indisi taxminan teng
+        'backfill_from_archive_match': all(from_archive[k] == backfilled[k] for k in ('posts', 'sent', 'failed'))
+            and math.isclose(from_archive['delay_seconds'], backfilled['delay_seconds'], rel_tol=1e-5),
+        'backfill_from_archive_rollups_agree': archive_rollups_agree,
+        'stats_ms_empty': small_ms,
+        'stats_ms_large_history': large_ms,
+        'scan_ms_empty': small_scan_ms,
+        'scan_ms_large_history': large_scan_ms,
+        'deliveries_after_archive': deliveries_left,
+        'totals_kept_after_archive': archived == backfilled,
+    }
+    exact, history = result['exact'], result['history']
+    result['ok'] = (
+        exact['totals_match'] and exact['per_post_match'] and exact['per_chat_match'] and exact['hourly_match']
+        and exact['last_24h_match'] and exact['duplicate_ignored'] and exact['failing_chats_reported']
+        and history['backfill_match'] and history['totals_kept_after_archive'] and history['deliveries_after_archive'] == 0
+        and history['backfill_rollups_agree'] and history['backfill_from_archive_match'] and history['backfill_from_archive_rollups_agree']
+        # Katta tarixda ham /stats so'rovi bir necha ms ichida (sanash usuli tarix bilan o'sadi)
+        and history['stats_ms_large_history'] < max(5 * history['stats_ms_empty'], 5)
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="avtopost unumdorlik o'lchovlari")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_db = sub.add_parser('db', help="Ulanishlar hovuzi: so'rov/soniya")
+    p_db.add_argument('--queries', type=int, default=200)
+
+    p_latency = sub.add_parser('latency', help="Sekin so'rov paytida handler kechikishi")
+    p_latency.add_argument('--slow-seconds', type=float, default=2.0)
+
+    p_fanout = sub.add_parser('fanout', help="Parallel yuborish tezligi (soxta bot bilan)")
+    p_fanout.add_argument('--chats', type=int, default=300)
+    p_fanout.add_argument('--latency-ms', type=float, default=50)
+    p_fanout.add_argument('--rate', type=float, default=GLOBAL_RATE_LIMIT)
+
+    p_dispatch = sub.add_parser('dispatch', help="Dispatcher kechikishi va bo'sh vaqtdagi so'rovlar")
+    p_dispatch.add_argument('--posts', type=int, default=20)
+    p_dispatch.add_argument('--spread', type=float, default=10)
+    p_dispatch.add_argument('--idle', type=float, default=30)
+
+    p_explain = sub.add_parser('explain', help="Issiq so'rovlar Seq Scan ishlatmasligini tekshirish")
+    p_explain.add_argument('--rows', type=int, default=1000000)
+    p_explain.add_argument('--pending', type=int, default=1000)
+    p_explain.add_argument('--chats', type=int, default=100000)
+
+    p_replicas = sub.add_parser('replicas', help="Bir nechta jarayonda yuborish: masshtab va takrorlar")
+    p_replicas.add_argument('--workers', default='1,2,4')
+    p_replicas.add_argument('--chats', type=int, default=1000)
+    p_replicas.add_argument('--posts', type=int, default=4)
+    p_replicas.add_argument('--latency-ms', type=float, default=50)
+    p_replicas.add_argument('--rate', type=float, default=100000)
+    p_replicas.add_argument('--shard-size', type=int, default=100)
+
+    p_webhook = sub.add_parser('webhook', help="Webhook orqali yangilanishlarni qabul qilish yuklama testi")
+    p_webhook.add_argument('--updates', type=int, default=5000)
+    p_webhook.add_argument('--concurrency', type=int, default=100)
+    p_webhook.add_argument('--handler-ms', type=float, default=5)
+
+    p_metrics = sub.add_parser('metrics', help="Metrikalar qo'shimcha xarajati (ns)")
+    p_metrics.add_argument('--iterations', type=int, default=200000)
+    p_metrics.add_argument('--chats', type=int, default=20000)
+
+    p_storage = sub.add_parser('storage', help="Bir xil yuborish ssenariysi har bir storage backend'da")
+    p_storage.add_argument('--backends', default='sqlite,postgres')
+    p_storage.add_argument('--chats', type=int, default=2000)
+    p_storage.add_argument('--posts', type=int, default=5)
+    p_storage.add_argument('--latency-ms', type=float, default=0)
+
+    p_e2e = sub.add_parser('e2e', help="Soxta Bot API serveri bilan to'liq yuborish zanjiri")
+    p_e2e.add_argument('--backend', default=storage.STORAGE_BACKEND)
+    p_e2e.add_argument('--chats', type=int, default=2000)
+    p_e2e.add_argument('--posts', type=int, default=3)
+    p_e2e.add_argument('--latency-ms', type=float, default=20)
+    p_e2e.add_argument('--flood-rate', type=float, default=0.0005, help="429 javob ehtimoli")
+    p_e2e.add_argument('--retry-after', type=int, default=1)
+    p_e2e.add_argument('--failing-chats', type=int, default=20, help="403 qaytaradigan chatlar soni")
+    p_e2e.add_argument('--rate', type=float, default=1000, help="Umumiy tezlik cheklovi (xabar/soniya)")
+    p_e2e.add_argument('--output', help="Natijani shu JSON faylga ham yozish")
+    p_e2e.add_argument('--album', type=int, default=0, help="0 dan katta bo'lsa, shuncha elementli albom (copy) postlari")
+
+    p_health = sub.add_parser('health', help="Chatlarni fon rejimida tekshirish: yuborishlarga yo'l berish va o'lik chatlar")
+    p_health.add_argument('--backend', default=storage.STORAGE_BACKEND)
+    p_health.add_argument('--chats', type=int, default=1000)
+    p_health.add_argument('--dead', type=int, default=50)
+    p_health.add_argument('--rate', type=float, default=200, help="Umumiy tezlik cheklovi (so'rov/soniya)")
+
+    p_startup = sub.add_parser('startup', help="Ishga tushish bosqichlari: bo'sh baza va katta tarix")
+    p_startup.add_argument('--backend', default=storage.STORAGE_BACKEND)
+    p_startup.add_argument('--chats', type=int, default=1000)
+    p_startup.add_argument('--posts', type=int, default=200000)
+
+    p_retention = sub.add_parser('retention', help="Eski postlarni arxivlash: partiyalar, dry run va hajm")
+    p_retention.add_argument('--backend', default=storage.STORAGE_BACKEND)
+    p_retention.add_argument('--chats', type=int, default=200)
+    p_retention.add_argument('--posts', type=int, default=1000)
+    p_retention.add_argument('--pending', type=int, default=20)
+    p_retention.add_argument('--batch-size', type=int, default=50)
+
+    p_drain = sub.add_parser('drain', help="Katta backlog'ni yuborish: o'tkazuvchanlik va xotira")
+    p_drain.add_argument('--backend', default=storage.STORAGE_BACKEND)
+    p_drain.add_argument('--posts', type=int, default=10000)
+    p_drain.add_argument('--chats', type=int, default=5)
+    p_drain.add_argument('--interval', type=float, default=2)
+
+    p_import = sub.add_parser('import', help="Fayldan import: tekshirish va bitta tranzaksiyada saqlash")
+    p_import.add_argument('--backend', default=storage.STORAGE_BACKEND)
+    p_import.add_argument('--rows', type=int, default=2000)
+    p_import.add_argument('--invalid', type=int, default=20)
+
+    p_actions = sub.add_parser('postactions', help="Yuborilgan postlarni tahrirlash va partiyalab o'chirish")
+    p_actions.add_argument('--backend', default=storage.STORAGE_BACKEND)
+    p_actions.add_argument('--chats', type=int, default=1000)
+    p_actions.add_argument('--albums', type=int, default=11)
+    p_actions.add_argument('--rate', type=float, default=1000)
+
+    p_pool = sub.add_parser('pool', help="Yordamchi bot tokenlari: tezlik, taqsimot va chiqarilgan botdan o'tish")
+    p_pool.add_argument('--backend', default=storage.STORAGE_BACKEND)
+    p_pool.add_argument('--chats', type=int, default=600)
+    p_pool.add_argument('--helpers', type=int, default=2)
+    p_pool.add_argument('--rate', type=float, default=100)
+    p_pool.add_argument('--kicked', type=int, default=30)
+
+    p_recurring = sub.add_parser('recurring', help="Takrorlanuvchi postlar: faqat navbatdagi post, atomar o'tish va DST")
+    p_recurring.add_argument('--backend', default=storage.STORAGE_BACKEND)
+    p_recurring.add_argument('--schedules', type=int, default=200)
+    p_recurring.add_argument('--horizon-days', type=int, default=365)
+    p_recurring.add_argument('--chats', type=int, default=20)
+    p_recurring.add_argument('--rounds', type=int, default=3)
+
+    p_fsm = sub.add_parser('fsm', help="FSM holatlari bazada: qayta ishga tushish, kesh va nusxalar")
+    p_fsm.add_argument('--backend', default=storage.STORAGE_BACKEND)
+    p_fsm.add_argument('--updates', type=int, default=1000)
+
+    p_slowlog = sub.add_parser('slowlog', help="Sekin amallar jurnali: qo'shimcha xarajat va kontekst, /profile natijasi")
+    p_slowlog.add_argument('--backend', default=storage.STORAGE_BACKEND)
+    p_slowlog.add_argument('--chats', type=int, default=500)
+    p_slowlog.add_argument('--slow', type=int, default=5, help="Yuborishi sekin bo'lgan chatlar soni")
+    p_slowlog.add_argument('--iterations', type=int, default=200000)
+    p_slowlog.add_argument('--profile-seconds', type=float, default=2)
+
+    p_stats = sub.add_parser('stats', help="Yetkazish statistikasi: aniq hisoblagichlar va tarixga bog'liq bo'lmagan /stats")
+    p_stats.add_argument('--backend', default=storage.STORAGE_BACKEND)
+    p_stats.add_argument('--chats', type=int, default=300)
+    p_stats.add_argument('--posts', type=int, default=5)
+    p_stats.add_argument('--failing', type=int, default=7, help="Bot chiqarilgan (xato beradigan) chatlar soni")
+    p_stats.add_argument('--history-posts', type=int, default=2000, help="Katta tarix: shuncha post x --chats yetkazish")
+
+    args = parser.parse_args()
+
+    if args.command == 'db':
+        result = bench_db(args.queries)
+    elif args.command == 'latency':
+        result = asyncio.run(bench_latency(args.slow_seconds))
+    elif args.command == 'fanout':
+        result = asyncio.run(bench_fanout(args.chats, args.latency_ms, args.rate))
+    elif args.command == 'dispatch':
+        result = asyncio.run(bench_dispatch(args.posts, args.spread, args.idle))
+    elif args.command == 'explain':
+        result = bench_explain(args.rows, args.pending, args.chats)
+    elif args.command == 'replicas':
+        workers = [int(n) for n in args.workers.split(',')]
+        result = bench_replicas(workers, args.chats, args.posts, args.latency_ms, args.rate, args.shard_size)
+    elif args.command == 'webhook':
+        result = asyncio.run(bench_webhook(args.updates, args.concurrency, args.handler_ms))
+    elif args.command == 'metrics':
+        result = asyncio.run(bench_metrics(args.iterations, args.chats))
+    elif args.command == 'storage':
+        result = bench_storage(args.backends.split(','), args.chats, args.posts, args.latency_ms)
+    elif args.command == 'e2e':
+        result = bench_e2e(args.backend, args.chats, args.posts, args.latency_ms, args.flood_rate,
+                           args.retry_after, args.failing_chats, args.rate, args.output, args.album)
+    elif args.command == 'health':
+        result = bench_health(args.backend, args.chats, args.dead, args.rate)
+    elif args.command == 'startup':
+        result = bench_startup(args.backend, args.chats, args.posts)
+    elif args.command == 'retention':
+        result = bench_retention(args.backend, args.chats, args.posts, args.pending, args.batch_size)
+    elif args.command == 'drain':
+        result = bench_drain(args.backend, args.posts, args.chats, args.interval)
+    elif args.command == 'import':
+        result = bench_import(args.backend, args.rows, args.invalid)
+    elif args.command == 'postactions':
+        result = bench_post_actions(args.backend, args.chats, args.albums, args.rate)
+    elif args.command == 'pool':
+        result = bench_pool(args.backend, args.chats, args.helpers, args.rate, args.kicked)
+    elif args.command == 'recurring':
+        result = bench_recurring(args.backend, args.schedules, args.horizon_days, args.chats, args.rounds)
+    elif args.command == 'fsm':
+        result = bench_fsm(args.backend, args.updates)
+    elif args.command == 'slowlog':
+        result = bench_slowlog(args.backend, args.chats, args.slow, args.iterations, args.profile_seconds)
+    elif args.command == 'stats':
+        result = bench_stats(args.backend, args.chats, args.posts, args.failing, args.history_posts)
+
+    print(json.dumps(result, indent=2))
+
+    # Regressiya tekshiruvlari (masalan, explain) muvaffaqiyatsiz bo'lsa, nol bo'lmagan kod bilan chiqish
+    if result.get('ok') is False:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
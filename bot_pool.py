@@ -0,0 +1,294 @@
+# bot_pool.py - Bir nechta bot tokeni orqali yuborish (yordamchi botlar pool'i)
+#
+# Telegram'ning umumiy yuborish limiti (sekundiga ~30 xabar) har bir bot tokeni uchun
+# alohida. HELPER_BOT_TOKENS berilsa, har bir chat o'zi a'zo bo'lgan botlardan eng kam
+# yuklanganiga biriktiriladi (target_chats.bot_id) va postlar shu bot orqali, uning
+# alohida RateLimiter'i bilan yuboriladi. Shunday qilib fan-out tezligi botlar soniga
+# mos ravishda oshadi.
+#
+#   - Biriktirish fon rejimida: taqsimlanmagan (bot_id IS NULL) chatlarda har bir
+#     yordamchi bot uchun get_chat_member() chaqiriladi (cheklovchidan past ustuvorlik bilan).
+#     Asosiy bot chatni o'zi ro'yxatdan o'tkazgani uchun doim nomzod.
+#   - Yordamchi bot chatdan chiqarilgan bo'lsa (CHAT_GONE), chat asosiy botga o'tkaziladi
+#     va xabar darhol asosiy bot orqali qayta yuboriladi, chat nofaol qilinmaydi.
+#   - file_id va admin chatidagi asl xabarlar faqat asosiy botga ochiq. Shuning uchun
+#     media/copy postlar avval HELPER_STAGING_CHAT_ID ga bir marta yuboriladi, yordamchi
+#     botlar esa ularni shu yerdan nusxalaydi. Staging chat berilmasa, yordamchi botlar
+#     faqat matnli postlarni yuboradi.
+#
+# main.py `pool` ni faqat HELPER_BOT_TOKENS berilganda o'rnatadi, aks holda hamma narsa
+# avvalgidek bitta bot va delivery.limiter orqali ishlaydi.
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Callable, Iterable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+import async_db
+import delivery
+import retry
+from chat_health import can_post
+from config import SEND_CONCURRENCY, HELPER_STAGING_CHAT_ID, BOT_POOL_ASSIGN_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Taqsimlanmagan chat qolmaganda keyingi urinishgacha kutish (soniya)
+_IDLE_SECONDS = 60
+# Boshqa nusxalar qilgan biriktirishlarni DB dan qayta o'qish oralig'i (soniya)
+_RELOAD_SECONDS = 600
+# Staging chatga yuborilgan postlar keshi (post_id -> nusxalash uchun post)
+_STAGED_CACHE_SIZE = 100
+
+
+class PoolMember:
+    """Pool'dagi bitta bot va uning alohida tezlik cheklovchisi."""
+
+    def __init__(self, bot: Bot, rate_limiter: delivery.RateLimiter = None):
+        self.bot = bot
+        self.id = bot.id
+        self._limiter = rate_limiter
+
+    @property
+    def limiter(self) -> delivery.RateLimiter:
+        # Asosiy bot umumiy delivery.limiter dan foydalanadi (chat_health va benchmark'lar ham shu)
+        return self._limiter or delivery.limiter
+
+
+class _PoolLimiter:
+    """delivery.fan_out uchun: ruxsat va flood pauzasi chatga yuboradigan botning cheklovchisiga yo'naltiriladi."""
+
+    def __init__(self, member_for: Callable[[int], PoolMember]):
+        self._member_for = member_for
+
+    def for_chat(self, chat_id: int) -> delivery.RateLimiter:
+        return self._member_for(chat_id).limiter
+
+    async def acquire(self, chat_id: int):
+        await self.for_chat(chat_id).acquire(chat_id)
+
+
+class BotPool:
+    """Asosiy bot va yordamchi botlar: chatlarni botlarga taqsimlash va yuborishni yo'naltirish."""
+
+    def __init__(
+        self,
+        primary: Bot,
+        helpers: Iterable[Bot] = (),
+        staging_chat_id: int = HELPER_STAGING_CHAT_ID,
+        batch_size: int = BOT_POOL_ASSIGN_BATCH_SIZE,
+        rate_limiter_factory: Callable[[], delivery.RateLimiter] = delivery.RateLimiter,
+    ):
+        self.primary = PoolMember(primary)
+        self.helpers = [PoolMember(bot, rate_limiter_factory()) for bot in helpers]
+        self.members = [self.primary] + self.helpers
+        self._by_id = {member.id: member for member in self.members}
+        self.staging_chat_id = staging_chat_id
+        self.batch_size = batch_size
+        self._assigned = {} # chat_id -> bot_id
+        self._load = Counter() # bot_id -> biriktirilgan chatlar soni
+        self._staged = {} # post_id -> asyncio.Task (staging chatdagi nusxa)
+        self._task = None
+
+    @property
+    def concurrency(self) -> int:
+        """fan_out worker'lari soni: har bir bot uchun SEND_CONCURRENCY tadan."""
+        return SEND_CONCURRENCY * len(self.members)
+
+    # --- YO'NALTIRISH ---
+
+    def helper_can_send(self, post: dict) -> bool:
+        """Yordamchi bot bu postni yubora oladimi (matn yoki staging chat orqali nusxa)."""
+        return post['media_type'] == 'text' or bool(self.staging_chat_id)
+
+    def member_for(self, chat_id: int, post: dict = None) -> PoolMember:
+        """Chatga biriktirilgan bot. Post yordamchi bot uchun mos bo'lmasa - asosiy bot."""
+        member = self._by_id.get(self._assigned.get(chat_id), self.primary)
+        if member is not self.primary and post is not None and not self.helper_can_send(post):
+            return self.primary
+        return member
+
+    def member(self, bot_id: int) -> Optional[PoolMember]:
+        """ID bo'yicha pool a'zosi (bot pool'dan olib tashlangan bo'lsa None)."""
+        return self._by_id.get(bot_id)
+
+    def limiter(self, post: dict = None, senders: dict = None) -> _PoolLimiter:
+        """
+        fan_out cheklovchisi: chatga biriktirilgan botniki. `senders` (chat_id -> PoolMember) berilsa,
+        chat o'sha botning cheklovchisidan foydalanadi (yuborilgan xabarlarni tahrirlash/o'chirish).
+        """
+        if senders is not None:
+            return _PoolLimiter(lambda chat_id: senders.get(chat_id, self.primary))
+        return _PoolLimiter(lambda chat_id: self.member_for(chat_id, post))
+
+    def chats_per_bot(self) -> dict:
+        return {member.id: self._load[member.id] for member in self.members}
+
+    def _set(self, chat_id: int, bot_id: Optional[int]):
+        previous = self._assigned.pop(chat_id, None)
+        if previous is not None:
+            self._load[previous] -= 1
+        if bot_id is not None:
+            self._assigned[chat_id] = bot_id
+            self._load[bot_id] += 1
+
+    # --- YUBORISH ---
+
+    async def send_post(self, post: dict, chat_id: int):
+        """
+        Postni chatga biriktirilgan bot orqali yuboradi (ruxsat fan_out da limiter(post) dan olingan).
+        Yordamchi bot chatdan chiqarilgan bo'lsa, chat asosiy botga o'tkaziladi va qayta yuboriladi.
+        Natija - delivery.Sent: xabar(lar) va ularni haqiqatda yuborgan botning ID'si.
+        """
+        member = self.member_for(chat_id, post)
+        if member is self.primary:
+            return delivery.Sent(member.id, await delivery.send_post(member.bot, post, chat_id))
+
+        try:
+            helper_post = await self._helper_post(post)
+        except Exception as e:
+            # Staging vaqtinchalik ishlamasa qayta urinish, butunlay ishlamasa asosiy bot yuboradi
+            if retry.classify(e) in (retry.FLOOD, retry.TRANSIENT):
+                raise
+        else:
+            try:
+                return delivery.Sent(member.id, await delivery.send_post(member.bot, helper_post, chat_id))
+            except Exception as e:
+                if retry.classify(e) != retry.CHAT_GONE:
+                    raise
+                logger.warning(f"Yordamchi bot {member.id} chat {chat_id} ga yubora olmadi ({e}). Chat asosiy botga o'tkaziladi.")
+                await self.reassign(chat_id, self.primary.id)
+
+        await self.primary.limiter.acquire(chat_id)
+        try:
+            return delivery.Sent(self.primary.id, await delivery.send_post(self.primary.bot, post, chat_id))
+        except TelegramRetryAfter as e:
+            self.primary.limiter.pause(e.retry_after)
+            raise
+
+    async def _helper_post(self, post: dict) -> dict:
+        """Yordamchi botlar yuboradigan post: matn o'zi, media/copy esa staging chatdagi nusxa."""
+        if post['media_type'] == 'text':
+            return post
+        task = self._staged.get(post['id'])
+        if task is None:
+            task = self._staged[post['id']] = asyncio.create_task(self._stage(post))
+            while len(self._staged) > _STAGED_CACHE_SIZE:
+                self._staged.pop(next(iter(self._staged)))
+        # Bitta worker bekor qilinsa ham boshqalar kutayotgan staging to'xtamasin
+        return await asyncio.shield(task)
+
+    async def _stage(self, post: dict) -> dict:
+        """Postni asosiy bot orqali staging chatga bir marta yuboradi."""
+        try:
+            await self.primary.limiter.acquire(self.staging_chat_id)
+            message = await delivery.send_post(self.primary.bot, post, self.staging_chat_id)
+        except Exception as e:
+            kind = retry.classify(e)
+            if kind == retry.FLOOD:
+                self.primary.limiter.pause(e.retry_after)
+            if kind in (retry.FLOOD, retry.TRANSIENT):
+                # Keyingi chaqiruv qayta urinib ko'rsin
+                self._staged.pop(post['id'], None)
+            else:
+                logger.error(f"Post {post['id']} ni staging chatga ({self.staging_chat_id}) yuborib bo'lmadi, uni asosiy bot yuboradi: {e}")
+            raise
+        messages = message if isinstance(message, list) else [message]
+        logger.info(f"Post {post['id']} yordamchi botlar uchun staging chatga yuborildi.")
+        return {
+            **post, 'media_type': 'copy',
+            'source_chat_id': self.staging_chat_id,
+            'source_message_ids': [m.message_id for m in messages],
+        }
+
+    # --- CHATLARNI BOTLARGA BIRIKTIRISH ---
+
+    async def load(self):
+        """Pool'dan olib tashlangan botlarning chatlarini bo'shatadi va biriktirishlarni DB dan o'qiydi."""
+        released = await async_db.reset_chat_bots([member.id for member in self.members])
+        if released:
+            logger.info(f"Pool'da yo'q botlarga biriktirilgan {released} ta chat qayta taqsimlanadi.")
+        self._assigned = {}
+        self._load = Counter()
+        for chat_id, bot_id in await async_db.get_chat_bots():
+            self._set(chat_id, bot_id)
+
+    async def reassign(self, chat_id: int, bot_id: int):
+        await async_db.assign_chat_bot(chat_id, bot_id)
+        self._set(chat_id, bot_id)
+
+    async def assign(self, chat_id: int, chat_type: str) -> int:
+        """Chatni u yerda post yubora oladigan botlardan eng kam yuklanganiga biriktiradi."""
+        candidates = []
+        for member in self.helpers:
+            # Haqiqiy yuborishlar ketayotganda tekshiruv kutib turadi
+            await member.limiter.acquire_idle()
+            try:
+                chat_member = await member.bot.get_chat_member(chat_id, member.id)
+            except Exception as e:
+                kind = retry.classify(e)
+                if kind == retry.FLOOD:
+                    member.limiter.pause(e.retry_after)
+                elif kind != retry.CHAT_GONE:
+                    logger.warning(f"Yordamchi bot {member.id} ning chat {chat_id} dagi holatini tekshirishda xato: {e}")
+                continue
+            if can_post(chat_member, chat_type):
+                candidates.append(member)
+        # Teng yuklamada yordamchi bot tanlanadi (asosiy bot oxirida)
+        candidates.append(self.primary)
+        chosen = min(candidates, key=lambda member: self._load[member.id])
+        await self.reassign(chat_id, chosen.id)
+        return chosen.id
+
+    async def assign_pending(self) -> int:
+        """Taqsimlanmagan chatlarning bitta partiyasini biriktiradi va ularning sonini qaytaradi."""
+        chats = await async_db.get_unassigned_chats(self.batch_size)
+        for chat_id, chat_type in chats:
+            try:
+                await self.assign(chat_id, chat_type)
+            except Exception as e:
+                logger.error(f"Chat {chat_id} ni botga biriktirishda xato: {e}")
+        return len(chats)
+
+    def start(self):
+        if not self.helpers:
+            return
+        if not self.staging_chat_id:
+            logger.warning("HELPER_STAGING_CHAT_ID ko'rsatilmagan: yordamchi botlar faqat matnli postlarni yuboradi.")
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def close(self):
+        self.stop()
+        for member in self.helpers:
+            await member.bot.session.close()
+
+    async def _run(self):
+        loaded_at = 0.0
+        while True:
+            if time.monotonic() - loaded_at >= _RELOAD_SECONDS:
+                try:
+                    await self.load()
+                    loaded_at = time.monotonic()
+                    logger.info(f"Bot pool: chatlar taqsimoti {self.chats_per_bot()}")
+                except Exception as e:
+                    logger.error(f"Bot pool: biriktirishlarni o'qishda xato: {e}")
+
+            try:
+                assigned = await self.assign_pending()
+            except Exception as e:
+                logger.error(f"Bot pool: taqsimlanmagan chatlarni olishda xato: {e}")
+                assigned = 0
+            if not assigned:
+                await asyncio.sleep(_IDLE_SECONDS)
+
+
+# main.py HELPER_BOT_TOKENS berilganda o'rnatadi (None - barcha yuborishlar asosiy bot orqali)
+pool: Optional[BotPool] = None
@@ -0,0 +1,136 @@
+# chat_health.py - Chatlarni fon rejimida tekshirish (o'lik chatlarni yuborishdan oldin aniqlash)
+#
+# Bot chatdan chiqarilgani yoki post yuborish huquqi olib qo'yilgani odatda faqat post
+# yuborilayotganda, xato orqali ma'lum bo'ladi va har bir shunday chat tezlik limitidan
+# joy egallab fan-out'ni sekinlashtiradi. ChatHealthProber har bir faol chatda botning
+# o'zi uchun get_chat_member() ni chaqiradi, tekshiruvlarni CHAT_HEALTH_INTERVAL_HOURS
+# davomida bir tekis taqsimlaydi, can_post_messages va last_checked_at ni yozadi va
+# post yubora olmaydigan chatlarni oldindan nofaol qiladi.
+#
+# Tekshiruvlar umumiy cheklovchidan past ustuvorlik bilan foydalanadi
+# (RateLimiter.acquire_idle): haqiqiy yuborishlar ketayotganda ular kutib turadi.
+
+import asyncio
+import logging
+
+from aiogram import Bot
+
+import async_db
+import delivery
+import metrics
+import retry
+from chat_registry import registry as chat_registry
+from config import CHAT_HEALTH_INTERVAL_HOURS, CHAT_HEALTH_MAX_RATE, CHAT_HEALTH_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Tekshiruv natijalari (metrikadagi `result` label'i)
+OK = 'ok'
+NO_RIGHTS = 'no_rights'
+GONE = 'gone'
+MIGRATED = 'migrated'
+ERROR = 'error'
+
+# Tekshiriladigan chat qolmaganda keyingi urinishgacha kutish (soniya)
+_IDLE_SECONDS = 60
+
+
+def can_post(member, chat_type: str) -> bool:
+    """get_chat_member() natijasiga qarab bot chatga post yubora oladimi."""
+    status = member.status
+    if status == 'creator':
+        return True
+    if status == 'administrator':
+        # can_post_messages faqat kanallarda beriladi (guruhlarda None)
+        return chat_type != 'channel' or bool(member.can_post_messages)
+    if status == 'member':
+        return chat_type != 'channel'
+    if status == 'restricted':
+        return chat_type != 'channel' and bool(member.can_send_messages)
+    return False # left, kicked
+
+
+class ChatHealthProber:
+    """Faol chatlarni navbat bilan (eng uzoq tekshirilmaganidan boshlab) tekshiruvchi fon jarayoni."""
+
+    def __init__(
+        self,
+        bot: Bot,
+        rate_limiter: delivery.RateLimiter = None,
+        interval_hours: float = CHAT_HEALTH_INTERVAL_HOURS,
+        max_rate: float = CHAT_HEALTH_MAX_RATE,
+        batch_size: int = CHAT_HEALTH_BATCH_SIZE,
+    ):
+        self.bot = bot
+        self.rate_limiter = rate_limiter
+        self.interval = interval_hours * 3600
+        self.max_rate = max_rate
+        self.batch_size = batch_size
+        self._task = None
+
+    def _spacing(self) -> float:
+        """Ikki tekshiruv orasidagi pauza: barcha chatlar bir intervalga yoyiladi, lekin max_rate dan tez emas."""
+        return max(self.interval / max(chat_registry.count, 1), 1 / self.max_rate)
+
+    async def check(self, chat_id: int, chat_type: str) -> str:
+        """Bitta chatni tekshiradi, natijani DB ga yozadi va kerak bo'lsa chatni nofaol qiladi."""
+        # Modul o'zgaruvchisi har safar o'qiladi (benchmark'lar delivery.limiter ni almashtiradi)
+        rate_limiter = self.rate_limiter or delivery.limiter
+        await rate_limiter.acquire_idle()
+        try:
+            member = await self.bot.get_chat_member(chat_id, self.bot.id)
+        except Exception as e:
+            kind = retry.classify(e)
+            if kind == retry.FLOOD:
+                rate_limiter.pause(e.retry_after)
+                return ERROR
+            if kind == retry.MIGRATE:
+                await async_db.migrate_chat(chat_id, e.migrate_to_chat_id)
+                return MIGRATED
+            if kind == retry.CHAT_GONE:
+                logger.warning(f"Chat {chat_id} tekshiruvi: bot chatda emas ({e}). Chat nofaol qilinadi.")
+                await async_db.record_chat_health(chat_id, False)
+                await async_db.deactivate_chat(chat_id)
+                return GONE
+            logger.warning(f"Chat {chat_id} ni tekshirishda xato: {e}")
+            return ERROR
+
+        allowed = can_post(member, chat_type)
+        await async_db.record_chat_health(chat_id, allowed)
+        if allowed:
+            return OK
+        logger.warning(f"Chat {chat_id} tekshiruvi: bot post yubora olmaydi ({member.status}). Chat nofaol qilinadi.")
+        await async_db.deactivate_chat(chat_id)
+        return NO_RIGHTS
+
+    def start(self):
+        if self.interval <= 0:
+            logger.info("Chatlarni tekshirish o'chirilgan (CHAT_HEALTH_INTERVAL_HOURS=0).")
+            return
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                chats = await async_db.claim_chats_for_health_check(self.batch_size, self.interval)
+            except Exception as e:
+                logger.error(f"Chatlarni tekshirish: navbatni olishda xato: {e}")
+                chats = []
+
+            if not chats:
+                await asyncio.sleep(max(self._spacing(), _IDLE_SECONDS))
+                continue
+
+            for chat_id, chat_type in chats:
+                try:
+                    result = await self.check(chat_id, chat_type)
+                except Exception as e:
+                    logger.error(f"Chat {chat_id} ni tekshirishda kutilmagan xato: {e}")
+                    result = ERROR
+                metrics.CHAT_HEALTH_CHECKS.labels(result).inc()
+                await asyncio.sleep(self._spacing())
@@ -0,0 +1,104 @@
+# chat_registry.py - Faol chatlarning jarayon ichidagi (in-memory) registri
+#
+# target_chats faqat add_chat, deactivate_chat (va bot chatdan chiqarilganda)
+# o'zgaradi. Shuning uchun faol chat ID'lari bir marta yuklanadi va shu yozish
+# yo'llari orqali yangilab boriladi (write-through). Boshqa nusxalardagi
+# o'zgarishlar PostgreSQL NOTIFY orqali keladi (payload: '+<chat_id>' yoki '-<chat_id>').
+#
+# O'qish (ids(), count) DB ga ham, executor'ga ham murojaat qilmaydi.
+
+import logging
+import threading
+from array import array
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+
+class ChatRegistry:
+    """Faol chat ID'lari to'plami va ularning ixcham (array) nusxasi."""
+
+    def __init__(self):
+        self._ids = set()
+        self._snapshot = None # array('q') - o'zgarishdan keyin birinchi o'qishda quriladi
+        self._loaded = False
+        self._loading = False
+        self._ops_during_load = []
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def count(self) -> int:
+        return len(self._ids)
+
+    def ids(self) -> array:
+        """Faol chat ID'larining o'zgarmas nusxasi (o'zgartirmang)."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = array('q', sorted(self._ids))
+                snapshot = self._snapshot
+        return snapshot
+
+    def begin_load(self):
+        """DB dan yuklash boshlanishidan oldin chaqiriladi: shu paytdan keyingi o'zgarishlar eslab qolinadi."""
+        with self._lock:
+            self._loading = True
+            self._ops_during_load = []
+
+    def load(self, chat_ids: Iterable[int]):
+        """DB dan olingan ro'yxatni o'rnatadi va yuklash davomida bo'lgan o'zgarishlarni ustidan qo'llaydi."""
+        with self._lock:
+            ids = set(chat_ids)
+            for is_add, chat_id in self._ops_during_load:
+                if is_add:
+                    ids.add(chat_id)
+                else:
+                    ids.discard(chat_id)
+            self._ids = ids
+            self._snapshot = None
+            self._loaded = True
+            self._loading = False
+            self._ops_during_load = []
+        logger.info(f"Chat registri yuklandi: {len(ids)} ta faol chat.")
+
+    def invalidate(self):
+        """Registrni eskirgan deb belgilaydi: keyingi o'qish DB dan qayta yuklaydi."""
+        with self._lock:
+            self._loaded = False
+
+    def _apply(self, is_add: bool, chat_id: int):
+        with self._lock:
+            if self._loading:
+                self._ops_during_load.append((is_add, chat_id))
+            if is_add:
+                if chat_id in self._ids:
+                    return
+                self._ids.add(chat_id)
+            else:
+                if chat_id not in self._ids:
+                    return
+                self._ids.discard(chat_id)
+            self._snapshot = None
+
+    def add(self, chat_id: int):
+        self._apply(True, chat_id)
+
+    def remove(self, chat_id: int):
+        self._apply(False, chat_id)
+
+    def apply_notify(self, payload: str):
+        """Boshqa nusxadan kelgan NOTIFY: '+<chat_id>' yoki '-<chat_id>'."""
+        chat_id = int(payload[1:])
+        if payload[0] == '+':
+            self.add(chat_id)
+        else:
+            self.remove(chat_id)
+
+
+# Dastur bo'yicha yagona registr
+registry = ChatRegistry()
@@ -1,6 +1,7 @@
 # config.py fayli
 
 import os
+import socket
 from dotenv import load_dotenv
 
 # Lokal ishga tushirish uchun .env ni yuklaymiz
@@ -13,9 +14,12 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 # Bu qiymat sizning Neon.tech dan olgan manzil (postgresql://...) bo'ladi.
 DATABASE_URL = os.getenv("DATABASE_URL") 
 
-# DB_NAME endi kerak emas, lekin boshqa joyda ishlatilgan bo'lsa qoldirish mumkin.
-# Agar ishlatilmasa, olib tashlashingiz mumkin. Hozircha qoldiramiz.
-DB_NAME = "bot_data.db" 
+# Ma'lumotlar ombori: 'postgres' (DATABASE_URL) yoki 'sqlite' (DB_NAME fayli).
+# SQLite bitta jarayon uchun: kichik o'rnatishlar va Postgres'siz benchmark'lar.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "postgres")
+
+# SQLite fayli (WAL rejimida ochiladi). ':memory:' - faqat xotirada, jarayon tugashi bilan o'chadi.
+DB_NAME = os.getenv("DB_NAME", "bot_data.db")
 
 # --- ADMIN IDS UCHUN YETCHIM ---
 # .env dan ADMIN_ID qiymatini string sifatida o'qish 
@@ -28,3 +32,113 @@ if admin_id_str:
 else:
     # Agar ID topilmasa, bo'sh ro'yxat qaytariladi
     ADMIN_ID = []
+
+# --- DB ULANISHLAR HOVUZI (CONNECTION POOL) ---
+# Hovuzda doim ochiq turadigan va eng ko'p ruxsat etilgan ulanishlar soni
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+# Shuncha soniya bo'sh turgan ulanish ishlatishdan oldin `SELECT 1` bilan tekshiriladi
+DB_POOL_IDLE_CHECK_SECONDS = int(os.getenv("DB_POOL_IDLE_CHECK_SECONDS", 30))
+# Bo'sh ulanish kutishning eng uzoq vaqti (soniya)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+
+# --- POSTLARNI YUBORISH (FAN-OUT) ---
+# Bir vaqtda ishlaydigan yuboruvchi worker'lar soni
+SEND_CONCURRENCY = int(os.getenv("SEND_CONCURRENCY", 20))
+# Telegram limitlari: bot bo'yicha sekundiga umumiy xabarlar va bitta guruhga daqiqasiga xabarlar
+GLOBAL_RATE_LIMIT = float(os.getenv("GLOBAL_RATE_LIMIT", 30))
+GROUP_RATE_LIMIT_PER_MINUTE = float(os.getenv("GROUP_RATE_LIMIT_PER_MINUTE", 20))
+
+# --- YETKAZISH JURNALI (post_deliveries) ---
+# Yuborish natijalari shuncha yozuv yig'ilganda yoki shuncha soniyada bir DB ga yoziladi
+LEDGER_BATCH_SIZE = int(os.getenv("LEDGER_BATCH_SIZE", 100))
+LEDGER_FLUSH_SECONDS = float(os.getenv("LEDGER_FLUSH_SECONDS", 2))
+
+# --- POSTLARNI ANIQ VAQTIDA YUBORISH (DISPATCHER) ---
+# Xotiradagi rejalarni DB bilan solishtirish oralig'i (daqiqa). Bu faqat xavfsizlik uchun.
+DISPATCH_RECONCILE_MINUTES = int(os.getenv("DISPATCH_RECONCILE_MINUTES", 10))
+# Yuborishda xato bo'lsa, qayta urinishdan oldin kutish (soniya)
+DISPATCH_RETRY_SECONDS = float(os.getenv("DISPATCH_RETRY_SECONDS", 30))
+# LISTEN ulanishi uzilganda qayta ulanishdan oldin kutish (soniya)
+LISTEN_RECONNECT_SECONDS = float(os.getenv("LISTEN_RECONNECT_SECONDS", 5))
+
+# --- BIR NECHTA NUSXADA YUBORISH (SHARD VA IJARALAR) ---
+# Har bir nusxaning noyob nomi (ijara egasi sifatida yoziladi)
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+# Bitta shard'dagi chatlar soni va shard ijarasi muddati (soniya)
+SHARD_SIZE = int(os.getenv("SHARD_SIZE", 500))
+SHARD_LEASE_SECONDS = int(os.getenv("SHARD_LEASE_SECONDS", 60))
+
+# --- XATOLARDA QAYTA URINISH ---
+# Bitta chatga eng ko'p urinishlar soni va vaqtinchalik xatolardan keyingi kutish chegaralari (soniya)
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", 5))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 1))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 60))
+# Flood control (RetryAfter) urinishlar soniga kirmaydi: bitta chat uchun Telegram so'ragan kutishlar
+# yig'indisi shundan (soniya) oshgandagina yuborish muvaffaqiyatsiz deb yoziladi
+RETRY_MAX_FLOOD_WAIT = float(os.getenv("RETRY_MAX_FLOOD_WAIT", 3600))
+
+# --- WEBHOOK REJIMI ---
+# Botning tashqi manzili (masalan, https://avtopost.onrender.com). O'rnatilmasa, Long Polling ishlatiladi.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+# Telegram yangilanishlari keladigan yo'l va X-Telegram-Bot-Api-Secret-Token tekshiruvi uchun maxfiy kalit
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+# --- KECHIKKAN POSTLARNI YUBORISH (DRAIN) ---
+# Vaqti kelgan postlar DB dan shuncha tadan sahifalab o'qiladi
+DRAIN_PAGE_SIZE = int(os.getenv("DRAIN_PAGE_SIZE", 100))
+
+# --- ALBOMLAR (MEDIA GROUP) ---
+# Albom qismlari alohida xabarlar bo'lib keladi: birinchi qismdan keyin shuncha soniya
+# ichida kelgan qismlar bitta post sifatida yig'iladi
+ALBUM_COLLECT_SECONDS = float(os.getenv("ALBUM_COLLECT_SECONDS", 1))
+
+# --- CHATLAR HOLATINI TEKSHIRISH (chat_health.py) ---
+# Har bir faol chat shuncha soatda bir marta tekshiriladi (0 - tekshiruv o'chirilgan)
+CHAT_HEALTH_INTERVAL_HOURS = float(os.getenv("CHAT_HEALTH_INTERVAL_HOURS", 24))
+# Tekshiruvlarning eng yuqori tezligi (so'rov/soniya) va bir marta egallanadigan chatlar soni
+CHAT_HEALTH_MAX_RATE = float(os.getenv("CHAT_HEALTH_MAX_RATE", 1))
+CHAT_HEALTH_BATCH_SIZE = int(os.getenv("CHAT_HEALTH_BATCH_SIZE", 10))
+
+# --- ESKI POSTLARNI ARXIVLASH (retention.py) ---
+# Vaqtidan shuncha kun o'tgan yuborilgan postlar arxivga ko'chiriladi (0 - arxivlash o'chirilgan)
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", 30))
+# Arxivlash oralig'i (soat), bitta tranzaksiyadagi postlar soni va partiyalar orasidagi pauza (soniya)
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", 6))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 50))
+RETENTION_PAUSE_SECONDS = float(os.getenv("RETENTION_PAUSE_SECONDS", 0.5))
+# true bo'lsa hech narsa ko'chirilmaydi, faqat nechta post ko'chirilishi logga yoziladi
+RETENTION_DRY_RUN = os.getenv("RETENTION_DRY_RUN", "false").lower() in ("1", "true", "yes")
+
+# --- POSTLARNI FAYLDAN IMPORT QILISH (/import) ---
+# Bitta CSV/JSON fayldagi eng ko'p qatorlar soni
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", 5000))
+
+# --- YORDAMCHI BOTLAR (bot_pool.py) ---
+# Vergul bilan ajratilgan qo'shimcha bot tokenlari. Telegram yuborish limiti har bir token uchun
+# alohida, shuning uchun har bir yordamchi bot o'z cheklovchisi bilan yuborish tezligini oshiradi.
+# Yordamchi bot chatga qo'lda qo'shiladi, so'ng chat avtomatik ravishda unga biriktiriladi.
+HELPER_BOT_TOKENS = [token.strip() for token in os.getenv("HELPER_BOT_TOKENS", "").split(",") if token.strip()]
+# Asosiy va barcha yordamchi botlar a'zo bo'lgan yopiq kanal/guruh. file_id va admin chatidagi
+# asl xabarlar faqat asosiy botga ochiq, shuning uchun media/copy postlar avval bu yerga bir marta
+# yuboriladi va yordamchi botlar ularni shu yerdan nusxalaydi. Ko'rsatilmasa yordamchi botlar
+# faqat matnli postlarni yuboradi.
+HELPER_STAGING_CHAT_ID = int(os.getenv("HELPER_STAGING_CHAT_ID", 0)) or None
+# Taqsimlanmagan chatlar shu o'lchamdagi partiyalarda olinadi
+BOT_POOL_ASSIGN_BATCH_SIZE = int(os.getenv("BOT_POOL_ASSIGN_BATCH_SIZE", 50))
+
+# --- FSM HOLATLARI (fsm_storage.py) ---
+# Admin jarayonlari (/newpost, /import, /editpost) holati bazada saqlanadi, shuning uchun
+# qayta ishga tushirishda yo'qolmaydi va barcha nusxalarga ko'rinadi. O'qishlar shuncha
+# soniya jarayon ichidagi keshdan olinadi (boshqa nusxa yozsa kesh NOTIFY orqali tozalanadi).
+FSM_CACHE_TTL_SECONDS = float(os.getenv("FSM_CACHE_TTL_SECONDS", 5))
+
+# --- SEKIN AMALLAR JURNALI VA PROFILLASH (slowlog.py, profiler.py) ---
+# Shundan uzoq davom etgan bitta db.py chaqiruvi yoki Bot API yuborishi post_id/chat_id bilan
+# logga yoziladi (millisekund, 0 - o'chirilgan)
+SLOW_DB_MS = float(os.getenv("SLOW_DB_MS", 200))
+SLOW_SEND_MS = float(os.getenv("SLOW_SEND_MS", 2000))
+# /profile: namuna olish oralig'i (millisekund) va eng uzun profillash vaqti (soniya)
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 10))
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", 300))
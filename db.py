@@ -1,222 +1,1148 @@
 # db.py - PostgreSQL (psycopg2) ga moslangan yakuniy versiya
 
+import json
 import psycopg2
 import logging
+import threading
+import time
 import pytz 
+from contextlib import contextmanager
 from datetime import datetime
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 
-from config import DATABASE_URL
+import recurrence
+import stats
+from chat_registry import registry as chat_registry
+from migrations import MIGRATIONS
+from config import DATABASE_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_IDLE_CHECK_SECONDS, DB_POOL_TIMEOUT, SHARD_SIZE
+# Post va yetkazish holatlari barcha backend'lar uchun umumiy (storage.py)
+from storage import (
+    POST_PENDING, POST_IN_PROGRESS, POST_DONE, POST_PARTIALLY_FAILED,
+    DELIVERY_PENDING, DELIVERY_SENT, DELIVERY_FAILED,
+    SHARD_PENDING, SHARD_DONE,
+)
 
 logger = logging.getLogger(__name__)
 
+# Boshqa nusxalardagi o'zgarishlar LISTEN/NOTIFY orqali keladi (pg_listener)
+SUPPORTS_NOTIFY = True
+
+# Issiq so'rovlar (benchmark.py explain ularning rejasini indeks bo'yicha tekshiradi)
+ACTIVE_CHATS_QUERY = "SELECT id FROM target_chats WHERE is_active = TRUE;"
+# Sahifalab (keyset) o'qish: (schedule_time, id) juftligi oldingi sahifaning oxiridan katta
+DUE_POSTS_QUERY = """
+    SELECT id, media_type, file_id, caption, status, schedule_time
+    FROM scheduled_posts 
+    WHERE status IN (%s, %s) AND schedule_time <= %s
+      AND (schedule_time, id) > (%s::timestamptz, %s)
+    ORDER BY schedule_time, id
+    LIMIT %s;
+"""
+
+# Yangi post qo'shilganda NOTIFY yuboriladigan kanal (payload: '<post_id>:<epoch soniya>')
+NEW_POST_CHANNEL = 'scheduled_posts_new'
+# Chat faollashganda/nofaol bo'lganda NOTIFY yuboriladigan kanal (payload: '+<chat_id>' / '-<chat_id>')
+CHATS_CHANGED_CHANNEL = 'target_chats_changed'
+# FSM holati o'zgarganda NOTIFY yuboriladigan kanal (payload: '<yozgan nusxa>:<kalit>')
+FSM_CHANGED_CHANNEL = 'fsm_states_changed'
+
+# Server uzib qo'ygan ulanishlarni tezroq aniqlash uchun TCP keepalive
+_CONNECT_KWARGS = {
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'keepalives_interval': 10,
+    'keepalives_count': 3,
+}
+
 # --- BAZA BILAN ALOQA FUNKSIYASI ---
 def get_db_connection():
-    """PostgreSQL ga ulanishni yaratadi va qaytaradi."""
+    """PostgreSQL ga yangi (hovuzsiz) ulanishni yaratadi va qaytaradi."""
     if not DATABASE_URL:
         logger.error("DATABASE_URL konfiguratsiyada topilmadi.")
         raise ValueError("DATABASE_URL topilmadi. Iltimos, Render ENV yoki .env da o'rnating.")
     
     try:
-        conn = psycopg2.connect(DATABASE_URL)
+        conn = psycopg2.connect(DATABASE_URL, **_CONNECT_KWARGS)
         return conn
     except Exception as e:
         logger.error(f"PostgreSQL ulanishida xato: {e}")
         # Ulanish xatosi bo'lsa, xatoni ko'rsatish
         raise
 
+# --- ULANISHLAR HOVUZI (CONNECTION POOL) ---
+# Har bir so'rov uchun yangi TLS + autentifikatsiya qilmaslik uchun ulanishlar qayta ishlatiladi.
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+_last_used = {} # id(conn) -> oxirgi marta hovuzga qaytarilgan vaqt (monotonic)
+
+# db_cursor() orqali bajarilgan tranzaksiyalar soni (benchmark va kuzatuv uchun)
+transaction_count = 0
+
+def get_pool():
+    """Ulanishlar hovuzini (birinchi chaqiruvda) yaratadi va qaytaradi."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if not DATABASE_URL:
+                    logger.error("DATABASE_URL konfiguratsiyada topilmadi.")
+                    raise ValueError("DATABASE_URL topilmadi. Iltimos, Render ENV yoki .env da o'rnating.")
+                _pool = ThreadedConnectionPool(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DATABASE_URL, **_CONNECT_KWARGS)
+                logger.info(f"DB ulanishlar hovuzi yaratildi (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE}).")
+    return _pool
+
+def close_pool():
+    """Hovuzdagi barcha ulanishlarni yopadi (dastur to'xtaganda chaqiriladi)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+            logger.info("DB ulanishlar hovuzi yopildi.")
+
+def _is_healthy(conn) -> bool:
+    """Uzoq vaqt bo'sh turgan ulanishni `SELECT 1` bilan tekshiradi."""
+    if conn.closed:
+        return False
+    last_used = _last_used.get(id(conn))
+    # Yangi ochilgan ulanish tekshirilmaydi
+    if last_used is None or time.monotonic() - last_used < DB_POOL_IDLE_CHECK_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error as e:
+        logger.warning(f"DB ulanishi uzilgan, qayta ulaniladi: {e}")
+        return False
+
+def _acquire_connection():
+    """Hovuzdan sog'lom ulanish oladi. Bo'sh ulanish bo'lmasa, DB_POOL_TIMEOUT gacha kutadi."""
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise PoolError(f"{DB_POOL_TIMEOUT} soniya ichida bo'sh DB ulanishi topilmadi.")
+    try:
+        pool = get_pool()
+        # Uzilgan ulanishlarni tashlab yuborib, yangisini olish (eng ko'pi bilan hovuz hajmicha urinish)
+        for _ in range(DB_POOL_MAX_SIZE + 1):
+            conn = pool.getconn()
+            if _is_healthy(conn):
+                return conn
+            _last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+        raise PoolError("Sog'lom DB ulanishini olish imkoni bo'lmadi.")
+    except Exception:
+        _pool_slots.release()
+        raise
+
+def _release_connection(conn, broken: bool = False):
+    """Ulanishni hovuzga qaytaradi. Buzilgan ulanish yopiladi va keyinroq qaytadan yaratiladi."""
+    try:
+        if broken or conn.closed:
+            _last_used.pop(id(conn), None)
+            get_pool().putconn(conn, close=True)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+            get_pool().putconn(conn)
+    finally:
+        _pool_slots.release()
+
+@contextmanager
+def db_cursor():
+    """
+    Hovuzdan ulanish olib cursor beradi. Blok muvaffaqiyatli tugasa commit,
+    xato bo'lsa rollback qilinadi; ulanish uzilgan bo'lsa u hovuzdan chiqariladi.
+    """
+    global transaction_count
+    conn = _acquire_connection()
+    transaction_count += 1
+    broken = False
+    try:
+        with conn.cursor() as cur:
+            yield cur
+        conn.commit()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    except Exception:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+        raise
+    finally:
+        _release_connection(conn, broken)
+
 # --- DEBUG FUNKSIYALARI ---
-def debug_check_db_content():
-    """Jadvallardagi barcha ma'lumotlarni logga chiqaradi (DEBUG maqsadida)."""
-    conn = None
+def get_db_summary() -> dict:
+    """
+    Ishga tushishda logga chiqariladigan qisqa statistika. Faqat qisman indekslar (faol chatlar,
+    yuborilmagan postlar) sanaladi, postlarning umumiy soni esa planner statistikasidan
+    (pg_class.reltuples) olinadi, shuning uchun vaqt yuborilgan postlar tarixi bilan o'smaydi.
+    """
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Target Chats ma'lumotlarini olish
-        cur.execute("SELECT id, title, is_active FROM target_chats;")
-        chats = cur.fetchall()
-        logger.info(f"DEBUG CHATS: Target Chats ({len(chats)}): {chats}")
-        
-        # Scheduled Posts ma'lumotlarini olish
-        cur.execute("SELECT id, schedule_time, is_sent FROM scheduled_posts;")
-        posts = cur.fetchall()
-        logger.info(f"DEBUG POSTS: Scheduled Posts ({len(posts)}): {posts}")
-        
+        with db_cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM target_chats WHERE is_active = TRUE;")
+            active_chats = cur.fetchone()[0]
+            cur.execute(
+                "SELECT COUNT(*) FROM scheduled_posts WHERE status IN (%s, %s);",
+                (POST_PENDING, POST_IN_PROGRESS)
+            )
+            pending_posts = cur.fetchone()[0]
+            cur.execute("SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE oid = 'scheduled_posts'::regclass;")
+            posts_estimate = cur.fetchone()[0]
+        return {'active_chats': active_chats, 'pending_posts': pending_posts, 'posts_estimate': posts_estimate}
     except Exception as e:
-        logger.error(f"DEBUG XATO: DB tarkibini tekshirishda xato: {e}")
-    finally:
-        if conn:
-            conn.close()
+        logger.error(f"DB statistikasini olishda xato: {e}")
+        raise
 
 # --- MA'LUMOTLAR BAZASINI INITSIIALIZATSIYA QILISH ---
+
+# Bir nechta nusxa bir vaqtda ishga tushganda migratsiyalarni navbat bilan bajarish uchun
+_MIGRATIONS_LOCK_ID = 727001
+
+def apply_migrations(cur) -> list:
+    """
+    migrations.MIGRATIONS dan hali qo'llanilmaganlarini berilgan cursor tranzaksiyasida
+    tartib bilan bajaradi va qo'llanilgan versiyalar ro'yxatini qaytaradi.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+        );
+    """)
+    cur.execute("SELECT pg_advisory_xact_lock(%s);", (_MIGRATIONS_LOCK_ID,))
+    cur.execute("SELECT version FROM schema_migrations;")
+    done = {row[0] for row in cur.fetchall()}
+
+    applied = []
+    for version, name, migration_sql in MIGRATIONS:
+        if version in done:
+            continue
+        cur.execute(migration_sql)
+        cur.execute(
+            "INSERT INTO schema_migrations (version, name) VALUES (%s, %s);",
+            (version, name)
+        )
+        logger.info(f"Migratsiya {version} qo'llanildi: {name}")
+        applied.append(version)
+    return applied
+
 def init_db():
-    """Jadvallar mavjudligini tekshiradi va kerak bo'lsa ularni yaratadi."""
-    conn = None
+    """Ma'lumotlar bazasi sxemasini migratsiyalar orqali oxirgi versiyaga keltiradi."""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # 1. target_chats jadvali
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS target_chats (
-                id BIGINT PRIMARY KEY,
-                title VARCHAR(255) NOT NULL,
-                type VARCHAR(50),
-                is_active BOOLEAN DEFAULT TRUE
-            );
-        """)
-        
-        # 2. scheduled_posts jadvali
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS scheduled_posts (
-                id SERIAL PRIMARY KEY,
-                media_type VARCHAR(50) NOT NULL,
-                file_id TEXT,
-                caption TEXT,
-                schedule_time TIMESTAMP WITH TIME ZONE NOT NULL,
-                is_sent BOOLEAN DEFAULT FALSE
-            );
-        """)
-        
-        conn.commit()
-        logger.info("PostgreSQL jadvallari muvaffaqiyatli tekshirildi/yaratildi.")
-        
-        # DB tarkibini tekshirish uchun DEBUG funksiyasini chaqirish
-        debug_check_db_content()
-        
+        with db_cursor() as cur:
+            applied = apply_migrations(cur)
+            
+        logger.info(f"PostgreSQL sxemasi tekshirildi ({len(applied)} ta yangi migratsiya qo'llanildi).")
     except Exception as e:
         logger.error(f"DB initsializatsiyasida xato: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
 
 # --- CHATLARNI QO'SHISH/YANGILASH ---
 def add_chat(chat_id: int, title: str, chat_type: str):
     """Chatni qo'shadi yoki faollashtiradi (agar allaqachon mavjud bo'lsa)."""
-    conn = None
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        # INSERT OR UPDATE (UPSERT)
-        cur.execute("""
-            INSERT INTO target_chats (id, title, type, is_active) 
-            VALUES (%s, %s, %s, TRUE)
-            ON CONFLICT (id) DO UPDATE 
-            SET title = EXCLUDED.title, type = EXCLUDED.type, is_active = TRUE;
-        """, (chat_id, title, chat_type))
-        conn.commit()
+    try:
+        with db_cursor() as cur:
+            # INSERT OR UPDATE (UPSERT)
+            cur.execute("""
+                INSERT INTO target_chats (id, title, type, is_active) 
+                VALUES (%s, %s, %s, TRUE)
+                ON CONFLICT (id) DO UPDATE 
+                SET title = EXCLUDED.title, type = EXCLUDED.type, is_active = TRUE, bot_id = NULL;
+            """, (chat_id, title, chat_type))
+            cur.execute("SELECT pg_notify(%s, %s);", (CHATS_CHANGED_CHANNEL, f"+{chat_id}"))
+        chat_registry.add(chat_id)
         logger.info(f"Chat {chat_id} muvaffaqiyatli qo'shildi/yangilandi.")
     except Exception as e:
         logger.error(f"Chatni qo'shish/yangilashda xato ({chat_id}): {e}")
-    finally:
-        if conn:
-            conn.close()
 
 # --- BOSHQA DB FUNKSIYALAR ---
 
 def get_active_chats():
-    """Barcha faol chat ID'larini qaytaradi."""
-    conn = None
+    """
+    Barcha faol chat ID'larini qaytaradi. Chat registri yuklangan bo'lsa, DB ga murojaat
+    qilinmaydi; aks holda ro'yxat DB dan o'qiladi va registr shu bilan yuklanadi.
+    """
+    if chat_registry.loaded:
+        return chat_registry.ids()
+
     chats = []
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT id FROM target_chats WHERE is_active = TRUE;")
-        chats = [int(row[0]) for row in cur.fetchall()]
+        chat_registry.begin_load()
+        with db_cursor() as cur:
+            cur.execute(ACTIVE_CHATS_QUERY)
+            chats = [int(row[0]) for row in cur.fetchall()]
+        chat_registry.load(chats)
+        chats = chat_registry.ids()
     except Exception as e:
         logger.error(f"Faol chatlarni olishda xato: {e}")
-    finally:
-        if conn:
-            conn.close()
     return chats
 
-def add_scheduled_post(media_type: str, file_id: str, caption: str, schedule_time: datetime) -> int:
-    """Yangi postni rejalashtirish jadvaliga qo'shadi."""
-    conn = None
+def add_scheduled_post(media_type: str, file_id: str, caption: str, schedule_time: datetime,
+                       source_chat_id: int = None, source_message_ids: list = None, caption_index: int = None) -> int:
+    """
+    Yangi postni rejalashtirish jadvaliga qo'shadi. media_type = 'copy' bo'lsa, post
+    `source_chat_id` chatidagi `source_message_ids` xabarlaridan (albomdan) nusxalanadi,
+    `caption_index` - albomning caption'li qismi (None - birinchi qism).
+    """
     post_id = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # Vaqtni Toshkent vaqt zonasiga moslash
         tz = pytz.timezone("Asia/Tashkent")
         scheduled_time_tz = tz.localize(schedule_time)
         
-        cur.execute("""
-            INSERT INTO scheduled_posts (media_type, file_id, caption, schedule_time) 
-            VALUES (%s, %s, %s, %s) RETURNING id;
-        """, (media_type, file_id, caption, scheduled_time_tz))
-        
-        post_id = cur.fetchone()[0]
-        conn.commit()
+        with db_cursor() as cur:
+            cur.execute("""
+                INSERT INTO scheduled_posts (media_type, file_id, caption, schedule_time, source_chat_id, source_message_ids, caption_index) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id;
+            """, (media_type, file_id, caption, scheduled_time_tz, source_chat_id, source_message_ids, caption_index))
+            post_id = cur.fetchone()[0]
+            # Dispatcher'larni xabardor qilish (NOTIFY faqat commit'dan keyin yetkaziladi)
+            cur.execute(
+                "SELECT pg_notify(%s, %s);",
+                (NEW_POST_CHANNEL, f"{post_id}:{scheduled_time_tz.timestamp()}")
+            )
     except Exception as e:
         logger.error(f"Postni rejalashtirishda xato: {e}")
-    finally:
-        if conn:
-            conn.close()
     return post_id
 
+def add_scheduled_posts(posts: list) -> list:
+    """
+    Ko'p postni bitta tranzaksiyada (ko'p qatorli INSERT) qo'shadi va [(id, schedule_time), ...] qaytaradi.
+    posts: (media_type, file_id, caption, schedule_time) lar, vaqt Toshkent vaqti deb olinadi.
+    Dispatcher'lar uchun NOTIFY'lar ham bitta so'rov bilan yuboriladi.
+    """
+    if not posts:
+        return []
+    tz = pytz.timezone("Asia/Tashkent")
+    rows = [(media_type, file_id, caption, tz.localize(schedule_time)) for media_type, file_id, caption, schedule_time in posts]
+    try:
+        with db_cursor() as cur:
+            created = execute_values(cur, """
+                INSERT INTO scheduled_posts (media_type, file_id, caption, schedule_time) VALUES %s
+                RETURNING id, schedule_time;
+            """, rows, page_size=1000, fetch=True)
+            cur.execute(
+                "SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload;",
+                (NEW_POST_CHANNEL, [f"{post_id}:{when.timestamp()}" for post_id, when in created])
+            )
+        logger.info(f"{len(created)} ta post bitta tranzaksiyada rejalashtirildi.")
+        return created
+    except Exception as e:
+        logger.error(f"Postlarni ommaviy rejalashtirishda xato: {e}")
+        raise
+
 def deactivate_chat(chat_id: int):
     """Chatni nofaol deb belgilaydi."""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("UPDATE target_chats SET is_active = FALSE WHERE id = %s;", (chat_id,))
-        conn.commit()
+        with db_cursor() as cur:
+            cur.execute("UPDATE target_chats SET is_active = FALSE WHERE id = %s;", (chat_id,))
+            cur.execute("SELECT pg_notify(%s, %s);", (CHATS_CHANGED_CHANNEL, f"-{chat_id}"))
+        chat_registry.remove(chat_id)
     except Exception as e:
         logger.error(f"Chatni nofaol qilishda xato ({chat_id}): {e}")
-    finally:
-        if conn:
-            conn.close()
 
-def get_due_posts():
-    """Yuborilishi kerak bo'lgan barcha postlarni qaytaradi."""
-    conn = None
+def migrate_chat(old_chat_id: int, new_chat_id: int):
+    """Guruh supergroup'ga ko'chganda chatni yangi ID bilan faollashtiradi va eski ID ni nofaol qiladi."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                INSERT INTO target_chats (id, title, type, is_active)
+                SELECT %s, title, 'supergroup', TRUE FROM target_chats WHERE id = %s
+                ON CONFLICT (id) DO UPDATE SET is_active = TRUE;
+            """, (new_chat_id, old_chat_id))
+            cur.execute("UPDATE target_chats SET is_active = FALSE WHERE id = %s;", (old_chat_id,))
+            cur.execute("SELECT pg_notify(%s, %s);", (CHATS_CHANGED_CHANNEL, f"-{old_chat_id}"))
+            cur.execute("SELECT pg_notify(%s, %s);", (CHATS_CHANGED_CHANNEL, f"+{new_chat_id}"))
+        chat_registry.remove(old_chat_id)
+        chat_registry.add(new_chat_id)
+        logger.info(f"Chat {old_chat_id} yangi ID ga ko'chirildi: {new_chat_id}.")
+    except Exception as e:
+        logger.error(f"Chat ID ni ko'chirishda xato ({old_chat_id} -> {new_chat_id}): {e}")
+        raise
+
+# --- CHATLAR HOLATINI TEKSHIRISH (chat_health.py) ---
+
+def claim_chats_for_health_check(limit: int, interval_seconds: float):
+    """
+    Oxirgi `interval_seconds` ichida tekshirilmagan eng eski `limit` ta faol chatni egallaydi
+    (last_checked_at hozirgi vaqtga o'rnatiladi, shuning uchun boshqa nusxalar ularni olmaydi).
+    Natija: [(chat_id, type), ...].
+    """
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                UPDATE target_chats c SET last_checked_at = NOW()
+                FROM (
+                    SELECT id FROM target_chats
+                    WHERE is_active = TRUE
+                      AND (last_checked_at IS NULL OR last_checked_at < NOW() - %s * INTERVAL '1 second')
+                    ORDER BY last_checked_at NULLS FIRST
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                ) s
+                WHERE c.id = s.id
+                RETURNING c.id, c.type;
+            """, (interval_seconds, limit))
+            return cur.fetchall()
+    except Exception as e:
+        logger.error(f"Tekshiriladigan chatlarni olishda xato: {e}")
+        raise
+
+def record_chat_health(chat_id: int, can_post_messages: bool):
+    """Botning chatga post yuborish huquqini va tekshiruv vaqtini yozadi."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "UPDATE target_chats SET can_post_messages = %s, last_checked_at = NOW() WHERE id = %s;",
+                (can_post_messages, chat_id)
+            )
+    except Exception as e:
+        logger.error(f"Chat holatini yozishda xato ({chat_id}): {e}")
+
+# --- BOTLARNI CHATLARGA TAQSIMLASH (bot_pool.py) ---
+
+def get_chat_bots():
+    """Yordamchi yoki asosiy botga biriktirilgan faol chatlar: [(chat_id, bot_id), ...]."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("SELECT id, bot_id FROM target_chats WHERE is_active = TRUE AND bot_id IS NOT NULL;")
+            return cur.fetchall()
+    except Exception as e:
+        logger.error(f"Chatlarga biriktirilgan botlarni olishda xato: {e}")
+        raise
+
+def get_unassigned_chats(limit: int):
+    """Hali botga biriktirilmagan ko'pi bilan `limit` ta faol chat: [(chat_id, type), ...]."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "SELECT id, type FROM target_chats WHERE is_active AND bot_id IS NULL ORDER BY id LIMIT %s;",
+                (limit,)
+            )
+            return cur.fetchall()
+    except Exception as e:
+        logger.error(f"Taqsimlanmagan chatlarni olishda xato: {e}")
+        raise
+
+def assign_chat_bot(chat_id: int, bot_id: int):
+    """Chatni `bot_id` botga biriktiradi (None - qayta taqsimlash uchun bo'shatish)."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("UPDATE target_chats SET bot_id = %s WHERE id = %s;", (bot_id, chat_id))
+    except Exception as e:
+        logger.error(f"Chatni botga biriktirishda xato ({chat_id} -> {bot_id}): {e}")
+
+def reset_chat_bots(bot_ids: list) -> int:
+    """`bot_ids` da yo'q (pool'dan olib tashlangan) botlarga biriktirilgan chatlarni bo'shatadi."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "UPDATE target_chats SET bot_id = NULL WHERE bot_id IS NOT NULL AND NOT (bot_id = ANY(%s));",
+                (list(bot_ids),)
+            )
+            return cur.rowcount
+    except Exception as e:
+        logger.error(f"Chat biriktirishlarini tozalashda xato: {e}")
+        raise
+
+def get_due_posts(after: tuple = None, limit: int = None):
+    """
+    Yuborilishi kerak bo'lgan postlarni (schedule_time, id) tartibida qaytaradi.
+    `limit` berilsa, bitta sahifa qaytariladi: keyingi sahifa uchun oxirgi postning
+    'cursor' qiymati (bazada saqlangan ko'rinishdagi schedule_time va id) `after` sifatida beriladi.
+    """
     posts = []
     
     # Hozirgi vaqtni Toshkent vaqt zonasida olish
     now = datetime.now(pytz.timezone("Asia/Tashkent")) 
+    after_time, after_id = after or ('-infinity', 0)
     
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT id, media_type, file_id, caption 
-            FROM scheduled_posts 
-            WHERE is_sent = FALSE AND schedule_time <= %s;
-        """, (now,))
-        
-        for row in cur.fetchall():
-            posts.append({
-                'id': row[0],
-                'media_type': row[1],
-                'file_id': row[2],
-                'caption': row[3]
-            })
+        with db_cursor() as cur:
+            # Yarim yo'lda to'xtab qolgan (in_progress) postlar ham qaytariladi
+            cur.execute(DUE_POSTS_QUERY, (POST_PENDING, POST_IN_PROGRESS, now, after_time, after_id, limit))
+            
+            for row in cur.fetchall():
+                posts.append({
+                    'id': row[0],
+                    'media_type': row[1],
+                    'file_id': row[2],
+                    'caption': row[3],
+                    'status': row[4],
+                    'schedule_time': row[5],
+                    'cursor': (row[5], row[0])
+                })
             
         if posts:
             logger.info(f"DEBUG: DB dan {len(posts)} ta yuborilishi kerak bo'lgan post topildi.")
             
     except Exception as e:
         logger.error(f"Yuboriladigan postlarni olishda xato: {e}")
-    finally:
-        if conn:
-            conn.close()
+        raise
     return posts
 
+def get_upcoming_schedule():
+    """Hali yuborilmagan (pending/in_progress) postlarning (id, schedule_time) ro'yxatini qaytaradi."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "SELECT id, schedule_time FROM scheduled_posts WHERE status IN (%s, %s);",
+                (POST_PENDING, POST_IN_PROGRESS)
+            )
+            return cur.fetchall()
+    except Exception as e:
+        logger.error(f"Kutilayotgan postlar jadvalini olishda xato: {e}")
+        raise
+
 def mark_post_as_sent(post_id: int):
     """Postni yuborilgan deb belgilaydi."""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("UPDATE scheduled_posts SET is_sent = TRUE WHERE id = %s;", (post_id,))
-        conn.commit()
+        with db_cursor() as cur:
+            cur.execute(
+                "UPDATE scheduled_posts SET is_sent = TRUE, status = %s WHERE id = %s;",
+                (POST_DONE, post_id)
+            )
     except Exception as e:
         logger.error(f"Postni yuborilgan deb belgilashda xato ({post_id}): {e}")
-    finally:
-        if conn:
-            conn.close()
+
+# --- TAKRORLANUVCHI POSTLAR (recurrence.py) ---
+# post_schedules dagi har bir jadvalning scheduled_posts da faqat navbatdagi posti bo'ladi.
+# Keyingisi plan_due_post da, joriy post rejalashtirilgan tranzaksiyaning o'zida yaratiladi.
+
+def _insert_occurrence(cur, schedule_id: int, when: datetime):
+    """Jadvalning `when` vaqtidagi postini yaratadi (kutilayotgan posti bo'lsa yoki jadval o'chirilgan bo'lsa None)."""
+    cur.execute("""
+        INSERT INTO scheduled_posts (media_type, file_id, caption, schedule_time, source_chat_id, source_message_ids, caption_index, schedule_id)
+        SELECT media_type, file_id, caption, %s, source_chat_id, source_message_ids, caption_index, id
+        FROM post_schedules WHERE id = %s AND is_active
+        ON CONFLICT (schedule_id) WHERE status = %s DO NOTHING
+        RETURNING id;
+    """, (when, schedule_id, POST_PENDING))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    cur.execute("SELECT pg_notify(%s, %s);", (NEW_POST_CHANNEL, f"{row[0]}:{when.timestamp()}"))
+    return row[0]
+
+def _advance_schedule(cur, schedule_id: int, after: datetime):
+    """Jadvalning `after` dan keyingi postini yaratadi va (post_id, vaqt) qaytaradi."""
+    # /unschedule bilan parallel bo'lsa, u tugaguncha kutiladi va o'chirilgan jadval davom ettirilmaydi
+    cur.execute("SELECT cron, timezone FROM post_schedules WHERE id = %s AND is_active FOR UPDATE;", (schedule_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    when = recurrence.next_occurrence(row[0], row[1], after)
+    if when is None:
+        cur.execute("UPDATE post_schedules SET is_active = FALSE WHERE id = %s;", (schedule_id,))
+        logger.info(f"Jadval {schedule_id}: cron ifodasi bo'yicha boshqa vaqt yo'q, jadval yakunlandi.")
+        return None
+    post_id = _insert_occurrence(cur, schedule_id, when)
+    return (post_id, when) if post_id is not None else None
+
+def add_recurring_post(media_type: str, file_id: str, caption: str, cron: str, timezone: str,
+                       source_chat_id: int = None, source_message_ids: list = None, caption_index: int = None):
+    """
+    Takrorlanuvchi postni va uning birinchi postini bitta tranzaksiyada qo'shadi.
+    (schedule_id, post_id, schedule_time) qaytaradi. Cron ifodasi noto'g'ri bo'lsa ValueError.
+    """
+    first = recurrence.next_occurrence(cron, timezone, None)
+    if first is None:
+        raise ValueError("bu cron ifodasi bo'yicha kelgusida birorta ham vaqt yo'q")
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                INSERT INTO post_schedules (cron, timezone, media_type, file_id, caption, source_chat_id, source_message_ids, caption_index)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id;
+            """, (cron, timezone, media_type, file_id, caption, source_chat_id, source_message_ids, caption_index))
+            schedule_id = cur.fetchone()[0]
+            post_id = _insert_occurrence(cur, schedule_id, first)
+        logger.info(f"Takrorlanuvchi post {schedule_id} ({cron}, {timezone}) qo'shildi, birinchi posti {post_id}: {first}.")
+        return schedule_id, post_id, first
+    except Exception as e:
+        logger.error(f"Takrorlanuvchi postni qo'shishda xato: {e}")
+        raise
+
+def get_post_schedules():
+    """Faol jadvallar va ularning navbatdagi posti: [{'id', 'cron', 'timezone', 'caption', 'next_post_id', 'next_time'}]."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                SELECT s.id, s.cron, s.timezone, s.caption, p.id, p.schedule_time
+                FROM post_schedules s
+                LEFT JOIN scheduled_posts p ON p.schedule_id = s.id AND p.status = %s
+                WHERE s.is_active
+                ORDER BY s.id;
+            """, (POST_PENDING,))
+            return [
+                {'id': row[0], 'cron': row[1], 'timezone': row[2], 'caption': row[3], 'next_post_id': row[4], 'next_time': row[5]}
+                for row in cur.fetchall()
+            ]
+    except Exception as e:
+        logger.error(f"Jadvallarni olishda xato: {e}")
+        raise
+
+def cancel_post_schedule(schedule_id: int) -> bool:
+    """Jadvalni to'xtatadi va uning hali yuborilmagan postini o'chiradi. Faol jadval topilmasa False."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("UPDATE post_schedules SET is_active = FALSE WHERE id = %s AND is_active;", (schedule_id,))
+            if not cur.rowcount:
+                return False
+            # Ayni paytda rejalashtirilayotgan post (plan_due_post qulflagan) o'tkazib yuboriladi: u allaqachon yuborilmoqda
+            cur.execute("""
+                DELETE FROM scheduled_posts WHERE id IN (
+                    SELECT id FROM scheduled_posts WHERE schedule_id = %s AND status = %s
+                    FOR UPDATE SKIP LOCKED
+                );
+            """, (schedule_id, POST_PENDING))
+        logger.info(f"Jadval {schedule_id} to'xtatildi.")
+        return True
+    except Exception as e:
+        logger.error(f"Jadvalni to'xtatishda xato ({schedule_id}): {e}")
+        raise
+
+# --- YETKAZISH JURNALI (post_deliveries) ---
+
+def get_pending_deliveries(post_id: int, first_chat_id: int = None, last_chat_id: int = None):
+    """
+    Post hali yetkazilmagan faol chatlarning ID'larini qaytaradi.
+    Chat oralig'i berilsa, faqat shu shard ichidagi chatlar qaytariladi.
+    """
+    chats = []
+    try:
+        with db_cursor() as cur:
+            if first_chat_id is None:
+                cur.execute("""
+                    SELECT d.chat_id FROM post_deliveries d
+                    JOIN target_chats c ON c.id = d.chat_id
+                    WHERE d.post_id = %s AND d.status = %s AND c.is_active = TRUE;
+                """, (post_id, DELIVERY_PENDING))
+            else:
+                cur.execute("""
+                    SELECT d.chat_id FROM post_deliveries d
+                    JOIN target_chats c ON c.id = d.chat_id
+                    WHERE d.post_id = %s AND d.status = %s AND c.is_active = TRUE
+                      AND d.chat_id BETWEEN %s AND %s;
+                """, (post_id, DELIVERY_PENDING, first_chat_id, last_chat_id))
+            chats = [int(row[0]) for row in cur.fetchall()]
+    except Exception as e:
+        logger.error(f"Yetkazilmagan chatlarni olishda xato ({post_id}): {e}")
+        raise
+    return chats
+
+def record_deliveries(rows: list):
+    """
+    Yuborish natijalarini bitta tranzaksiyada yozadi va statistika hisoblagichlarini oshiradi.
+    rows: (post_id, chat_id, status, message_id, extra_message_ids, error, attempts, bot_id) lar ro'yxati.
+    """
+    if not rows:
+        return
+    try:
+        with db_cursor() as cur:
+            # Hali pending bo'lgan yozuvlar tartib bilan qulflanadi: faqat shular yangilanadi va sanaladi,
+            # kechikkan yoki takroriy natija (ijara boshqa worker'ga o'tganda) yozilgan 'sent' ni buzmaydi
+            pending = execute_values(cur, """
+                SELECT d.post_id, d.chat_id, EXTRACT(EPOCH FROM NOW() - p.schedule_time)::float8
+                FROM post_deliveries d
+                JOIN scheduled_posts p ON p.id = d.post_id
+                WHERE (d.post_id, d.chat_id) IN (VALUES %s) AND d.status = 'pending'
+                ORDER BY d.post_id, d.chat_id
+                FOR UPDATE OF d;
+            """, [row[:2] for row in rows], template="(%s::integer, %s::bigint)", page_size=1000, fetch=True)
+            delays = {(post_id, chat_id): delay for post_id, chat_id, delay in pending}
+
+            execute_values(cur, """
+                UPDATE post_deliveries AS d
+                SET status = v.status,
+                    attempts = d.attempts + v.attempts,
+                    message_id = COALESCE(v.message_id, d.message_id),
+                    extra_message_ids = COALESCE(v.extra_message_ids, d.extra_message_ids),
+                    bot_id = COALESCE(v.bot_id, d.bot_id),
+                    error = v.error,
+                    updated_at = NOW(),
+                    sent_at = CASE WHEN v.status = 'sent' THEN NOW() ELSE d.sent_at END
+                FROM (VALUES %s) AS v (post_id, chat_id, status, message_id, extra_message_ids, error, attempts, bot_id)
+                WHERE d.post_id = v.post_id AND d.chat_id = v.chat_id AND d.status = 'pending';
+            """, rows, template="(%s::integer, %s::bigint, %s, %s::bigint, %s::bigint[], %s, %s::integer, %s::bigint)", page_size=1000)
+
+            _add_delivery_stats(cur, [
+                (post_id, chat_id, status, error, delays.pop((post_id, chat_id)))
+                for post_id, chat_id, status, _, _, error, _, _ in rows if (post_id, chat_id) in delays
+            ])
+    except Exception as e:
+        logger.error(f"Yetkazish natijalarini yozishda xato: {e}")
+        raise
+
+def finish_post_delivery(post_id: int) -> str:
+    """
+    Yetkazish jurnaliga qarab post holatini done yoki partially_failed qiladi va uni qaytaradi.
+    Nofaol bo'lib qolgan chatlarning kutilayotgan yozuvlari 'failed' deb belgilanadi.
+    Hali yuborilmagan faol chatlar bo'lsa, post in_progress holatida qoladi.
+    """
+    status = None
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                UPDATE post_deliveries d
+                SET status = %s, error = 'chat nofaol', updated_at = NOW()
+                FROM target_chats c
+                WHERE d.post_id = %s AND d.status = %s AND c.id = d.chat_id AND c.is_active = FALSE
+                RETURNING d.chat_id;
+            """, (DELIVERY_FAILED, post_id, DELIVERY_PENDING))
+            _add_delivery_stats(cur, [(post_id, chat_id, DELIVERY_FAILED, 'chat nofaol', 0.0) for (chat_id,) in cur.fetchall()])
+            cur.execute("""
+                SELECT COUNT(*) FILTER (WHERE status = %s),
+                       COUNT(*) FILTER (WHERE status = %s)
+                FROM post_deliveries WHERE post_id = %s;
+            """, (DELIVERY_PENDING, DELIVERY_FAILED, post_id))
+            pending, failed = cur.fetchone()
+            if pending:
+                return POST_IN_PROGRESS
+
+            status = POST_PARTIALLY_FAILED if failed else POST_DONE
+            # Post bir marta yakunlanadi: oxirgi shard va get_completed_post_ids bir vaqtda chaqirsa ham
+            # yakunlangan postlar hisoblagichi bir marta oshadi
+            cur.execute(
+                "UPDATE scheduled_posts SET status = %s, is_sent = TRUE WHERE id = %s AND status = %s RETURNING id;",
+                (status, post_id, POST_IN_PROGRESS)
+            )
+            if cur.fetchone():
+                _complete_post_stats(cur, post_id)
+    except Exception as e:
+        logger.error(f"Post holatini yakunlashda xato ({post_id}): {e}")
+        raise
+    return status
+
+# --- YETKAZISH STATISTIKASI (/stats, stats.py) ---
+# Hisoblagichlar natija yozilgan tranzaksiyada oshiriladi. Qulflar doim bir xil tartibda olinadi:
+# post_deliveries -> chat_stats (chat_id tartibida) -> post_stats -> hourly_stats -> delivery_totals.
+
+def _add_delivery_stats(cur, changes: list):
+    """pending'dan chiqqan yozuvlar [(post_id, chat_id, status, xato, kechikish), ...] bo'yicha hisoblagichlarni oshiradi."""
+    if not changes:
+        return
+    posts, chats, (sent, failed, delay) = stats.aggregate(changes)
+    execute_values(cur, """
+        INSERT INTO chat_stats (chat_id, sent, failed, last_error, last_failed_at) VALUES %s
+        ON CONFLICT (chat_id) DO UPDATE
+        SET sent = chat_stats.sent + EXCLUDED.sent,
+            failed = chat_stats.failed + EXCLUDED.failed,
+            last_error = COALESCE(EXCLUDED.last_error, chat_stats.last_error),
+            last_failed_at = COALESCE(EXCLUDED.last_failed_at, chat_stats.last_failed_at);
+    """, [(chat_id, s, f, error, f) for chat_id, s, f, error in chats],
+        template="(%s::bigint, %s, %s, %s, CASE WHEN %s > 0 THEN NOW() END)", page_size=1000)
+    execute_values(cur, """
+        INSERT INTO post_stats (post_id, schedule_time, sent, failed, delay_seconds, last_sent_at)
+        SELECT v.post_id, p.schedule_time, v.sent, v.failed, v.delay_seconds, CASE WHEN v.sent > 0 THEN NOW() END
+        FROM (VALUES %s) AS v (post_id, sent, failed, delay_seconds)
+        JOIN scheduled_posts p ON p.id = v.post_id
+        ORDER BY v.post_id
+        ON CONFLICT (post_id) DO UPDATE
+        SET sent = post_stats.sent + EXCLUDED.sent,
+            failed = post_stats.failed + EXCLUDED.failed,
+            delay_seconds = post_stats.delay_seconds + EXCLUDED.delay_seconds,
+            last_sent_at = COALESCE(EXCLUDED.last_sent_at, post_stats.last_sent_at);
+    """, [(post_id, *counts) for post_id, counts in sorted(posts.items())],
+        template="(%s::integer, %s::integer, %s::integer, %s::float8)")
+    cur.execute("""
+        INSERT INTO hourly_stats (hour, sent, failed, delay_seconds)
+        VALUES (date_trunc('hour', NOW()), %s, %s, %s)
+        ON CONFLICT (hour) DO UPDATE
+        SET sent = hourly_stats.sent + EXCLUDED.sent,
+            failed = hourly_stats.failed + EXCLUDED.failed,
+            delay_seconds = hourly_stats.delay_seconds + EXCLUDED.delay_seconds;
+        UPDATE delivery_totals
+        SET sent = sent + %s, failed = failed + %s, delay_seconds = delay_seconds + %s
+        WHERE id = 1;
+    """, (sent, failed, delay, sent, failed, delay))
+
+def _complete_post_stats(cur, post_id: int):
+    """Post yakunlandi: uning yakunlanish vaqti va yakunlangan postlar hisoblagichlari."""
+    cur.execute("""
+        INSERT INTO post_stats (post_id, schedule_time, completed_at)
+        SELECT id, schedule_time, NOW() FROM scheduled_posts WHERE id = %s
+        ON CONFLICT (post_id) DO UPDATE SET completed_at = EXCLUDED.completed_at;
+        INSERT INTO hourly_stats (hour, posts) VALUES (date_trunc('hour', NOW()), 1)
+        ON CONFLICT (hour) DO UPDATE SET posts = hourly_stats.posts + 1;
+        UPDATE delivery_totals SET posts = posts + 1 WHERE id = 1;
+    """, (post_id,))
+
+def get_delivery_stats(recent_posts: int, failing_chats: int) -> dict:
+    """
+    /stats uchun hisoblagichlar: jami (bitta qator), so'nggi 24 soat (ko'pi bilan 24 qator), so'nggi
+    postlar va eng ko'p xato bergan chatlar (indeks bo'yicha LIMIT). post_deliveries o'qilmaydi.
+    """
+    counts = ('posts', 'sent', 'failed', 'delay_seconds')
+    try:
+        with db_cursor() as cur:
+            cur.execute("SELECT posts, sent, failed, delay_seconds FROM delivery_totals WHERE id = 1;")
+            totals = dict(zip(counts, cur.fetchone() or (0, 0, 0, 0.0)))
+            cur.execute("""
+                SELECT COALESCE(SUM(posts), 0), COALESCE(SUM(sent), 0), COALESCE(SUM(failed), 0), COALESCE(SUM(delay_seconds), 0)
+                FROM hourly_stats
+                WHERE hour >= date_trunc('hour', NOW()) - INTERVAL '23 hours';
+            """)
+            last_24h = dict(zip(counts, cur.fetchone()))
+            cur.execute("""
+                SELECT post_id, sent, failed, delay_seconds, EXTRACT(EPOCH FROM completed_at - schedule_time)::float8
+                FROM post_stats
+                ORDER BY post_id DESC
+                LIMIT %s;
+            """, (recent_posts,))
+            posts = [
+                {'post_id': post_id, 'sent': sent, 'failed': failed, 'delay_seconds': delay, 'duration_seconds': duration}
+                for post_id, sent, failed, delay, duration in cur.fetchall()
+            ]
+            cur.execute("""
+                SELECT s.chat_id, c.title, s.sent, s.failed, s.last_error
+                FROM chat_stats s
+                LEFT JOIN target_chats c ON c.id = s.chat_id
+                WHERE s.failed > 0
+                ORDER BY s.failed DESC
+                LIMIT %s;
+            """, (failing_chats,))
+            chats = [
+                {'chat_id': chat_id, 'title': title, 'sent': sent, 'failed': failed, 'last_error': last_error}
+                for chat_id, title, sent, failed, last_error in cur.fetchall()
+            ]
+    except Exception as e:
+        logger.error(f"Yetkazish statistikasini olishda xato: {e}")
+        raise
+    return {'totals': totals, 'last_24h': last_24h, 'recent_posts': posts, 'failing_chats': chats}
+
+# --- BIR NECHTA NUSXA (REPLICA) UCHUN POST VA SHARD'LARNI EGALLASH ---
+# Post yuborishdan oldin rejalashtiriladi: yetkazish jurnali yaratiladi va chatlar
+# ID oralig'i bo'yicha shard'larga bo'linadi. Har bir shard'ni bitta worker vaqtinchalik
+# ijara (lease) bilan egallaydi. Worker o'lib qolsa, ijara tugagach shard boshqa worker
+# tomonidan qayta olinadi va jurnal tufayli faqat yuborilmagan chatlarga yuboriladi.
+
+def plan_due_post(post_id: int, chat_ids, shard_size: int = SHARD_SIZE):
+    """
+    Vaqti kelgan postni boshqa nusxalar bilan to'qnashmasdan (FOR UPDATE SKIP LOCKED)
+    egallaydi, uning yetkazish jurnalini va shard'larini yaratib, postni in_progress qiladi.
+    Post allaqachon rejalashtirilgan, boshqa nusxa egallagan yoki faol chat bo'lmasa, None qaytaradi.
+    """
+    if not chat_ids:
+        return None
+
+    try:
+        with db_cursor() as cur:
+            # Shard'lari hali yaratilmagan in_progress postlar (eski versiyadan qolgan) ham olinadi
+            cur.execute("""
+                SELECT id, media_type, file_id, caption, source_chat_id, source_message_ids, schedule_id, schedule_time
+                FROM scheduled_posts p
+                WHERE id = %s AND status IN (%s, %s)
+                  AND (status = %s OR NOT EXISTS (SELECT 1 FROM delivery_shards s WHERE s.post_id = p.id))
+                FOR UPDATE SKIP LOCKED;
+            """, (post_id, POST_PENDING, POST_IN_PROGRESS, POST_PENDING))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            post = {
+                'id': row[0], 'media_type': row[1], 'file_id': row[2], 'caption': row[3],
+                'source_chat_id': row[4], 'source_message_ids': row[5], 'schedule_id': row[6],
+            }
+
+            execute_values(cur, """
+                INSERT INTO post_deliveries (post_id, chat_id) VALUES %s
+                ON CONFLICT (post_id, chat_id) DO NOTHING;
+            """, [(post['id'], chat_id) for chat_id in chat_ids], page_size=1000)
+
+            # Chatlar ID bo'yicha tartiblanib, har biri shard_size tadan oraliqlarga bo'linadi
+            ordered = sorted(chat_ids)
+            shards = [
+                (post['id'], shard_no, chunk[0], chunk[-1])
+                for shard_no, chunk in enumerate(
+                    ordered[i:i + shard_size] for i in range(0, len(ordered), shard_size)
+                )
+            ]
+            execute_values(cur, """
+                INSERT INTO delivery_shards (post_id, shard_no, first_chat_id, last_chat_id) VALUES %s
+                ON CONFLICT (post_id, shard_no) DO NOTHING;
+            """, shards, page_size=1000)
+
+            cur.execute(
+                "UPDATE scheduled_posts SET status = %s WHERE id = %s;",
+                (POST_IN_PROGRESS, post['id'])
+            )
+
+            # Takrorlanuvchi post: keyingi posti shu tranzaksiyada yaratiladi (joriysi endi pending emas)
+            post['next_occurrence'] = _advance_schedule(cur, post['schedule_id'], row[7]) if post['schedule_id'] else None
+        logger.info(f"Post ID {post['id']} rejalashtirildi: {len(chat_ids)} ta chat, {len(shards)} ta shard.")
+        return post
+    except Exception as e:
+        logger.error(f"Vaqti kelgan postni rejalashtirishda xato: {e}")
+        raise
+
+def claim_delivery_shard(worker_id: str, lease_seconds: int):
+    """
+    Yuborilmagan va ijarasi bo'sh (yoki muddati o'tgan) bitta shard'ni egallaydi.
+    Natija: {'post': {...}, 'shard_no', 'first_chat_id', 'last_chat_id', 'previous_owner'} yoki None.
+    """
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                UPDATE delivery_shards s
+                SET lease_owner = %s, lease_expires_at = NOW() + %s * INTERVAL '1 second'
+                FROM (
+                    SELECT post_id, shard_no, lease_owner AS previous_owner
+                    FROM delivery_shards
+                    WHERE status = %s AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
+                    ORDER BY post_id, shard_no
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                ) c
+                WHERE s.post_id = c.post_id AND s.shard_no = c.shard_no
+                RETURNING s.post_id, s.shard_no, s.first_chat_id, s.last_chat_id, c.previous_owner;
+            """, (worker_id, lease_seconds, SHARD_PENDING))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            post_id, shard_no, first_chat_id, last_chat_id, previous_owner = row
+
+            cur.execute(
+                """
+                SELECT media_type, file_id, caption, schedule_time, source_chat_id, source_message_ids
+                FROM scheduled_posts WHERE id = %s;
+                """,
+                (post_id,)
+            )
+            media_type, file_id, caption, schedule_time, source_chat_id, source_message_ids = cur.fetchone()
+        return {
+            'post': {
+                'id': post_id, 'media_type': media_type, 'file_id': file_id, 'caption': caption,
+                'schedule_time': schedule_time, 'source_chat_id': source_chat_id, 'source_message_ids': source_message_ids,
+            },
+            'shard_no': shard_no,
+            'first_chat_id': first_chat_id,
+            'last_chat_id': last_chat_id,
+            'previous_owner': previous_owner,
+        }
+    except Exception as e:
+        logger.error(f"Shard egallashda xato: {e}")
+        raise
+
+def renew_shard_lease(post_id: int, shard_no: int, worker_id: str, lease_seconds: int) -> bool:
+    """Shard ijarasini uzaytiradi. Ijara boshqa worker'ga o'tib ketgan bo'lsa False qaytaradi (DB xatosi - istisno)."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                UPDATE delivery_shards
+                SET lease_expires_at = NOW() + %s * INTERVAL '1 second'
+                WHERE post_id = %s AND shard_no = %s AND lease_owner = %s AND status = %s;
+            """, (lease_seconds, post_id, shard_no, worker_id, SHARD_PENDING))
+            return cur.rowcount == 1
+    except Exception as e:
+        logger.error(f"Shard ijarasini uzaytirishda xato ({post_id}/{shard_no}): {e}")
+        raise
+
+def complete_delivery_shard(post_id: int, shard_no: int, worker_id: str) -> bool:
+    """
+    Shard'ni yakunlangan deb belgilaydi. Postning barcha shard'lari yakunlangan bo'lsa
+    True qaytaradi (post holatini finish_post_delivery bilan yakunlash mumkin).
+    """
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                UPDATE delivery_shards
+                SET status = %s, lease_owner = NULL, lease_expires_at = NULL
+                WHERE post_id = %s AND shard_no = %s AND lease_owner = %s;
+            """, (SHARD_DONE, post_id, shard_no, worker_id))
+            cur.execute(
+                "SELECT 1 FROM delivery_shards WHERE post_id = %s AND status = %s LIMIT 1;",
+                (post_id, SHARD_PENDING)
+            )
+            return cur.fetchone() is None
+    except Exception as e:
+        logger.error(f"Shard'ni yakunlashda xato ({post_id}/{shard_no}): {e}")
+        return False
+
+def get_completed_post_ids():
+    """Barcha shard'lari yakunlangan, lekin hali in_progress holatidagi postlar (yakunlash uchun)."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                SELECT p.id FROM scheduled_posts p
+                WHERE p.status = %s
+                  AND EXISTS (SELECT 1 FROM delivery_shards s WHERE s.post_id = p.id)
+                  AND NOT EXISTS (SELECT 1 FROM delivery_shards s WHERE s.post_id = p.id AND s.status = %s);
+            """, (POST_IN_PROGRESS, SHARD_PENDING))
+            return [row[0] for row in cur.fetchall()]
+    except Exception as e:
+        logger.error(f"Yakunlangan postlarni olishda xato: {e}")
+        return []
+
+# --- YUBORILGAN POSTLARNI TAHRIRLASH VA O'CHIRISH (post_actions.py) ---
+
+def get_post(post_id: int):
+    """Postning asosiy ma'lumotlari (id, media_type, caption, status, source_message_ids, caption_index) yoki None."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "SELECT id, media_type, caption, status, source_message_ids, caption_index FROM scheduled_posts WHERE id = %s;",
+                (post_id,)
+            )
+            row = cur.fetchone()
+        if row is None:
+            return None
+        return {'id': row[0], 'media_type': row[1], 'caption': row[2], 'status': row[3], 'source_message_ids': row[4],
+                'caption_index': row[5] or 0}
+    except Exception as e:
+        logger.error(f"Postni olishda xato ({post_id}): {e}")
+        raise
+
+def get_post_messages(post_ids: list):
+    """
+    Postlar yuborilgan chatlardagi xabarlar: (chat_id, post_id, [message_id, ...], bot_id) lar ro'yxati,
+    chat_id bo'yicha tartiblangan. Albomda ro'yxat barcha elementlarning ID'laridan iborat, bot_id -
+    xabarlarni yuborgan bot (15-migratsiyagacha yuborilganlarda None).
+    """
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                SELECT chat_id, post_id, message_id, extra_message_ids, bot_id FROM post_deliveries
+                WHERE post_id = ANY(%s) AND status = %s AND message_id IS NOT NULL
+                ORDER BY chat_id, post_id;
+            """, (list(post_ids), DELIVERY_SENT))
+            return [
+                (chat_id, post_id, [message_id] + (extra or []), bot_id)
+                for chat_id, post_id, message_id, extra, bot_id in cur.fetchall()
+            ]
+    except Exception as e:
+        logger.error(f"Post xabarlarini olishda xato ({post_ids}): {e}")
+        raise
+
+def update_post_caption(post_id: int, caption: str):
+    """Tahrirlangan matnni postning o'ziga ham yozadi (arxiv va keyingi ko'rishlar uchun)."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("UPDATE scheduled_posts SET caption = %s WHERE id = %s;", (caption, post_id))
+    except Exception as e:
+        logger.error(f"Post matnini yangilashda xato ({post_id}): {e}")
+
+def clear_post_messages(post_ids: list, chat_ids: list):
+    """O'chirilgan xabarlarning ID'larini jurnaldan olib tashlaydi (yetkazish holati o'zgarmaydi)."""
+    if not chat_ids:
+        return
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                UPDATE post_deliveries
+                SET message_id = NULL, extra_message_ids = NULL, updated_at = NOW()
+                WHERE post_id = ANY(%s) AND chat_id = ANY(%s);
+            """, (list(post_ids), list(chat_ids)))
+    except Exception as e:
+        logger.error(f"O'chirilgan xabarlarni jurnalda belgilashda xato: {e}")
+
+# --- ESKI POSTLARNI ARXIVLASH (retention.py) ---
+# Yuborib bo'lingan eski postlar scheduled_posts_archive ga ko'chiriladi: post va uning
+# barcha post_deliveries yozuvlari bitta arxiv qatoriga aylanadi, issiq jadvallardan esa
+# o'chiriladi (delivery_shards va post_deliveries ON DELETE CASCADE bilan).
+
+def count_archivable_posts(older_than_seconds: float) -> dict:
+    """Arxivga ko'chirilishi kerak bo'lgan postlar va ularning yetkazish yozuvlari soni (dry run)."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                SELECT COUNT(*), COALESCE(SUM((SELECT COUNT(*) FROM post_deliveries d WHERE d.post_id = p.id)), 0)
+                FROM scheduled_posts p
+                WHERE status IN (%s, %s) AND schedule_time < NOW() - %s * INTERVAL '1 second';
+            """, (POST_DONE, POST_PARTIALLY_FAILED, older_than_seconds))
+            posts, deliveries = cur.fetchone()
+        return {'posts': posts, 'deliveries': int(deliveries)}
+    except Exception as e:
+        logger.error(f"Arxivlanadigan postlarni sanashda xato: {e}")
+        raise
+
+def archive_sent_posts(older_than_seconds: float, batch_size: int) -> int:
+    """
+    `older_than_seconds` dan eski, yuborib bo'lingan ko'pi bilan `batch_size` ta postni bitta qisqa
+    tranzaksiyada arxivga ko'chiradi va ko'chirilganlar sonini qaytaradi. Boshqa nusxa ko'chirayotgan
+    postlar o'tkazib yuboriladi (SKIP LOCKED).
+    """
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                WITH batch AS (
+                    SELECT id FROM scheduled_posts
+                    WHERE status IN (%s, %s) AND schedule_time < NOW() - %s * INTERVAL '1 second'
+                    ORDER BY schedule_time
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                ), moved AS (
+                    INSERT INTO scheduled_posts_archive (
+                        id, media_type, file_id, caption, schedule_time, status,
+                        source_chat_id, source_message_ids, schedule_id, sent_count, failed_count, deliveries
+                    )
+                    SELECT p.id, p.media_type, p.file_id, p.caption, p.schedule_time, p.status,
+                           p.source_chat_id, p.source_message_ids, p.schedule_id,
+                           COUNT(d.chat_id) FILTER (WHERE d.status = %s),
+                           COUNT(d.chat_id) FILTER (WHERE d.status = %s),
+                           COALESCE(
+                               jsonb_agg(jsonb_build_array(d.chat_id, d.status, d.message_id, d.attempts, d.error, d.sent_at, d.extra_message_ids))
+                               FILTER (WHERE d.chat_id IS NOT NULL),
+                               '[]'
+                           )
+                    FROM scheduled_posts p
+                    JOIN batch b ON b.id = p.id
+                    LEFT JOIN post_deliveries d ON d.post_id = p.id
+                    GROUP BY p.id
+                    RETURNING id
+                )
+                DELETE FROM scheduled_posts WHERE id IN (SELECT id FROM moved);
+            """, (POST_DONE, POST_PARTIALLY_FAILED, older_than_seconds, batch_size, DELIVERY_SENT, DELIVERY_FAILED))
+            return cur.rowcount
+    except Exception as e:
+        logger.error(f"Postlarni arxivlashda xato: {e}")
+        raise
+
+# --- AIOGRAM FSM HOLATLARI (fsm_storage.py) ---
+# Holat va ma'lumot alohida yoziladi (aiogram set_state/set_data). Ikkalasi ham bo'sh bo'lib
+# qolgan qator o'chiriladi. Boshqa nusxalar keshidagi eskirgan yozuvni NOTIFY orqali tashlaydi.
+
+def _finish_fsm_write(cur, key: str, origin: str):
+    cur.execute("DELETE FROM fsm_states WHERE key = %s AND state IS NULL AND data = '{}'::jsonb;", (key,))
+    cur.execute("SELECT pg_notify(%s, %s);", (FSM_CHANGED_CHANNEL, f"{origin}:{key}"))
+
+def get_fsm_record(key: str):
+    """(state, data) yoki holat saqlanmagan bo'lsa (None, {})."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("SELECT state, data FROM fsm_states WHERE key = %s;", (key,))
+            row = cur.fetchone()
+        return (row[0], row[1]) if row else (None, {})
+    except Exception as e:
+        logger.error(f"FSM holatini o'qishda xato ({key}): {e}")
+        raise
+
+def set_fsm_state(key: str, state: str, origin: str = ''):
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                INSERT INTO fsm_states (key, state) VALUES (%s, %s)
+                ON CONFLICT (key) DO UPDATE SET state = EXCLUDED.state, updated_at = NOW();
+            """, (key, state))
+            _finish_fsm_write(cur, key, origin)
+    except Exception as e:
+        logger.error(f"FSM holatini yozishda xato ({key}): {e}")
+        raise
+
+def set_fsm_data(key: str, data: dict, origin: str = ''):
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                INSERT INTO fsm_states (key, data) VALUES (%s, %s::jsonb)
+                ON CONFLICT (key) DO UPDATE SET data = EXCLUDED.data, updated_at = NOW();
+            """, (key, json.dumps(data)))
+            _finish_fsm_write(cur, key, origin)
+    except Exception as e:
+        logger.error(f"FSM ma'lumotlarini yozishda xato ({key}): {e}")
+        raise
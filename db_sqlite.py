@@ -0,0 +1,1036 @@
+# db_sqlite.py - SQLite backend'i (db.py bilan bir xil funksiyalar, qarang: storage.py)
+#
+# Bitta jarayon uchun: kichik o'rnatishlar va Postgres'siz benchmark'lar. Baza
+# config.DB_NAME faylida WAL rejimida ochiladi (':memory:' - faqat xotirada).
+# Barcha executor thread'lari bitta ulanishdan qulf orqali navbat bilan
+# foydalanadi. Har bir yozuvchi tranzaksiya BEGIN IMMEDIATE bilan boshlanadi,
+# shuning uchun postlar va shard'larni egallash SKIP LOCKED'siz ham xavfsiz.
+# NOTIFY yo'q: o'zgarishlar faqat shu jarayonning chat registri va dispatcher'iga yetadi.
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import pytz
+from contextlib import contextmanager
+from datetime import datetime
+
+import recurrence
+import stats
+from chat_registry import registry as chat_registry
+from migrations import SQLITE_MIGRATIONS
+from config import DB_NAME, SHARD_SIZE
+from storage import (
+    POST_PENDING, POST_IN_PROGRESS, POST_DONE, POST_PARTIALLY_FAILED,
+    DELIVERY_PENDING, DELIVERY_SENT, DELIVERY_FAILED,
+    SHARD_PENDING, SHARD_DONE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Boshqa nusxalar bilan LISTEN/NOTIFY orqali bog'lanish yo'q
+SUPPORTS_NOTIFY = False
+
+# Yuborilmagan va yuborib bo'lingan postlar shartlari SQL ga qiymat sifatida yoziladi: SQLite shart
+# parametr (?) bilan berilsa qisman indekslarni (scheduled_posts_due_idx, scheduled_posts_sent_idx)
+# ishlatmaydi va butun jadvalni o'qiydi
+_UNSENT = f"status IN ('{POST_PENDING}', '{POST_IN_PROGRESS}')"
+_SENT = f"status IN ('{POST_DONE}', '{POST_PARTIALLY_FAILED}')"
+
+_TZ = pytz.timezone("Asia/Tashkent")
+
+# Baza fayli (benchmark'lar birinchi ulanishdan oldin o'zgartirishi mumkin)
+database = DB_NAME
+
+_conn = None
+_lock = threading.RLock()
+
+# db_cursor() orqali bajarilgan tranzaksiyalar soni (benchmark va kuzatuv uchun)
+transaction_count = 0
+
+def _to_datetime(ts: float) -> datetime:
+    """Epoch soniyani Toshkent vaqtidagi datetime ga aylantiradi."""
+    return datetime.fromtimestamp(ts, _TZ)
+
+def _join_ids(ids) -> str:
+    """ID'lar ro'yxatini saqlash uchun '12,13,14' ko'rinishiga keltiradi (Postgres'dagi BIGINT[] o'rniga)."""
+    return ','.join(map(str, ids)) if ids else None
+
+def _split_ids(value: str) -> list:
+    """_join_ids() ning teskarisi."""
+    return [int(i) for i in value.split(',')] if value else None
+
+# --- BAZA BILAN ALOQA ---
+
+def get_db_connection():
+    """SQLite ulanishini (birinchi chaqiruvda) ochadi va qaytaradi."""
+    global _conn
+    with _lock:
+        if _conn is None:
+            # isolation_level=None: tranzaksiyalar db_cursor() da qo'lda boshqariladi
+            conn = sqlite3.connect(database, check_same_thread=False, isolation_level=None)
+            if database != ':memory:':
+                conn.execute("PRAGMA journal_mode = WAL;")
+                conn.execute("PRAGMA synchronous = NORMAL;")
+            conn.execute("PRAGMA foreign_keys = ON;")
+            conn.execute("PRAGMA busy_timeout = 10000;")
+            _conn = conn
+            logger.info(f"SQLite bazasi ochildi: {database}")
+    return _conn
+
+def close_pool():
+    """Ulanishni yopadi (dastur to'xtaganda chaqiriladi)."""
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+            logger.info("SQLite ulanishi yopildi.")
+
+@contextmanager
+def db_cursor():
+    """
+    Qulf ostida cursor beradi. Blok muvaffaqiyatli tugasa commit, xato bo'lsa rollback qilinadi.
+    """
+    global transaction_count
+    with _lock:
+        conn = get_db_connection()
+        transaction_count += 1
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE;")
+        try:
+            yield cur
+            conn.execute("COMMIT;")
+        except Exception:
+            conn.execute("ROLLBACK;")
+            raise
+        finally:
+            cur.close()
+
+# --- DEBUG FUNKSIYALARI ---
+def get_db_summary() -> dict:
+    """
+    Ishga tushishda logga chiqariladigan qisqa statistika (db.py dagi bilan bir xil). Postlarning
+    umumiy soni o'rniga eng katta ID olinadi (AUTOINCREMENT, indeks bo'yicha bitta qadam).
+    """
+    try:
+        with db_cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM target_chats WHERE is_active;")
+            active_chats = cur.fetchone()[0]
+            cur.execute(f"SELECT COUNT(*) FROM scheduled_posts WHERE {_UNSENT};")
+            pending_posts = cur.fetchone()[0]
+            cur.execute("SELECT COALESCE(MAX(id), 0) FROM scheduled_posts;")
+            posts_estimate = cur.fetchone()[0]
+        return {'active_chats': active_chats, 'pending_posts': pending_posts, 'posts_estimate': posts_estimate}
+    except Exception as e:
+        logger.error(f"DB statistikasini olishda xato: {e}")
+        raise
+
+# --- MA'LUMOTLAR BAZASINI INITSIIALIZATSIYA QILISH ---
+
+def apply_migrations(cur) -> list:
+    """
+    migrations.SQLITE_MIGRATIONS dan hali qo'llanilmaganlarini berilgan cursor tranzaksiyasida
+    tartib bilan bajaradi va qo'llanilgan versiyalar ro'yxatini qaytaradi.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at REAL NOT NULL
+        );
+    """)
+    cur.execute("SELECT version FROM schema_migrations;")
+    done = {row[0] for row in cur.fetchall()}
+
+    applied = []
+    for version, name, migration_sql in SQLITE_MIGRATIONS:
+        if version in done:
+            continue
+        # cursor.executescript() ochiq tranzaksiyani commit qilib yuboradi, shuning uchun so'rovlar birma-bir
+        for statement in migration_sql.split(';'):
+            if statement.strip():
+                cur.execute(statement)
+        cur.execute(
+            "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?);",
+            (version, name, time.time())
+        )
+        logger.info(f"Migratsiya {version} qo'llanildi: {name}")
+        applied.append(version)
+    return applied
+
+def init_db():
+    """Ma'lumotlar bazasi sxemasini migratsiyalar orqali oxirgi versiyaga keltiradi."""
+    try:
+        with db_cursor() as cur:
+            applied = apply_migrations(cur)
+
+        logger.info(f"SQLite sxemasi tekshirildi ({len(applied)} ta yangi migratsiya qo'llanildi).")
+    except Exception as e:
+        logger.error(f"DB initsializatsiyasida xato: {e}")
+        raise
+
+# --- CHATLAR ---
+
+def add_chat(chat_id: int, title: str, chat_type: str):
+    """Chatni qo'shadi yoki faollashtiradi (agar allaqachon mavjud bo'lsa)."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                INSERT INTO target_chats (id, title, type, is_active)
+                VALUES (?, ?, ?, TRUE)
+                ON CONFLICT (id) DO UPDATE
+                SET title = excluded.title, type = excluded.type, is_active = TRUE, bot_id = NULL;
+            """, (chat_id, title, chat_type))
+        chat_registry.add(chat_id)
+        logger.info(f"Chat {chat_id} muvaffaqiyatli qo'shildi/yangilandi.")
+    except Exception as e:
+        logger.error(f"Chatni qo'shish/yangilashda xato ({chat_id}): {e}")
+
+def get_active_chats():
+    """
+    Barcha faol chat ID'larini qaytaradi. Chat registri yuklangan bo'lsa, DB ga murojaat
+    qilinmaydi; aks holda ro'yxat DB dan o'qiladi va registr shu bilan yuklanadi.
+    """
+    if chat_registry.loaded:
+        return chat_registry.ids()
+
+    chats = []
+    try:
+        chat_registry.begin_load()
+        with db_cursor() as cur:
+            cur.execute("SELECT id FROM target_chats WHERE is_active = TRUE;")
+            chats = [row[0] for row in cur.fetchall()]
+        chat_registry.load(chats)
+        chats = chat_registry.ids()
+    except Exception as e:
+        logger.error(f"Faol chatlarni olishda xato: {e}")
+    return chats
+
+def deactivate_chat(chat_id: int):
+    """Chatni nofaol deb belgilaydi."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("UPDATE target_chats SET is_active = FALSE WHERE id = ?;", (chat_id,))
+        chat_registry.remove(chat_id)
+    except Exception as e:
+        logger.error(f"Chatni nofaol qilishda xato ({chat_id}): {e}")
+
+def migrate_chat(old_chat_id: int, new_chat_id: int):
+    """Guruh supergroup'ga ko'chganda chatni yangi ID bilan faollashtiradi va eski ID ni nofaol qiladi."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                INSERT INTO target_chats (id, title, type, is_active)
+                SELECT ?, title, 'supergroup', TRUE FROM target_chats WHERE id = ?
+                ON CONFLICT (id) DO UPDATE SET is_active = TRUE;
+            """, (new_chat_id, old_chat_id))
+            cur.execute("UPDATE target_chats SET is_active = FALSE WHERE id = ?;", (old_chat_id,))
+        chat_registry.remove(old_chat_id)
+        chat_registry.add(new_chat_id)
+        logger.info(f"Chat {old_chat_id} yangi ID ga ko'chirildi: {new_chat_id}.")
+    except Exception as e:
+        logger.error(f"Chat ID ni ko'chirishda xato ({old_chat_id} -> {new_chat_id}): {e}")
+        raise
+
+# --- CHATLAR HOLATINI TEKSHIRISH (chat_health.py) ---
+
+def claim_chats_for_health_check(limit: int, interval_seconds: float):
+    """
+    Oxirgi `interval_seconds` ichida tekshirilmagan eng eski `limit` ta faol chatni egallaydi
+    (last_checked_at hozirgi vaqtga o'rnatiladi). Natija: [(chat_id, type), ...].
+    """
+    now = time.time()
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                SELECT id, type FROM target_chats
+                WHERE is_active AND (last_checked_at IS NULL OR last_checked_at < ?)
+                ORDER BY last_checked_at
+                LIMIT ?;
+            """, (now - interval_seconds, limit))
+            chats = cur.fetchall()
+            cur.executemany(
+                "UPDATE target_chats SET last_checked_at = ? WHERE id = ?;",
+                [(now, chat_id) for chat_id, _ in chats]
+            )
+            return chats
+    except Exception as e:
+        logger.error(f"Tekshiriladigan chatlarni olishda xato: {e}")
+        raise
+
+def record_chat_health(chat_id: int, can_post_messages: bool):
+    """Botning chatga post yuborish huquqini va tekshiruv vaqtini yozadi."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "UPDATE target_chats SET can_post_messages = ?, last_checked_at = ? WHERE id = ?;",
+                (can_post_messages, time.time(), chat_id)
+            )
+    except Exception as e:
+        logger.error(f"Chat holatini yozishda xato ({chat_id}): {e}")
+
+# --- BOTLARNI CHATLARGA TAQSIMLASH (bot_pool.py) ---
+
+def get_chat_bots():
+    """Yordamchi yoki asosiy botga biriktirilgan faol chatlar: [(chat_id, bot_id), ...]."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("SELECT id, bot_id FROM target_chats WHERE is_active AND bot_id IS NOT NULL;")
+            return cur.fetchall()
+    except Exception as e:
+        logger.error(f"Chatlarga biriktirilgan botlarni olishda xato: {e}")
+        raise
+
+def get_unassigned_chats(limit: int):
+    """Hali botga biriktirilmagan ko'pi bilan `limit` ta faol chat: [(chat_id, type), ...]."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "SELECT id, type FROM target_chats WHERE is_active AND bot_id IS NULL ORDER BY id LIMIT ?;",
+                (limit,)
+            )
+            return cur.fetchall()
+    except Exception as e:
+        logger.error(f"Taqsimlanmagan chatlarni olishda xato: {e}")
+        raise
+
+def assign_chat_bot(chat_id: int, bot_id: int):
+    """Chatni `bot_id` botga biriktiradi (None - qayta taqsimlash uchun bo'shatish)."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("UPDATE target_chats SET bot_id = ? WHERE id = ?;", (bot_id, chat_id))
+    except Exception as e:
+        logger.error(f"Chatni botga biriktirishda xato ({chat_id} -> {bot_id}): {e}")
+
+def reset_chat_bots(bot_ids: list) -> int:
+    """`bot_ids` da yo'q (pool'dan olib tashlangan) botlarga biriktirilgan chatlarni bo'shatadi."""
+    bot_ids = list(bot_ids)
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                f"UPDATE target_chats SET bot_id = NULL WHERE bot_id IS NOT NULL AND bot_id NOT IN ({', '.join('?' * len(bot_ids))});",
+                bot_ids
+            )
+            return cur.rowcount
+    except Exception as e:
+        logger.error(f"Chat biriktirishlarini tozalashda xato: {e}")
+        raise
+
+# --- POSTLAR ---
+
+def add_scheduled_post(media_type: str, file_id: str, caption: str, schedule_time: datetime,
+                       source_chat_id: int = None, source_message_ids: list = None, caption_index: int = None) -> int:
+    """Yangi postni rejalashtirish jadvaliga qo'shadi (vaqt Toshkent vaqti deb olinadi)."""
+    post_id = None
+    try:
+        scheduled_ts = _TZ.localize(schedule_time).timestamp()
+        with db_cursor() as cur:
+            cur.execute("""
+                INSERT INTO scheduled_posts (media_type, file_id, caption, schedule_time, source_chat_id, source_message_ids, caption_index)
+                VALUES (?, ?, ?, ?, ?, ?, ?);
+            """, (media_type, file_id, caption, scheduled_ts, source_chat_id, _join_ids(source_message_ids), caption_index))
+            post_id = cur.lastrowid
+    except Exception as e:
+        logger.error(f"Postni rejalashtirishda xato: {e}")
+    return post_id
+
+def add_scheduled_posts(posts: list) -> list:
+    """
+    Ko'p postni bitta tranzaksiyada qo'shadi va [(id, schedule_time), ...] qaytaradi.
+    posts: (media_type, file_id, caption, schedule_time) lar, vaqt Toshkent vaqti deb olinadi.
+    """
+    created = []
+    try:
+        with db_cursor() as cur:
+            for media_type, file_id, caption, schedule_time in posts:
+                scheduled_ts = _TZ.localize(schedule_time).timestamp()
+                cur.execute("""
+                    INSERT INTO scheduled_posts (media_type, file_id, caption, schedule_time)
+                    VALUES (?, ?, ?, ?) RETURNING id;
+                """, (media_type, file_id, caption, scheduled_ts))
+                created.append((cur.fetchone()[0], _to_datetime(scheduled_ts)))
+        logger.info(f"{len(created)} ta post bitta tranzaksiyada rejalashtirildi.")
+        return created
+    except Exception as e:
+        logger.error(f"Postlarni ommaviy rejalashtirishda xato: {e}")
+        raise
+
+def get_due_posts(after: tuple = None, limit: int = None):
+    """
+    Yuborilishi kerak bo'lgan postlarni (schedule_time, id) tartibida qaytaradi.
+    `limit` berilsa, bitta sahifa qaytariladi: keyingi sahifa uchun oxirgi postning
+    'cursor' qiymati `after` sifatida beriladi. Unda saqlangan epoch qiymatining o'zi turadi:
+    datetime orqali qaytarilgan float yaxlitlanib, bir xil vaqtli qolgan postlarni o'tkazib yuborardi.
+    """
+    posts = []
+    after_ts, after_id = after or (float('-inf'), 0)
+    try:
+        with db_cursor() as cur:
+            # Yarim yo'lda to'xtab qolgan (in_progress) postlar ham qaytariladi
+            cur.execute(f"""
+                SELECT id, media_type, file_id, caption, status, schedule_time
+                FROM scheduled_posts
+                WHERE {_UNSENT} AND schedule_time <= ?
+                  AND (schedule_time, id) > (?, ?)
+                ORDER BY schedule_time, id
+                LIMIT ?;
+            """, (time.time(), after_ts, after_id, -1 if limit is None else limit))
+            for row in cur.fetchall():
+                posts.append({
+                    'id': row[0],
+                    'media_type': row[1],
+                    'file_id': row[2],
+                    'caption': row[3],
+                    'status': row[4],
+                    'schedule_time': _to_datetime(row[5]),
+                    'cursor': (row[5], row[0])
+                })
+
+        if posts:
+            logger.info(f"DEBUG: DB dan {len(posts)} ta yuborilishi kerak bo'lgan post topildi.")
+
+    except Exception as e:
+        logger.error(f"Yuboriladigan postlarni olishda xato: {e}")
+        raise
+    return posts
+
+def get_upcoming_schedule():
+    """Hali yuborilmagan (pending/in_progress) postlarning (id, schedule_time) ro'yxatini qaytaradi."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(f"SELECT id, schedule_time FROM scheduled_posts WHERE {_UNSENT};")
+            return [(post_id, _to_datetime(ts)) for post_id, ts in cur.fetchall()]
+    except Exception as e:
+        logger.error(f"Kutilayotgan postlar jadvalini olishda xato: {e}")
+        raise
+
+def mark_post_as_sent(post_id: int):
+    """Postni yuborilgan deb belgilaydi."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "UPDATE scheduled_posts SET is_sent = TRUE, status = ? WHERE id = ?;",
+                (POST_DONE, post_id)
+            )
+    except Exception as e:
+        logger.error(f"Postni yuborilgan deb belgilashda xato ({post_id}): {e}")
+
+# --- TAKRORLANUVCHI POSTLAR (recurrence.py) ---
+
+def _insert_occurrence(cur, schedule_id: int, when: datetime):
+    """Jadvalning `when` vaqtidagi postini yaratadi (kutilayotgan posti bo'lsa yoki jadval o'chirilgan bo'lsa None)."""
+    # Qisman indeks (scheduled_posts_next_occurrence_idx) sharti SQL ga qiymat sifatida yoziladi
+    cur.execute(f"""
+        INSERT INTO scheduled_posts (media_type, file_id, caption, schedule_time, source_chat_id, source_message_ids, caption_index, schedule_id)
+        SELECT media_type, file_id, caption, ?, source_chat_id, source_message_ids, caption_index, id
+        FROM post_schedules WHERE id = ? AND is_active
+        ON CONFLICT (schedule_id) WHERE status = '{POST_PENDING}' DO NOTHING
+        RETURNING id;
+    """, (when.timestamp(), schedule_id))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def _advance_schedule(cur, schedule_id: int, after: datetime):
+    """Jadvalning `after` dan keyingi postini yaratadi va (post_id, vaqt) qaytaradi."""
+    cur.execute("SELECT cron, timezone FROM post_schedules WHERE id = ? AND is_active;", (schedule_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    when = recurrence.next_occurrence(row[0], row[1], after)
+    if when is None:
+        cur.execute("UPDATE post_schedules SET is_active = FALSE WHERE id = ?;", (schedule_id,))
+        logger.info(f"Jadval {schedule_id}: cron ifodasi bo'yicha boshqa vaqt yo'q, jadval yakunlandi.")
+        return None
+    post_id = _insert_occurrence(cur, schedule_id, when)
+    return (post_id, when) if post_id is not None else None
+
+def add_recurring_post(media_type: str, file_id: str, caption: str, cron: str, timezone: str,
+                       source_chat_id: int = None, source_message_ids: list = None, caption_index: int = None):
+    """
+    Takrorlanuvchi postni va uning birinchi postini bitta tranzaksiyada qo'shadi.
+    (schedule_id, post_id, schedule_time) qaytaradi. Cron ifodasi noto'g'ri bo'lsa ValueError.
+    """
+    first = recurrence.next_occurrence(cron, timezone, None)
+    if first is None:
+        raise ValueError("bu cron ifodasi bo'yicha kelgusida birorta ham vaqt yo'q")
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                INSERT INTO post_schedules (cron, timezone, media_type, file_id, caption, source_chat_id, source_message_ids, caption_index)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+            """, (cron, timezone, media_type, file_id, caption, source_chat_id, _join_ids(source_message_ids), caption_index))
+            schedule_id = cur.lastrowid
+            post_id = _insert_occurrence(cur, schedule_id, first)
+        logger.info(f"Takrorlanuvchi post {schedule_id} ({cron}, {timezone}) qo'shildi, birinchi posti {post_id}: {first}.")
+        return schedule_id, post_id, first
+    except Exception as e:
+        logger.error(f"Takrorlanuvchi postni qo'shishda xato: {e}")
+        raise
+
+def get_post_schedules():
+    """Faol jadvallar va ularning navbatdagi posti: [{'id', 'cron', 'timezone', 'caption', 'next_post_id', 'next_time'}]."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(f"""
+                SELECT s.id, s.cron, s.timezone, s.caption, p.id, p.schedule_time
+                FROM post_schedules s
+                LEFT JOIN scheduled_posts p ON p.schedule_id = s.id AND p.status = '{POST_PENDING}'
+                WHERE s.is_active
+                ORDER BY s.id;
+            """)
+            return [
+                {
+                    'id': row[0], 'cron': row[1], 'timezone': row[2], 'caption': row[3],
+                    'next_post_id': row[4], 'next_time': _to_datetime(row[5]) if row[5] is not None else None,
+                }
+                for row in cur.fetchall()
+            ]
+    except Exception as e:
+        logger.error(f"Jadvallarni olishda xato: {e}")
+        raise
+
+def cancel_post_schedule(schedule_id: int) -> bool:
+    """Jadvalni to'xtatadi va uning hali yuborilmagan postini o'chiradi. Faol jadval topilmasa False."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("UPDATE post_schedules SET is_active = FALSE WHERE id = ? AND is_active;", (schedule_id,))
+            if not cur.rowcount:
+                return False
+            cur.execute("DELETE FROM scheduled_posts WHERE schedule_id = ? AND status = ?;", (schedule_id, POST_PENDING))
+        logger.info(f"Jadval {schedule_id} to'xtatildi.")
+        return True
+    except Exception as e:
+        logger.error(f"Jadvalni to'xtatishda xato ({schedule_id}): {e}")
+        raise
+
+# --- YETKAZISH JURNALI (post_deliveries) ---
+
+def get_pending_deliveries(post_id: int, first_chat_id: int = None, last_chat_id: int = None):
+    """
+    Post hali yetkazilmagan faol chatlarning ID'larini qaytaradi.
+    Chat oralig'i berilsa, faqat shu shard ichidagi chatlar qaytariladi.
+    """
+    try:
+        with db_cursor() as cur:
+            if first_chat_id is None:
+                cur.execute("""
+                    SELECT d.chat_id FROM post_deliveries d
+                    JOIN target_chats c ON c.id = d.chat_id
+                    WHERE d.post_id = ? AND d.status = ? AND c.is_active = TRUE;
+                """, (post_id, DELIVERY_PENDING))
+            else:
+                cur.execute("""
+                    SELECT d.chat_id FROM post_deliveries d
+                    JOIN target_chats c ON c.id = d.chat_id
+                    WHERE d.post_id = ? AND d.status = ? AND c.is_active = TRUE
+                      AND d.chat_id BETWEEN ? AND ?;
+                """, (post_id, DELIVERY_PENDING, first_chat_id, last_chat_id))
+            return [row[0] for row in cur.fetchall()]
+    except Exception as e:
+        logger.error(f"Yetkazilmagan chatlarni olishda xato ({post_id}): {e}")
+        raise
+
+# Bitta so'rovda tekshiriladigan (post_id, chat_id) juftliklari (SQLite parametrlar chegarasi)
+_LOOKUP_CHUNK = 400
+
+def record_deliveries(rows: list):
+    """
+    Yuborish natijalarini bitta tranzaksiyada yozadi va statistika hisoblagichlarini oshiradi.
+    rows: (post_id, chat_id, status, message_id, extra_message_ids, error, attempts, bot_id) lar ro'yxati.
+    """
+    if not rows:
+        return
+    now = time.time()
+    try:
+        with db_cursor() as cur:
+            # Faqat hali pending bo'lgan yozuvlar yangilanadi va sanaladi (db.py dagi kabi)
+            delays = {}
+            for start in range(0, len(rows), _LOOKUP_CHUNK):
+                chunk = rows[start:start + _LOOKUP_CHUNK]
+                cur.execute(f"""
+                    SELECT d.post_id, d.chat_id, ? - p.schedule_time
+                    FROM post_deliveries d
+                    JOIN scheduled_posts p ON p.id = d.post_id
+                    WHERE (d.post_id, d.chat_id) IN (VALUES {', '.join(['(?, ?)'] * len(chunk))}) AND d.status = ?;
+                """, (now, *(value for row in chunk for value in row[:2]), DELIVERY_PENDING))
+                delays.update(((post_id, chat_id), delay) for post_id, chat_id, delay in cur.fetchall())
+
+            cur.executemany("""
+                UPDATE post_deliveries
+                SET status = :status,
+                    attempts = attempts + :attempts,
+                    message_id = COALESCE(:message_id, message_id),
+                    extra_message_ids = COALESCE(:extra_message_ids, extra_message_ids),
+                    bot_id = COALESCE(:bot_id, bot_id),
+                    error = :error,
+                    updated_at = :now,
+                    sent_at = CASE WHEN :status = 'sent' THEN :now ELSE sent_at END
+                WHERE post_id = :post_id AND chat_id = :chat_id AND status = 'pending';
+            """, [
+                {'post_id': post_id, 'chat_id': chat_id, 'status': status, 'message_id': message_id,
+                 'extra_message_ids': _join_ids(extra_message_ids), 'error': error, 'attempts': attempts,
+                 'bot_id': bot_id, 'now': now}
+                for post_id, chat_id, status, message_id, extra_message_ids, error, attempts, bot_id in rows
+            ])
+
+            _add_delivery_stats(cur, [
+                (post_id, chat_id, status, error, delays.pop((post_id, chat_id)))
+                for post_id, chat_id, status, _, _, error, _, _ in rows if (post_id, chat_id) in delays
+            ], now)
+    except Exception as e:
+        logger.error(f"Yetkazish natijalarini yozishda xato: {e}")
+        raise
+
+def finish_post_delivery(post_id: int) -> str:
+    """
+    Yetkazish jurnaliga qarab post holatini done yoki partially_failed qiladi va uni qaytaradi.
+    Nofaol bo'lib qolgan chatlarning kutilayotgan yozuvlari 'failed' deb belgilanadi.
+    Hali yuborilmagan faol chatlar bo'lsa, post in_progress holatida qoladi.
+    """
+    status = None
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                UPDATE post_deliveries
+                SET status = ?, error = 'chat nofaol', updated_at = ?
+                WHERE post_id = ? AND status = ?
+                  AND chat_id IN (SELECT id FROM target_chats WHERE is_active = FALSE)
+                RETURNING chat_id;
+            """, (DELIVERY_FAILED, time.time(), post_id, DELIVERY_PENDING))
+            _add_delivery_stats(cur, [(post_id, chat_id, DELIVERY_FAILED, 'chat nofaol', 0.0) for (chat_id,) in cur.fetchall()], time.time())
+            cur.execute("""
+                SELECT COALESCE(SUM(status = ?), 0), COALESCE(SUM(status = ?), 0)
+                FROM post_deliveries WHERE post_id = ?;
+            """, (DELIVERY_PENDING, DELIVERY_FAILED, post_id))
+            pending, failed = cur.fetchone()
+            if pending:
+                return POST_IN_PROGRESS
+
+            status = POST_PARTIALLY_FAILED if failed else POST_DONE
+            cur.execute(
+                "UPDATE scheduled_posts SET status = ?, is_sent = TRUE WHERE id = ? AND status = ? RETURNING id;",
+                (status, post_id, POST_IN_PROGRESS)
+            )
+            if cur.fetchone():
+                _complete_post_stats(cur, post_id, time.time())
+    except Exception as e:
+        logger.error(f"Post holatini yakunlashda xato ({post_id}): {e}")
+        raise
+    return status
+
+# --- YETKAZISH STATISTIKASI (/stats, stats.py) ---
+# db.py dagi bilan bir xil hisoblagichlar. Soat - 3600 ga karrali epoch qiymati.
+
+def _add_delivery_stats(cur, changes: list, now: float):
+    """pending'dan chiqqan yozuvlar [(post_id, chat_id, status, xato, kechikish), ...] bo'yicha hisoblagichlarni oshiradi."""
+    if not changes:
+        return
+    posts, chats, (sent, failed, delay) = stats.aggregate(changes)
+    cur.executemany("""
+        INSERT INTO chat_stats (chat_id, sent, failed, last_error, last_failed_at)
+        VALUES (?, ?, ?, ?, CASE WHEN ? > 0 THEN ? END)
+        ON CONFLICT (chat_id) DO UPDATE
+        SET sent = sent + excluded.sent,
+            failed = failed + excluded.failed,
+            last_error = COALESCE(excluded.last_error, last_error),
+            last_failed_at = COALESCE(excluded.last_failed_at, last_failed_at);
+    """, [(chat_id, s, f, error, f, now) for chat_id, s, f, error in chats])
+    cur.executemany("""
+        INSERT INTO post_stats (post_id, schedule_time, sent, failed, delay_seconds, last_sent_at)
+        SELECT id, schedule_time, ?, ?, ?, CASE WHEN ? > 0 THEN ? END FROM scheduled_posts WHERE id = ?
+        ON CONFLICT (post_id) DO UPDATE
+        SET sent = sent + excluded.sent,
+            failed = failed + excluded.failed,
+            delay_seconds = delay_seconds + excluded.delay_seconds,
+            last_sent_at = COALESCE(excluded.last_sent_at, last_sent_at);
+    """, [(s, f, d, s, now, post_id) for post_id, (s, f, d) in sorted(posts.items())])
+    cur.execute("""
+        INSERT INTO hourly_stats (hour, sent, failed, delay_seconds) VALUES (?, ?, ?, ?)
+        ON CONFLICT (hour) DO UPDATE
+        SET sent = sent + excluded.sent,
+            failed = failed + excluded.failed,
+            delay_seconds = delay_seconds + excluded.delay_seconds;
+    """, (now - now % 3600, sent, failed, delay))
+    cur.execute(
+        "UPDATE delivery_totals SET sent = sent + ?, failed = failed + ?, delay_seconds = delay_seconds + ? WHERE id = 1;",
+        (sent, failed, delay)
+    )
+
+def _complete_post_stats(cur, post_id: int, now: float):
+    """Post yakunlandi: uning yakunlanish vaqti va yakunlangan postlar hisoblagichlari."""
+    cur.execute("""
+        INSERT INTO post_stats (post_id, schedule_time, completed_at)
+        SELECT id, schedule_time, ? FROM scheduled_posts WHERE id = ?
+        ON CONFLICT (post_id) DO UPDATE SET completed_at = excluded.completed_at;
+    """, (now, post_id))
+    cur.execute("""
+        INSERT INTO hourly_stats (hour, posts) VALUES (?, 1)
+        ON CONFLICT (hour) DO UPDATE SET posts = posts + 1;
+    """, (now - now % 3600,))
+    cur.execute("UPDATE delivery_totals SET posts = posts + 1 WHERE id = 1;")
+
+def get_delivery_stats(recent_posts: int, failing_chats: int) -> dict:
+    """/stats uchun hisoblagichlar (db.py dagi bilan bir xil, post_deliveries o'qilmaydi)."""
+    counts = ('posts', 'sent', 'failed', 'delay_seconds')
+    now = time.time()
+    try:
+        with db_cursor() as cur:
+            cur.execute("SELECT posts, sent, failed, delay_seconds FROM delivery_totals WHERE id = 1;")
+            totals = dict(zip(counts, cur.fetchone() or (0, 0, 0, 0.0)))
+            cur.execute("""
+                SELECT COALESCE(SUM(posts), 0), COALESCE(SUM(sent), 0), COALESCE(SUM(failed), 0), COALESCE(SUM(delay_seconds), 0)
+                FROM hourly_stats
+                WHERE hour >= ?;
+            """, (now - now % 3600 - 23 * 3600,))
+            last_24h = dict(zip(counts, cur.fetchone()))
+            cur.execute("""
+                SELECT post_id, sent, failed, delay_seconds, completed_at - schedule_time
+                FROM post_stats
+                ORDER BY post_id DESC
+                LIMIT ?;
+            """, (recent_posts,))
+            posts = [
+                {'post_id': post_id, 'sent': sent, 'failed': failed, 'delay_seconds': delay, 'duration_seconds': duration}
+                for post_id, sent, failed, delay, duration in cur.fetchall()
+            ]
+            cur.execute("""
+                SELECT s.chat_id, c.title, s.sent, s.failed, s.last_error
+                FROM chat_stats s
+                LEFT JOIN target_chats c ON c.id = s.chat_id
+                WHERE s.failed > 0
+                ORDER BY s.failed DESC
+                LIMIT ?;
+            """, (failing_chats,))
+            chats = [
+                {'chat_id': chat_id, 'title': title, 'sent': sent, 'failed': failed, 'last_error': last_error}
+                for chat_id, title, sent, failed, last_error in cur.fetchall()
+            ]
+    except Exception as e:
+        logger.error(f"Yetkazish statistikasini olishda xato: {e}")
+        raise
+    return {'totals': totals, 'last_24h': last_24h, 'recent_posts': posts, 'failing_chats': chats}
+
+# --- POST VA SHARD'LARNI EGALLASH ---
+# db.py dagi bilan bir xil jarayon. BEGIN IMMEDIATE yozuvchilarni navbatga qo'yadi,
+# shuning uchun bir post yoki shard ikki marta egallanmaydi.
+
+def plan_due_post(post_id: int, chat_ids, shard_size: int = SHARD_SIZE):
+    """
+    Vaqti kelgan postni egallaydi, uning yetkazish jurnalini va shard'larini yaratib, postni
+    in_progress qiladi. Post allaqachon rejalashtirilgan yoki faol chat bo'lmasa, None qaytaradi.
+    """
+    if not chat_ids:
+        return None
+
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                SELECT id, media_type, file_id, caption, source_chat_id, source_message_ids, schedule_id, schedule_time
+                FROM scheduled_posts p
+                WHERE id = ? AND status IN (?, ?)
+                  AND (status = ? OR NOT EXISTS (SELECT 1 FROM delivery_shards s WHERE s.post_id = p.id));
+            """, (post_id, POST_PENDING, POST_IN_PROGRESS, POST_PENDING))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            post = {
+                'id': row[0], 'media_type': row[1], 'file_id': row[2], 'caption': row[3],
+                'source_chat_id': row[4], 'source_message_ids': _split_ids(row[5]), 'schedule_id': row[6],
+            }
+
+            cur.executemany(
+                "INSERT OR IGNORE INTO post_deliveries (post_id, chat_id) VALUES (?, ?);",
+                [(post['id'], chat_id) for chat_id in chat_ids]
+            )
+
+            # Chatlar ID bo'yicha tartiblanib, har biri shard_size tadan oraliqlarga bo'linadi
+            ordered = sorted(chat_ids)
+            shards = [
+                (post['id'], shard_no, chunk[0], chunk[-1])
+                for shard_no, chunk in enumerate(
+                    ordered[i:i + shard_size] for i in range(0, len(ordered), shard_size)
+                )
+            ]
+            cur.executemany("""
+                INSERT OR IGNORE INTO delivery_shards (post_id, shard_no, first_chat_id, last_chat_id)
+                VALUES (?, ?, ?, ?);
+            """, shards)
+
+            cur.execute(
+                "UPDATE scheduled_posts SET status = ? WHERE id = ?;",
+                (POST_IN_PROGRESS, post['id'])
+            )
+
+            # Takrorlanuvchi post: keyingi posti shu tranzaksiyada yaratiladi (joriysi endi pending emas)
+            post['next_occurrence'] = _advance_schedule(cur, post['schedule_id'], _to_datetime(row[7])) if post['schedule_id'] else None
+        logger.info(f"Post ID {post['id']} rejalashtirildi: {len(chat_ids)} ta chat, {len(shards)} ta shard.")
+        return post
+    except Exception as e:
+        logger.error(f"Vaqti kelgan postni rejalashtirishda xato: {e}")
+        raise
+
+def claim_delivery_shard(worker_id: str, lease_seconds: int):
+    """
+    Yuborilmagan va ijarasi bo'sh (yoki muddati o'tgan) bitta shard'ni egallaydi.
+    Natija: {'post': {...}, 'shard_no', 'first_chat_id', 'last_chat_id', 'previous_owner'} yoki None.
+    """
+    now = time.time()
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                SELECT post_id, shard_no, first_chat_id, last_chat_id, lease_owner
+                FROM delivery_shards
+                WHERE status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)
+                ORDER BY post_id, shard_no
+                LIMIT 1;
+            """, (SHARD_PENDING, now))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            post_id, shard_no, first_chat_id, last_chat_id, previous_owner = row
+            cur.execute(
+                "UPDATE delivery_shards SET lease_owner = ?, lease_expires_at = ? WHERE post_id = ? AND shard_no = ?;",
+                (worker_id, now + lease_seconds, post_id, shard_no)
+            )
+
+            cur.execute(
+                """
+                SELECT media_type, file_id, caption, schedule_time, source_chat_id, source_message_ids
+                FROM scheduled_posts WHERE id = ?;
+                """,
+                (post_id,)
+            )
+            media_type, file_id, caption, schedule_time, source_chat_id, source_message_ids = cur.fetchone()
+        return {
+            'post': {
+                'id': post_id, 'media_type': media_type, 'file_id': file_id, 'caption': caption,
+                'schedule_time': _to_datetime(schedule_time), 'source_chat_id': source_chat_id,
+                'source_message_ids': _split_ids(source_message_ids),
+            },
+            'shard_no': shard_no,
+            'first_chat_id': first_chat_id,
+            'last_chat_id': last_chat_id,
+            'previous_owner': previous_owner,
+        }
+    except Exception as e:
+        logger.error(f"Shard egallashda xato: {e}")
+        raise
+
+def renew_shard_lease(post_id: int, shard_no: int, worker_id: str, lease_seconds: int) -> bool:
+    """Shard ijarasini uzaytiradi. Ijara boshqa worker'ga o'tib ketgan bo'lsa False qaytaradi (DB xatosi - istisno)."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                UPDATE delivery_shards
+                SET lease_expires_at = ?
+                WHERE post_id = ? AND shard_no = ? AND lease_owner = ? AND status = ?;
+            """, (time.time() + lease_seconds, post_id, shard_no, worker_id, SHARD_PENDING))
+            return cur.rowcount == 1
+    except Exception as e:
+        logger.error(f"Shard ijarasini uzaytirishda xato ({post_id}/{shard_no}): {e}")
+        raise
+
+def complete_delivery_shard(post_id: int, shard_no: int, worker_id: str) -> bool:
+    """
+    Shard'ni yakunlangan deb belgilaydi. Postning barcha shard'lari yakunlangan bo'lsa
+    True qaytaradi (post holatini finish_post_delivery bilan yakunlash mumkin).
+    """
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                UPDATE delivery_shards
+                SET status = ?, lease_owner = NULL, lease_expires_at = NULL
+                WHERE post_id = ? AND shard_no = ? AND lease_owner = ?;
+            """, (SHARD_DONE, post_id, shard_no, worker_id))
+            cur.execute(
+                "SELECT 1 FROM delivery_shards WHERE post_id = ? AND status = ? LIMIT 1;",
+                (post_id, SHARD_PENDING)
+            )
+            return cur.fetchone() is None
+    except Exception as e:
+        logger.error(f"Shard'ni yakunlashda xato ({post_id}/{shard_no}): {e}")
+        return False
+
+def get_completed_post_ids():
+    """Barcha shard'lari yakunlangan, lekin hali in_progress holatidagi postlar (yakunlash uchun)."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                SELECT p.id FROM scheduled_posts p
+                WHERE p.status = ?
+                  AND EXISTS (SELECT 1 FROM delivery_shards s WHERE s.post_id = p.id)
+                  AND NOT EXISTS (SELECT 1 FROM delivery_shards s WHERE s.post_id = p.id AND s.status = ?);
+            """, (POST_IN_PROGRESS, SHARD_PENDING))
+            return [row[0] for row in cur.fetchall()]
+    except Exception as e:
+        logger.error(f"Yakunlangan postlarni olishda xato: {e}")
+        return []
+
+# --- YUBORILGAN POSTLARNI TAHRIRLASH VA O'CHIRISH (post_actions.py) ---
+
+def get_post(post_id: int):
+    """Postning asosiy ma'lumotlari (id, media_type, caption, status, source_message_ids, caption_index) yoki None."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "SELECT id, media_type, caption, status, source_message_ids, caption_index FROM scheduled_posts WHERE id = ?;",
+                (post_id,)
+            )
+            row = cur.fetchone()
+        if row is None:
+            return None
+        return {'id': row[0], 'media_type': row[1], 'caption': row[2], 'status': row[3], 'source_message_ids': _split_ids(row[4]),
+                'caption_index': row[5] or 0}
+    except Exception as e:
+        logger.error(f"Postni olishda xato ({post_id}): {e}")
+        raise
+
+def get_post_messages(post_ids: list):
+    """
+    Postlar yuborilgan chatlardagi xabarlar: (chat_id, post_id, [message_id, ...], bot_id) lar ro'yxati,
+    chat_id bo'yicha tartiblangan. Albomda ro'yxat barcha elementlarning ID'laridan iborat, bot_id -
+    xabarlarni yuborgan bot (15-migratsiyagacha yuborilganlarda None).
+    """
+    post_ids = list(post_ids)
+    if not post_ids:
+        return []
+    try:
+        with db_cursor() as cur:
+            cur.execute(f"""
+                SELECT chat_id, post_id, message_id, extra_message_ids, bot_id FROM post_deliveries
+                WHERE post_id IN ({', '.join('?' * len(post_ids))}) AND status = ? AND message_id IS NOT NULL
+                ORDER BY chat_id, post_id;
+            """, (*post_ids, DELIVERY_SENT))
+            return [
+                (chat_id, post_id, [message_id] + (_split_ids(extra) or []), bot_id)
+                for chat_id, post_id, message_id, extra, bot_id in cur.fetchall()
+            ]
+    except Exception as e:
+        logger.error(f"Post xabarlarini olishda xato ({post_ids}): {e}")
+        raise
+
+def update_post_caption(post_id: int, caption: str):
+    """Tahrirlangan matnni postning o'ziga ham yozadi (arxiv va keyingi ko'rishlar uchun)."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("UPDATE scheduled_posts SET caption = ? WHERE id = ?;", (caption, post_id))
+    except Exception as e:
+        logger.error(f"Post matnini yangilashda xato ({post_id}): {e}")
+
+def clear_post_messages(post_ids: list, chat_ids: list):
+    """O'chirilgan xabarlarning ID'larini jurnaldan olib tashlaydi (yetkazish holati o'zgarmaydi)."""
+    if not chat_ids:
+        return
+    now = time.time()
+    try:
+        with db_cursor() as cur:
+            cur.executemany("""
+                UPDATE post_deliveries
+                SET message_id = NULL, extra_message_ids = NULL, updated_at = ?
+                WHERE post_id = ? AND chat_id = ?;
+            """, [(now, post_id, chat_id) for post_id in post_ids for chat_id in chat_ids])
+    except Exception as e:
+        logger.error(f"O'chirilgan xabarlarni jurnalda belgilashda xato: {e}")
+
+# --- ESKI POSTLARNI ARXIVLASH (retention.py) ---
+# db.py dagi bilan bir xil. deliveries ustuni JSON matn (siqilmaydi).
+
+def count_archivable_posts(older_than_seconds: float) -> dict:
+    """Arxivga ko'chirilishi kerak bo'lgan postlar va ularning yetkazish yozuvlari soni (dry run)."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(f"""
+                SELECT COUNT(*), COALESCE(SUM((SELECT COUNT(*) FROM post_deliveries d WHERE d.post_id = p.id)), 0)
+                FROM scheduled_posts p
+                WHERE {_SENT} AND schedule_time < ?;
+            """, (time.time() - older_than_seconds,))
+            posts, deliveries = cur.fetchone()
+        return {'posts': posts, 'deliveries': deliveries}
+    except Exception as e:
+        logger.error(f"Arxivlanadigan postlarni sanashda xato: {e}")
+        raise
+
+def archive_sent_posts(older_than_seconds: float, batch_size: int) -> int:
+    """
+    `older_than_seconds` dan eski, yuborib bo'lingan ko'pi bilan `batch_size` ta postni bitta qisqa
+    tranzaksiyada arxivga ko'chiradi va ko'chirilganlar sonini qaytaradi.
+    """
+    try:
+        with db_cursor() as cur:
+            cur.execute(f"""
+                SELECT id FROM scheduled_posts
+                WHERE {_SENT} AND schedule_time < ?
+                ORDER BY schedule_time
+                LIMIT ?;
+            """, (time.time() - older_than_seconds, batch_size))
+            ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                return 0
+
+            placeholders = ', '.join('?' * len(ids))
+            cur.execute(f"""
+                INSERT INTO scheduled_posts_archive (
+                    id, media_type, file_id, caption, schedule_time, status,
+                    source_chat_id, source_message_ids, schedule_id, sent_count, failed_count, deliveries
+                )
+                SELECT p.id, p.media_type, p.file_id, p.caption, p.schedule_time, p.status,
+                       p.source_chat_id, p.source_message_ids, p.schedule_id,
+                       COUNT(d.chat_id) FILTER (WHERE d.status = ?),
+                       COUNT(d.chat_id) FILTER (WHERE d.status = ?),
+                       COALESCE(
+                           json_group_array(json_array(d.chat_id, d.status, d.message_id, d.attempts, d.error, d.sent_at, d.extra_message_ids))
+                           FILTER (WHERE d.chat_id IS NOT NULL),
+                           '[]'
+                       )
+                FROM scheduled_posts p
+                LEFT JOIN post_deliveries d ON d.post_id = p.id
+                WHERE p.id IN ({placeholders})
+                GROUP BY p.id;
+            """, (DELIVERY_SENT, DELIVERY_FAILED, *ids))
+            cur.execute(f"DELETE FROM scheduled_posts WHERE id IN ({placeholders});", ids)
+            return len(ids)
+    except Exception as e:
+        logger.error(f"Postlarni arxivlashda xato: {e}")
+        raise
+
+# --- AIOGRAM FSM HOLATLARI (fsm_storage.py) ---
+
+def _finish_fsm_write(cur, key: str):
+    cur.execute("DELETE FROM fsm_states WHERE key = ? AND state IS NULL AND data = '{}';", (key,))
+
+def get_fsm_record(key: str):
+    """(state, data) yoki holat saqlanmagan bo'lsa (None, {})."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("SELECT state, data FROM fsm_states WHERE key = ?;", (key,))
+            row = cur.fetchone()
+        return (row[0], json.loads(row[1])) if row else (None, {})
+    except Exception as e:
+        logger.error(f"FSM holatini o'qishda xato ({key}): {e}")
+        raise
+
+def set_fsm_state(key: str, state: str, origin: str = ''):
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                INSERT INTO fsm_states (key, state) VALUES (?, ?)
+                ON CONFLICT (key) DO UPDATE SET state = excluded.state, updated_at = ?;
+            """, (key, state, time.time()))
+            _finish_fsm_write(cur, key)
+    except Exception as e:
+        logger.error(f"FSM holatini yozishda xato ({key}): {e}")
+        raise
+
+def set_fsm_data(key: str, data: dict, origin: str = ''):
+    try:
+        with db_cursor() as cur:
+            cur.execute("""
+                INSERT INTO fsm_states (key, data) VALUES (?, ?)
+                ON CONFLICT (key) DO UPDATE SET data = excluded.data, updated_at = ?;
+            """, (key, json.dumps(data), time.time()))
+            _finish_fsm_write(cur, key)
+    except Exception as e:
+        logger.error(f"FSM ma'lumotlarini yozishda xato ({key}): {e}")
+        raise
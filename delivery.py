@@ -0,0 +1,288 @@
+# delivery.py - Postlarni ko'plab chatlarga parallel va tezlik cheklovi bilan yuborish
+#
+# Yuborish cheklangan sondagi worker'lar orqali bajariladi. Telegram limitlari
+# token bucket'lar bilan ta'minlanadi:
+#   - bot bo'yicha umumiy limit (sekundiga ~30 ta xabar),
+#   - bitta guruh/kanal uchun qattiqroq limit (daqiqasiga ~20 ta xabar).
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Iterable, List, NamedTuple, Optional
+
+from aiogram import Bot
+
+import metrics
+import retry
+import slowlog
+from config import SEND_CONCURRENCY, GLOBAL_RATE_LIMIT, GROUP_RATE_LIMIT_PER_MINUTE, RETRY_MAX_ATTEMPTS, RETRY_MAX_FLOOD_WAIT
+
+logger = logging.getLogger(__name__)
+
+# --- TEZLIK CHEKLOVCHILARI (TOKEN BUCKET) ---
+
+class TokenBucket:
+    """Asyncio uchun token bucket: sekundiga `rate` ta token, eng ko'pi `capacity` ta."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def is_full(self) -> bool:
+        """Bucket to'liq bo'lsa (uzoq vaqt ishlatilmagan) True qaytaradi."""
+        self._refill()
+        return self._tokens >= self.capacity
+
+    def time_to_full(self) -> float:
+        """Bucket to'lishigacha qolgan vaqt (soniya), to'la bo'lsa 0."""
+        self._refill()
+        return max(0.0, (self.capacity - self._tokens) / self.rate)
+
+    async def acquire(self):
+        """Bitta token olguncha kutadi. Kutayotganlar navbat (FIFO) tartibida xizmat qilinadi."""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RateLimiter:
+    """Bot bo'yicha umumiy va har bir chat bo'yicha alohida limitlarni birga qo'llaydi."""
+
+    # Shuncha chat bucket'idan oshganda ishlatilmay turganlari tozalanadi
+    _MAX_CHAT_BUCKETS = 10000
+
+    def __init__(self, global_rate: float = GLOBAL_RATE_LIMIT, chat_rate_per_minute: float = GROUP_RATE_LIMIT_PER_MINUTE):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_rate = chat_rate_per_minute / 60
+        self._chat_buckets = {}
+        self._paused_until = 0.0
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self._MAX_CHAT_BUCKETS:
+                self._prune()
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self._chat_rate, 1)
+        return bucket
+
+    def _prune(self):
+        """To'lib turgan (ya'ni hozir cheklovga ta'sir qilmaydigan) chat bucket'larini o'chiradi."""
+        for chat_id in [cid for cid, bucket in self._chat_buckets.items() if bucket.is_full()]:
+            del self._chat_buckets[chat_id]
+
+    def for_chat(self, chat_id: int) -> 'RateLimiter':
+        """`chat_id` ga yuborishni cheklaydigan cheklovchi (bitta bot - doim o'zi, bot_pool'da chat boti)."""
+        return self
+
+    def pause(self, seconds: float):
+        """Telegram flood control (RetryAfter) so'raganda shu botning barcha yuborishlarini to'xtatib turadi."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def _wait_pause(self):
+        while (delay := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    async def acquire(self, chat_id: int):
+        """Avval chat limitini, keyin umumiy limitni kutadi (to'xtatilgan bo'lsa, pauza tugashini ham)."""
+        await self._wait_pause()
+        await self._chat_bucket(chat_id).acquire()
+        await self.global_bucket.acquire()
+        await self._wait_pause()
+
+    async def acquire_idle(self):
+        """
+        Past ustuvorlikdagi fon so'rovlari (chat_health) uchun: umumiy bucket to'la bo'lgandagina,
+        ya'ni haqiqiy yuborishlar token ishlatmay turganda bitta token oladi.
+        """
+        while True:
+            await self._wait_pause()
+            wait = self.global_bucket.time_to_full()
+            if wait <= 0:
+                await self.global_bucket.acquire()
+                return
+            await asyncio.sleep(wait)
+
+
+# Barcha yuborishlar uchun umumiy cheklovchi (bitta bot tokeni = bitta limit)
+limiter = RateLimiter()
+
+# --- YUBORISH NATIJASI ---
+
+class DeliveryResult(NamedTuple):
+    chat_id: int
+    message_id: Optional[int] = None
+    error: Optional[Exception] = None
+    attempts: int = 1
+    # Albomning birinchisidan keyingi xabarlari (copy_messages), oddiy postlarda None
+    extra_message_ids: Optional[List[int]] = None
+    # Xabarni yuborgan bot (send() Sent qaytarganda), uni faqat shu bot tahrirlay oladi
+    bot_id: Optional[int] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+class Sent(NamedTuple):
+    """fan_out dagi send() natijasi: yuborilgan xabar(lar) va ularni yuborgan bot ID'si."""
+    bot_id: int
+    message: Any
+
+# --- POSTNI BITTA CHATGA YUBORISH ---
+
+async def send_post(bot: Bot, post: dict, chat_id: int):
+    """
+    Post turiga qarab tegishli Bot API metodini chaqiradi va yuborilgan xabarni qaytaradi.
+    'copy' postlari admin yuborgan asl xabardan nusxalanadi (formatlash va albom saqlanadi):
+    albom (10 tagacha element) har bir chatga bitta copy_messages chaqiruvi bilan ketadi.
+    """
+    media_type = post['media_type']
+    file_id = post['file_id']
+    caption = post['caption']
+
+    if media_type == 'copy':
+        message_ids = post['source_message_ids']
+        if len(message_ids) == 1:
+            return await bot.copy_message(chat_id, post['source_chat_id'], message_ids[0])
+        return await bot.copy_messages(chat_id, post['source_chat_id'], message_ids)
+    elif media_type == 'text':
+        return await bot.send_message(chat_id, caption)
+    elif media_type == 'photo':
+        return await bot.send_photo(chat_id, photo=file_id, caption=caption)
+    elif media_type == 'video':
+        return await bot.send_video(chat_id, video=file_id, caption=caption)
+    elif media_type == 'document':
+        return await bot.send_document(chat_id, document=file_id, caption=caption)
+    raise ValueError(f"Noma'lum media turi: {media_type}")
+
+# --- PARALLEL YUBORISH (FAN-OUT) ---
+
+async def fan_out(
+    chat_ids: Iterable[int],
+    send: Callable[[int], Awaitable],
+    rate_limiter: RateLimiter = None,
+    concurrency: int = SEND_CONCURRENCY,
+    on_result: Optional[Callable[[DeliveryResult], Awaitable]] = None,
+    on_migrate: Optional[Callable[[int, int], Awaitable]] = None,
+    max_attempts: int = RETRY_MAX_ATTEMPTS,
+    max_flood_wait: float = RETRY_MAX_FLOOD_WAIT,
+) -> List[DeliveryResult]:
+    """
+    `send(chat_id)` ni barcha chatlar uchun `concurrency` ta worker orqali chaqiradi.
+    Har bir chaqiruvdan oldin tezlik cheklovchisidan ruxsat olinadi.
+    `on_result` berilsa, har bir yakuniy natija tayyor bo'lishi bilan unga uzatiladi.
+
+    Xatolar retry.classify() bo'yicha qayta ishlanadi: flood control chatga yuboruvchi botning
+    cheklovchisini to'xtatadi va urinishlar soniga kirmaydi (chat uchun kutishlar yig'indisi
+    `max_flood_wait` dan oshmaguncha), vaqtinchalik xatolar kechiktirilgan navbatga qo'yiladi, guruh
+    supergroup'ga ko'chgan bo'lsa `on_migrate(eski_id, yangi_id)` chaqirilib, xabar yangi ID ga yuboriladi.
+    Natijadagi chat_id doim asl (jurnaldagi) ID bo'lib qoladi.
+    """
+    rate_limiter = rate_limiter or limiter
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    for chat_id in chat_ids:
+        queue.put_nowait((chat_id, chat_id, 1, 0.0)) # (asl chat_id, yuboriladigan chat_id, urinish, flood kutishlari)
+
+    outstanding = queue.qsize()
+    if not outstanding:
+        return []
+    worker_count = min(concurrency, outstanding)
+    results = []
+    delayed = [] # kechiktirilgan qayta urinishlar (bekor qilish uchun)
+
+    metrics.SEND_QUEUE_DEPTH.inc(outstanding)
+
+    async def finish(result: DeliveryResult):
+        nonlocal outstanding
+        results.append(result)
+        (metrics.SENT if result.ok else metrics.FAILED).inc()
+        if on_result:
+            await on_result(result)
+        outstanding -= 1
+        metrics.SEND_QUEUE_DEPTH.dec()
+        if outstanding == 0:
+            # Barcha chatlar yakunlandi: worker'larni to'xtatish
+            for _ in range(worker_count):
+                queue.put_nowait(None)
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            chat_id, target_id, attempt, flood_wait = item
+            await rate_limiter.acquire(target_id)
+            # send() ichidagi DB chaqiruvlari va sekin yuborish jurnali uchun
+            context = slowlog.chat_id.set(target_id)
+            start = time.perf_counter()
+            try:
+                message = await send(target_id)
+                error = None
+            except Exception as e:
+                error = e
+            elapsed = time.perf_counter() - start
+            metrics.SEND_LATENCY.observe(elapsed)
+            if elapsed >= slowlog.send_threshold:
+                slowlog.slow_send(elapsed, error)
+            slowlog.chat_id.reset(context)
+
+            if error is None:
+                bot_id = extra_ids = None
+                if isinstance(message, Sent):
+                    bot_id, message = message
+                if isinstance(message, list):
+                    # copy_messages (albom): birinchi xabar ID'si message_id ga, qolganlari extra_message_ids ga
+                    extra_ids = [m.message_id for m in message[1:]] or None
+                    message = message[0] if message else None
+                await finish(DeliveryResult(chat_id, getattr(message, 'message_id', None), attempts=attempt,
+                                            extra_message_ids=extra_ids, bot_id=bot_id))
+                continue
+
+            kind = retry.classify(error)
+            metrics.ERRORS[kind].inc()
+            if kind == retry.FLOOD and flood_wait + error.retry_after <= max_flood_wait:
+                # Flood control chatning xatosi emas: urinish sarflanmaydi, faqat kutish vaqti yig'iladi
+                logger.warning(f"Flood control: yuborish {error.retry_after} soniyaga to'xtatildi (chat {target_id}).")
+                rate_limiter.for_chat(target_id).pause(error.retry_after)
+                queue.put_nowait((chat_id, target_id, attempt, flood_wait + error.retry_after))
+                continue
+            if attempt < max_attempts:
+                if kind == retry.MIGRATE and on_migrate:
+                    new_id = error.migrate_to_chat_id
+                    logger.info(f"Chat {target_id} supergroup'ga ko'chgan: yangi ID {new_id}.")
+                    try:
+                        await on_migrate(target_id, new_id)
+                    except Exception as e:
+                        logger.error(f"Chat ID ni yangilashda xato ({target_id} -> {new_id}): {e}")
+                    queue.put_nowait((chat_id, new_id, attempt + 1, flood_wait))
+                    continue
+                if kind == retry.TRANSIENT:
+                    delay = retry.backoff(attempt)
+                    logger.warning(f"Chat {target_id} ga yuborishda vaqtinchalik xato, {delay:.1f} s dan keyin qayta urinish: {error}")
+                    delayed.append(loop.call_later(delay, queue.put_nowait, (chat_id, target_id, attempt + 1, flood_wait)))
+                    continue
+            await finish(DeliveryResult(chat_id, error=error, attempts=attempt))
+
+    workers = [asyncio.create_task(worker()) for _ in range(worker_count)]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+        for handle in delayed:
+            handle.cancel()
+        # Bekor qilinganda yakunlanmay qolgan yuborishlar navbat chuqurligidan chiqariladi
+        metrics.SEND_QUEUE_DEPTH.dec(outstanding)
+    return results
@@ -0,0 +1,106 @@
+# fsm_storage.py - aiogram FSM holatlarini bazada saqlash (DbStorage)
+#
+# Dispatcher() standart holatda FSM ni xotirada saqlaydi: deploy /newpost ning o'rtasida
+# bo'lsa admin qoralamasi yo'qoladi, ikkinchi nusxa esa holatni umuman ko'rmaydi.
+# DbStorage holat va ma'lumotni fsm_states jadvalida (ilovaning qolgan qismi bilan bir xil
+# ulanishlar hovuzi orqali, async_db) saqlaydi.
+#
+# Bitta yangilanishni qayta ishlashda holat bir necha marta o'qiladi (filtr, get_data,
+# update_data), shuning uchun o'qishlar FSM_CACHE_TTL_SECONDS davomida jarayon ichidagi
+# keshdan olinadi. Yozish bazaga va keshga birga yoziladi (write-through). Boshqa nusxa
+# yozganda uning NOTIFY'i (db.FSM_CHANGED_CHANNEL) shu kalitni keshdan o'chiradi, ulanish
+# uzilib qolsa esa butun kesh tozalanadi. NOTIFY'siz (SQLite) bitta jarayon ishlaydi.
+
+import copy
+import time
+import uuid
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+import async_db
+from config import FSM_CACHE_TTL_SECONDS
+
+
+def storage_key(key: StorageKey) -> str:
+    """StorageKey -> fsm_states.key ('bot_id:chat_id:user_id:thread_id:business_connection_id:destiny')."""
+    return ':'.join(str(part) if part is not None else '' for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny,
+    ))
+
+
+class DbStorage(BaseStorage):
+    """aiogram FSM storage: holatlar bazada, o'qishlar qisqa muddatli kesh orqali."""
+
+    # Shuncha yozuvdan oshganda muddati o'tganlari tozalanadi
+    _MAX_CACHE_ENTRIES = 10000
+
+    def __init__(self, ttl: float = FSM_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        # NOTIFY payload'idagi shu nusxa belgisi: o'zining yozuvlari keshni tozalamasin
+        self.origin = uuid.uuid4().hex[:12]
+        self._cache: Dict[str, Tuple[float, Optional[str], dict]] = {} # kalit -> (muddati, state, data)
+        self.reads = 0 # bazadan o'qishlar soni (benchmark va kuzatuv uchun)
+
+    async def _load(self, key: StorageKey) -> Tuple[Optional[str], dict]:
+        k = storage_key(key)
+        cached = self._cache.get(k)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1], cached[2]
+        self.reads += 1
+        state, data = await async_db.get_fsm_record(k)
+        self._remember(k, state, data)
+        return state, data
+
+    def _remember(self, k: str, state: Optional[str], data: dict):
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        if len(self._cache) >= self._MAX_CACHE_ENTRIES:
+            for stale in [key for key, entry in self._cache.items() if entry[0] <= now]:
+                del self._cache[stale]
+        self._cache[k] = (now + self.ttl, state, data)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        k = storage_key(key)
+        await async_db.set_fsm_state(k, state, self.origin)
+        cached = self._cache.get(k)
+        if cached is not None and cached[0] > time.monotonic():
+            self._remember(k, state, cached[2])
+        else:
+            self._cache.pop(k, None)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        data = copy.deepcopy(dict(data))
+        k = storage_key(key)
+        await async_db.set_fsm_data(k, data, self.origin)
+        cached = self._cache.get(k)
+        if cached is not None and cached[0] > time.monotonic():
+            self._remember(k, cached[1], data)
+        else:
+            self._cache.pop(k, None)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(key)
+        # Handler o'zgartirsa kesh buzilmasin
+        return copy.deepcopy(data)
+
+    def apply_notify(self, payload: str):
+        """NOTIFY payload'i: '<yozgan nusxa>:<kalit>'. Boshqa nusxa yozgan kalit keshdan o'chiriladi."""
+        origin, k = payload.split(':', 1)
+        if origin != self.origin:
+            self._cache.pop(k, None)
+
+    def invalidate(self):
+        """Butun keshni tozalaydi (LISTEN ulanishi uzilganda NOTIFY'lar yo'qolgan bo'lishi mumkin)."""
+        self._cache.clear()
+
+    async def close(self) -> None:
+        # Ulanishlar hovuzi umumiy: uni async_db.shutdown() yopadi
+        self._cache.clear()
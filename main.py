@@ -1,49 +1,106 @@
 # main.py - Asosiy bot logikasi
 
+import asyncio
 import logging
 from datetime import datetime
+import aiohttp
 import pytz 
 
 from aiogram import Bot, Dispatcher, types, F
+from aiogram.exceptions import TelegramAPIError
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 # Importlar
-from config import BOT_TOKEN, ADMIN_ID 
-from db import init_db, add_chat, get_active_chats, add_scheduled_post, deactivate_chat
+from config import BOT_TOKEN, ADMIN_ID, DISPATCH_RECONCILE_MINUTES, ALBUM_COLLECT_SECONDS, RETENTION_DAYS, RETENTION_INTERVAL_HOURS, HELPER_BOT_TOKENS, PROFILE_MAX_SECONDS
+from async_db import init_db, add_chat, get_active_chats, add_scheduled_post, add_scheduled_posts, deactivate_chat, get_db_summary, shutdown as shutdown_db
+from async_db import add_recurring_post, get_post_schedules, cancel_post_schedule, get_delivery_stats
 from scheduler import check_and_send_posts
+from post_dispatcher import PostDispatcher
+from chat_health import ChatHealthProber
+from bot_pool import BotPool
+from retention import archive_old_posts
+from chat_registry import registry as chat_registry
+from fsm_storage import DbStorage
+import bot_pool
+import metrics
+import post_actions
+import post_import
+import profiler
+import recurrence
+import startup
+import stats
+import storage
 
 # Global sozlamalar
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+# Admin jarayonlarining holati bazada: qayta ishga tushirishda yo'qolmaydi va barcha nusxalarga ko'rinadi
+fsm_storage = DbStorage()
+dp = Dispatcher(storage=fsm_storage)
 
 # APScheduler O'zbekiston vaqt mintaqasida ishlaydi
 scheduler = AsyncIOScheduler(timezone="Asia/Tashkent") 
 
+async def send_due_posts():
+    """Vaqti kelgan postlarni yuboradi, takrorlanuvchi postlarning yangi navbatdagi postlarini dispatcher'ga qo'shadi."""
+    for post_id, schedule_time in await check_and_send_posts(bot):
+        post_dispatcher.schedule(post_id, schedule_time)
+
+# Postlarni aniq vaqtida yuboruvchi dispatcher (keyingi post vaqtigacha uxlaydi)
+post_dispatcher = PostDispatcher(send_due_posts)
+metrics.PENDING_POSTS.set_function(lambda: post_dispatcher.pending)
+
+# O'lik chatlarni post yuborilishidan oldin aniqlovchi fon tekshiruvi
+chat_prober = ChatHealthProber(bot)
+
+# Yordamchi bot tokenlari berilsa, yuborishlar botlar o'rtasida taqsimlanadi (har birining o'z limiti bor)
+if HELPER_BOT_TOKENS:
+    bot_pool.pool = BotPool(bot, [Bot(token=token) for token in HELPER_BOT_TOKENS])
+
 # --- Admin vaziyatlari (FSM) ---
 class PostState(StatesGroup):
     waiting_for_post = State()
     waiting_for_schedule_time = State()
 
+class ImportState(StatesGroup):
+    waiting_for_file = State()
+
+class EditState(StatesGroup):
+    waiting_for_text = State()
+
 # --- ADMIN TEKSHIRUVI ---
 def is_admin(user_id: int) -> bool:
     """Faqat ADMIN_ID ro'yxatidagi foydalanuvchilar uchun ruxsat beradi."""
     return user_id in ADMIN_ID
 
+async def active_chat_count() -> int:
+    """Faol chatlar soni: registr yuklangan bo'lsa undan (DB va ro'yxat nusxasisiz)."""
+    if chat_registry.loaded:
+        return chat_registry.count
+    return len(await get_active_chats())
+
 # --- HANDLERS (Buyruqlar va Xabarlar) ---
 
 @dp.message(Command("start"))
 async def command_start_handler(message: types.Message):
     if is_admin(message.from_user.id):
-        await message.answer(f"Assalomu alaykum, Administrator! 😊\n\nBot ishga tushdi. Faol chatlar soni: **{len(get_active_chats())}**\n\n/newpost - Yangi post rejalashtirish\n/myid - ID raqamingizni olish")
+        await message.answer(f"Assalomu alaykum, Administrator! 😊\n\nBot ishga tushdi. Faol chatlar soni: **{await active_chat_count()}**\n\n/newpost - Yangi post rejalashtirish\n/import - Postlarni CSV/JSON fayldan rejalashtirish\n/schedules - Takrorlanuvchi postlar\n/unschedule ID - Takrorlanuvchi postni to'xtatish\n/editpost ID - Yuborilgan postni tahrirlash\n/deletepost ID [ID ...] - Yuborilgan postlarni o'chirish\n/stats - Yetkazish statistikasi\n/profile SONIYA - Profil (flame graph) olish\n/myid - ID raqamingizni olish")
     else:
         await message.answer("Siz administrator emassiz. Bot faqat admin tomonidan boshqariladi.")
 
+@dp.message(Command("stats"))
+async def stats_command(message: types.Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Sizda bu funksiyaga ruxsat yo'q.")
+    # Oldindan yig'ilgan hisoblagichlar: javob vaqti tarix hajmiga bog'liq emas
+    summary = await get_delivery_stats()
+    await message.answer(stats.report(summary, await active_chat_count()))
+
 @dp.message(Command("myid"))
 async def command_myid(message: types.Message):
     await message.answer(f"Sizning ID raqamingiz: `{message.from_user.id}`\n\n*(Uni Render Environment Variables yoki .env ga `ADMIN_ID` sifatida saqlang)*", parse_mode="Markdown")
@@ -55,39 +112,55 @@ async def start_new_post(message: types.Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         return await message.answer("Sizda bu funksiyaga ruxsat yo'q.")
     
-    await message.answer("Yubormoqchi bo'lgan postni (matn, rasm, video yoki hujjat) yuboring. Tugmalar qo'shish hozircha qo'llab-quvvatlanmaydi.")
+    await message.answer("Yubormoqchi bo'lgan postni (matn, rasm, video, hujjat yoki albom) yuboring. Tugmalar qo'shish hozircha qo'llab-quvvatlanmaydi.")
     await state.set_state(PostState.waiting_for_post)
 
-@dp.message(PostState.waiting_for_post, F.content_type.in_({'text', 'photo', 'video', 'document'}))
+# Postlar admin yuborgan asl xabardan copy_message/copy_messages bilan nusxalanadi
+# (media_type = 'copy'), shuning uchun formatlash (entities) va albomlar saqlanadi.
+POST_CONTENT_TYPES = {'text', 'photo', 'video', 'document', 'audio', 'animation', 'voice'}
+
+# Yig'ilayotgan albomlar: media_group_id -> qismlar (types.Message)
+_albums = {}
+
+@dp.message(PostState.waiting_for_post, F.media_group_id, F.content_type.in_({'photo', 'video', 'document', 'audio'}))
+async def process_album_part(message: types.Message, state: FSMContext):
+    """
+    Albom qismlarini yig'adi. Birinchi qism ALBUM_COLLECT_SECONDS kutadi, shu orada kelgan
+    qismlar ro'yxatga qo'shiladi va albom bitta post sifatida qabul qilinadi.
+    """
+    parts = _albums.get(message.media_group_id)
+    if parts is not None:
+        parts.append(message)
+        return
+
+    parts = _albums[message.media_group_id] = [message]
+    await asyncio.sleep(ALBUM_COLLECT_SECONDS)
+    del _albums[message.media_group_id]
+
+    parts.sort(key=lambda part: part.message_id)
+    # Telegram albomida 10 tadan ortiq element bo'lmaydi
+    parts = parts[:10]
+    # copy_messages caption'ni o'sha qismda qoldiradi, /editpost shu qismni tahrirlaydi
+    caption_index = next((i for i, part in enumerate(parts) if part.caption), 0)
+    await accept_post(message, state, [part.message_id for part in parts], parts[caption_index].caption or "", caption_index)
+
+@dp.message(PostState.waiting_for_post, F.content_type.in_(POST_CONTENT_TYPES))
 async def process_post_content(message: types.Message, state: FSMContext):
-    media_type = 'text'
-    file_id = None
-    caption = message.caption or message.text
-    
-    # Media turini aniqlash va File ID ni olish
-    if message.photo:
-        media_type = 'photo'
-        file_id = message.photo[-1].file_id
-    elif message.video:
-        media_type = 'video'
-        file_id = message.video.file_id
-    elif message.document:
-        media_type = 'document'
-        file_id = message.document.file_id
-    elif message.text:
-        media_type = 'text'
-        # caption allaqachon message.text ga teng
-
-    if not caption and file_id:
-        caption = "" # Caption bo'lmasa bo'sh string
-
-    await state.update_data(media_type=media_type, file_id=file_id, caption=caption)
+    await accept_post(message, state, [message.message_id], message.caption or message.text or "")
+
+async def accept_post(message: types.Message, state: FSMContext, message_ids: list, caption: str, caption_index: int = 0):
+    """Asl xabar(lar) manbasini FSM ga saqlaydi va yuborish vaqtini so'raydi."""
+    await state.update_data(
+        media_type='copy', file_id=None, caption=caption,
+        source_chat_id=message.chat.id, source_message_ids=message_ids, caption_index=caption_index,
+    )
     
     # Kelajakdagi vaqtni kiriting deb foydalanuvchiga aytish uchun
     current_time_uz = datetime.now(pytz.timezone("Asia/Tashkent")).strftime('%Y-%m-%d %H:%M:%S')
+    album_note = f" (albom: {len(message_ids)} ta element)" if len(message_ids) > 1 else ""
 
     await message.answer(
-        f"Post qabul qilindi.\n\nEndi postni qachon yuborish vaqtini kiriting. **Format:** `YYYY-MM-DD HH:MM:SS` (masalan, 2025-11-04 18:30:00)\n\n*(Joriy Toshkent vaqti: {current_time_uz})*"
+        f"Post qabul qilindi{album_note}. Post shu xabardan nusxalanadi, shuning uchun uni yuborilguncha o'chirmang.\n\nEndi postni qachon yuborish vaqtini kiriting. **Format:** `YYYY-MM-DD HH:MM:SS` (masalan, 2025-11-04 18:30:00)\n\nTakrorlanuvchi post uchun cron ifodasi: `cron 0 9 * * *` (har kuni 09:00) yoki `cron 30 18 * * 1-5 Europe/Berlin` (vaqt mintaqasi ixtiyoriy, standart - Asia/Tashkent)\n\n*(Joriy Toshkent vaqti: {current_time_uz})*"
     )
     await state.set_state(PostState.waiting_for_schedule_time)
 
@@ -95,6 +168,15 @@ async def process_post_content(message: types.Message, state: FSMContext):
 async def process_schedule_time(message: types.Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         return # Admin tekshiruvi
+    if message.media_group_id:
+        return # ALBUM_COLLECT_SECONDS dan keyin kechikib kelgan albom qismi
+
+    try:
+        spec = recurrence.parse_spec(message.text or '')
+    except ValueError as e:
+        return await message.answer(f"Noto'g'ri cron ifodasi: {e}")
+    if spec is not None:
+        return await schedule_recurring_post(message, state, *spec)
 
     try:
         schedule_time_str = message.text.strip()
@@ -107,15 +189,22 @@ async def process_schedule_time(message: types.Message, state: FSMContext):
         data = await state.get_data()
         
         # DB ga saqlash
-        post_id = add_scheduled_post(
+        post_id = await add_scheduled_post(
             data['media_type'],
             data['file_id'] if data['file_id'] else '',
             data['caption'] if data['caption'] else '',
-            schedule_time
+            schedule_time,
+            data.get('source_chat_id'),
+            data.get('source_message_ids'),
+            data.get('caption_index'),
         )
         
+        # Dispatcher'ga darhol xabar berish (NOTIFY kelishini kutmasdan)
+        if post_id:
+            post_dispatcher.schedule(post_id, pytz.timezone("Asia/Tashkent").localize(schedule_time))
+        
         await message.answer(
-            f"✅ **Post muvaffaqiyatli rejalashtirildi!**\nID: {post_id}\nVaqt: {schedule_time_str}\nManzillar soni: {len(get_active_chats())}"
+            f"✅ **Post muvaffaqiyatli rejalashtirildi!**\nID: {post_id}\nVaqt: {schedule_time_str}\nManzillar soni: {len(await get_active_chats())}"
         , parse_mode="Markdown")
         await state.clear()
 
@@ -126,6 +215,190 @@ async def process_schedule_time(message: types.Message, state: FSMContext):
         logger.error(f"Rejalashtirishda xato: {e}")
         await state.clear()
 
+async def schedule_recurring_post(message: types.Message, state: FSMContext, cron: str, timezone: str):
+    """Postni cron jadvali bo'yicha saqlaydi: DB da jadval va uning faqat navbatdagi posti bo'ladi."""
+    data = await state.get_data()
+    try:
+        schedule_id, post_id, first_time = await add_recurring_post(
+            data['media_type'], data['file_id'] or '', data['caption'] or '', cron, timezone,
+            data.get('source_chat_id'), data.get('source_message_ids'), data.get('caption_index'),
+        )
+    except Exception as e:
+        logger.error(f"Takrorlanuvchi postni saqlashda xato: {e}")
+        await state.clear()
+        return await message.answer(f"Kutilmagan xato: {e}")
+
+    post_dispatcher.schedule(post_id, first_time)
+    await message.answer(
+        f"✅ Takrorlanuvchi post rejalashtirildi!\nJadval ID: {schedule_id}\nCron: {cron} ({timezone})\n"
+        f"Birinchi yuborish: {first_time.strftime('%Y-%m-%d %H:%M:%S %Z')}\n\nTo'xtatish: /unschedule {schedule_id}"
+    )
+    await state.clear()
+
+@dp.message(Command("schedules"))
+async def list_schedules(message: types.Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Sizda bu funksiyaga ruxsat yo'q.")
+    schedules = await get_post_schedules()
+    if not schedules:
+        return await message.answer("Takrorlanuvchi postlar yo'q.")
+    lines = ["Takrorlanuvchi postlar:"]
+    for schedule in schedules:
+        next_time = schedule['next_time'].astimezone(pytz.timezone(schedule['timezone'])).strftime('%Y-%m-%d %H:%M') if schedule['next_time'] else "-"
+        caption = (schedule['caption'] or '').replace('\n', ' ')[:40]
+        lines.append(f"{schedule['id']}. {schedule['cron']} ({schedule['timezone']}), keyingisi: {next_time} - {caption}")
+    await message.answer("\n".join(lines))
+
+@dp.message(Command("unschedule"))
+async def unschedule_command(message: types.Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Sizda bu funksiyaga ruxsat yo'q.")
+    try:
+        schedule_ids = parse_post_ids(message)
+    except ValueError:
+        schedule_ids = []
+    if len(schedule_ids) != 1:
+        return await message.answer("Foydalanish: `/unschedule ID` (ID'larni /schedules ko'rsatadi)", parse_mode="Markdown")
+
+    if await cancel_post_schedule(schedule_ids[0]):
+        await message.answer(f"✅ Jadval {schedule_ids[0]} to'xtatildi, uning navbatdagi posti o'chirildi.")
+    else:
+        await message.answer(f"{schedule_ids[0]} raqamli faol jadval topilmadi.")
+
+
+# --- 1.1. POSTLARNI FAYLDAN IMPORT QILISH ---
+
+@dp.message(Command("import"))
+async def start_import(message: types.Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Sizda bu funksiyaga ruxsat yo'q.")
+
+    await message.answer(
+        "Postlar ro'yxatini CSV yoki JSON fayl (hujjat) sifatida yuboring.\n\n"
+        "Ustunlar: media_type (text, photo, video, document), file_id, caption, schedule_time "
+        "(YYYY-MM-DD HH:MM:SS, Toshkent vaqti). Matnli postlarda matn caption ustunida bo'ladi.\n\n"
+        f"Fayl to'liq tekshiriladi, to'g'ri qatorlar bitta tranzaksiyada saqlanadi (ko'pi bilan {post_import.IMPORT_MAX_ROWS} ta)."
+    )
+    await state.set_state(ImportState.waiting_for_file)
+
+@dp.message(ImportState.waiting_for_file, F.document)
+async def process_import_file(message: types.Message, state: FSMContext):
+    # Holat fayl qabul qilingandagina tozalanadi: yuklab yoki o'qib bo'lmasa admin faylni qayta yuboradi
+    try:
+        data = await bot.download(message.document)
+    except (TelegramAPIError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f"Import faylini yuklab olishda xato: {e}")
+        return await message.answer(f"Faylni yuklab bo'lmadi: {e}\n\nFaylni qayta yuboring.")
+    try:
+        posts, rejected = post_import.load(data.read(), message.document.file_name or '')
+    except ValueError as e:
+        return await message.answer(f"Faylni o'qib bo'lmadi: {e}\n\nTuzatilgan faylni qayta yuboring.")
+    await state.clear()
+
+    try:
+        created = await add_scheduled_posts(posts)
+    except Exception as e:
+        logger.error(f"Import qilishda xato: {e}")
+        return await message.answer(f"Postlarni saqlashda xato, hech narsa rejalashtirilmadi: {e}")
+
+    # Dispatcher'ga darhol xabar berish (NOTIFY kelishini kutmasdan)
+    for post_id, schedule_time in created:
+        post_dispatcher.schedule(post_id, schedule_time)
+    await message.answer(post_import.report(len(created), rejected))
+
+@dp.message(ImportState.waiting_for_file)
+async def process_import_not_file(message: types.Message, state: FSMContext):
+    await message.answer("Iltimos, CSV yoki JSON faylni hujjat sifatida yuboring.")
+
+
+# --- 1.2. YUBORILGAN POSTLARNI TAHRIRLASH VA O'CHIRISH ---
+
+# Tahrirlash/o'chirish minglab chatlarga so'rov yuboradi, shuning uchun fon vazifasida
+# bajariladi va natija adminga tayyor bo'lganda yuboriladi
+_admin_tasks = set()
+
+def run_admin_action(message: types.Message, action, report=post_actions.report):
+    async def runner():
+        try:
+            summary = await action
+        except ValueError as e:
+            return await message.answer(f"Bajarib bo'lmadi: {e}")
+        except Exception as e:
+            logger.error(f"Admin amalida xato: {e}")
+            return await message.answer(f"Kutilmagan xato: {e}")
+        if report is not None:
+            await message.answer(report(summary))
+
+    task = asyncio.create_task(runner())
+    _admin_tasks.add(task)
+    task.add_done_callback(_admin_tasks.discard)
+
+def parse_post_ids(message: types.Message) -> list:
+    """'/deletepost 12 13' -> [12, 13]. Noto'g'ri qiymat bo'lsa ValueError."""
+    return [int(part) for part in (message.text or '').split()[1:]]
+
+@dp.message(Command("editpost"))
+async def start_edit_post(message: types.Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Sizda bu funksiyaga ruxsat yo'q.")
+    try:
+        post_ids = parse_post_ids(message)
+    except ValueError:
+        post_ids = []
+    if len(post_ids) != 1:
+        return await message.answer("Foydalanish: `/editpost ID` (masalan, /editpost 12)", parse_mode="Markdown")
+
+    await state.update_data(post_id=post_ids[0])
+    await message.answer(f"Post {post_ids[0]} uchun yangi matnni (yoki caption'ni) yuboring. Formatlash saqlanadi.")
+    await state.set_state(EditState.waiting_for_text)
+
+@dp.message(EditState.waiting_for_text, F.text | F.caption)
+async def process_edit_text(message: types.Message, state: FSMContext):
+    data = await state.get_data()
+    await state.clear()
+    text = message.text or message.caption
+    entities = message.entities or message.caption_entities
+    await message.answer(f"Post {data['post_id']} barcha chatlarda tahrirlanmoqda...")
+    run_admin_action(message, post_actions.edit_post(bot, data['post_id'], text, entities))
+
+@dp.message(Command("deletepost"))
+async def delete_post_command(message: types.Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Sizda bu funksiyaga ruxsat yo'q.")
+    try:
+        post_ids = parse_post_ids(message)
+    except ValueError:
+        post_ids = []
+    if not post_ids:
+        return await message.answer("Foydalanish: `/deletepost ID [ID ...]` (masalan, /deletepost 12 13)", parse_mode="Markdown")
+
+    await message.answer(f"Post(lar) {', '.join(map(str, post_ids))} barcha chatlardan o'chirilmoqda...")
+    run_admin_action(message, post_actions.delete_posts(bot, post_ids))
+
+
+# --- 1.3. PROFILLASH ---
+
+async def send_profile(message: types.Message, seconds: int):
+    """Event loop'ni profillaydi va natijani collapsed-stack fayl sifatida adminga yuboradi."""
+    data, samples = await profiler.profile(seconds)
+    filename = f"profile-{datetime.now(pytz.timezone('Asia/Tashkent')):%Y%m%d-%H%M%S}.folded"
+    await message.answer_document(
+        types.BufferedInputFile(data, filename=filename),
+        caption=f"{seconds} s, {samples} ta namuna. flamegraph.pl yoki speedscope.app bilan oching.",
+    )
+
+@dp.message(Command("profile"))
+async def profile_command(message: types.Message):
+    if not is_admin(message.from_user.id):
+        return await message.answer("Sizda bu funksiyaga ruxsat yo'q.")
+    parts = (message.text or '').split()
+    seconds = int(parts[1]) if len(parts) == 2 and parts[1].isdigit() else 0
+    if not 1 <= seconds <= PROFILE_MAX_SECONDS:
+        return await message.answer(f"Foydalanish: `/profile SONIYA` (1 dan {PROFILE_MAX_SECONDS} gacha, masalan, /profile 30)", parse_mode="Markdown")
+
+    await message.answer(f"Profil {seconds} soniya davomida yig'ilmoqda...")
+    run_admin_action(message, send_profile(message, seconds), report=None)
+
 
 # --- 2. XIZMAT XABARLARI (KANALGA QO'SHILISH/O'CHIRILISH) ---
 
@@ -142,7 +415,7 @@ async def bot_added_to_chat(update: types.ChatMemberUpdated):
 
     if is_admin_or_member and (can_post or update.chat.type != 'channel'):
         # Chatni faol deb DB ga qo'shish/yangilash
-        add_chat(chat_id, chat_title, update.chat.type)
+        await add_chat(chat_id, chat_title, update.chat.type)
         
         # Adminni ogohlantirish (faqat birinchi admin ID ga yuboriladi)
         if ADMIN_ID and update.old_chat_member.status in ['left', 'kicked', 'restricted']:
@@ -155,7 +428,7 @@ async def bot_added_to_chat(update: types.ChatMemberUpdated):
     # Bot o'chirilganda/bloklanganda
     elif new_member.status in ['left', 'kicked']:
         # Chatni nofaol deb belgilash
-        deactivate_chat(chat_id)
+        await deactivate_chat(chat_id)
         
         # Adminni ogohlantirish
         if ADMIN_ID:
@@ -166,31 +439,103 @@ async def bot_added_to_chat(update: types.ChatMemberUpdated):
             )
 
 
-# --- BOTNI ISHGA TUSHIRISH FUNKSIYASI (server.py tomonidan chaqiriladi) ---
+# --- BOTNI ISHGA TUSHIRISH FUNKSIYALARI (server.py tomonidan chaqiriladi) ---
 
-async def main():
-    """Botning asosiy ishga tushirish mantig'i."""
+async def on_startup() -> bool:
+    """
+    Yangilanishlarni qabul qilishdan oldingi tayyorgarlik: DB, chat registri, dispatcher va scheduler.
+    Webhook va Long Polling rejimlari uchun umumiy. Bot ishga tushishi mumkin bo'lsa True qaytaradi.
+
+    Bir-biriga bog'liq bo'lmagan qadamlar parallel bajariladi va har birining vaqti
+    startup.phases ga yoziladi (/ready va /metrics da ko'rinadi). Jadvallar to'liq
+    o'qilmaydi: logga faqat get_db_summary() dagi sonlar chiqadi.
+    """
     logger.info("Bot ishga tushirilmoqda...")
     
     # ADMIN_ID ro'yxati bo'sh emasligini tekshirish
     if not BOT_TOKEN or not ADMIN_ID:
         logger.error("BOT_TOKEN yoki ADMIN_ID topilmadi. Bot ishga tushirilmadi.")
-        return # Botni ishga tushirishni to'xtatish
+        return False # Botni ishga tushirishni to'xtatish
+
+    # SQLite bitta jarayonda ishlaydi: LISTEN (va psycopg2) faqat Postgres'da kerak
+    listener = storage.notify_listener()
+    if listener is not None:
+        from db import CHATS_CHANGED_CHANNEL, FSM_CHANGED_CHANNEL
+        # Boshqa nusxalardagi chat o'zgarishlarini registrga qo'llash. Ulanish uzilib
+        # qolsa, NOTIFY'lar yo'qolgan bo'lishi mumkin, shuning uchun registr qayta yuklanadi.
+        listener.subscribe(CHATS_CHANGED_CHANNEL, chat_registry.apply_notify)
+        listener.on_reconnect(chat_registry.invalidate)
+        # Boshqa nusxa o'zgartirgan FSM holatlari keshdan o'chiriladi
+        listener.subscribe(FSM_CHANGED_CHANNEL, fsm_storage.apply_notify)
+        listener.on_reconnect(fsm_storage.invalidate)
 
-    # DB ni ishga tushirish
     try:
-        init_db()
+        # 1. Migratsiyalar, token tekshiruvi (get_me) va LISTEN ulanishi bir vaqtda.
+        # (SQLite bitta jarayonda ishlaydi: yangi postlar dispatcher'ga to'g'ridan-to'g'ri beriladi)
+        first = {'db': init_db(), 'bot': bot.me()}
+        if listener is not None:
+            first['listen'] = listener.start()
+        if bot_pool.pool:
+            first['helpers'] = asyncio.gather(*(member.bot.me() for member in bot_pool.pool.helpers))
+        results = await startup.parallel(**first)
+        logger.info(f"Bot: @{results['bot'].username}")
+        if bot_pool.pool:
+            logger.info(f"Yordamchi botlar: {', '.join('@' + helper.username for helper in results['helpers'])}")
+
+        # 2. Sxema tayyor: chat registri, qisqa statistika va dispatcher heap'i. Dispatcher
+        # LISTEN dan keyin yuklanadi, shuning uchun oradagi yangi post NOTIFY'i yo'qolmaydi.
+        results = await startup.parallel(
+            chats=get_active_chats(), # keyingi o'qishlar DB ga murojaat qilmaydi
+            summary=get_db_summary(),
+            dispatcher=post_dispatcher.start(),
+        )
     except Exception as e:
-        logger.error(f"DB initsializatsiyasida jiddiy xato: {e}. Bot ishga tushirilmadi.")
-        return
+        logger.error(f"Ishga tushishda jiddiy xato: {e}. Bot ishga tushirilmadi.")
+        return False
+
+    summary = startup.info['db'] = results['summary']
+    logger.info(
+        f"DB: {summary['active_chats']} ta faol chat, {summary['pending_posts']} ta kutilayotgan post, "
+        f"jami ~{summary['posts_estimate']} ta post."
+    )
 
-    # Scheduler ni ishga tushirish (har 1 daqiqada postlarni tekshiradi)
-    scheduler.add_job(check_and_send_posts, 'interval', minutes=1, args=(bot,))
+    chat_prober.start()
+    if bot_pool.pool:
+        bot_pool.pool.start()
+    # Xavfsizlik uchun vaqti-vaqti bilan xotiradagi rejalarni DB bilan solishtirish
+    scheduler.add_job(post_dispatcher.reconcile, 'interval', minutes=DISPATCH_RECONCILE_MINUTES)
+    # Yuborilgan eski postlarni arxivga ko'chirish (issiq jadvallar kichik qoladi)
+    if RETENTION_DAYS > 0:
+        scheduler.add_job(archive_old_posts, 'interval', hours=RETENTION_INTERVAL_HOURS, max_instances=1)
     scheduler.start()
     logger.info("Scheduler ishga tushdi.")
+    startup.mark_ready()
+    return True
+
+async def on_shutdown():
+    """on_startup() da ishga tushirilgan fon jarayonlarini to'xtatadi."""
+    startup.mark_not_ready()
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    post_dispatcher.stop()
+    chat_prober.stop()
+    if bot_pool.pool:
+        await bot_pool.pool.close()
+    listener = storage.notify_listener()
+    if listener is not None:
+        listener.stop()
+    # DB thread'lari va ulanishlar hovuzini yopish
+    shutdown_db()
 
-    # Botni ishga tushirish (Long Polling)
-    await dp.start_polling(bot)
+async def main():
+    """Botni faqat Long Polling rejimida ishga tushirish (HTTP serversiz)."""
+    if not await on_startup():
+        return
+
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await on_shutdown()
 
 # --- FAYLNING ENG OSTIDAGI QISM BUTUNLAY O'CHIRILDI ---
 # (server.py bu main funksiyasini chaqiradi)
@@ -0,0 +1,65 @@
+# metrics.py - Prometheus metrikalari (server.py dagi /metrics orqali beriladi)
+#
+# Metrikalar yuborish yo'li (delivery.fan_out, scheduler) va DB chaqiruvlari
+# (async_db.run) atrofida yig'iladi. Issiq yo'lda ishlatiladigan label'li
+# metrikalar oldindan `.labels()` qilib qo'yilgan, shuning uchun bitta yuborish
+# bir nechta qulfli qo'shish amalidan boshqa narsaga tushmaydi
+# (qarang: python benchmark.py metrics).
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+import retry
+from chat_registry import registry as chat_registry
+
+# Bot API chaqiruvlari va DB so'rovlari uchun (soniya)
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Post vaqtidan birinchi yuborishgacha (soniya)
+_LATENESS_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+# --- YUBORISH ---
+
+SENDS = Counter('avtopost_sends_total', "Yakunlangan yuborishlar (chat bo'yicha yakuniy natija)", ['result'])
+SEND_ERRORS = Counter('avtopost_send_errors_total', "Bot API xatolari, retry.classify() turi bo'yicha", ['error_class'])
+SEND_LATENCY = Histogram('avtopost_send_seconds', "Bitta chatga bitta yuborish urinishining davomiyligi", buckets=_LATENCY_BUCKETS)
+SEND_QUEUE_DEPTH = Gauge('avtopost_send_queue_depth', "fan_out da hali yakunlanmagan yuborishlar soni")
+SCHEDULE_TO_FIRST_SEND = Histogram(
+    'avtopost_schedule_to_first_send_seconds',
+    "Postning schedule_time vaqtidan birinchi muvaffaqiyatli yuborishgacha o'tgan vaqt",
+    buckets=_LATENESS_BUCKETS,
+)
+
+SENT = SENDS.labels('sent')
+FAILED = SENDS.labels('failed')
+ERRORS = {kind: SEND_ERRORS.labels(kind) for kind in (retry.FLOOD, retry.MIGRATE, retry.TRANSIENT, retry.CHAT_GONE, retry.FAILED)}
+
+# --- REJALAR VA CHATLAR ---
+
+ACTIVE_CHATS = Gauge('avtopost_active_chats', "Registrdagi faol chatlar soni")
+ACTIVE_CHATS.set_function(lambda: chat_registry.count)
+PENDING_POSTS = Gauge('avtopost_dispatcher_pending_posts', "Dispatcher heap'ida kutayotgan postlar soni")
+DRAIN_LAG = Gauge('avtopost_drain_lag_seconds', "Yuborilayotgan postning schedule_time dan kechikishi (bo'sh turganda 0)")
+DRAINED_POSTS = Counter('avtopost_drained_posts_total', "Drain sikli rejalashtirib yuborgan postlar")
+CHAT_HEALTH_CHECKS = Counter('avtopost_chat_health_checks_total', "chat_health tekshiruvlari natija bo'yicha", ['result'])
+ARCHIVED_POSTS = Counter('avtopost_archived_posts_total', "retention.py arxivga ko'chirgan postlar")
+
+# --- ISHGA TUSHISH ---
+
+STARTUP_PHASE = Gauge('avtopost_startup_phase_seconds', "Ishga tushish bosqichlarining davomiyligi (startup.py)", ['phase'])
+
+# --- DB ---
+
+DB_QUERY = Histogram('avtopost_db_query_seconds', "db.py funksiyalarining bajarilish vaqti (executor thread'ida)", ['function'], buckets=_LATENCY_BUCKETS)
+DB_ERRORS = Counter('avtopost_db_errors_total', "Xato bilan tugagan db.py chaqiruvlari", ['function'])
+
+# --- SEKIN AMALLAR (slowlog.py) ---
+
+SLOW_OPERATIONS = Counter('avtopost_slow_operations_total', "Chegaradan uzoq davom etgan DB chaqiruvlari va yuborishlar", ['kind'])
+SLOW_DB = SLOW_OPERATIONS.labels('db')
+SLOW_SEND = SLOW_OPERATIONS.labels('send')
+
+
+def render() -> bytes:
+    """Barcha metrikalarni Prometheus matn formatida qaytaradi."""
+    return generate_latest()
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
@@ -0,0 +1,619 @@
+# migrations.py - Ma'lumotlar bazasi sxemasining versiyalangan migratsiyalari
+#
+# Har bir migratsiya (versiya, nomi, SQL) ko'rinishida. db.apply_migrations()
+# schema_migrations jadvalida qayd qilinmagan migratsiyalarni tartib bilan
+# bajaradi. Qo'llanilgan migratsiyani o'zgartirmang — yangisini qo'shing.
+#
+# 1-2 migratsiyalar oldingi init_db() dagi DDL bilan bir xil va IF NOT EXISTS
+# bilan yozilgan, shuning uchun mavjud bazalarda ham xavfsiz bajariladi.
+
+MIGRATIONS = [
+    (1, "target_chats va scheduled_posts jadvallari", """
+        CREATE TABLE IF NOT EXISTS target_chats (
+            id BIGINT PRIMARY KEY,
+            title VARCHAR(255) NOT NULL,
+            type VARCHAR(50),
+            is_active BOOLEAN DEFAULT TRUE
+        );
+
+        CREATE TABLE IF NOT EXISTS scheduled_posts (
+            id SERIAL PRIMARY KEY,
+            media_type VARCHAR(50) NOT NULL,
+            file_id TEXT,
+            caption TEXT,
+            schedule_time TIMESTAMP WITH TIME ZONE NOT NULL,
+            is_sent BOOLEAN DEFAULT FALSE
+        );
+    """),
+
+    (2, "post holati va post_deliveries jurnali", """
+        ALTER TABLE scheduled_posts
+        ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'pending';
+
+        UPDATE scheduled_posts SET status = 'done'
+        WHERE is_sent = TRUE AND status = 'pending';
+
+        CREATE TABLE IF NOT EXISTS post_deliveries (
+            post_id INTEGER NOT NULL REFERENCES scheduled_posts(id) ON DELETE CASCADE,
+            chat_id BIGINT NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            message_id BIGINT,
+            error TEXT,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+            sent_at TIMESTAMP WITH TIME ZONE,
+            PRIMARY KEY (post_id, chat_id)
+        );
+    """),
+
+    (3, "vaqti kelgan postlar, faol chatlar va kutilayotgan yetkazishlar uchun qisman indekslar", """
+        -- get_due_posts / get_upcoming_schedule: faqat yuborilmagan postlar indekslanadi,
+        -- shuning uchun indeks hajmi yuborilganlar tarixi bilan o'smaydi
+        CREATE INDEX IF NOT EXISTS scheduled_posts_due_idx
+        ON scheduled_posts (schedule_time)
+        WHERE status IN ('pending', 'in_progress');
+
+        -- get_active_chats: faqat faol chatlar (index-only scan)
+        CREATE INDEX IF NOT EXISTS target_chats_active_idx
+        ON target_chats (id)
+        WHERE is_active;
+
+        -- get_pending_deliveries: post bo'yicha hali yuborilmagan chatlar
+        CREATE INDEX IF NOT EXISTS post_deliveries_pending_idx
+        ON post_deliveries (post_id, chat_id)
+        WHERE status = 'pending';
+    """),
+
+    (4, "bir nechta nusxa uchun chat oralig'i bo'yicha shard'lar va ijaralar", """
+        CREATE TABLE IF NOT EXISTS delivery_shards (
+            post_id INTEGER NOT NULL REFERENCES scheduled_posts(id) ON DELETE CASCADE,
+            shard_no INTEGER NOT NULL,
+            first_chat_id BIGINT NOT NULL,
+            last_chat_id BIGINT NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            lease_owner TEXT,
+            lease_expires_at TIMESTAMP WITH TIME ZONE,
+            PRIMARY KEY (post_id, shard_no)
+        );
+
+        CREATE INDEX IF NOT EXISTS delivery_shards_pending_idx
+        ON delivery_shards (post_id, shard_no)
+        WHERE status = 'pending';
+    """),
+
+    (5, "vaqti kelgan postlarni sahifalab o'qish uchun (schedule_time, id) indeksi", """
+        -- get_due_posts keyset sahifalari: ORDER BY schedule_time, id va (schedule_time, id) > (...)
+        DROP INDEX IF EXISTS scheduled_posts_due_idx;
+
+        CREATE INDEX IF NOT EXISTS scheduled_posts_due_idx
+        ON scheduled_posts (schedule_time, id)
+        WHERE status IN ('pending', 'in_progress');
+    """),
+
+    (6, "copy_message rejimi uchun asl xabar (yoki albom) manbasi", """
+        -- media_type = 'copy': post admin chatidagi asl xabar(lar)dan nusxalanadi
+        ALTER TABLE scheduled_posts
+        ADD COLUMN IF NOT EXISTS source_chat_id BIGINT,
+        ADD COLUMN IF NOT EXISTS source_message_ids BIGINT[];
+    """),
+
+    (7, "chat_health: botning chatdagi huquqlari va oxirgi tekshiruv vaqti", """
+        ALTER TABLE target_chats
+        ADD COLUMN IF NOT EXISTS can_post_messages BOOLEAN,
+        ADD COLUMN IF NOT EXISTS last_checked_at TIMESTAMP WITH TIME ZONE;
+
+        -- claim_chats_for_health_check: eng uzoq tekshirilmagan faol chatlar birinchi
+        CREATE INDEX IF NOT EXISTS target_chats_health_idx
+        ON target_chats (last_checked_at NULLS FIRST)
+        WHERE is_active;
+    """),
+
+    (8, "yuborilgan eski postlar arxivi (retention.py)", """
+        -- Har bir arxivlangan post bitta qator: post_deliveries yozuvlari deliveries ustuniga
+        -- [[chat_id, status, message_id, attempts, error, sent_at], ...] ko'rinishida yig'iladi,
+        -- katta JSONB qiymatlarni esa TOAST avtomatik siqadi
+        CREATE TABLE IF NOT EXISTS scheduled_posts_archive (
+            id INTEGER PRIMARY KEY,
+            media_type VARCHAR(50) NOT NULL,
+            file_id TEXT,
+            caption TEXT,
+            schedule_time TIMESTAMP WITH TIME ZONE NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            source_chat_id BIGINT,
+            source_message_ids BIGINT[],
+            sent_count INTEGER NOT NULL,
+            failed_count INTEGER NOT NULL,
+            deliveries JSONB NOT NULL,
+            archived_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+        );
+
+        CREATE INDEX IF NOT EXISTS scheduled_posts_archive_time_idx
+        ON scheduled_posts_archive (schedule_time);
+
+        -- archive_sent_posts: arxivlanishi kerak bo'lgan (yuborib bo'lingan) eng eski postlar
+        CREATE INDEX IF NOT EXISTS scheduled_posts_sent_idx
+        ON scheduled_posts (schedule_time)
+        WHERE status IN ('done', 'partially_failed');
+    """),
+
+    (9, "albom xabarlarining barcha ID'lari (/editpost va /deletepost uchun)", """
+        -- Birinchi xabar ID'si message_id da qoladi, albomning qolgan xabarlari shu ustunga
+        -- yoziladi (oddiy postlarda NULL, ya'ni qo'shimcha joy egallamaydi). Arxivdagi
+        -- deliveries elementlariga ular 7-qiymat sifatida qo'shiladi
+        ALTER TABLE post_deliveries
+        ADD COLUMN IF NOT EXISTS extra_message_ids BIGINT[];
+    """),
+
+    (10, "bot_pool: chatga biriktirilgan bot (yordamchi bot tokenlari)", """
+        -- NULL - chat hali taqsimlanmagan (asosiy bot yuboradi)
+        ALTER TABLE target_chats
+        ADD COLUMN IF NOT EXISTS bot_id BIGINT;
+
+        -- get_unassigned_chats: taqsimlanishi kerak bo'lgan faol chatlar
+        CREATE INDEX IF NOT EXISTS target_chats_unassigned_idx
+        ON target_chats (id)
+        WHERE is_active AND bot_id IS NULL;
+    """),
+
+    (11, "takrorlanuvchi postlar: cron jadvali va uning navbatdagi posti", """
+        -- Har bir takrorlanuvchi post bitta qator: cron ifodasi, vaqt mintaqasi va post mazmuni.
+        -- scheduled_posts da uning faqat navbatdagi posti bo'ladi, keyingisi plan_due_post da
+        -- shu post rejalashtirilgan tranzaksiyada yaratiladi
+        CREATE TABLE IF NOT EXISTS post_schedules (
+            id SERIAL PRIMARY KEY,
+            cron TEXT NOT NULL,
+            timezone TEXT NOT NULL,
+            media_type VARCHAR(50) NOT NULL,
+            file_id TEXT,
+            caption TEXT,
+            source_chat_id BIGINT,
+            source_message_ids BIGINT[],
+            is_active BOOLEAN NOT NULL DEFAULT TRUE,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+        );
+
+        ALTER TABLE scheduled_posts
+        ADD COLUMN IF NOT EXISTS schedule_id INTEGER REFERENCES post_schedules(id);
+
+        ALTER TABLE scheduled_posts_archive
+        ADD COLUMN IF NOT EXISTS schedule_id INTEGER;
+
+        -- Bitta jadvalning ko'pi bilan bitta kutilayotgan posti (takroriy yaratishdan himoya)
+        CREATE UNIQUE INDEX IF NOT EXISTS scheduled_posts_next_occurrence_idx
+        ON scheduled_posts (schedule_id)
+        WHERE status = 'pending';
+    """),
+
+    (12, "aiogram FSM holatlari (fsm_storage.py)", """
+        -- Kalit: bot_id:chat_id:user_id:thread_id:business_connection_id:destiny (aiogram StorageKey).
+        -- Holat tozalangan (state NULL, data bo'sh) qatorlar o'chiriladi, jadval faqat
+        -- tugallanmagan admin jarayonlari hajmida qoladi
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data JSONB NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+        );
+    """),
+
+    (13, "yetkazish statistikasi: post, soat, chat bo'yicha va jami hisoblagichlar (/stats)", """
+        -- Hisoblagichlar record_deliveries va finish_post_delivery bilan bir tranzaksiyada oshiriladi,
+        -- /stats faqat shu jadvallarni o'qiydi (post_deliveries tarixini sanamaydi). Arxivlash ularga
+        -- tegmaydi. delay_seconds - yuborilgan xabarlar uchun (sent_at - schedule_time) yig'indisi,
+        -- o'rtacha yetkazish vaqti = delay_seconds / sent
+        CREATE TABLE IF NOT EXISTS post_stats (
+            post_id INTEGER PRIMARY KEY,
+            schedule_time TIMESTAMP WITH TIME ZONE NOT NULL,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            delay_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+            last_sent_at TIMESTAMP WITH TIME ZONE,
+            completed_at TIMESTAMP WITH TIME ZONE
+        );
+
+        -- hour - natija yozilgan soatning boshi, posts - shu soatda yakunlangan postlar
+        CREATE TABLE IF NOT EXISTS hourly_stats (
+            hour TIMESTAMP WITH TIME ZONE PRIMARY KEY,
+            posts INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            delay_seconds DOUBLE PRECISION NOT NULL DEFAULT 0
+        );
+
+        -- Butun tarix uchun jami: yagona qator (id = 1)
+        CREATE TABLE IF NOT EXISTS delivery_totals (
+            id SMALLINT PRIMARY KEY CHECK (id = 1),
+            posts BIGINT NOT NULL DEFAULT 0,
+            sent BIGINT NOT NULL DEFAULT 0,
+            failed BIGINT NOT NULL DEFAULT 0,
+            delay_seconds DOUBLE PRECISION NOT NULL DEFAULT 0
+        );
+
+        -- Har bir yetkazishda yangilanadi: indeks faqat failed da, shuning uchun faqat sent oshganda
+        -- yangilanish HOT bo'lib qoladi (fillfactor sahifada yangi versiya uchun joy qoldiradi)
+        CREATE TABLE IF NOT EXISTS chat_stats (
+            chat_id BIGINT PRIMARY KEY,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            last_failed_at TIMESTAMP WITH TIME ZONE
+        ) WITH (fillfactor = 90);
+
+        -- /stats: eng ko'p xato bergan chatlar
+        CREATE INDEX IF NOT EXISTS chat_stats_failed_idx
+        ON chat_stats (failed DESC)
+        WHERE failed > 0;
+
+        -- Mavjud tarixdan boshlang'ich qiymatlar (bir martalik, migratsiya paytida): issiq jurnal va
+        -- arxiv (retention.py) birga sanaladi, shuning uchun post, soat va chat bo'yicha qiymatlar jami
+        -- bilan mos keladi. Arxivda updated_at yo'q: xato yozuvlar post vaqti soatiga, arxivlangan post
+        -- esa oxirgi yuborilgan xabar (bo'lmasa post vaqti) soatiga yoziladi
+        INSERT INTO post_stats (post_id, schedule_time, sent, failed, delay_seconds, last_sent_at, completed_at)
+        SELECT p.id, p.schedule_time,
+               COUNT(*) FILTER (WHERE d.status = 'sent'),
+               COUNT(*) FILTER (WHERE d.status = 'failed'),
+               COALESCE(SUM(EXTRACT(EPOCH FROM d.sent_at - p.schedule_time)) FILTER (WHERE d.status = 'sent'), 0),
+               MAX(d.sent_at),
+               CASE WHEN p.status IN ('done', 'partially_failed') THEN MAX(d.updated_at) END
+        FROM scheduled_posts p
+        JOIN post_deliveries d ON d.post_id = p.id AND d.status <> 'pending'
+        GROUP BY p.id
+        ON CONFLICT (post_id) DO NOTHING;
+
+        INSERT INTO post_stats (post_id, schedule_time, sent, failed, delay_seconds, last_sent_at, completed_at)
+        SELECT a.id, a.schedule_time, a.sent_count, a.failed_count,
+               COALESCE(SUM(EXTRACT(EPOCH FROM (e->>5)::timestamptz - a.schedule_time)) FILTER (WHERE e->>1 = 'sent'), 0),
+               MAX((e->>5)::timestamptz),
+               COALESCE(MAX((e->>5)::timestamptz), a.schedule_time)
+        FROM scheduled_posts_archive a
+        LEFT JOIN LATERAL jsonb_array_elements(a.deliveries) e ON TRUE
+        GROUP BY a.id
+        ON CONFLICT (post_id) DO NOTHING;
+
+        INSERT INTO hourly_stats (hour, posts, sent, failed, delay_seconds)
+        SELECT hour, SUM(posts), SUM(sent), SUM(failed), SUM(delay_seconds)
+        FROM (
+            SELECT date_trunc('hour', d.updated_at) AS hour, 0 AS posts,
+                   (d.status = 'sent')::int AS sent, (d.status = 'failed')::int AS failed,
+                   CASE WHEN d.status = 'sent' THEN EXTRACT(EPOCH FROM d.sent_at - p.schedule_time) ELSE 0 END AS delay_seconds
+            FROM post_deliveries d
+            JOIN scheduled_posts p ON p.id = d.post_id
+            WHERE d.status <> 'pending'
+            UNION ALL
+            SELECT date_trunc('hour', COALESCE((e->>5)::timestamptz, a.schedule_time)), 0,
+                   (e->>1 = 'sent')::int, (e->>1 = 'failed')::int,
+                   CASE WHEN e->>1 = 'sent' THEN EXTRACT(EPOCH FROM (e->>5)::timestamptz - a.schedule_time) ELSE 0 END
+            FROM scheduled_posts_archive a, jsonb_array_elements(a.deliveries) e
+            WHERE e->>1 <> 'pending'
+            UNION ALL
+            SELECT date_trunc('hour', completed_at), 1, 0, 0, 0
+            FROM post_stats
+            WHERE completed_at IS NOT NULL
+        ) h
+        GROUP BY hour
+        ON CONFLICT (hour) DO NOTHING;
+
+        INSERT INTO chat_stats (chat_id, sent, failed)
+        SELECT chat_id, SUM(sent), SUM(failed)
+        FROM (
+            SELECT chat_id, (status = 'sent')::int AS sent, (status = 'failed')::int AS failed
+            FROM post_deliveries
+            WHERE status <> 'pending'
+            UNION ALL
+            SELECT (e->>0)::bigint, (e->>1 = 'sent')::int, (e->>1 = 'failed')::int
+            FROM scheduled_posts_archive a, jsonb_array_elements(a.deliveries) e
+            WHERE e->>1 <> 'pending'
+        ) c
+        GROUP BY chat_id
+        ON CONFLICT (chat_id) DO NOTHING;
+
+        INSERT INTO delivery_totals (id, posts, sent, failed, delay_seconds)
+        SELECT 1, COUNT(*) FILTER (WHERE completed_at IS NOT NULL),
+               COALESCE(SUM(sent), 0), COALESCE(SUM(failed), 0), COALESCE(SUM(delay_seconds), 0)
+        FROM post_stats
+        ON CONFLICT (id) DO NOTHING;
+    """),
+
+    (14, "albomning caption'li qismi (/editpost uchun)", """
+        -- Albomda caption istalgan qismda bo'lishi mumkin, copy_messages uni shu qismda
+        -- qoldiradi. NULL - birinchi qism (oddiy postlar va shu migratsiyagacha qo'shilganlar)
+        ALTER TABLE scheduled_posts
+        ADD COLUMN IF NOT EXISTS caption_index SMALLINT;
+
+        ALTER TABLE post_schedules
+        ADD COLUMN IF NOT EXISTS caption_index SMALLINT;
+    """),
+
+    (15, "xabarni yuborgan bot (/editpost va /deletepost uchun)", """
+        -- Xabarni faqat uni yuborgan bot tahrirlay oladi, chatning hozirgi boti esa keyin
+        -- o'zgarishi mumkin (yordamchi bot chiqarilgan yoki pool'dan olib tashlangan).
+        -- NULL - shu migratsiyagacha yuborilgan xabarlar
+        ALTER TABLE post_deliveries
+        ADD COLUMN IF NOT EXISTS bot_id BIGINT;
+    """),
+]
+
+
+# --- SQLITE (db_sqlite.py) ---
+# Versiyalar yuqoridagilar bilan bir xil: Postgres'ga migratsiya qo'shilganda shu
+# ro'yxatga ham mos SQLite varianti qo'shiladi. Vaqtlar epoch soniya (REAL) sifatida
+# saqlanadi. Har bir SQL ';' bo'yicha alohida so'rovlarga bo'linadi, shuning uchun
+# izoh va satrlarda ';' ishlatmang.
+
+SQLITE_MIGRATIONS = [
+    (1, "target_chats va scheduled_posts jadvallari", """
+        CREATE TABLE IF NOT EXISTS target_chats (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            type TEXT,
+            is_active BOOLEAN NOT NULL DEFAULT TRUE
+        );
+
+        CREATE TABLE IF NOT EXISTS scheduled_posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            media_type TEXT NOT NULL,
+            file_id TEXT,
+            caption TEXT,
+            schedule_time REAL NOT NULL,
+            is_sent BOOLEAN NOT NULL DEFAULT FALSE
+        );
+    """),
+
+    (2, "post holati va post_deliveries jurnali", """
+        ALTER TABLE scheduled_posts ADD COLUMN status TEXT NOT NULL DEFAULT 'pending';
+
+        CREATE TABLE IF NOT EXISTS post_deliveries (
+            post_id INTEGER NOT NULL REFERENCES scheduled_posts(id) ON DELETE CASCADE,
+            chat_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            message_id INTEGER,
+            error TEXT,
+            created_at REAL NOT NULL DEFAULT ((julianday('now') - 2440587.5) * 86400.0),
+            updated_at REAL NOT NULL DEFAULT ((julianday('now') - 2440587.5) * 86400.0),
+            sent_at REAL,
+            PRIMARY KEY (post_id, chat_id)
+        ) WITHOUT ROWID;
+    """),
+
+    (3, "vaqti kelgan postlar, faol chatlar va kutilayotgan yetkazishlar uchun qisman indekslar", """
+        CREATE INDEX IF NOT EXISTS scheduled_posts_due_idx
+        ON scheduled_posts (schedule_time)
+        WHERE status IN ('pending', 'in_progress');
+
+        CREATE INDEX IF NOT EXISTS target_chats_active_idx
+        ON target_chats (id)
+        WHERE is_active;
+
+        CREATE INDEX IF NOT EXISTS post_deliveries_pending_idx
+        ON post_deliveries (post_id, chat_id)
+        WHERE status = 'pending';
+    """),
+
+    (4, "chat oralig'i bo'yicha shard'lar va ijaralar", """
+        CREATE TABLE IF NOT EXISTS delivery_shards (
+            post_id INTEGER NOT NULL REFERENCES scheduled_posts(id) ON DELETE CASCADE,
+            shard_no INTEGER NOT NULL,
+            first_chat_id INTEGER NOT NULL,
+            last_chat_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            lease_owner TEXT,
+            lease_expires_at REAL,
+            PRIMARY KEY (post_id, shard_no)
+        );
+
+        CREATE INDEX IF NOT EXISTS delivery_shards_pending_idx
+        ON delivery_shards (post_id, shard_no)
+        WHERE status = 'pending';
+    """),
+
+    (5, "vaqti kelgan postlarni sahifalab o'qish uchun (schedule_time, id) indeksi", """
+        DROP INDEX IF EXISTS scheduled_posts_due_idx;
+
+        CREATE INDEX IF NOT EXISTS scheduled_posts_due_idx
+        ON scheduled_posts (schedule_time, id)
+        WHERE status IN ('pending', 'in_progress');
+    """),
+
+    (6, "copy_message rejimi uchun asl xabar (yoki albom) manbasi", """
+        ALTER TABLE scheduled_posts ADD COLUMN source_chat_id INTEGER;
+
+        -- Postgres'dagi BIGINT[] o'rniga vergul bilan ajratilgan ID'lar (masalan, '12,13,14')
+        ALTER TABLE scheduled_posts ADD COLUMN source_message_ids TEXT;
+    """),
+
+    (7, "chat_health: botning chatdagi huquqlari va oxirgi tekshiruv vaqti", """
+        ALTER TABLE target_chats ADD COLUMN can_post_messages BOOLEAN;
+
+        ALTER TABLE target_chats ADD COLUMN last_checked_at REAL;
+
+        CREATE INDEX IF NOT EXISTS target_chats_health_idx
+        ON target_chats (last_checked_at)
+        WHERE is_active;
+    """),
+
+    (8, "yuborilgan eski postlar arxivi (retention.py)", """
+        CREATE TABLE IF NOT EXISTS scheduled_posts_archive (
+            id INTEGER PRIMARY KEY,
+            media_type TEXT NOT NULL,
+            file_id TEXT,
+            caption TEXT,
+            schedule_time REAL NOT NULL,
+            status TEXT NOT NULL,
+            source_chat_id INTEGER,
+            source_message_ids TEXT,
+            sent_count INTEGER NOT NULL,
+            failed_count INTEGER NOT NULL,
+            deliveries TEXT NOT NULL,
+            archived_at REAL NOT NULL DEFAULT ((julianday('now') - 2440587.5) * 86400.0)
+        );
+
+        CREATE INDEX IF NOT EXISTS scheduled_posts_archive_time_idx
+        ON scheduled_posts_archive (schedule_time);
+
+        CREATE INDEX IF NOT EXISTS scheduled_posts_sent_idx
+        ON scheduled_posts (schedule_time)
+        WHERE status IN ('done', 'partially_failed');
+    """),
+
+    (9, "albom xabarlarining barcha ID'lari (/editpost va /deletepost uchun)", """
+        ALTER TABLE post_deliveries ADD COLUMN extra_message_ids TEXT;
+    """),
+
+    (10, "bot_pool: chatga biriktirilgan bot (yordamchi bot tokenlari)", """
+        ALTER TABLE target_chats ADD COLUMN bot_id INTEGER;
+
+        CREATE INDEX IF NOT EXISTS target_chats_unassigned_idx
+        ON target_chats (id)
+        WHERE is_active AND bot_id IS NULL;
+    """),
+
+    (11, "takrorlanuvchi postlar: cron jadvali va uning navbatdagi posti", """
+        CREATE TABLE IF NOT EXISTS post_schedules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cron TEXT NOT NULL,
+            timezone TEXT NOT NULL,
+            media_type TEXT NOT NULL,
+            file_id TEXT,
+            caption TEXT,
+            source_chat_id INTEGER,
+            source_message_ids TEXT,
+            is_active BOOLEAN NOT NULL DEFAULT TRUE,
+            created_at REAL NOT NULL DEFAULT ((julianday('now') - 2440587.5) * 86400.0)
+        );
+
+        ALTER TABLE scheduled_posts ADD COLUMN schedule_id INTEGER REFERENCES post_schedules(id);
+
+        ALTER TABLE scheduled_posts_archive ADD COLUMN schedule_id INTEGER;
+
+        CREATE UNIQUE INDEX IF NOT EXISTS scheduled_posts_next_occurrence_idx
+        ON scheduled_posts (schedule_id)
+        WHERE status = 'pending';
+    """),
+
+    (12, "aiogram FSM holatlari (fsm_storage.py)", """
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at REAL NOT NULL DEFAULT ((julianday('now') - 2440587.5) * 86400.0)
+        );
+    """),
+
+    (13, "yetkazish statistikasi: post, soat, chat bo'yicha va jami hisoblagichlar (/stats)", """
+        CREATE TABLE IF NOT EXISTS post_stats (
+            post_id INTEGER PRIMARY KEY,
+            schedule_time REAL NOT NULL,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            delay_seconds REAL NOT NULL DEFAULT 0,
+            last_sent_at REAL,
+            completed_at REAL
+        );
+
+        -- hour - soat boshining epoch qiymati (3600 ga karrali)
+        CREATE TABLE IF NOT EXISTS hourly_stats (
+            hour REAL PRIMARY KEY,
+            posts INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            delay_seconds REAL NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS delivery_totals (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            posts INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            delay_seconds REAL NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS chat_stats (
+            chat_id INTEGER PRIMARY KEY,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            last_failed_at REAL
+        );
+
+        CREATE INDEX IF NOT EXISTS chat_stats_failed_idx
+        ON chat_stats (failed DESC)
+        WHERE failed > 0;
+
+        INSERT INTO post_stats (post_id, schedule_time, sent, failed, delay_seconds, last_sent_at, completed_at)
+        SELECT p.id, p.schedule_time,
+               SUM(d.status = 'sent'),
+               SUM(d.status = 'failed'),
+               COALESCE(SUM(CASE WHEN d.status = 'sent' THEN d.sent_at - p.schedule_time END), 0),
+               MAX(d.sent_at),
+               CASE WHEN p.status IN ('done', 'partially_failed') THEN MAX(d.updated_at) END
+        FROM scheduled_posts p
+        JOIN post_deliveries d ON d.post_id = p.id AND d.status <> 'pending'
+        GROUP BY p.id
+        ON CONFLICT (post_id) DO NOTHING;
+
+        INSERT INTO post_stats (post_id, schedule_time, sent, failed, delay_seconds, last_sent_at, completed_at)
+        SELECT a.id, a.schedule_time, a.sent_count, a.failed_count,
+               COALESCE(SUM(CASE WHEN json_extract(e.value, '$[1]') = 'sent' THEN json_extract(e.value, '$[5]') - a.schedule_time END), 0),
+               MAX(json_extract(e.value, '$[5]')),
+               COALESCE(MAX(json_extract(e.value, '$[5]')), a.schedule_time)
+        FROM scheduled_posts_archive a
+        LEFT JOIN json_each(a.deliveries) e
+        GROUP BY a.id
+        ON CONFLICT (post_id) DO NOTHING;
+
+        INSERT INTO hourly_stats (hour, posts, sent, failed, delay_seconds)
+        SELECT CAST(ts / 3600 AS INTEGER) * 3600.0, SUM(posts), SUM(sent), SUM(failed), SUM(delay_seconds)
+        FROM (
+            SELECT d.updated_at AS ts, 0 AS posts,
+                   d.status = 'sent' AS sent, d.status = 'failed' AS failed,
+                   CASE WHEN d.status = 'sent' THEN d.sent_at - p.schedule_time ELSE 0 END AS delay_seconds
+            FROM post_deliveries d
+            JOIN scheduled_posts p ON p.id = d.post_id
+            WHERE d.status <> 'pending'
+            UNION ALL
+            SELECT COALESCE(json_extract(e.value, '$[5]'), a.schedule_time), 0,
+                   json_extract(e.value, '$[1]') = 'sent', json_extract(e.value, '$[1]') = 'failed',
+                   CASE WHEN json_extract(e.value, '$[1]') = 'sent' THEN json_extract(e.value, '$[5]') - a.schedule_time ELSE 0 END
+            FROM scheduled_posts_archive a, json_each(a.deliveries) e
+            WHERE json_extract(e.value, '$[1]') <> 'pending'
+            UNION ALL
+            SELECT completed_at, 1, 0, 0, 0
+            FROM post_stats
+            WHERE completed_at IS NOT NULL
+        )
+        GROUP BY 1
+        ON CONFLICT (hour) DO NOTHING;
+
+        INSERT INTO chat_stats (chat_id, sent, failed)
+        SELECT chat_id, SUM(sent), SUM(failed)
+        FROM (
+            SELECT chat_id, status = 'sent' AS sent, status = 'failed' AS failed
+            FROM post_deliveries
+            WHERE status <> 'pending'
+            UNION ALL
+            SELECT json_extract(e.value, '$[0]'), json_extract(e.value, '$[1]') = 'sent', json_extract(e.value, '$[1]') = 'failed'
+            FROM scheduled_posts_archive a, json_each(a.deliveries) e
+            WHERE json_extract(e.value, '$[1]') <> 'pending'
+        )
+        GROUP BY chat_id
+        ON CONFLICT (chat_id) DO NOTHING;
+
+        INSERT INTO delivery_totals (id, posts, sent, failed, delay_seconds)
+        SELECT 1, COUNT(completed_at), COALESCE(SUM(sent), 0), COALESCE(SUM(failed), 0), COALESCE(SUM(delay_seconds), 0)
+        FROM post_stats
+        WHERE TRUE
+        ON CONFLICT (id) DO NOTHING;
+    """),
+
+    (14, "albomning caption'li qismi (/editpost uchun)", """
+        ALTER TABLE scheduled_posts ADD COLUMN caption_index INTEGER;
+
+        ALTER TABLE post_schedules ADD COLUMN caption_index INTEGER;
+    """),
+
+    (15, "xabarni yuborgan bot (/editpost va /deletepost uchun)", """
+        ALTER TABLE post_deliveries ADD COLUMN bot_id INTEGER;
+    """),
+]
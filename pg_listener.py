@@ -0,0 +1,125 @@
+# pg_listener.py - PostgreSQL LISTEN/NOTIFY xabarlarini asyncio event loop'da qabul qilish
+#
+# Bitta alohida (hovuzdan tashqari, autocommit) ulanish LISTEN qiladi va uning
+# soketi event loop'ga `add_reader` orqali ulanadi, shuning uchun kutish uchun
+# thread yoki polling kerak emas. Ulanish uzilsa, qayta ulanadi va
+# `on_reconnect` callback'lari chaqiriladi (uzilish paytida NOTIFY'lar yo'qolgan
+# bo'lishi mumkin).
+
+import asyncio
+import inspect
+import logging
+from typing import Awaitable, Callable, Dict, List, Union
+
+import psycopg2
+from psycopg2 import sql
+
+import async_db
+import db
+from config import LISTEN_RECONNECT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class PgListener:
+    """Kanallarga obuna bo'lish va NOTIFY payload'larini callback'larga uzatish."""
+
+    def __init__(self):
+        self._callbacks: Dict[str, List[Callable[[str], None]]] = {}
+        self._reconnect_callbacks: List[Callable[[], Union[Awaitable, None]]] = []
+        self._conn = None
+        self._loop = None
+        self._reconnect_task = None
+
+    def subscribe(self, channel: str, callback: Callable[[str], None]):
+        """`channel` ga kelgan har bir NOTIFY payload'i bilan `callback(payload)` chaqiriladi."""
+        is_new = channel not in self._callbacks
+        self._callbacks.setdefault(channel, []).append(callback)
+        # Listener allaqachon ishlayotgan bo'lsa, yangi kanalni darhol LISTEN qilish
+        if is_new and self._conn is not None:
+            with self._conn.cursor() as cur:
+                cur.execute(sql.SQL("LISTEN {};").format(sql.Identifier(channel)))
+
+    def on_reconnect(self, callback: Callable[[], Union[Awaitable, None]]):
+        """Qayta ulangandan keyin chaqiriladigan callback, oddiy yoki async (yo'qolgan xabarlarni tiklash uchun)."""
+        self._reconnect_callbacks.append(callback)
+
+    async def start(self):
+        """Ulanishni ochadi va obuna bo'lingan barcha kanallarni LISTEN qiladi."""
+        self._loop = asyncio.get_running_loop()
+        try:
+            await self._connect()
+        except Exception as e:
+            logger.error(f"LISTEN ulanishini ochishda xato: {e}")
+            self._schedule_reconnect()
+
+    def stop(self):
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        self._drop()
+
+    async def _connect(self):
+        conn = await async_db.run(db.get_db_connection)
+        conn.set_session(autocommit=True)
+        with conn.cursor() as cur:
+            for channel in self._callbacks:
+                cur.execute(sql.SQL("LISTEN {};").format(sql.Identifier(channel)))
+        self._conn = conn
+        self._loop.add_reader(conn.fileno(), self._on_readable)
+        logger.info(f"PostgreSQL LISTEN ishga tushdi: {', '.join(self._callbacks)}")
+
+    def _drop(self):
+        if self._conn is None:
+            return
+        try:
+            self._loop.remove_reader(self._conn.fileno())
+        except Exception:
+            pass
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def _on_readable(self):
+        try:
+            self._conn.poll()
+        except psycopg2.Error as e:
+            logger.warning(f"LISTEN ulanishi uzildi: {e}")
+            self._drop()
+            self._schedule_reconnect()
+            return
+
+        while self._conn.notifies:
+            notify = self._conn.notifies.pop(0)
+            for callback in self._callbacks.get(notify.channel, []):
+                try:
+                    callback(notify.payload)
+                except Exception as e:
+                    logger.error(f"NOTIFY ({notify.channel}) ni qayta ishlashda xato: {e}")
+
+    def _schedule_reconnect(self):
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = self._loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while True:
+            await asyncio.sleep(LISTEN_RECONNECT_SECONDS)
+            try:
+                await self._connect()
+                break
+            except Exception as e:
+                logger.error(f"LISTEN ulanishini tiklashda xato: {e}")
+
+        for callback in self._reconnect_callbacks:
+            try:
+                result = callback()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Qayta ulanish callback'ida xato: {e}")
+
+
+# Dastur bo'yicha yagona listener (bitta ulanish barcha kanallar uchun)
+listener = PgListener()
@@ -0,0 +1,209 @@
+# post_actions.py - Yuborib bo'lingan postlarni barcha chatlarda tahrirlash va o'chirish
+#
+# Har bir chatga yuborilgan xabar ID'lari post_deliveries da saqlanadi (albomning birinchi
+# xabari message_id da, qolganlari extra_message_ids da). /editpost va /deletepost shu
+# ID'lar bo'yicha edit_message_text / edit_message_caption / delete_messages ni yuborish
+# bilan bir xil yo'l orqali chaqiradi: delivery.fan_out (parallel worker'lar, umumiy
+# tezlik cheklovchisi, flood control va vaqtinchalik xatolarda qayta urinish).
+#
+# O'chirishda bitta chatdagi barcha xabarlar (bir nechta post va albom elementlari)
+# delete_messages ga DELETE_BATCH_SIZE tadan beriladi, ya'ni albomli post har bir chatda
+# bitta chaqiruv bilan o'chadi.
+#
+# Xabarni faqat uni yuborgan bot o'zgartira oladi: yordamchi botlar sozlangan bo'lsa
+# (bot_pool.py) so'rov jurnalga yozilgan (post_deliveries.bot_id) bot orqali, uning
+# cheklovchisi bilan yuboriladi. Chatning hozirgi boti bunga ta'sir qilmaydi: u yordamchi bot
+# chiqarilganda yoki pool'dan olib tashlanganda o'zgaradi, staging ishlamasa esa postni
+# biriktirilgan bot o'rniga asosiy bot yuboradi.
+
+import logging
+from collections import Counter
+from typing import List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+import async_db
+import bot_pool
+import delivery
+import retry
+import slowlog
+from storage import POST_PENDING
+
+logger = logging.getLogger(__name__)
+
+# Bot API: bitta deleteMessages chaqiruvida ko'pi bilan shuncha xabar
+DELETE_BATCH_SIZE = 100
+
+# Natija o'zgarmagan, ya'ni qayta urinish kerak bo'lmagan holatlar
+_NOT_MODIFIED = 'message is not modified'
+_ALREADY_DELETED = 'message to delete not found'
+# Xabarda matn yo'q (media): tahrirlash edit_message_caption orqali
+_NO_TEXT = 'no text in the message to edit'
+
+# Tahrirlash usuli: post turi bo'yicha ma'lum bo'lsa shu yerdan olinadi
+_EDIT_KINDS = {'text': 'text', 'photo': 'caption', 'video': 'caption', 'document': 'caption'}
+
+
+def _edit_kind(post: dict):
+    """'text', 'caption' yoki None (copy post: asl xabar turi saqlanmagan, birinchi javobdan aniqlanadi)."""
+    if post['media_type'] in _EDIT_KINDS:
+        return _EDIT_KINDS[post['media_type']]
+    if len(post['source_message_ids'] or []) > 1:
+        return 'caption' # albom faqat media'dan iborat
+    return None
+
+def _sender(pool: bot_pool.BotPool, chat_id: int, bot_id: Optional[int], post: dict):
+    """
+    (xabarni yuborgan pool a'zosi, u pool'dan olib tashlanganmi). Jurnalda bot yozilmagan bo'lsa
+    (15-migratsiyagacha yuborilgan) - chatning hozirgi boti, yozilgan bot pool'da bo'lmasa - asosiy bot.
+    """
+    if bot_id is None:
+        return pool.member_for(chat_id, post), False
+    member = pool.member(bot_id)
+    if member is None:
+        return pool.primary, True
+    return member, False
+
+def _log_missing(action: str, missing: set):
+    if missing:
+        logger.error(f"{action}: {len(missing)} ta chatda xabarni yuborgan bot pool'da yo'q, asosiy bot ishlatiladi "
+                     f"(masalan, chat {min(missing)}).")
+
+def _summary(action: str, post_ids: List[int], results: List[delivery.DeliveryResult], api_calls: int) -> dict:
+    errors = Counter(retry.classify(r.error) for r in results if not r.ok)
+    return {
+        'action': action,
+        'posts': list(post_ids),
+        'chats': len(results),
+        'ok': sum(1 for r in results if r.ok),
+        'failed': sum(errors.values()),
+        'errors': dict(errors),
+        'api_calls': api_calls,
+    }
+
+async def edit_post(bot: Bot, post_id: int, text: str, entities: list = None, rate_limiter: delivery.RateLimiter = None) -> dict:
+    """
+    Postning matnini (yoki caption'ini) u yuborilgan barcha chatlarda `text` ga almashtiradi.
+    `entities` - admin yuborgan yangi matnning formatlashi. Yangi matn bazaga kamida bitta chatda
+    tahrirlangandagina yoziladi. Post topilmasa yoki hali yuborilmagan bo'lsa ValueError.
+    """
+    slowlog.post_id.set(post_id) # admin vazifasining o'z konteksti
+    post = await async_db.get_post(post_id)
+    if post is None:
+        raise ValueError(f"{post_id} raqamli post topilmadi")
+    if post['status'] == POST_PENDING:
+        raise ValueError(f"post {post_id} hali yuborilmagan")
+
+    # Albomda faqat caption'li qism tahrirlanadi (copy_messages caption'ni o'sha qismda qoldiradi)
+    index = post['caption_index']
+    rows = await async_db.get_post_messages([post_id])
+    messages = {chat_id: message_ids[min(index, len(message_ids) - 1)] for chat_id, _, message_ids, _ in rows}
+    kind = _edit_kind(post)
+    pool = bot_pool.pool
+    senders, missing = {}, set()
+    if pool is not None:
+        for chat_id, _, _, bot_id in rows:
+            senders[chat_id], gone = _sender(pool, chat_id, bot_id, post)
+            if gone:
+                missing.add(chat_id)
+        _log_missing(f"Post {post_id} tahriri", missing)
+        bot_for, rate_limiter = (lambda chat_id: senders[chat_id].bot), pool.limiter(senders=senders)
+    else:
+        bot_for, rate_limiter = (lambda chat_id: bot), rate_limiter or delivery.limiter
+    api_calls = 0
+
+    async def send(chat_id: int):
+        nonlocal kind, api_calls
+        message_id = messages[chat_id]
+        bot = bot_for(chat_id)
+        try:
+            if kind != 'caption':
+                # Parallel worker'lar tur aniqlanguncha bir nechta taxminiy chaqiruv yuborishi mumkin
+                guessed = kind is None
+                try:
+                    api_calls += 1
+                    return await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, entities=entities)
+                except TelegramBadRequest as e:
+                    if not guessed or _NO_TEXT not in str(e).lower():
+                        raise
+                    kind = 'caption'
+            api_calls += 1
+            return await bot.edit_message_caption(chat_id=chat_id, message_id=message_id, caption=text, caption_entities=entities)
+        except TelegramBadRequest as e:
+            if _NOT_MODIFIED in str(e).lower():
+                return None
+            raise
+
+    results = await delivery.fan_out(messages, send, rate_limiter)
+    summary = _summary('edit', [post_id], results, api_calls)
+    summary['sender_missing'] = len(missing)
+    # Saqlangan matn obunachilar ko'rayotganiga mos bo'lsin: hech bir chatda tahrirlanmagan bo'lsa u o'zgarmaydi
+    summary['caption_saved'] = summary['ok'] > 0
+    if summary['caption_saved']:
+        await async_db.update_post_caption(post_id, text)
+    logger.info(f"Post {post_id} tahrirlandi: {summary}")
+    return summary
+
+async def delete_posts(bot: Bot, post_ids: List[int], rate_limiter: delivery.RateLimiter = None) -> dict:
+    """
+    Postlarni ular yuborilgan barcha chatlardan o'chiradi. Muvaffaqiyatli o'chirilgan chatlarning
+    xabar ID'lari jurnaldan olib tashlanadi, shuning uchun takroriy chaqiruv ularni qayta so'ramaydi.
+    """
+    posts = {post_id: await async_db.get_post(post_id) for post_id in post_ids}
+    rate_limiter = rate_limiter or delivery.limiter
+    pool = bot_pool.pool
+    # Har bir bot faqat o'zi yuborgan xabarlarni o'chira oladi: chat_id -> {pool a'zosi: [message_id, ...]}
+    messages = {}
+    missing = set()
+    for chat_id, post_id, message_ids, bot_id in await async_db.get_post_messages(post_ids):
+        member = None
+        if pool is not None:
+            member, gone = _sender(pool, chat_id, bot_id, posts[post_id])
+            if gone:
+                missing.add(chat_id)
+        messages.setdefault(chat_id, {}).setdefault(member, []).extend(message_ids)
+    _log_missing(f"Postlar {list(post_ids)} o'chirilishi", missing)
+    api_calls = 0
+
+    async def send(chat_id: int):
+        nonlocal api_calls
+        first = True
+        for member, message_ids in messages[chat_id].items():
+            for start in range(0, len(message_ids), DELETE_BATCH_SIZE):
+                if not first:
+                    # Birinchi partiya uchun ruxsatni fan_out olgan, keyingilari ham limitga bo'ysunadi
+                    await (member.limiter if member else rate_limiter).acquire(chat_id)
+                first = False
+                api_calls += 1
+                try:
+                    await (member.bot if member else bot).delete_messages(chat_id, message_ids[start:start + DELETE_BATCH_SIZE])
+                except TelegramBadRequest as e:
+                    if _ALREADY_DELETED not in str(e).lower():
+                        raise
+
+    if pool is not None:
+        # Birinchi partiyani yuboradigan botning cheklovchisi
+        rate_limiter = pool.limiter(senders={chat_id: next(iter(by_bot)) for chat_id, by_bot in messages.items()})
+    results = await delivery.fan_out(messages, send, rate_limiter)
+    await async_db.clear_post_messages(post_ids, [r.chat_id for r in results if r.ok])
+    summary = _summary('delete', post_ids, results, api_calls)
+    summary['sender_missing'] = len(missing)
+    logger.info(f"Postlar {list(post_ids)} o'chirildi: {summary}")
+    return summary
+
+def report(summary: dict) -> str:
+    """Admin uchun natija matni."""
+    action = "tahrirlandi" if summary['action'] == 'edit' else "o'chirildi"
+    posts = ', '.join(map(str, summary['posts']))
+    if not summary['chats']:
+        return f"Post(lar) {posts}: yuborilgan xabarlar topilmadi."
+    lines = [f"✅ Post(lar) {posts}: {summary['ok']} ta chatda {action}."]
+    if summary['failed']:
+        errors = ', '.join(f"{kind}: {count}" for kind, count in summary['errors'].items())
+        lines.append(f"❌ {summary['failed']} ta chatda xato ({errors}).")
+    if summary.get('sender_missing'):
+        lines.append(f"❌ {summary['sender_missing']} ta chatda xabarni yuborgan bot pool'da yo'q, so'rov asosiy bot orqali yuborildi.")
+    if summary.get('caption_saved') is False:
+        lines.append("Hech bir chatda tahrirlanmadi, post matni o'zgartirilmadi.")
+    return "\n".join(lines)
@@ -0,0 +1,122 @@
+# post_dispatcher.py - Postlarni aniq vaqtida yuborish (har daqiqalik polling o'rniga)
+#
+# Kelgusi postlarning vaqtlari xotiradagi min-heap'da saqlanadi. Dispatcher eng
+# yaqin post vaqtigacha uxlaydi, vaqti kelganda `on_due()` ni chaqiradi.
+# Heap ishga tushishda scheduled_posts dan yuklanadi va yangi postlar
+# qo'shilganda PostgreSQL NOTIFY (yoki to'g'ridan-to'g'ri `schedule()`) orqali
+# yangilanadi. Sekin davriy `reconcile()` xavfsizlik uchun qoladi.
+
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Optional, Union
+
+import async_db
+import storage
+from config import DISPATCH_RETRY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class PostDispatcher:
+    """Kelgusi post vaqtlarini min-heap'da saqlab, har birini o'z vaqtida ishga tushiradi."""
+
+    def __init__(self, on_due: Callable[[], Awaitable]):
+        self._on_due = on_due
+        self._heap = [] # (epoch soniya, post_id)
+        self._scheduled = {} # post_id -> heap'dagi amaldagi vaqt (eskirgan yozuvlarni tashlab ketish uchun)
+        self._retry_at: Optional[float] = None
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    # --- HEAP BOSHQARUVI ---
+
+    def schedule(self, post_id: int, when: Union[datetime, float]):
+        """Postni `when` vaqtida yuborish uchun heap'ga qo'shadi (takror chaqirish xavfsiz)."""
+        ts = when.timestamp() if isinstance(when, datetime) else float(when)
+        if self._scheduled.get(post_id) == ts:
+            return
+        self._scheduled[post_id] = ts
+        heapq.heappush(self._heap, (ts, post_id))
+        self._wakeup.set()
+
+    def _on_notify(self, payload: str):
+        """NOTIFY payload'i: '<post_id>:<epoch soniya>'."""
+        post_id, ts = payload.split(':', 1)
+        self.schedule(int(post_id), float(ts))
+
+    def _next_time(self) -> Optional[float]:
+        # Eskirgan (qayta rejalashtirilgan) yozuvlarni tashlab ketish
+        while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        times = [t for t in (self._heap[0][0] if self._heap else None, self._retry_at) if t is not None]
+        return min(times) if times else None
+
+    def _pop_due(self, now: float):
+        while self._heap and self._heap[0][0] <= now:
+            ts, post_id = heapq.heappop(self._heap)
+            if self._scheduled.get(post_id) == ts:
+                del self._scheduled[post_id]
+        if self._retry_at is not None and self._retry_at <= now:
+            self._retry_at = None
+
+    @property
+    def pending(self) -> int:
+        """Heap'da kutayotgan postlar soni."""
+        return len(self._scheduled)
+
+    # --- ASOSIY SIKL ---
+
+    async def reconcile(self):
+        """Heap'ni DB dagi kutilayotgan postlar bilan to'liq qayta quradi."""
+        try:
+            rows = await async_db.get_upcoming_schedule()
+        except Exception as e:
+            logger.error(f"Dispatcher: rejalarni DB dan yuklashda xato: {e}")
+            return
+        self._scheduled = {post_id: when.timestamp() for post_id, when in rows}
+        self._heap = [(ts, post_id) for post_id, ts in self._scheduled.items()]
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+        logger.info(f"Dispatcher: {len(self._heap)} ta kutilayotgan post yuklandi.")
+
+    async def start(self):
+        """Heap'ni yuklaydi, NOTIFY ga obuna bo'ladi (Postgres'da) va asosiy siklni ishga tushiradi."""
+        listener = storage.notify_listener()
+        if listener is not None:
+            from db import NEW_POST_CHANNEL
+            listener.subscribe(NEW_POST_CHANNEL, self._on_notify)
+            listener.on_reconnect(self.reconcile)
+        await self.reconcile()
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            next_time = self._next_time()
+            if next_time is None:
+                await self._wakeup.wait()
+                continue
+
+            delay = next_time - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._pop_due(time.time())
+            try:
+                # on_due siklning o'zida kutiladi, shuning uchun yuborishlar hech qachon ustma-ust tushmaydi
+                await self._on_due()
+            except Exception as e:
+                logger.error(f"Dispatcher: postlarni yuborishda xato: {e}")
+                self._retry_at = time.time() + DISPATCH_RETRY_SECONDS
@@ -0,0 +1,129 @@
+# post_import.py - /import buyrug'i uchun CSV/JSON fayldan postlarni o'qish va tekshirish
+#
+# Fayl avval to'liq tekshiriladi: har bir noto'g'ri qator sababi bilan rad etiladi,
+# to'g'ri qatorlar esa bitta tranzaksiyada yoziladi (async_db.add_scheduled_posts).
+#
+# CSV (birinchi qator sarlavha):
+#   media_type,file_id,caption,schedule_time
+#   photo,AgACAgIAAxk...,Rasm tagidagi matn,2025-11-04 18:30:00
+#   text,,Oddiy matnli post,2025-11-04 19:00:00
+# JSON:
+#   [{"media_type": "photo", "file_id": "AgACAgIAAxk...", "caption": "...", "schedule_time": "2025-11-04 18:30:00"}]
+#
+# Matnli postlarda (media_type = text) matn caption (yoki text) ustunida, file_id bo'sh.
+# schedule_time - Toshkent vaqti, /newpost dagi bilan bir xil formatda.
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterable, List, NamedTuple, Tuple
+
+import pytz
+
+from config import IMPORT_MAX_ROWS
+
+MEDIA_TYPES = ('text', 'photo', 'video', 'document')
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Telegram cheklovlari: xabar matni va media caption'i uzunligi
+TEXT_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+_TZ = pytz.timezone("Asia/Tashkent")
+
+
+class ImportedPost(NamedTuple):
+    media_type: str
+    file_id: str
+    caption: str
+    schedule_time: datetime # Toshkent vaqti (naive), add_scheduled_post dagi kabi
+
+
+class RejectedRow(NamedTuple):
+    row: int # CSV da fayldagi qator raqami, JSON da element tartib raqami (1 dan)
+    reason: str
+
+
+def parse(data: bytes, filename: str = '') -> List[Tuple[int, dict]]:
+    """Fayl tarkibini (qator raqami, ustunlar) ro'yxatiga aylantiradi. Fayl o'qilmasa ValueError."""
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ValueError("fayl UTF-8 kodlashda emas")
+
+    if filename.lower().endswith('.json') or text.lstrip().startswith('['):
+        try:
+            items = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON xatosi: {e}")
+        if not isinstance(items, list):
+            raise ValueError("JSON fayl postlar ro'yxatidan ([...]) iborat bo'lishi kerak")
+        return [(i, item) for i, item in enumerate(items, start=1)]
+
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or 'schedule_time' not in reader.fieldnames:
+        raise ValueError("CSV sarlavhasi topilmadi (media_type,file_id,caption,schedule_time)")
+    # Sarlavha 1-qator, shuning uchun ma'lumotlar 2-qatordan boshlanadi
+    return [(reader.line_num, row) for row in reader]
+
+def validate(records: Iterable[Tuple[int, dict]], now: datetime = None) -> Tuple[List[ImportedPost], List[RejectedRow]]:
+    """Har bir yozuvni tekshiradi va (to'g'ri postlar, rad etilgan qatorlar) ni qaytaradi."""
+    now = now or datetime.now(_TZ).replace(tzinfo=None)
+    posts, rejected = [], []
+    for row_no, record in records:
+        if not isinstance(record, dict):
+            rejected.append(RejectedRow(row_no, "yozuv obyekt ({...}) emas"))
+            continue
+        media_type = str(record.get('media_type') or '').strip().lower()
+        file_id = str(record.get('file_id') or '').strip()
+        caption = str(record.get('caption') or record.get('text') or '')
+        raw_time = str(record.get('schedule_time') or '').strip()
+
+        if media_type not in MEDIA_TYPES:
+            rejected.append(RejectedRow(row_no, f"noma'lum media_type: {media_type!r} ({', '.join(MEDIA_TYPES)})"))
+            continue
+        if media_type == 'text':
+            if not caption.strip():
+                rejected.append(RejectedRow(row_no, "matnli post bo'sh"))
+                continue
+            if len(caption) > TEXT_LIMIT:
+                rejected.append(RejectedRow(row_no, f"matn {TEXT_LIMIT} belgidan uzun"))
+                continue
+            file_id = ''
+        else:
+            if not file_id:
+                rejected.append(RejectedRow(row_no, f"{media_type} uchun file_id ko'rsatilmagan"))
+                continue
+            if len(caption) > CAPTION_LIMIT:
+                rejected.append(RejectedRow(row_no, f"caption {CAPTION_LIMIT} belgidan uzun"))
+                continue
+        try:
+            schedule_time = datetime.strptime(raw_time, TIME_FORMAT)
+        except ValueError:
+            rejected.append(RejectedRow(row_no, f"noto'g'ri vaqt {raw_time!r} (YYYY-MM-DD HH:MM:SS)"))
+            continue
+        if schedule_time < now:
+            rejected.append(RejectedRow(row_no, f"vaqt o'tib ketgan: {raw_time}"))
+            continue
+
+        posts.append(ImportedPost(media_type, file_id, caption, schedule_time))
+    return posts, rejected
+
+def load(data: bytes, filename: str = '', now: datetime = None) -> Tuple[List[ImportedPost], List[RejectedRow]]:
+    """Faylni o'qiydi va tekshiradi. Fayl umuman o'qilmasa yoki juda katta bo'lsa ValueError."""
+    records = parse(data, filename)
+    if not records:
+        raise ValueError("faylda birorta ham post yo'q")
+    if len(records) > IMPORT_MAX_ROWS:
+        raise ValueError(f"faylda {len(records)} ta qator bor, ko'pi bilan {IMPORT_MAX_ROWS} ta ruxsat etiladi")
+    return validate(records, now)
+
+def report(created: int, rejected: List[RejectedRow], limit: int = 20) -> str:
+    """Admin uchun natija matni (rad etilgan qatorlarning dastlabki `limit` tasi bilan)."""
+    lines = [f"✅ {created} ta post rejalashtirildi."]
+    if rejected:
+        lines.append(f"❌ {len(rejected)} ta qator rad etildi:")
+        lines += [f"  {r.row}-qator: {r.reason}" for r in rejected[:limit]]
+        if len(rejected) > limit:
+            lines.append(f"  ... va yana {len(rejected) - limit} ta")
+    return "\n".join(lines)
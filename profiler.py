@@ -0,0 +1,102 @@
+# profiler.py - /profile uchun namuna oluvchi (sampling) profiler
+#
+# signal.setitimer har PROFILE_INTERVAL_MS da SIGALRM yuboradi. Signal handler'i asosiy thread'da
+# (event loop shu yerda ishlaydi) keyingi bytecode chegarasida bajariladi va unga aynan to'xtatilgan
+# kadr beriladi, shuning uchun loop CPU ishida bo'lsa ham, select() da kutayotgan bo'lsa ham namuna
+# to'g'ri joydan olinadi. Fon thread'idan sys._current_frames() ni o'qish esa GIL tufayli loop'ni
+# faqat u GIL'ni bo'shatgan paytda (asosan select() da) ko'radi va CPU ishlarini ko'rsatmaydi.
+# Shu namunada async_db executor thread'larining ("db...") stek'lari ham olinadi; navbatdan vazifa
+# kutayotgan ishsiz thread'lar qo'shilmaydi.
+#
+# Natija flame graph vositalari (flamegraph.pl, speedscope, inferno) o'qiydigan collapsed-stack
+# formatida qaytariladi, har bir kadr "funksiya (fayl:funksiyaning birinchi qatori)", ildiz - thread nomi:
+#   MainThread;run (runners.py:86);run_until_complete (base_events.py:617);... 42
+#
+# Profiler faqat /profile davomida ishlaydi va kodni o'zgartirmaydi (sys.setprofile ishlatilmaydi).
+
+import asyncio
+import os
+import signal
+import sys
+import threading
+from collections import Counter
+from typing import Tuple
+
+from config import PROFILE_INTERVAL_MS
+
+# async_db._executor thread'lari nomining boshlanishi
+_DB_THREAD_PREFIX = 'db'
+# Ishsiz executor thread'i shu funksiyada navbatdan vazifa kutadi
+_IDLE_WORKER = ('_worker', os.path.join('concurrent', 'futures', 'thread.py'))
+
+_running = False
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return code.co_name == _IDLE_WORKER[0] and code.co_filename.endswith(_IDLE_WORKER[1])
+
+
+class SamplingProfiler:
+    """Asosiy thread (event loop) va DB executor thread'larining stek'larini SIGALRM bo'yicha sanaydi."""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0 # namuna olish sikllari soni
+        self._previous_handler = None
+
+    def _record(self, name: str, frame):
+        labels = []
+        while frame is not None:
+            labels.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        labels.append(name)
+        self.stacks[';'.join(reversed(labels))] += 1
+
+    def _on_signal(self, signum, frame):
+        main = threading.main_thread()
+        self._record(main.name, frame)
+        names = {thread.ident: thread.name for thread in threading.enumerate() if thread.name.startswith(_DB_THREAD_PREFIX)}
+        for thread_id, thread_frame in sys._current_frames().items():
+            name = names.get(thread_id)
+            if name is not None and not _is_idle(thread_frame):
+                self._record(name, thread_frame)
+        self.samples += 1
+
+    def start(self):
+        """Faqat asosiy thread'dan chaqiriladi (signal handler'lari shu yerda o'rnatiladi)."""
+        self._previous_handler = signal.signal(signal.SIGALRM, self._on_signal)
+        signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self._previous_handler)
+
+    def collapsed(self) -> bytes:
+        """Collapsed-stack formati: har qatorda 'kadr;kadr;... soni', eng ko'p uchraganlari birinchi."""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()).encode()
+
+
+async def profile(seconds: float, interval: float = PROFILE_INTERVAL_MS / 1000) -> Tuple[bytes, int]:
+    """
+    Joriy event loop'ni `seconds` soniya profillaydi va (collapsed-stack fayl, namunalar soni) ni
+    qaytaradi. Bir vaqtda faqat bitta profil yig'iladi; loop asosiy thread'da bo'lmasa ham ValueError.
+    """
+    global _running
+    if _running:
+        raise ValueError("profil allaqachon yig'ilmoqda")
+    if threading.current_thread() is not threading.main_thread():
+        raise ValueError("profiler faqat asosiy thread'dagi event loop uchun ishlaydi")
+    _running = True
+    profiler = SamplingProfiler(interval)
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+        _running = False
+    return profiler.collapsed(), profiler.samples
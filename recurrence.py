@@ -0,0 +1,62 @@
+# recurrence.py - Takrorlanuvchi postlar uchun cron jadvallari
+#
+# Takrorlanuvchi post post_schedules jadvalida bitta qator (cron ifodasi + vaqt mintaqasi)
+# sifatida saqlanadi, scheduled_posts da esa uning faqat navbatdagi posti turadi. Post
+# rejalashtirilganda (plan_due_post) keyingi vaqt shu yerda hisoblanadi va yangi post
+# o'sha tranzaksiyada yaratiladi. Shuning uchun vaqti kelgan postlar so'rovi va jadval
+# hajmi jadval qanchalik uzoqqa cho'zilishiga bog'liq emas.
+#
+# Ifoda oddiy 5 maydonli crontab (daqiqa soat kun oy hafta_kuni), vaqtlarni APScheduler'ning
+# CronTrigger'i vaqt mintaqasini (shu jumladan yozgi vaqtga o'tishni) hisobga olib hisoblaydi.
+# Admin kiritadigan ko'rinish:
+#   cron 0 9 * * *                  - har kuni 09:00 (Toshkent)
+#   cron 30 18 * * 1-5 Europe/Berlin - ish kunlari 18:30 (Berlin vaqti)
+
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+import pytz
+from apscheduler.triggers.cron import CronTrigger
+
+DEFAULT_TIMEZONE = "Asia/Tashkent"
+PREFIX = 'cron'
+
+
+def trigger(expression: str, timezone: str = DEFAULT_TIMEZONE) -> CronTrigger:
+    """Cron ifodasidan trigger yasaydi. Ifoda yoki vaqt mintaqasi noto'g'ri bo'lsa ValueError."""
+    try:
+        tz = pytz.timezone(timezone)
+    except pytz.UnknownTimeZoneError:
+        raise ValueError(f"noma'lum vaqt mintaqasi: {timezone}")
+    if len(expression.split()) != 5:
+        raise ValueError("cron ifodasida 5 ta maydon bo'lishi kerak (daqiqa soat kun oy hafta_kuni)")
+    try:
+        return CronTrigger.from_crontab(expression, timezone=tz)
+    except ValueError as e:
+        raise ValueError(f"noto'g'ri cron ifodasi: {e}")
+
+def next_occurrence(expression: str, timezone: str, after: datetime) -> Optional[datetime]:
+    """
+    `after` dan keyingi (va hozirdan oldin bo'lmagan) birinchi vaqt. Bot uzoq to'xtab qolgan
+    bo'lsa o'tkazib yuborilgan vaqtlar qayta yaratilmaydi. Ifoda boshqa hech qachon ishlamasa None.
+    """
+    now = datetime.now(pytz.utc)
+    base = max(after, now) if after is not None else now
+    # get_next_fire_time `base` ga teng vaqtni ham qaytaradi, shuning uchun undan qat'iy keyingisi olinadi
+    return trigger(expression, timezone).get_next_fire_time(None, base + timedelta(microseconds=1))
+
+def parse_spec(text: str) -> Optional[Tuple[str, str]]:
+    """
+    Admin matnidan (cron ifodasi, vaqt mintaqasi) ni ajratadi. Matn 'cron' bilan boshlanmasa None,
+    ifoda noto'g'ri bo'lsa ValueError.
+    """
+    parts = text.split()
+    if not parts or parts[0].lower() != PREFIX:
+        return None
+    if len(parts) not in (6, 7):
+        raise ValueError("format: cron <daqiqa> <soat> <kun> <oy> <hafta_kuni> [vaqt mintaqasi]")
+    expression = ' '.join(parts[1:6])
+    timezone = parts[6] if len(parts) == 7 else DEFAULT_TIMEZONE
+    if next_occurrence(expression, timezone, None) is None:
+        raise ValueError("bu cron ifodasi bo'yicha kelgusida birorta ham vaqt yo'q")
+    return expression, timezone
@@ -0,0 +1,79 @@
+# retention.py - Yuborilgan eski postlarni arxivlash (issiq jadvallarni kichik saqlash)
+#
+# scheduled_posts va post_deliveries dagi yuborib bo'lingan postlar hech qachon
+# o'chirilmas edi, shuning uchun ular (ayniqsa har bir post x chat bo'lgan yetkazish
+# jurnali) cheklangan hajmli Neon bazasida cheksiz o'sardi. archive_old_posts()
+# RETENTION_DAYS dan eski postlarni kichik partiyalarda scheduled_posts_archive ga
+# ko'chiradi: har bir partiya alohida qisqa tranzaksiya, partiyalar orasida pauza.
+# Natijada issiq jadvallar faqat kutilayotgan va yaqinda yuborilgan postlar hajmida qoladi.
+#
+# main.py uni RETENTION_INTERVAL_HOURS da bir ishga tushiradi. Qo'lda:
+#   python retention.py --dry-run
+#   python retention.py --days 90
+
+import argparse
+import asyncio
+import logging
+import time
+
+import async_db
+import metrics
+from config import RETENTION_DAYS, RETENTION_BATCH_SIZE, RETENTION_PAUSE_SECONDS, RETENTION_DRY_RUN
+
+logger = logging.getLogger(__name__)
+
+
+async def archive_old_posts(
+    days: float = RETENTION_DAYS,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    pause: float = RETENTION_PAUSE_SECONDS,
+    dry_run: bool = RETENTION_DRY_RUN,
+) -> dict:
+    """
+    `days` kundan eski yuborilgan postlarni arxivga ko'chiradi. dry_run bo'lsa hech narsa
+    o'zgartirilmaydi, faqat ko'chiriladigan postlar va yetkazish yozuvlari soni qaytariladi.
+    """
+    older_than = days * 86400
+    if dry_run:
+        counts = await async_db.count_archivable_posts(older_than)
+        logger.info(
+            f"Arxivlash (dry run): {counts['posts']} ta post va {counts['deliveries']} ta "
+            f"yetkazish yozuvi arxivga ko'chirilgan bo'lardi ({days:g} kundan eski)."
+        )
+        return {'dry_run': True, **counts}
+
+    moved = batches = 0
+    longest = 0.0
+    while True:
+        start = time.perf_counter()
+        count = await async_db.archive_sent_posts(older_than, batch_size)
+        longest = max(longest, time.perf_counter() - start)
+        if count:
+            moved += count
+            batches += 1
+            metrics.ARCHIVED_POSTS.inc(count)
+        if count < batch_size:
+            break
+        # Partiyalar orasida boshqa so'rovlarga (yuborish, NOTIFY) yo'l berish
+        await asyncio.sleep(pause)
+
+    if moved:
+        logger.info(f"Arxivlash: {moved} ta post {batches} ta partiyada arxivga ko'chirildi (eng uzun partiya {longest:.2f} s).")
+    return {'dry_run': False, 'posts': moved, 'batches': batches, 'longest_batch_seconds': round(longest, 3)}
+
+
+async def _main(args):
+    await async_db.init_db()
+    try:
+        print(await archive_old_posts(args.days, args.batch_size, args.pause, args.dry_run))
+    finally:
+        async_db.shutdown()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Yuborilgan eski postlarni arxivga ko'chirish")
+    parser.add_argument('--days', type=float, default=RETENTION_DAYS)
+    parser.add_argument('--batch-size', type=int, default=RETENTION_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=RETENTION_PAUSE_SECONDS)
+    parser.add_argument('--dry-run', action='store_true', default=RETENTION_DRY_RUN)
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,65 @@
+# retry.py - Telegram xatolarini turiga qarab qayta ishlash siyosati
+#
+# Xato matnidagi so'zlarni qidirish o'rniga aiogram'ning tiplangan xato
+# klasslari ishlatiladi:
+#   FLOOD     - TelegramRetryAfter: umumiy cheklovchi Telegram aytgan vaqtga to'xtatiladi,
+#               so'ng xabar qayta yuboriladi;
+#   MIGRATE   - TelegramMigrateToChat: guruh supergroup'ga aylangan, chat ID yangilanadi
+#               va xabar yangi ID ga yuboriladi;
+#   TRANSIENT - tarmoq/server xatolari: jitter'li eksponensial kutishdan keyin qayta urinish;
+#   CHAT_GONE - bot chatdan chiqarilgan/bloklangan: chat nofaol qilinadi;
+#   FAILED    - boshqa xatolar (masalan, noto'g'ri kontent): faqat shu yuborish muvaffaqiyatsiz.
+
+import asyncio
+import random
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramMigrateToChat,
+    TelegramNetworkError,
+    TelegramNotFound,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from config import RETRY_BASE_DELAY, RETRY_MAX_DELAY
+
+FLOOD = 'flood'
+MIGRATE = 'migrate'
+TRANSIENT = 'transient'
+CHAT_GONE = 'chat_gone'
+FAILED = 'failed'
+
+# TelegramBadRequest ichida chatning o'zi bilan bog'liq (qayta urinib bo'lmaydigan) xatolar
+_CHAT_GONE_MESSAGES = (
+    'chat not found',
+    'bot is not a member',
+    'bot was kicked',
+    'not an administrator',
+    'not enough rights',
+    'have no rights to send',
+    'need administrator rights',
+    'chat_write_forbidden',
+)
+
+def classify(error: Exception) -> str:
+    """Xatoni yuqoridagi turlardan biriga ajratadi."""
+    if isinstance(error, TelegramRetryAfter):
+        return FLOOD
+    if isinstance(error, TelegramMigrateToChat):
+        return MIGRATE
+    if isinstance(error, (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError)):
+        return TRANSIENT
+    if isinstance(error, (TelegramForbiddenError, TelegramNotFound)):
+        return CHAT_GONE
+    if isinstance(error, TelegramBadRequest):
+        message = str(error).lower()
+        if any(text in message for text in _CHAT_GONE_MESSAGES):
+            return CHAT_GONE
+    return FAILED
+
+def backoff(attempt: int) -> float:
+    """`attempt`-urinishdan keyingi kutish vaqti (soniya): eksponensial o'sish + tasodifiy jitter."""
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    return random.uniform(delay / 2, delay)
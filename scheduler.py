@@ -2,83 +2,231 @@
 
 import asyncio
 import logging
-from datetime import datetime
-import pytz 
+import time
 
 from aiogram import Bot
-from aiogram.exceptions import TelegramAPIError
 
-import db # db.py faylini import qilish
+import async_db # db.py funksiyalarining asinxron versiyasi
+import bot_pool # Yordamchi botlar (bir nechta token)
+import delivery # Parallel, tezlik cheklovli yuborish
+import metrics # Prometheus metrikalari
+import retry # Telegram xatolarini turiga qarab ajratish
+import slowlog # Sekin amallar jurnali (post_id/chat_id konteksti)
+from config import LEDGER_BATCH_SIZE, LEDGER_FLUSH_SECONDS, WORKER_ID, SHARD_LEASE_SECONDS, DRAIN_PAGE_SIZE, SEND_CONCURRENCY
+from storage import DELIVERY_SENT, DELIVERY_FAILED
 
 # Logging sozlamasi
 logger = logging.getLogger(__name__)
 
-async def check_and_send_posts(bot: Bot):
-    """Vaqti kelgan postlarni tekshiradi va barcha faol chatlarga yuboradi."""
-    
-    # 1. Bazadan yuborilishi kerak bo'lgan postlarni olish
-    posts = db.get_due_posts() # Natija: Lug'atlar ro'yxati (List of dicts)
-    
-    # Post topilmasa funksiyadan chiqish
-    if not posts:
-        return
+# --- YETKAZISH JURNALINI PARTIYALAB YOZISH ---
+
+class LedgerWriter:
+    """Yuborish natijalarini yig'ib, post_deliveries ga partiyalab yozadi."""
+
+    def __init__(self, post_id: int, batch_size: int = LEDGER_BATCH_SIZE, interval: float = LEDGER_FLUSH_SECONDS):
+        self.post_id = post_id
+        self.batch_size = batch_size
+        self.interval = interval
+        self._rows = []
+        self._last_flush = time.monotonic()
+
+    async def add(self, result: delivery.DeliveryResult):
+        if result.ok:
+            row = (self.post_id, result.chat_id, DELIVERY_SENT, result.message_id, result.extra_message_ids, None, result.attempts,
+                   result.bot_id)
+        else:
+            row = (self.post_id, result.chat_id, DELIVERY_FAILED, None, None, str(result.error)[:500], result.attempts, None)
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size or time.monotonic() - self._last_flush >= self.interval:
+            await self.flush()
+
+    async def flush(self):
+        # Buferni await dan oldin almashtiramiz, shunda parallel worker'lar bir yozuvni ikki marta yozmaydi
+        rows, self._rows = self._rows, []
+        self._last_flush = time.monotonic()
+        if rows:
+            await async_db.record_deliveries(rows)
+
+# --- VAQTI KELGAN POSTLARNI YUBORISH (DRAIN) ---
+
+# Drain sikli ishlayotgan paytda kelgan chaqiruvlar yangi sikl ochmaydi, faqat
+# ishlayotgan siklni yana bir aylanishga majbur qiladi (ustma-ust tushish yo'q, uyg'otish yo'qolmaydi)
+_draining = False
+_rerun = False
+
+# Hozir yuborilayotgan postning schedule_time dan kechikishi (soniya, bo'sh turganda 0)
+drain_lag = 0.0
+
+async def check_and_send_posts(bot: Bot) -> list:
+    """
+    Vaqti kelgan postlarni barcha faol chatlarga yuboradi. Bir nechta nusxa (replica) bir vaqtda
+    chaqirsa ham xavfsiz: postlar va chat shard'lari SKIP LOCKED va ijaralar orqali taqsimlanadi.
+    Shu jarayonda esa bir vaqtda faqat bitta drain sikli ishlaydi.
+
+    Takrorlanuvchi postlarning shu siklda yaratilgan navbatdagi postlari [(post_id, vaqt), ...]
+    qaytariladi (SQLite'da NOTIFY yo'q, dispatcher ular haqida shu orqali biladi).
+    """
+    global _draining, _rerun, drain_lag
+    if _draining:
+        _rerun = True
+        return []
+
+    _draining = True
+    occurrences = []
+    try:
+        while True:
+            _rerun = False
+            await _drain(bot, occurrences)
+            if not _rerun:
+                break
+    finally:
+        _draining = False
+        drain_lag = 0.0
+        metrics.DRAIN_LAG.set(0)
+    return occurrences
+
+async def _drain(bot: Bot, occurrences: list):
+    """
+    Kechikib qolgan postlarni schedule_time tartibida DRAIN_PAGE_SIZE tadan sahifalab o'qiydi va
+    birma-bir yuboradi, shuning uchun xotira backlog hajmiga bog'liq emas.
+    """
+    global drain_lag
+
+    # 1. Egasiz (yoki ijarasi tugagan) shard'lar: boshqa worker o'lib qolgan yoki yarim yo'lda qolgan postlar
+    await _deliver_claimable_shards(bot)
+
+    # 2. Vaqti kelgan postlar: oxirgi ko'rilgan (schedule_time, id) dan keyingi sahifa
+    after = None
+    while True:
+        page = await async_db.get_due_posts(after, DRAIN_PAGE_SIZE)
+        if not page:
+            break
+        active_chats = await async_db.get_active_chats()
+        if not active_chats:
+            logger.warning("Faol chat yo'q. Vaqti kelgan postlar yuborilgan deb belgilanmadi.")
+            break
+
+        for post in page:
+            drain_lag = max(0.0, time.time() - post['schedule_time'].timestamp())
+            metrics.DRAIN_LAG.set(drain_lag)
+            # Boshqa nusxa allaqachon rejalashtirgan bo'lsa None: u holda uning shard'lariga yordam beriladi
+            planned = await async_db.plan_due_post(post['id'], active_chats)
+            if planned is not None:
+                metrics.DRAINED_POSTS.inc()
+                if planned['next_occurrence']:
+                    occurrences.append(planned['next_occurrence'])
+            await _deliver_claimable_shards(bot)
 
-    # 2. Barcha faol chat ID'larini olish
-    active_chats = db.get_active_chats()
-
-    # Har bir yuborilishi kerak bo'lgan post uchun
-    # Bu yerda post lug'at (dict) sifatida qabul qilinadi
-    for post in posts:
-        # Lug'atdan ma'lumotlarni o'qish
-        post_id = post['id'] 
-        media_type = post['media_type']
-        file_id = post['file_id']
-        caption = post['caption']
-
-        # Yuborish harakati muvaffaqiyatli bo'lganini kuzatish uchun bayroq
-        # Agar bitta chatga ham yuborilsa true bo'ladi
-        send_successful = False
-        
-        # Har bir faol chatga yuborish
-        for chat_id in active_chats:
+        after = page[-1]['cursor']
+
+    # 3. Barcha shard'lari yuborilgan, lekin holati yakunlanmay qolgan postlar (worker o'lib qolganda)
+    for post_id in await async_db.get_completed_post_ids():
+        status = await async_db.finish_post_delivery(post_id)
+        logger.info(f"Post ID {post_id} yuborildi. Holati: {status}.")
+
+async def _deliver_claimable_shards(bot: Bot):
+    """Egallash mumkin bo'lgan shard'lar tugaguncha ularni birma-bir yuboradi."""
+    while True:
+        claim = await async_db.claim_delivery_shard(WORKER_ID, SHARD_LEASE_SECONDS)
+        if claim is None:
+            return
+        # Shard davomidagi sekin DB chaqiruvlari va yuborishlar post_id bilan logga yoziladi
+        context = slowlog.post_id.set(claim['post']['id'])
+        try:
+            await _deliver_shard(bot, claim)
+        finally:
+            slowlog.post_id.reset(context)
+
+async def _deliver_shard(bot: Bot, claim: dict):
+    """Egallangan shard'dagi hali yuborilmagan chatlarga postni yuboradi va ijarani yangilab turadi."""
+    post = claim['post']
+    post_id = post['id']
+    shard_no = claim['shard_no']
+    if claim['previous_owner']:
+        logger.warning(f"Post {post_id} shard {shard_no}: {claim['previous_owner']} ijarasi tugagan, shard qayta olindi.")
+
+    # 3. Yetkazish jurnali bo'yicha faqat hali yuborilmagan chatlar olinadi,
+    # shuning uchun uzilib qolgan yuborish qayta boshlanganda takroriy xabar ketmaydi.
+    pending_chats = await async_db.get_pending_deliveries(post_id, claim['first_chat_id'], claim['last_chat_id'])
+
+    # Shard'dagi chatlarga parallel yuborish (tezlik cheklovi delivery.py da)
+    ledger = LedgerWriter(post_id)
+
+    # Post vaqtidan birinchi yuborishgacha: 0-shard birinchi egallanadi, shuning uchun
+    # har bir post uchun bir marta (va faqat shu shard'da) o'lchanadi
+    first_send_pending = shard_no == 0 and not claim['previous_owner']
+
+    async def on_result(result: delivery.DeliveryResult):
+        nonlocal first_send_pending
+        if first_send_pending and result.ok:
+            first_send_pending = False
+            metrics.SCHEDULE_TO_FIRST_SEND.observe(time.time() - post['schedule_time'].timestamp())
+        await ledger.add(result)
+
+    async def send_with_bot(chat_id: int):
+        return delivery.Sent(bot.id, await delivery.send_post(bot, post, chat_id))
+
+    # Yordamchi botlar bo'lsa har bir chatga o'ziga biriktirilgan bot o'z cheklovchisi bilan yuboradi.
+    # Yuborgan bot jurnalga yoziladi: xabarni keyin faqat u tahrirlay oladi
+    pool = bot_pool.pool
+    if pool is not None:
+        send, rate_limiter, concurrency = (lambda chat_id: pool.send_post(post, chat_id)), pool.limiter(post), pool.concurrency
+    else:
+        send, rate_limiter, concurrency = send_with_bot, None, SEND_CONCURRENCY
+
+    send_task = asyncio.create_task(delivery.fan_out(
+        pending_chats,
+        send,
+        rate_limiter=rate_limiter,
+        concurrency=concurrency,
+        on_result=on_result,
+        on_migrate=async_db.migrate_chat,
+    ))
+    lease_lost = False
+    try:
+        # Yuborish davomida ijarani muddatining uchdan birida bir uzaytirib turish
+        while True:
+            done, _ = await asyncio.wait({send_task}, timeout=SHARD_LEASE_SECONDS / 3)
+            if done:
+                break
             try:
-                # Post turiga qarab tegishli metodni chaqirish
-                if media_type == 'text':
-                    await bot.send_message(chat_id, caption)
-                elif media_type == 'photo':
-                    # media_type ga mos ravishda parametr nomini berish
-                    await bot.send_photo(chat_id, photo=file_id, caption=caption) 
-                elif media_type == 'video':
-                    await bot.send_video(chat_id, video=file_id, caption=caption)
-                elif media_type == 'document':
-                    await bot.send_document(chat_id, document=file_id, caption=caption)
-                
-                # Agar yuborish muvaffaqiyatli bo'lsa
-                send_successful = True
-                await asyncio.sleep(0.5) # Telegram API limitlariga tushmaslik uchun kutish
-
-            except TelegramAPIError as e:
-                # Xatolikni qayd qilish
-                error_message = str(e)
-                logger.error(f"Post {post_id} ni chat {chat_id} ga yuborishda xato: {error_message}")
-                
-                # Chat admin tekshiruvida yoki yuborishda xato bo'lsa
-                if 'chat not found' in error_message or 'bot is not a member' in error_message or 'not an administrator' in error_message:
-                    # Agar bot chatdan o'chirilgan bo'lsa, uni nofaol deb belgilash
-                    logger.warning(f"Chat {chat_id} da post yuborish xatosi. Chat nofaol qilinadi.")
-                    db.deactivate_chat(chat_id)
-                continue # Keyingi chatga o'tish
-                
+                renewed = await async_db.renew_shard_lease(post_id, shard_no, WORKER_ID, SHARD_LEASE_SECONDS)
             except Exception as e:
-                logger.error(f"Post {post_id} ni yuborishda kutilmagan xato: {e}")
-                continue # Keyingi chatga o'tish
+                # Vaqtinchalik DB xatosi ijarani yo'qotish emas: yuborish davom etadi, keyingi safar yana uriniladi.
+                # Xato ijara muddatidan uzoq cho'zilsa, keyingi urinish haqiqiy egalik o'zgarishini ko'radi.
+                logger.warning(f"Post {post_id} shard {shard_no}: ijarani uzaytirib bo'lmadi, keyinroq qayta uriniladi: {e}")
+                continue
+            if not renewed:
+                lease_lost = True
+                break
+    finally:
+        if not send_task.done():
+            send_task.cancel()
+            # Bekor qilingan worker'lar flush'dan keyin on_result chaqirmasligi uchun vazifa tugashi kutiladi
+            await asyncio.wait({send_task})
+        await ledger.flush()
 
-        # 4. Agar kamida bitta chatga ham yuborish muvaffaqiyatli bo'lsa, postni yuborilgan deb belgilash
-        if send_successful:
-            db.mark_post_as_sent(post_id) 
-            logger.info(f"Post ID {post_id} muvaffaqiyatli yuborildi va belgilandi.")
-        else:
-            logger.warning(f"Post ID {post_id} hech qaysi chatga yuborilmadi. Yuborilgan deb belgilanmadi.")
+    if lease_lost:
+        logger.warning(f"Post {post_id} shard {shard_no}: ijara boshqa worker'ga o'tdi, yuborish to'xtatildi.")
+        return
+
+    for result in send_task.result():
+        if result.ok:
+            continue
+
+        e = result.error
+        chat_id = result.chat_id
+        logger.error(f"Post {post_id} ni chat {chat_id} ga yuborishda xato ({result.attempts} urinish): {e}")
+
+        # Bot chatdan chiqarilgan/bloklangan bo'lsa (qayta urinib bo'lmaydigan xato), chatni nofaol qilish
+        if retry.classify(e) == retry.CHAT_GONE:
+            logger.warning(f"Chat {chat_id} da post yuborish xatosi. Chat nofaol qilinadi.")
+            await async_db.deactivate_chat(chat_id)
+
+    # 4. Oxirgi shard yakunlangach, jurnal bo'yicha post holatini yakunlash (done yoki partially_failed)
+    if await async_db.complete_delivery_shard(post_id, shard_no, WORKER_ID):
+        status = await async_db.finish_post_delivery(post_id)
+        logger.info(f"Post ID {post_id} yuborildi. Holati: {status}.")
 
 # Funksiyani to'g'ri chaqirish uchun
 # if __name__ == "__main__":
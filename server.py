@@ -1,12 +1,23 @@
-# server.py - Render uchun Health Check serveri va Bot Polling boshqaruvchisi
+# server.py - Render uchun yagona asyncio HTTP server (Health Check + Webhook) va bot boshqaruvchisi
+#
+# Bitta aiohttp server PORT da ishlaydi va doim /health (hamda /), /live, /ready va /metrics
+# so'rovlariga javob beradi. /live jarayon tirikligini, /ready esa ishga tushish bosqichlari
+# (startup.py) tugab, bot yangilanishlarni qabul qilishga tayyorligini bildiradi.
+# WEBHOOK_URL o'rnatilgan bo'lsa, Telegram yangilanishlari shu serverga aiogram'ning
+# webhook handler'i orqali keladi. Aks holda zaxira sifatida Long Polling ishlatiladi.
 
 import os
-import threading
 import asyncio
 import logging
-from http.server import BaseHTTPRequestHandler, HTTPServer
 import signal # Serverni SIGTERM signali orqali to'xtatish uchun
 
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+import metrics
+import startup
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET
+
 # Logging sozlamalari (main.py dan mustaqil ishlashi uchun)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -15,113 +26,109 @@ logger = logging.getLogger(__name__)
 # Agar o'rnatilmagan bo'lsa, standart 8080 ishlatiladi
 PORT = int(os.environ.get("PORT", 8080))
 
-# Bot Polling jarayonini saqlash uchun global o'zgaruvchi
-polling_task = None
+# --- HTTP HANDLER ---
 
-# --- HTTP HANDLER (501 NOT IMPLEMENTED XATOSINI TUZATISH) ---
+async def health_check(request: web.Request) -> web.Response:
+    """Render'dan kelgan Health Check so'rovlariga javob beradi (GET, HEAD va POST)."""
+    return web.Response(text="Bot is running and awake.")
 
-class HealthCheckHandler(BaseHTTPRequestHandler):
-    """
-    Render'dan kelgan Health Check so'rovlariga javob berish uchun klass.
-    501 xatosini oldini olish uchun asosiy HTTP metodlarga javob beradi.
-    """
-    
-    def _send_response(self):
-        """Javob yuborish uchun yordamchi funksiya."""
-        self.send_response(200) # 200 OK
-        self.send_header('Content-type', 'text/plain')
-        self.end_headers()
-        self.wfile.write(b"Bot is running and awake.")
-
-    def do_GET(self):
-        """GET so'roviga javob beradi (Standart Health Check)."""
-        self._send_response()
-
-    def do_HEAD(self):
-        """HEAD so'roviga javob beradi."""
-        self._send_response()
-        
-    def do_POST(self):
-        """POST so'roviga javob beradi (Agar ping POST bo'lsa)."""
-        self._send_response()
-        
-    def log_message(self, format, *args):
-        """HTTP serverning keraksiz loglarini o'chiradi."""
-        return 
-
-# --- SERVER BOSHQARUVI ---
-
-httpd = None # Global HTTP server obyekti
-
-def start_health_check_server():
+async def live_handler(request: web.Request) -> web.Response:
+    """Liveness: event loop javob beryapti (DB yoki Telegram holatiga bog'liq emas)."""
+    return web.Response(text="ok")
+
+async def ready_handler(request: web.Request) -> web.Response:
+    """Readiness: ishga tushish tugagan bo'lsa 200, aks holda 503. Bosqichlar vaqti ham qaytariladi."""
+    body = {'ready': startup.ready, 'phases': startup.phases, **startup.info}
+    return web.json_response(body, status=200 if startup.ready else 503)
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    """Prometheus uchun metrikalar (metrics.py)."""
+    return web.Response(body=metrics.render(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+def create_app(dp=None, bot=None) -> web.Application:
     """
-    HTTP serverni alohida thread'da ishga tushiradi. 
-    Bu Renderga botning tezda javob berishini ta'minlaydi.
+    Health Check yo'llari bilan aiohttp ilovasini yaratadi. `dp` va `bot` berilsa,
+    Telegram webhook handler'i ham WEBHOOK_PATH ga ulanadi.
     """
-    global httpd
-    server_address = ('0.0.0.0', PORT)
-    try:
-        httpd = HTTPServer(server_address, HealthCheckHandler)
-        logger.info(f"Health Check Server 0.0.0.0:{PORT} portida ishga tushdi.")
-        httpd.serve_forever()
-    except Exception as e:
-        logger.error(f"HTTP Serverni ishga tushirishda xato: {e}")
-
-def stop_health_check_server(signum=None, frame=None):
-    """SIGTERM signali kelganda serverni to'xtatadi."""
-    global httpd, polling_task
-    logger.warning("SIGTERM signali qabul qilindi. Serverni to'xtatish...")
-    
-    if httpd:
-        # HTTP serverni to'xtatish
-        threading.Thread(target=httpd.shutdown).start()
-        
-    if polling_task:
-        # Bot Pollingni bekor qilish
-        polling_task.cancel()
-        logger.info("Bot Polling bekor qilindi.")
+    app = web.Application()
+    for path in ('/', '/health'):
+        app.router.add_get(path, health_check) # HEAD ham avtomatik qo'shiladi
+        app.router.add_post(path, health_check)
+    app.router.add_get('/live', live_handler)
+    app.router.add_get('/ready', ready_handler)
+    app.router.add_get('/metrics', metrics_handler)
+
+    if dp is not None and bot is not None:
+        SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+        setup_application(app, dp, bot=bot)
+    return app
 
 # --- ASOSIY JARAYONLARNI BIRGA BOSHQARISH ---
 
-async def run_bot_and_server(main_func):
+async def run_bot_and_server():
     """
-    Bot Pollingni va HTTP Health Check serverni birga boshqaradi.
+    HTTP serverni ishga tushiradi, so'ng botni webhook yoki Long Polling rejimida boshqaradi.
+    SIGTERM kelganda hammasi tartib bilan to'xtatiladi.
     """
-    global polling_task
-    
+    # main.py import qilinganda Bot obyekti yaratiladi, shuning uchun import shu yerda
+    from main import bot, dp, on_startup, on_shutdown
+
+    use_webhook = bool(WEBHOOK_URL)
+    stop_event = asyncio.Event()
+
+    async def stop_polling():
+        try:
+            await dp.stop_polling()
+        except RuntimeError:
+            pass # Polling hali boshlanmagan
+
+    def stop(*args):
+        logger.warning("SIGTERM signali qabul qilindi. Serverni to'xtatish...")
+        stop_event.set()
+        if not use_webhook:
+            asyncio.ensure_future(stop_polling())
+
     # SIGTERM (Render tomonidan to'xtatish buyrug'i) handlerini o'rnatish
-    signal.signal(signal.SIGTERM, stop_health_check_server)
-
-    # 1. HTTP serverni alohida thread'da ishga tushirish (Renderga tez javob berish uchun)
-    server_thread = threading.Thread(target=start_health_check_server)
-    server_thread.daemon = True 
-    server_thread.start()
-    
-    # 2. HTTP server ishga tushishini kutish (Kerakli, ammo main.py ning boshqaruviga beriladi)
-    await asyncio.sleep(2) 
-    
-    # 3. HTTP server ishga tushgach, asosiy bot funksiyasini ishga tushirish
-    logger.info("Telegram Polling boshlanmoqda...")
-    polling_task = asyncio.create_task(main_func()) # main.py dagi main() funksiyasi
-    
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, stop)
+    loop.add_signal_handler(signal.SIGINT, stop)
+
+    # 1. HTTP server darhol ishga tushadi (Render Health Check'i bot tayyorlanishini kutmaydi)
+    app = create_app(dp, bot) if use_webhook else create_app()
+    runner = web.AppRunner(app, access_log=None) # HTTP serverning keraksiz loglarini o'chirish
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', PORT).start()
+    logger.info(f"HTTP Server 0.0.0.0:{PORT} portida ishga tushdi.")
+
     try:
-        await polling_task
-    except asyncio.CancelledError:
-        logger.info("Bot Polling jarayoni bekor qilindi.")
+        # 2. DB, registr, dispatcher va scheduler
+        if not await on_startup() or stop_event.is_set():
+            return
+
+        # 3. Telegram yangilanishlarini qabul qilish
+        if use_webhook:
+            await bot.set_webhook(
+                f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+            logger.info(f"Webhook rejimi: yangilanishlar {WEBHOOK_PATH} orqali qabul qilinmoqda.")
+            await stop_event.wait()
+        else:
+            # Oldin o'rnatilgan webhook bo'lsa, getUpdates ishlamaydi
+            await bot.delete_webhook()
+            logger.info("Telegram Polling boshlanmoqda...")
+            await dp.start_polling(bot, handle_signals=False)
     except Exception as e:
-        logger.error(f"Bot Polling jarayonida kutilmagan xato: {e}")
-        stop_health_check_server()
+        logger.error(f"Bot jarayonida kutilmagan xato: {e}")
+    finally:
+        await on_shutdown()
+        await runner.cleanup()
+        await bot.session.close()
 
 
 if __name__ == "__main__":
-    # main.py dagi asosiy asyncio.run(main()) o'rniga, bu faylni ishga tushiramiz
     try:
-        # main.py dan main funksiyasini import qilish talab qilinadi!
-        from main import main as bot_main
-        
-        asyncio.run(run_bot_and_server(bot_main))
-        
-    except ImportError:
-        logger.error("Xato: main.py faylidan main funksiyasi import qilinmadi. Tekshiring!")
+        asyncio.run(run_bot_and_server())
     except Exception as e:
         logger.error(f"Asosiy server xatosi: {e}")
@@ -0,0 +1,51 @@
+# slowlog.py - Sekin amallar jurnali (doim yoqilgan)
+#
+# Bitta db.py chaqiruvi SLOW_DB_MS dan yoki bitta Bot API yuborishi SLOW_SEND_MS dan uzoq
+# davom etsa, u qaysi post va chat uchun bajarilgani bilan birga logga yoziladi va
+# metrics.SLOW_OPERATIONS ga qo'shiladi. Vaqt baribir metrikalar uchun o'lchanadi
+# (async_db._timed, delivery.fan_out), shuning uchun chegaradan tez amallarga faqat bitta
+# taqqoslash qo'shiladi (qarang: python benchmark.py slowlog).
+#
+# post_id va chat_id contextvars orqali uzatiladi: scheduler shard yuborishdan oldin post_id ni,
+# fan_out worker'i har bir yuborish atrofida chat_id ni o'rnatadi. async_db.run chaqiruvchining
+# kontekstini executor thread'iga o'tkazadi, shuning uchun DB chaqiruvlari ham shu ma'lumotni ko'radi.
+
+import contextvars
+import logging
+
+import metrics
+from config import SLOW_DB_MS, SLOW_SEND_MS
+
+logger = logging.getLogger(__name__)
+
+post_id = contextvars.ContextVar('post_id', default=None)
+chat_id = contextvars.ContextVar('chat_id', default=None)
+
+
+def _threshold(ms: float) -> float:
+    """Millisekund -> soniya, 0 bo'lsa jurnal o'chirilgan (hech bir vaqt undan oshmaydi)."""
+    return ms / 1000 if ms > 0 else float('inf')
+
+# Chaqiruvchilar `elapsed >= slowlog.db_threshold` ni o'zlari tekshiradi, ya'ni tez amal uchun funksiya chaqirilmaydi
+db_threshold = _threshold(SLOW_DB_MS)
+send_threshold = _threshold(SLOW_SEND_MS)
+
+
+def _context() -> str:
+    parts = []
+    if post_id.get() is not None:
+        parts.append(f"post_id={post_id.get()}")
+    if chat_id.get() is not None:
+        parts.append(f"chat_id={chat_id.get()}")
+    return ' '.join(parts) or '-'
+
+def slow_db(name: str, elapsed: float):
+    """db.py funksiyasi `name` chegaradan uzoq bajarildi."""
+    metrics.SLOW_DB.inc()
+    logger.warning(f"Sekin DB chaqiruvi: {name} {elapsed * 1000:.0f} ms ({_context()})")
+
+def slow_send(elapsed: float, error: Exception = None):
+    """Bot API yuborishi chegaradan uzoq davom etdi (xato bilan tugagan bo'lsa ham)."""
+    metrics.SLOW_SEND.inc()
+    outcome = f", xato: {type(error).__name__}" if error is not None else ''
+    logger.warning(f"Sekin yuborish: {elapsed * 1000:.0f} ms{outcome} ({_context()})")
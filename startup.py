@@ -0,0 +1,48 @@
+# startup.py - Ishga tushish bosqichlari, ularning davomiyligi va tayyorlik (readiness) holati
+#
+# main.on_startup() mustaqil qadamlarni parallel bajaradi va har birini `step()` bilan
+# o'rab vaqtini yozadi. Natijalar logga, /metrics ga (avtopost_startup_phase_seconds)
+# va server.py dagi /ready javobiga chiqadi. /ready faqat `ready` True bo'lganda 200 qaytaradi.
+
+import asyncio
+import logging
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bosqich nomi -> davomiyligi (soniya), bajarilish tartibida
+phases = {}
+# DB statistikasi (get_db_summary) va boshqa qisqa ma'lumotlar
+info = {}
+# Barcha bosqichlar muvaffaqiyatli tugadi va bot yangilanishlarni qabul qilishga tayyor
+ready = False
+
+_started = time.perf_counter()
+
+
+async def step(name: str, awaitable):
+    """`awaitable` ni kutadi va davomiyligini `phases` ga yozadi (xato bo'lsa ham)."""
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        phases[name] = round(time.perf_counter() - start, 3)
+        metrics.STARTUP_PHASE.labels(name).set(phases[name])
+
+async def parallel(**steps):
+    """Bir-biriga bog'liq bo'lmagan qadamlarni bir vaqtda bajaradi va natijalarini nom bo'yicha qaytaradi."""
+    results = await asyncio.gather(*(step(name, awaitable) for name, awaitable in steps.items()))
+    return dict(zip(steps, results))
+
+def mark_ready():
+    global ready
+    ready = True
+    phases['total'] = round(time.perf_counter() - _started, 3)
+    metrics.STARTUP_PHASE.labels('total').set(phases['total'])
+    logger.info(f"Bot tayyor ({phases['total']} s). Bosqichlar: {phases}")
+
+def mark_not_ready():
+    global ready
+    ready = False
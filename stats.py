@@ -0,0 +1,94 @@
+# stats.py - Yetkazish statistikasi (/stats)
+#
+# Hisoblagichlar yetkazish natijalari yozilayotgan tranzaksiyaning o'zida oshiriladi
+# (record_deliveries, finish_post_delivery): post bo'yicha (post_stats), soat bo'yicha
+# (hourly_stats), chat bo'yicha (chat_stats) va butun tarix uchun jami (delivery_totals).
+# Faqat pending holatidan sent/failed ga o'tgan yozuvlar sanaladi, shuning uchun bir natija
+# ikki marta yozilsa ham (masalan, ijara boshqa worker'ga o'tganda) hisoblagich buzilmaydi.
+#
+# /stats faqat shu jadvallardagi bir nechta qatorni o'qiydi: jami - bitta qator, so'nggi 24 soat -
+# ko'pi bilan 24 qator, so'nggi postlar va eng ko'p xato bergan chatlar - indeks bo'yicha LIMIT.
+# Javob vaqti post_deliveries tarixi hajmiga bog'liq emas (qarang: python benchmark.py stats).
+
+from typing import Dict, Iterable, List, Tuple
+
+from storage import DELIVERY_SENT
+
+# /stats da ko'rsatiladigan so'nggi postlar va xatoli chatlar soni
+RECENT_POSTS = 5
+FAILING_CHATS = 5
+
+
+def aggregate(changes: Iterable[tuple]) -> Tuple[Dict[int, tuple], List[tuple], tuple]:
+    """
+    changes: pending'dan chiqqan yozuvlar [(post_id, chat_id, status, xato, kechikish soniyasi), ...].
+    (post_id -> (sent, failed, delay), [(chat_id, sent, failed, oxirgi xato), ...], (sent, failed, delay))
+    qaytaradi. Chatlar chat_id tartibida: parallel tranzaksiyalar qatorlarni bir xil tartibda qulflaydi.
+    """
+    posts, chats = {}, {}
+    for post_id, chat_id, status, error, delay in changes:
+        sent = status == DELIVERY_SENT
+        post = posts.setdefault(post_id, [0, 0, 0.0])
+        chat = chats.setdefault(chat_id, [0, 0, None])
+        if sent:
+            post[0] += 1
+            post[2] += delay
+            chat[0] += 1
+        else:
+            post[1] += 1
+            chat[1] += 1
+            chat[2] = error
+    total = (
+        sum(p[0] for p in posts.values()),
+        sum(p[1] for p in posts.values()),
+        sum(p[2] for p in posts.values()),
+    )
+    return (
+        {post_id: tuple(p) for post_id, p in posts.items()},
+        [(chat_id, *chats[chat_id]) for chat_id in sorted(chats)],
+        total,
+    )
+
+
+def _rate(failed: int, sent: int) -> str:
+    total = sent + failed
+    return f"{failed / total * 100:.1f}%" if total else "-"
+
+def _seconds(value) -> str:
+    if value is None:
+        return "-"
+    if value < 120:
+        return f"{value:.1f} s"
+    if value < 7200:
+        return f"{value / 60:.1f} daq"
+    return f"{value / 3600:.1f} soat"
+
+def _average(counts: dict):
+    return counts['delay_seconds'] / counts['sent'] if counts['sent'] else None
+
+def report(summary: dict, active_chats: int) -> str:
+    """Admin uchun /stats matni (async_db.get_delivery_stats natijasidan)."""
+    totals, day = summary['totals'], summary['last_24h']
+    lines = [
+        "📊 Yetkazish statistikasi",
+        f"Faol chatlar: {active_chats}",
+        "",
+        f"Jami: {totals['posts']} ta post, {totals['sent']} ta xabar yetkazildi, {totals['failed']} ta xato "
+        f"({_rate(totals['failed'], totals['sent'])}), o'rtacha yetkazish vaqti {_seconds(_average(totals))}",
+        f"So'nggi 24 soat: {day['posts']} ta post, {day['sent']} ta xabar, {day['failed']} ta xato "
+        f"({_rate(day['failed'], day['sent'])}), o'rtacha {_seconds(_average(day))}",
+    ]
+    if summary['recent_posts']:
+        lines += ["", "So'nggi postlar:"]
+        for post in summary['recent_posts']:
+            lines.append(
+                f"  #{post['post_id']}: {post['sent']} yetkazildi, {post['failed']} xato ({_rate(post['failed'], post['sent'])}), "
+                f"o'rtacha {_seconds(_average(post))}, to'liq {_seconds(post['duration_seconds'])}"
+            )
+    if summary['failing_chats']:
+        lines += ["", "Eng ko'p xato bergan chatlar:"]
+        for chat in summary['failing_chats']:
+            title = chat['title'] or chat['chat_id']
+            error = f" - {chat['last_error'][:80]}" if chat['last_error'] else ''
+            lines.append(f"  {title} ({chat['chat_id']}): {chat['failed']} / {chat['sent'] + chat['failed']} ({_rate(chat['failed'], chat['sent'])}){error}")
+    return "\n".join(lines)
@@ -0,0 +1,137 @@
+# storage.py - Ma'lumotlar ombori (storage) interfeysi va backend'ni tanlash
+#
+# Chatlar, postlar va yetkazish jurnali bilan ishlaydigan funksiyalar ikki modulda
+# bir xil nom va imzo bilan yozilgan:
+#   postgres - db.py (psycopg2, DATABASE_URL): bir nechta nusxa va LISTEN/NOTIFY bilan;
+#   sqlite   - db_sqlite.py (DB_NAME fayli WAL rejimida yoki ':memory:'): bitta jarayon,
+#              kichik o'rnatishlar va Postgres'siz benchmark'lar uchun.
+# Backend config.STORAGE_BACKEND orqali tanlanadi. async_db har doim `storage.backend`
+# ni chaqiradi, shuning uchun boshqa kod qaysi backend ishlayotganini bilmaydi.
+
+import importlib
+from datetime import datetime
+from typing import List, Optional, Protocol, Sequence, Tuple
+
+from config import STORAGE_BACKEND
+
+# --- POST VA YETKAZISH HOLATLARI (barcha backend'lar uchun umumiy) ---
+# scheduled_posts.status
+POST_PENDING = 'pending'
+POST_IN_PROGRESS = 'in_progress'
+POST_DONE = 'done'
+POST_PARTIALLY_FAILED = 'partially_failed'
+
+# post_deliveries.status
+DELIVERY_PENDING = 'pending'
+DELIVERY_SENT = 'sent'
+DELIVERY_FAILED = 'failed'
+
+# delivery_shards.status
+SHARD_PENDING = 'pending'
+SHARD_DONE = 'done'
+
+
+class Storage(Protocol):
+    """Backend modul bajarishi kerak bo'lgan funksiyalar (db.py va db_sqlite.py)."""
+
+    # Boshqa nusxalardagi o'zgarishlar NOTIFY orqali keladimi (pg_listener kerakmi)
+    SUPPORTS_NOTIFY: bool
+    # Bajarilgan tranzaksiyalar soni (benchmark va kuzatuv uchun)
+    transaction_count: int
+
+    def init_db(self) -> None: ...
+    def close_pool(self) -> None: ...
+    def get_db_summary(self) -> dict: ...
+
+    # Chatlar
+    def add_chat(self, chat_id: int, title: str, chat_type: str) -> None: ...
+    def get_active_chats(self) -> Sequence[int]: ...
+    def deactivate_chat(self, chat_id: int) -> None: ...
+    def migrate_chat(self, old_chat_id: int, new_chat_id: int) -> None: ...
+    def claim_chats_for_health_check(self, limit: int, interval_seconds: float) -> List[Tuple[int, str]]: ...
+    def record_chat_health(self, chat_id: int, can_post_messages: bool) -> None: ...
+
+    # Botlarni chatlarga taqsimlash (bot_pool.py)
+    def get_chat_bots(self) -> List[Tuple[int, int]]: ...
+    def get_unassigned_chats(self, limit: int) -> List[Tuple[int, str]]: ...
+    def assign_chat_bot(self, chat_id: int, bot_id: Optional[int]) -> None: ...
+    def reset_chat_bots(self, bot_ids: list) -> int: ...
+
+    # Postlar
+    def add_scheduled_post(self, media_type: str, file_id: str, caption: str, schedule_time: datetime,
+                           source_chat_id: int = None, source_message_ids: list = None, caption_index: int = None) -> Optional[int]: ...
+    def add_scheduled_posts(self, posts: list) -> List[Tuple[int, datetime]]: ...
+    def get_due_posts(self, after: tuple = None, limit: int = None) -> List[dict]: ...
+    def get_upcoming_schedule(self) -> List[Tuple[int, datetime]]: ...
+    def mark_post_as_sent(self, post_id: int) -> None: ...
+
+    # Takrorlanuvchi postlar (recurrence.py)
+    def add_recurring_post(self, media_type: str, file_id: str, caption: str, cron: str, timezone: str,
+                           source_chat_id: int = None, source_message_ids: list = None,
+                           caption_index: int = None) -> Tuple[int, int, datetime]: ...
+    def get_post_schedules(self) -> List[dict]: ...
+    def cancel_post_schedule(self, schedule_id: int) -> bool: ...
+
+    # Yetkazish jurnali
+    def get_pending_deliveries(self, post_id: int, first_chat_id: int = None, last_chat_id: int = None) -> List[int]: ...
+    def record_deliveries(self, rows: list) -> None: ...
+    def finish_post_delivery(self, post_id: int) -> Optional[str]: ...
+
+    # Yetkazish statistikasi (/stats, stats.py)
+    def get_delivery_stats(self, recent_posts: int, failing_chats: int) -> dict: ...
+
+    # Shard'lar va ijaralar
+    def plan_due_post(self, post_id: int, chat_ids, shard_size: int = ...) -> Optional[dict]: ...
+    def claim_delivery_shard(self, worker_id: str, lease_seconds: int) -> Optional[dict]: ...
+    def renew_shard_lease(self, post_id: int, shard_no: int, worker_id: str, lease_seconds: int) -> bool: ...
+    def complete_delivery_shard(self, post_id: int, shard_no: int, worker_id: str) -> bool: ...
+    def get_completed_post_ids(self) -> List[int]: ...
+
+    # Yuborilgan postlarni tahrirlash va o'chirish (post_actions.py)
+    def get_post(self, post_id: int) -> Optional[dict]: ...
+    def get_post_messages(self, post_ids: list) -> List[Tuple[int, int, List[int], Optional[int]]]: ...
+    def update_post_caption(self, post_id: int, caption: str) -> None: ...
+    def clear_post_messages(self, post_ids: list, chat_ids: list) -> None: ...
+
+    # Arxivlash (retention.py)
+    def count_archivable_posts(self, older_than_seconds: float) -> dict: ...
+    def archive_sent_posts(self, older_than_seconds: float, batch_size: int) -> int: ...
+
+    # aiogram FSM holatlari (fsm_storage.py)
+    def get_fsm_record(self, key: str) -> Tuple[Optional[str], dict]: ...
+    def set_fsm_state(self, key: str, state: Optional[str], origin: str = '') -> None: ...
+    def set_fsm_data(self, key: str, data: dict, origin: str = '') -> None: ...
+
+
+# Backend nomi -> modul
+_BACKENDS = {
+    'postgres': 'db',
+    'sqlite': 'db_sqlite',
+}
+
+def load_backend(name: str) -> Storage:
+    """Nomi bo'yicha backend modulini import qiladi."""
+    if name not in _BACKENDS:
+        raise ValueError(f"Noma'lum STORAGE_BACKEND: {name!r}. Mavjudlari: {', '.join(_BACKENDS)}")
+    return importlib.import_module(_BACKENDS[name])
+
+def use(name: str) -> Storage:
+    """Ishlatilayotgan backend'ni almashtiradi (benchmark'lar uchun) va uni qaytaradi."""
+    global backend
+    backend = load_backend(name)
+    return backend
+
+
+def notify_listener():
+    """
+    Backend NOTIFY'ni qo'llasa pg_listener.listener, aks holda None. Listener (va psycopg2) shu yerda
+    import qilinadi, shuning uchun STORAGE_BACKEND=sqlite bilan psycopg2 o'rnatilmagan bo'lishi mumkin.
+    """
+    if not backend.SUPPORTS_NOTIFY:
+        return None
+    from pg_listener import listener
+    return listener
+
+
+# Dastur bo'yicha ishlatiladigan backend
+backend: Storage = load_backend(STORAGE_BACKEND)